@@ -1 +1 @@
-# NECTA Backend Application Package
\ No newline at end of file
+# NECTA Backend Application Package
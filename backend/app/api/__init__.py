@@ -1 +1 @@
-# API Package
\ No newline at end of file
+# API Package
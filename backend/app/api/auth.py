@@ -0,0 +1,31 @@
+"""
+Session endpoints for bearer token auth.
+
+Tokens are issued by the identity provider, not by NECTA; the backend only
+verifies them (see :mod:`app.services.auth`). Logging out revokes the
+presented token on every worker until it would have expired anyway.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.api.deps import get_current_user, get_token_verifier
+from app.services.auth import AuthenticationError, Claims, TokenVerifier
+
+router = APIRouter(prefix="/api/auth", tags=["auth"])
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    user: Claims | None = Depends(get_current_user),
+    verifier: TokenVerifier | None = Depends(get_token_verifier),
+) -> None:
+    """Revoke the request's bearer token."""
+    if verifier is None or user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Authentication is not configured",
+        )
+    try:
+        await verifier.revoke(user)
+    except AuthenticationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
@@ -0,0 +1,54 @@
+"""
+Inbound callbacks from n8n workflows answering asynchronously.
+
+A workflow that acknowledged a message without an answer POSTs its result
+to the ``callback_url`` it received in the message metadata. The URL is
+signed (see :mod:`app.services.callbacks`), so no other credentials are
+needed.
+"""
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field
+
+from app.api.deps import get_callback_registry
+from app.services.callbacks import CallbackRegistry
+from app.services.webhook import WebhookResponse
+
+router = APIRouter(prefix="/api/callbacks", tags=["callbacks"])
+
+
+class AgentCallback(BaseModel):
+    """An agent's result; the same shape as a synchronous webhook answer."""
+    response: str = ""
+    format: str = "markdown"
+    metadata: dict[str, Any] = Field(default_factory=dict)
+    error: str | None = Field(default=None, description="Set when the agent run failed")
+
+    def to_response(self, message_id: str) -> WebhookResponse:
+        return WebhookResponse(
+            success=self.error is None,
+            message_id=message_id,
+            agent_response=self.response if self.error is None else None,
+            response_format=self.format,
+            error=self.error,
+            metadata=self.metadata,
+        )
+
+
+@router.post("/{message_id}", status_code=status.HTTP_202_ACCEPTED)
+async def agent_callback(
+    message_id: str,
+    payload: AgentCallback,
+    expires: int = Query(...),
+    signature: str = Query(..., min_length=64, max_length=64),
+    registry: CallbackRegistry = Depends(get_callback_registry),
+) -> dict[str, bool]:
+    """Accept an agent's result and wake the session waiting for it."""
+    if not registry.verify(message_id, expires, signature):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired callback signature",
+        )
+    await registry.resolve(payload.to_response(message_id))
+    return {"accepted": True}
@@ -0,0 +1,403 @@
+"""
+Chat endpoints.
+"""
+import asyncio
+import math
+import os
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import (
+    get_blob_store,
+    get_context_manager,
+    get_current_user,
+    get_db_session,
+    get_dispatcher,
+    get_message_sink,
+    get_profile_cache,
+    get_webhook_client,
+)
+from app.config import get_settings
+from app.services.auth import Claims
+from app.services.blob_store import BlobNotFoundError, BlobStore
+from app.services.context import ContextManager, prepare_context
+from app.services.dispatcher import QueueFullError, WebhookDispatcher
+from app.services.history import MAX_PAGE_SIZE, InvalidCursorError, list_messages
+from app.services.message_sink import MessageSink, record_reply
+from app.services.profiles import ProfileCache, canonical_profile_id
+from app.services.search import (
+    InvalidSearchQueryError,
+    SearchUnavailableError,
+    search_messages,
+)
+from app.services.uploads import MAX_ATTACHMENTS, AttachmentError
+from app.services.validation import BlobId, Filename, MessageContent, check_attachments
+from app.services.webhook import (
+    WebhookClient,
+    WebhookMessage,
+    WebhookResponse,
+)
+from app.services.webhook_models import WebhookAttachment
+
+# Every chat endpoint needs a valid bearer token when auth is configured
+router = APIRouter(prefix="/api/chat", tags=["chat"], dependencies=[Depends(get_current_user)])
+
+
+def _user_id(user: Claims | None) -> str:
+    """The token's subject, or ``anonymous`` when auth is off."""
+    return str(user.get("sub", "anonymous")) if user else "anonymous"
+
+
+class ChatStreamRequest(MessageContent):
+    """
+    A chat message to stream through an n8n webhook.
+
+    The content rules are ``CreateMessage``'s; attachments are checked
+    against the same limits once their blobs are known (see :func:`_attach`).
+    """
+    webhook_path: str = Field(..., pattern=r"^/?webhook(-test)?/[A-Za-z0-9_\-/]+$")
+
+
+class AttachmentRef(BaseModel):
+    """An upload (see ``POST /api/uploads``) attached to a chat message."""
+    blob_id: BlobId
+    filename: Filename
+
+
+class ChatMessageRequest(ChatStreamRequest):
+    """A chat message to deliver through the dispatch queue."""
+    profile_id: str = Field(default="default", min_length=1, max_length=64)
+    file_attachments: list[AttachmentRef] = Field(default_factory=list, max_length=MAX_ATTACHMENTS)
+
+
+class ChatMessageOut(BaseModel):
+    """A stored chat message."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    profile_id: str
+    message_type: str
+    content: str
+    content_format: str
+    metadata: dict[str, Any] = Field(default_factory=dict, validation_alias="message_metadata")
+    file_attachments: list[dict[str, Any]] = Field(default_factory=list)
+    created_at: datetime
+
+
+class ChatHistoryPage(BaseModel):
+    """A page of chat history, newest first."""
+    items: list[ChatMessageOut]
+    next_cursor: str | None = None
+
+
+@router.get("/messages", response_model=ChatHistoryPage)
+async def get_chat_history(
+    profile_id: str = Query(..., min_length=1, max_length=64),
+    cursor: str | None = Query(default=None, max_length=512),
+    limit: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_db_session),
+    sink: MessageSink | None = Depends(get_message_sink),
+) -> ChatHistoryPage:
+    """
+    Page through a profile's messages, newest first.
+
+    Pass the previous page's ``next_cursor`` to continue; each page costs
+    the same however far back it is. Messages still in the write-behind
+    buffer are flushed first, so a client always sees its own messages.
+    """
+    profile_id = canonical_profile_id(profile_id) or profile_id
+    if sink is not None:
+        await sink.sync(profile_id)
+    try:
+        page = await list_messages(session, profile_id, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    return ChatHistoryPage(
+        items=[ChatMessageOut.model_validate(m) for m in page.items],
+        next_cursor=page.next_cursor,
+    )
+
+
+class ChatSearchHit(BaseModel):
+    """A stored chat message matching a search, with its relevance."""
+    message: ChatMessageOut
+    score: float
+
+
+class ChatSearchPage(BaseModel):
+    """A page of search results, best match first."""
+    items: list[ChatSearchHit]
+    next_cursor: str | None = None
+
+
+@router.get("/search", response_model=ChatSearchPage)
+async def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=256),
+    profile_id: str | None = Query(default=None, min_length=1, max_length=64),
+    message_type: str | None = Query(default=None, pattern=r"^(user|agent|system)$"),
+    since: datetime | None = Query(default=None),
+    until: datetime | None = Query(default=None),
+    cursor: str | None = Query(default=None, max_length=512),
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_db_session),
+    sink: MessageSink | None = Depends(get_message_sink),
+) -> ChatSearchPage:
+    """
+    Search stored messages, best match first.
+
+    All words in ``q`` must match; ``"quoted words"`` match a phrase and a
+    trailing ``*`` matches a prefix. Pass the previous page's
+    ``next_cursor`` to continue.
+    """
+    if profile_id is not None:
+        profile_id = canonical_profile_id(profile_id) or profile_id
+    if sink is not None:
+        await sink.sync(profile_id)
+    try:
+        page = await search_messages(
+            session, q,
+            profile_id=profile_id,
+            message_type=message_type,
+            since=since,
+            until=until,
+            limit=limit,
+            cursor=cursor,
+        )
+    except (InvalidSearchQueryError, InvalidCursorError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    except SearchUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e)) from e
+    return ChatSearchPage(
+        items=[
+            ChatSearchHit(message=ChatMessageOut.model_validate(hit.message), score=hit.score)
+            for hit in page.items
+        ],
+        next_cursor=page.next_cursor,
+    )
+
+
+async def _attach(store: BlobStore, refs: list[AttachmentRef]) -> list[dict[str, Any]]:
+    """
+    Reference a message's uploads in the blob store.
+
+    Returns:
+        The stored ``file_attachments`` records.
+
+    Raises:
+        AttachmentError: If an upload is unknown (or was collected), the
+            files exceed the per-message limits or a file type is not allowed.
+    """
+    if not refs:
+        return []
+    blob_ids = [ref.blob_id for ref in refs]
+    try:
+        blobs = await store.attach(blob_ids)
+    except BlobNotFoundError as e:
+        raise AttachmentError(f"Unknown attachment {e}; upload it again") from e
+    try:
+        check_attachments(blobs)
+    except ValueError as e:
+        await store.detach(blob_ids)
+        raise AttachmentError(str(e)) from e
+    return [
+        {
+            "blob_id": blob.blob_id,
+            "filename": ref.filename,
+            "size": blob.size,
+            "mime_type": blob.mime_type,
+        }
+        for ref, blob in zip(refs, blobs, strict=True)
+    ]
+
+
+@dataclass
+class ChatDelivery:
+    """A chat message accepted by the dispatcher, waiting for its reply."""
+    profile_id: str
+    message: WebhookMessage
+    future: "asyncio.Future[WebhookResponse]"
+    # None when the conversation is not persisted
+    sink: MessageSink | None
+    contexts: ContextManager
+    store: BlobStore
+    attachments: list[dict[str, Any]]
+
+    async def reply(self) -> WebhookResponse:
+        """
+        Wait for the agent's answer and record it.
+
+        The wait is shielded, so a caller going away does not cancel the
+        queued job.
+        """
+        try:
+            response = await asyncio.shield(self.future)
+        finally:
+            if self.sink is None:
+                # No stored message holds the uploads once they were sent
+                await self.store.detach([info["blob_id"] for info in self.attachments])
+        if self.sink is not None:
+            await record_reply(self.sink, self.profile_id, response)
+        if response.success:
+            self.contexts.record(self.profile_id, "assistant", response.agent_response or "")
+            if self.sink is not None and self.contexts.enabled(self.profile_id):
+                await self.contexts.announce(self.profile_id)
+        return response
+
+
+async def submit_chat_message(
+    request: ChatMessageRequest,
+    user_id: str,
+    dispatcher: WebhookDispatcher,
+    sink: MessageSink | None,
+    session: AsyncSession,
+    contexts: ContextManager,
+    profiles: ProfileCache,
+    store: BlobStore,
+    message_id: str | None = None,
+) -> ChatDelivery:
+    """
+    Queue a chat message for its profile's agent.
+
+    Shared by ``POST /api/chat/messages`` and the WebSocket gateway. The
+    profile is looked up once and handed to the dispatcher with the job. A
+    stored profile is sent to its own webhook for its current environment,
+    with its context budget, and the message and reply are persisted
+    through ``sink``; other profile ids go to ``webhook_path`` on the
+    configured n8n instance and are not persisted (they have no
+    conversation to record). When the profile has a context budget, the
+    recent conversation is sent along in ``metadata.context``.
+
+    Raises:
+        LookupError: If the profile is inactive or cannot be sent to.
+        AttachmentError: If an attachment is unknown, too large or not allowed.
+        QueueFullError: If the dispatch queue is full.
+    """
+    profile = await profiles.get(request.profile_id)
+    profile_id = request.profile_id
+    webhook_path = request.webhook_path
+    if profile is not None:
+        # The stored id, in case the request spelt the UUID in upper case
+        profile_id = profile.id
+        if not profile.is_active:
+            raise LookupError(f"Profile {profile.id} is not active")
+        contexts.set_budget(profile.id, profile.context_max_tokens)
+        # The dispatcher roots a stored profile's client at its webhook URL
+        webhook_path = ""
+    else:
+        # Messages reference profiles.id, so ad-hoc ids are not persisted
+        sink = None
+    message_id = message_id or str(uuid4())
+    context = await prepare_context(contexts, session, profile_id, request.content, sink)
+    attachments = await _attach(store, request.file_attachments)
+    upload_dir = get_settings().upload_dir
+    message = WebhookMessage(
+        message_id=message_id,
+        user_id=user_id,
+        content=request.content,
+        format=request.content_format,
+        files=[
+            WebhookAttachment(
+                path=os.path.relpath(store.path_for(info["blob_id"]), upload_dir),
+                filename=info["filename"],
+            )
+            for info in attachments
+        ],
+        metadata={"context": context} if context is not None else {},
+    )
+    try:
+        future = await dispatcher.submit(profile_id, webhook_path, message, profile)
+    except BaseException:
+        await store.detach([info["blob_id"] for info in attachments])
+        raise
+    if sink is not None:
+        await sink.write(
+            profile_id, "user", message.content, message.format,
+            file_attachments=attachments,
+            message_id=message.message_id,
+        )
+    return ChatDelivery(
+        profile_id=profile_id,
+        message=message,
+        future=future,
+        sink=sink,
+        contexts=contexts,
+        store=store,
+        attachments=attachments,
+    )
+
+
+@router.post("/messages", response_model=WebhookResponse)
+async def send_chat_message(
+    request: ChatMessageRequest,
+    dispatcher: WebhookDispatcher = Depends(get_dispatcher),
+    sink: MessageSink | None = Depends(get_message_sink),
+    session: AsyncSession = Depends(get_db_session),
+    contexts: ContextManager = Depends(get_context_manager),
+    profiles: ProfileCache = Depends(get_profile_cache),
+    store: BlobStore = Depends(get_blob_store),
+    user: Claims | None = Depends(get_current_user),
+) -> WebhookResponse:
+    """
+    Queue a message for the profile's agent and return its reply.
+
+    See :func:`submit_chat_message` for how the profile is resolved and
+    what is persisted. A message with ``file_attachments`` is sent as
+    multipart, one part per upload under its original filename; a persisted
+    message keeps its upload from being collected.
+    Responds with 429 and ``Retry-After`` when the dispatch queue is full.
+    """
+    try:
+        delivery = await submit_chat_message(
+            request, _user_id(user), dispatcher, sink, session, contexts, profiles, store
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+    except AttachmentError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e)) from e
+    return await delivery.reply()
+
+
+@router.post("/stream")
+async def stream_chat(
+    request: ChatStreamRequest,
+    client: WebhookClient = Depends(get_webhook_client),
+    user: Claims | None = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Forward a message to n8n and relay the answer as Server-Sent Events.
+
+    Each event carries a ``StreamChunk``; the last one has ``done`` set.
+    Chunks are pulled from n8n only as fast as the chat client reads them,
+    so a slow reader applies backpressure instead of buffering the answer.
+    """
+    message = WebhookMessage(
+        message_id=str(uuid4()),
+        user_id=_user_id(user),
+        content=request.content,
+        format=request.content_format,
+    )
+
+    async def events() -> AsyncIterator[str]:
+        async for chunk in client.stream_message(request.webhook_path, message):
+            event = "error" if chunk.error else "message"
+            yield f"event: {event}\ndata: {chunk.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,212 @@
+"""
+Shared FastAPI dependencies.
+"""
+import hmac
+from collections.abc import AsyncIterator
+
+from fastapi import (
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketException,
+    status,
+)
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.db import get_session, get_sessionmaker
+from app.services.auth import AuthenticationError, Claims, TokenVerifier
+from app.services.auth import get_token_verifier as _get_token_verifier
+from app.services.blob_store import BlobStore
+from app.services.blob_store import get_blob_store as _get_blob_store
+from app.services.callbacks import CallbackRegistry
+from app.services.callbacks import get_callback_registry as _get_callback_registry
+from app.services.context import ContextManager
+from app.services.context import get_context_manager as _get_context_manager
+from app.services.dispatcher import WebhookDispatcher
+from app.services.dispatcher import get_dispatcher as _get_dispatcher
+from app.services.health import HealthChecker
+from app.services.health import get_health_checker as _get_health_checker
+from app.services.message_sink import MessageSink, current_message_sink
+from app.services.profiles import ProfileCache
+from app.services.profiles import get_profile_cache as _get_profile_cache
+from app.services.realtime import ConnectionManager
+from app.services.realtime import get_connection_manager as _get_connection_manager
+from app.services.webhook import WebhookClient, webhook_client_from_settings
+
+
+def get_webhook_client() -> WebhookClient:
+    """
+    Webhook client for the configured n8n instance.
+
+    Raises:
+        HTTPException: 503 when no n8n base URL is configured.
+    """
+    client = webhook_client_from_settings()
+    if client is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="n8n integration is not configured",
+        )
+    return client
+
+
+def get_profile_cache() -> ProfileCache:
+    """The process-wide profile cache."""
+    return _get_profile_cache()
+
+
+def get_dispatcher() -> WebhookDispatcher:
+    """The process-wide webhook dispatcher."""
+    return _get_dispatcher()
+
+
+async def get_db_session() -> AsyncIterator[AsyncSession]:
+    """Database session for one request."""
+    async for session in get_session():
+        yield session
+
+
+def get_db_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Session factory, for work that outlives one request (such as a socket)."""
+    return get_sessionmaker()
+
+
+def get_message_sink() -> MessageSink | None:
+    """
+    The write-behind message sink started by the application lifespan.
+
+    None when the lifespan has not run (messages are then not persisted).
+    """
+    return current_message_sink()
+
+
+def get_blob_store() -> BlobStore:
+    """The process-wide attachment blob store."""
+    return _get_blob_store()
+
+
+def get_connection_manager() -> ConnectionManager:
+    """This worker's WebSocket connection manager."""
+    return _get_connection_manager()
+
+
+def get_callback_registry() -> CallbackRegistry:
+    """
+    Registry of sessions waiting for asynchronous agent replies.
+
+    Raises:
+        HTTPException: 404 when callback mode is not configured.
+    """
+    registry = _get_callback_registry()
+    if registry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return registry
+
+
+def get_health_checker() -> HealthChecker:
+    """The process-wide dependency prober."""
+    return _get_health_checker()
+
+
+def get_context_manager() -> ContextManager:
+    """This worker's conversation context windows."""
+    return _get_context_manager()
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def get_token_verifier() -> TokenVerifier | None:
+    """The process-wide bearer token verifier, or None when auth is off."""
+    return _get_token_verifier()
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(_bearer),
+    verifier: TokenVerifier | None = Depends(get_token_verifier),
+) -> Claims | None:
+    """
+    Claims of the request's bearer token.
+
+    Returns:
+        The verified claims, or None when no ``JWT_KEY`` is configured.
+
+    Raises:
+        HTTPException: 401 when auth is on and the token is missing or invalid.
+    """
+    if verifier is None:
+        return None
+    try:
+        if credentials is None:
+            raise AuthenticationError("Not authenticated")
+        return verifier.verify(credentials.credentials)
+    except AuthenticationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from e
+
+
+async def get_socket_user(
+    websocket: WebSocket,
+    token: str | None = Query(default=None, max_length=8192),
+    verifier: TokenVerifier | None = Depends(get_token_verifier),
+) -> Claims | None:
+    """
+    Claims of a WebSocket's bearer token.
+
+    Browsers cannot set headers on a WebSocket, so besides an
+    ``Authorization: Bearer`` header the token is accepted as ``?token=``.
+
+    Returns:
+        The verified claims, or None when no ``JWT_KEY`` is configured.
+
+    Raises:
+        WebSocketException: Closes the socket with 1008 (policy violation)
+            when auth is on and the token is missing or invalid.
+    """
+    if verifier is None:
+        return None
+    header = websocket.headers.get("authorization", "")
+    scheme, _, credentials = header.partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        token = credentials
+    try:
+        if not token:
+            raise AuthenticationError("Not authenticated")
+        return verifier.verify(token)
+    except AuthenticationError as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e)) from e
+
+
+_LOOPBACK = {"127.0.0.1", "::1", "localhost"}
+
+
+async def require_metrics_access(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(_bearer),
+) -> None:
+    """
+    Guard the metrics scrape endpoint.
+
+    Raises:
+        HTTPException: 401 when ``METRICS_TOKEN`` is set and the request
+            does not carry it; 403 when it is not set and the client is
+            not on the loopback interface.
+    """
+    token = get_settings().metrics_token
+    if token:
+        presented = credentials.credentials if credentials is not None else ""
+        if not hmac.compare_digest(presented.encode(), token.encode()):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    elif request.client is None or request.client.host not in _LOOPBACK:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
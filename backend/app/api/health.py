@@ -0,0 +1,56 @@
+"""
+Readiness and deep health endpoints.
+
+``/health`` (in :mod:`app.main`) stays a static liveness check. ``/ready``
+probes the dependencies the service cannot work without and answers 503
+when one is down; ``/health/deep`` also reports n8n and the configured
+webhooks. Probe results are cached briefly (see :mod:`app.services.health`).
+"""
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from app.api.deps import get_health_checker
+from app.services.health import HealthChecker, ProbeResult
+
+router = APIRouter(tags=["health"])
+
+
+def _report(results: dict[str, ProbeResult]) -> dict[str, Any]:
+    return {
+        name: {"ok": r.ok, "latency_ms": r.latency_ms, "detail": r.detail, "critical": r.critical}
+        for name, r in results.items()
+    }
+
+
+@router.get("/ready")
+async def readiness(checker: HealthChecker = Depends(get_health_checker)) -> JSONResponse:
+    """Whether this worker can serve traffic (for load balancers)."""
+    results = await checker.check(checker.critical)
+    ready = all(r.ok for r in results.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": _report(results)},
+    )
+
+
+@router.get("/health/deep")
+async def deep_health(checker: HealthChecker = Depends(get_health_checker)) -> JSONResponse:
+    """
+    Status of every dependency.
+
+    ``degraded`` (HTTP 200) means only non-critical probes failed, e.g. n8n
+    is down but chats can still be stored and read.
+    """
+    results = await checker.check()
+    if all(r.ok for r in results.values()):
+        status = "healthy"
+    elif all(r.ok for r in results.values() if r.critical):
+        status = "degraded"
+    else:
+        status = "unhealthy"
+    return JSONResponse(
+        status_code=503 if status == "unhealthy" else 200,
+        content={"status": status, "service": "necta-backend", "checks": _report(results)},
+    )
@@ -0,0 +1,214 @@
+"""
+Prometheus scrape endpoint.
+
+Webhook latency, retries and timeouts are recorded as they happen (see
+:mod:`app.services.metrics`); everything else is read from the running
+components when ``/metrics`` is scraped. Set ``METRICS_TOKEN`` to let
+Prometheus scrape remotely with that bearer token; without it the endpoint
+only answers loopback clients.
+"""
+import hashlib
+from collections.abc import Iterable
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import require_metrics_access
+from app.services.auth import current_token_verifier
+from app.services.broker import current_broker
+from app.services.cache import current_response_cache
+from app.services.callbacks import current_callback_registry
+from app.services.context import current_context_manager
+from app.services.dispatcher import current_dispatcher
+from app.services.http_pool import current_http_registry
+from app.services.message_sink import current_message_sink
+from app.services.metrics import REGISTRY, MetricFamily
+from app.services.profiles import current_profile_cache
+from app.services.rate_limit import current_rate_limiter
+from app.services.realtime import current_connection_manager
+from app.services.retry import CircuitState, current_breaker_registry
+from app.services.routing import current_selector_registry
+from app.services.tracing import current_trace_exporter
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _gauge(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "gauge", help).add(value)
+
+
+def _counter(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "counter", help).add(value)
+
+
+def endpoint_labels(url: str) -> dict[str, str]:
+    """
+    Labels identifying a webhook endpoint without exposing its URL.
+
+    Webhook paths can carry secrets, so a series names the host and a short
+    digest of the full URL instead.
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    if parts.port is not None:
+        host = f"{host}:{parts.port}"
+    return {"host": host, "endpoint": hashlib.sha256(url.encode()).hexdigest()[:12]}
+
+
+def component_metrics() -> Iterable[MetricFamily]:
+    """
+    Occupancy and throughput of the shared components.
+
+    Only components the application has already created are read, so a
+    scrape never builds one (or opens its connections).
+    """
+    dispatcher = current_dispatcher()
+    if dispatcher is not None:
+        dispatch = dispatcher.stats()
+        yield _gauge("necta_dispatch_queued", "Jobs waiting for a dispatch worker", dispatch["queued"])
+        yield _gauge("necta_dispatch_in_flight", "Jobs being sent to n8n", dispatch["in_flight"])
+        yield _gauge(
+            "necta_dispatch_awaiting_callback",
+            "Jobs acknowledged by n8n and waiting for a callback",
+            dispatch["awaiting_callback"],
+        )
+
+    http = current_http_registry()
+    if http is not None:
+        active = MetricFamily("necta_http_connections_active", "gauge", "Outbound connections in use")
+        idle = MetricFamily("necta_http_connections_idle", "gauge", "Outbound keep-alive connections")
+        for origin, counts in http.connection_counts().items():
+            active.add(counts["active"], origin=origin)
+            idle.add(counts["idle"], origin=origin)
+        yield active
+        yield idle
+
+    breakers = current_breaker_registry()
+    if breakers is not None:
+        open_ = MetricFamily("necta_circuit_open", "gauge", "1 while a webhook's circuit is open")
+        trips = MetricFamily("necta_circuit_trips_total", "counter", "Times a webhook's circuit opened")
+        for url, snapshot in breakers.states().items():
+            labels = endpoint_labels(url)
+            open_.add(float(snapshot["state"] == CircuitState.OPEN.value), **labels)
+            trips.add(snapshot["trips"], **labels)
+        yield open_
+        yield trips
+
+    selectors = current_selector_registry()
+    if selectors is not None:
+        ewma = MetricFamily(
+            "necta_endpoint_latency_ewma_ms", "gauge", "Smoothed latency of each n8n endpoint"
+        )
+        in_flight = MetricFamily("necta_endpoint_in_flight", "gauge", "Calls running per n8n endpoint")
+        for selector in selectors.stats().values():
+            for url, stats in selector["endpoints"].items():
+                labels = endpoint_labels(url)
+                if stats["ewma_ms"] is not None:
+                    ewma.add(stats["ewma_ms"], **labels)
+                in_flight.add(stats["in_flight"], **labels)
+        yield ewma
+        yield in_flight
+
+    limiter = current_rate_limiter()
+    if limiter is not None:
+        rate = MetricFamily("necta_rate_limit_rps", "gauge", "Adapted outbound request rate")
+        waits = MetricFamily("necta_rate_limit_waits_total", "counter", "Calls paced by the limiter")
+        rejected = MetricFamily(
+            "necta_rate_limit_rejected_total", "counter", "Calls that found no slot in time"
+        )
+        for key, stats in limiter.stats().items():
+            rate.add(stats["rate"], key=key)
+            waits.add(stats["waits"], key=key)
+            rejected.add(stats["rejected"], key=key)
+        yield rate
+        yield waits
+        yield rejected
+
+    response_cache = current_response_cache()
+    if response_cache is not None:
+        cache = response_cache.stats()
+        yield _gauge("necta_response_cache_entries", "Cached webhook responses", cache["entries"])
+        yield _counter("necta_response_cache_hits_total", "Response cache hits", cache["hits"])
+        yield _counter("necta_response_cache_misses_total", "Response cache misses", cache["misses"])
+
+    sink = current_message_sink()
+    if sink is not None:
+        stats = sink.stats()
+        yield _gauge("necta_message_sink_pending", "Messages waiting to be written", stats["pending"])
+        yield _counter("necta_message_sink_written_total", "Messages written", stats["written"])
+        yield _counter("necta_message_sink_dropped_total", "Messages dropped", stats["dropped"])
+
+    profile_cache = current_profile_cache()
+    if profile_cache is not None:
+        profiles = profile_cache.stats()
+        yield _gauge("necta_profile_cache_entries", "Profiles (and unknown ids) cached", profiles["entries"])
+        yield _counter("necta_profile_cache_hits_total", "Profile lookups served from cache", profiles["hits"])
+        yield _counter("necta_profile_cache_loads_total", "Profile lookups that queried the database", profiles["loads"])
+        yield _counter(
+            "necta_profile_cache_invalidations_total",
+            "Cached profiles dropped after a change",
+            profiles["invalidations"],
+        )
+
+    context_manager = current_context_manager()
+    if context_manager is not None:
+        contexts = context_manager.stats()
+        yield _gauge(
+            "necta_context_conversations", "Conversation context windows in memory", contexts["conversations"]
+        )
+        yield _counter(
+            "necta_context_invalidations_total",
+            "Context windows dropped after another worker's change",
+            contexts["invalidated"],
+        )
+
+    manager = current_connection_manager()
+    if manager is not None:
+        connections = manager.stats()
+        yield _gauge("necta_ws_connections", "Open WebSocket connections", connections["connections"])
+        yield _gauge("necta_ws_users", "Users with an open WebSocket", connections["users"])
+
+    broker = current_broker()
+    if broker is not None:
+        yield _counter("necta_broker_published_total", "Events published", broker.stats()["published"])
+
+    callbacks = current_callback_registry()
+    if callbacks is not None:
+        stats = callbacks.stats()
+        yield _gauge("necta_callbacks_pending", "Sessions waiting for a callback", stats["pending"])
+        yield _counter("necta_callbacks_expired_total", "Callbacks that never arrived", stats["expired"])
+
+    verifier = current_token_verifier()
+    if verifier is not None:
+        stats = verifier.stats()
+        yield _counter("necta_auth_cache_hits_total", "Tokens served from the verified cache", stats["hits"])
+        yield _counter("necta_auth_cache_misses_total", "Tokens verified in full", stats["misses"])
+        yield _counter("necta_auth_rejected_total", "Tokens rejected", stats["rejected"])
+        yield _gauge("necta_auth_revoked_tokens", "Revoked tokens not yet expired", stats["revoked"])
+
+    exporter = current_trace_exporter()
+    if exporter is not None:
+        stats = exporter.stats()
+        yield _gauge("necta_traces_pending", "Trace events waiting for export", stats["pending"])
+        yield _counter("necta_traces_exported_total", "Trace events exported", stats["exported"])
+        yield _counter(
+            "necta_traces_dropped_total",
+            "Trace events dropped or sampled out",
+            stats["dropped"] + stats["sampled_out"],
+        )
+
+
+REGISTRY.add_collector(component_metrics)
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_metrics_access)],
+)
+async def metrics() -> PlainTextResponse:
+    """Metrics for this worker in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
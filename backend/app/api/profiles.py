@@ -0,0 +1,93 @@
+"""
+Profile endpoints.
+
+Reads are served from the profile cache. Updates are written to the
+database and then announced, so every worker applies them (a dev/prod
+toggle included) before the next message.
+"""
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user, get_db_session, get_profile_cache
+from app.models.profile import Profile
+from app.services.profiles import ProfileCache, ProfileConfig, canonical_profile_id
+
+router = APIRouter(
+    prefix="/api/profiles", tags=["profiles"], dependencies=[Depends(get_current_user)]
+)
+
+
+class ProfileOut(BaseModel):
+    """A profile's sending configuration (credentials are never returned)."""
+    id: str
+    name: str
+    environment: str
+    webhook_url: str
+    webhook_auth_type: str
+    context_max_tokens: int | None
+    is_active: bool
+    version: int
+
+    @classmethod
+    def from_config(cls, config: ProfileConfig) -> "ProfileOut":
+        return cls(
+            id=config.id,
+            name=config.name,
+            environment=config.environment,
+            webhook_url=config.webhook_url,
+            webhook_auth_type=config.webhook_auth_type,
+            context_max_tokens=config.context_max_tokens,
+            is_active=config.is_active,
+            version=config.version,
+        )
+
+
+class ProfileUpdate(BaseModel):
+    """Fields of a profile that can be changed; omitted fields are kept."""
+    environment: Literal["dev", "prod"] | None = None
+    is_active: bool | None = None
+    context_max_tokens: int | None = Field(default=None, ge=0)
+
+
+@router.get("/{profile_id}", response_model=ProfileOut)
+async def get_profile(
+    profile_id: str,
+    profiles: ProfileCache = Depends(get_profile_cache),
+) -> ProfileOut:
+    """Return a profile's configuration."""
+    config = await profiles.get(profile_id)
+    if config is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return ProfileOut.from_config(config)
+
+
+@router.patch("/{profile_id}", response_model=ProfileOut)
+async def update_profile(
+    profile_id: str,
+    update: ProfileUpdate,
+    session: AsyncSession = Depends(get_db_session),
+    profiles: ProfileCache = Depends(get_profile_cache),
+) -> ProfileOut:
+    """
+    Change a profile and notify every worker.
+
+    ``context_max_tokens`` may be set to null to use the default budget.
+    """
+    profile = await session.get(Profile, canonical_profile_id(profile_id) or profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    changes = update.model_dump(exclude_unset=True)
+    for field in ("environment", "is_active"):
+        if changes.get(field, ...) is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{field} cannot be null",
+            )
+    for field, value in changes.items():
+        setattr(profile, field, value)
+    await session.commit()
+    await profiles.updated(profile)
+    return ProfileOut.from_config(ProfileConfig.from_model(profile))
@@ -0,0 +1,174 @@
+"""
+WebSocket chat gateway.
+
+Clients connect to ``/ws/chat`` with their bearer token (an
+``Authorization`` header, or ``?token=`` from a browser) and exchange JSON
+frames. The socket belongs to the token's subject; when auth is off each
+socket is its own anonymous user, so no one can join another's channel.
+
+- ``{"type": "message", "profile_id", "webhook_path", "content"}`` sends a
+  chat message, exactly as ``POST /api/chat/messages`` does; the agent's
+  answer arrives as an ``agent_reply`` event on every connection of the
+  user, on any worker, after agent ``typing`` events with ``state``
+  ``start`` and ``stop``.
+- ``{"type": "typing", "profile_id"}`` is relayed to the user's other
+  connections.
+- ``{"type": "pong"}`` (or any frame) answers the server's ``ping``.
+"""
+import asyncio
+import json
+import logging
+from typing import Any
+from uuid import uuid4
+
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.chat import ChatMessageRequest, submit_chat_message
+from app.api.deps import (
+    get_blob_store,
+    get_connection_manager,
+    get_context_manager,
+    get_db_sessionmaker,
+    get_dispatcher,
+    get_message_sink,
+    get_profile_cache,
+    get_socket_user,
+)
+from app.services.auth import Claims
+from app.services.blob_store import BlobStore
+from app.services.context import ContextManager
+from app.services.dispatcher import QueueFullError, WebhookDispatcher
+from app.services.message_sink import MessageSink
+from app.services.profiles import ProfileCache
+from app.services.realtime import Connection, ConnectionManager
+from app.services.uploads import AttachmentError
+
+router = APIRouter(tags=["realtime"])
+logger = logging.getLogger(__name__)
+
+# Replies keep running if the sending socket goes away; hold references
+_deliveries: set[asyncio.Task] = set()
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(
+    websocket: WebSocket,
+    user: Claims | None = Depends(get_socket_user),
+    manager: ConnectionManager = Depends(get_connection_manager),
+    dispatcher: WebhookDispatcher = Depends(get_dispatcher),
+    sink: MessageSink | None = Depends(get_message_sink),
+    sessionmaker: async_sessionmaker[AsyncSession] = Depends(get_db_sessionmaker),
+    contexts: ContextManager = Depends(get_context_manager),
+    profiles: ProfileCache = Depends(get_profile_cache),
+    store: BlobStore = Depends(get_blob_store),
+) -> None:
+    """Bidirectional chat for one browser tab."""
+    if user is not None and user.get("sub"):
+        user_id = str(user["sub"])
+    else:
+        user_id = f"anonymous:{uuid4()}"
+    await websocket.accept()
+    conn = await manager.connect(user_id, websocket)
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            manager.touch(conn)
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                conn.enqueue({"type": "error", "error": "Invalid JSON"})
+                continue
+            if not isinstance(frame, dict):
+                conn.enqueue({"type": "error", "error": "Expected a JSON object"})
+                continue
+            await _handle(
+                frame, conn, manager, dispatcher, sink, sessionmaker, contexts, profiles, store
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.disconnect(conn)
+
+
+async def _handle(
+    frame: dict[str, Any],
+    conn: Connection,
+    manager: ConnectionManager,
+    dispatcher: WebhookDispatcher,
+    sink: MessageSink | None,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    contexts: ContextManager,
+    profiles: ProfileCache,
+    store: BlobStore,
+) -> None:
+    kind = frame.get("type")
+    if kind == "pong":
+        return
+    if kind == "typing":
+        await manager.publish(conn.user_id, {
+            "type": "typing",
+            "actor": "user",
+            "profile_id": frame.get("profile_id"),
+            "exclude_connection": conn.connection_id,
+        })
+        return
+    if kind == "message":
+        try:
+            request = ChatMessageRequest.model_validate(frame)
+        except ValidationError as e:
+            # The context of a validator's error holds the exception itself
+            conn.enqueue({
+                "type": "error",
+                "error": e.errors(include_url=False, include_context=False),
+            })
+            return
+        task = asyncio.create_task(_deliver(
+            request, conn, manager, dispatcher, sink, sessionmaker, contexts, profiles, store
+        ))
+        _deliveries.add(task)
+        task.add_done_callback(_deliveries.discard)
+        return
+    conn.enqueue({"type": "error", "error": f"Unknown frame type: {kind!r}"})
+
+
+async def _deliver(
+    request: ChatMessageRequest,
+    conn: Connection,
+    manager: ConnectionManager,
+    dispatcher: WebhookDispatcher,
+    sink: MessageSink | None,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    contexts: ContextManager,
+    profiles: ProfileCache,
+    store: BlobStore,
+) -> None:
+    """Dispatch a message and publish the agent's reply to all the user's tabs."""
+    user_id = conn.user_id
+    message_id = str(uuid4())
+    try:
+        # A session per message: deliveries on one socket run concurrently
+        async with sessionmaker() as session:
+            delivery = await submit_chat_message(
+                request, user_id, dispatcher, sink, session, contexts, profiles, store,
+                message_id=message_id,
+            )
+    except (QueueFullError, AttachmentError, LookupError) as e:
+        conn.enqueue({"type": "error", "message_id": message_id, "error": str(e)})
+        return
+    typing = {"type": "typing", "actor": "agent", "profile_id": request.profile_id}
+    await manager.publish(user_id, {**typing, "state": "start"})
+    try:
+        response = await delivery.reply()
+    except Exception as e:
+        logger.exception(f"Delivering message {message_id} failed")
+        conn.enqueue({"type": "error", "message_id": message_id, "error": str(e)})
+        return
+    finally:
+        await manager.publish(user_id, {**typing, "state": "stop"})
+    await manager.publish(user_id, {
+        "type": "agent_reply",
+        "profile_id": request.profile_id,
+        "response": response.model_dump(mode="json"),
+    })
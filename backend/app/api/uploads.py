@@ -0,0 +1,62 @@
+"""
+Attachment upload endpoints.
+
+The request body is the file itself, streamed into the blob store chunk
+by chunk, so an upload never sits in memory. Identical files share one
+blob. The returned ``blob_id`` is what a chat message's
+``file_attachments`` refer to; a blob no message attaches is collected
+after ``BLOB_GC_GRACE_SECONDS``.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel
+
+from app.api.deps import get_blob_store, get_current_user
+from app.services.blob_store import BlobStore
+from app.services.uploads import MAX_TOTAL_BYTES, AttachmentError
+from app.services.validation import check_mime_type
+
+router = APIRouter(
+    prefix="/api/uploads", tags=["uploads"], dependencies=[Depends(get_current_user)]
+)
+
+
+class UploadOut(BaseModel):
+    """A stored upload, to be attached to a chat message."""
+    blob_id: str
+    filename: str
+    size: int
+    mime_type: str
+
+
+@router.post("", response_model=UploadOut, status_code=status.HTTP_201_CREATED)
+async def upload_file(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255, pattern=r"^[a-zA-Z0-9._-]+$"),
+    store: BlobStore = Depends(get_blob_store),
+) -> UploadOut:
+    """
+    Store the request body as an attachment.
+
+    Responds with 413 when the file is larger than 16MB, 422 when it is
+    empty and 415 when its type (sniffed from the content) may not be
+    attached. A refused file is not referenced, so it is collected.
+    """
+    try:
+        info = await store.ingest(
+            request.stream(), filename=filename, take_ref=False, max_bytes=MAX_TOTAL_BYTES
+        )
+    except AttachmentError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)) from e
+    if info.size == 0:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="File is empty"
+        )
+    try:
+        check_mime_type(info.mime_type)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e)
+        ) from e
+    return UploadOut(
+        blob_id=info.blob_id, filename=filename, size=info.size, mime_type=info.mime_type
+    )
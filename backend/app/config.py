@@ -0,0 +1,141 @@
+"""
+Application settings for the NECTA backend.
+
+Values are read from environment variables (or a local ``.env`` file), using
+the same names as ``.env.example`` and ``docker-compose.yml``.
+"""
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Runtime configuration for the backend."""
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    app_env: str = "development"
+    debug: bool = False
+
+    # n8n integration
+    n8n_base_url: str | None = None
+    webhook_timeout: float = 30.0
+    webhook_max_retries: int = 3
+    webhook_retry_delay_seconds: float = 5.0
+    webhook_retry_deadline_seconds: float = 45.0
+    circuit_failure_threshold: int = 5
+    circuit_recovery_seconds: float = 30.0
+    # Further n8n base URLs serving the same webhooks, and whether slow calls
+    # are hedged against them (only for agents without side effects)
+    n8n_replica_urls: list[str] = []
+    webhook_hedging: bool = False
+    hedge_min_delay_seconds: float = 0.05
+
+    # Adaptive (AIMD) outbound rate limits per n8n origin and per profile
+    rate_limit_enabled: bool = True
+    rate_limit_initial_rps: float = 10.0
+    rate_limit_min_rps: float = 1.0
+    rate_limit_max_rps: float = 100.0
+    rate_limit_burst: int = 20
+    rate_limit_latency_target_seconds: float | None = 30.0
+    rate_limit_max_wait_seconds: float = 10.0
+
+    # Shared outbound HTTP connection pools (one per n8n origin)
+    http_pool_max_connections: int = 100
+    http_pool_max_keepalive: int = 20
+    http_pool_keepalive_expiry_seconds: float = 30.0
+    http_pool_idle_ttl_seconds: float = 300.0
+    http2_enabled: bool = True
+
+    # Response cache for connectivity tests and deterministic agents
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: float = 30.0
+
+    # Database (a plain sqlite:/// URL is upgraded to the aiosqlite driver)
+    database_url: str = "sqlite+aiosqlite:///./necta.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_echo: bool = False
+
+    # Write-behind message persistence
+    message_sink_max_batch: int = 256
+    message_sink_flush_interval_seconds: float = 0.05
+    message_sink_max_pending: int = 10000
+
+    # WebSocket gateway
+    ws_heartbeat_interval_seconds: float = 25.0
+    ws_idle_timeout_seconds: float = 60.0
+
+    # Attachments referenced by webhook messages live under this directory
+    upload_dir: str = "./uploads"
+    # Uploaded blobs no message references are collected after the grace
+    # period; the collector runs every interval
+    blob_gc_interval_seconds: float = 600.0
+    blob_gc_grace_seconds: float = 3600.0
+
+    # Redis (optional; enables cross-worker features)
+    redis_url: str | None = None
+
+    # Conversation context sent with each message (0 tokens disables it;
+    # profiles can override the budget)
+    context_max_tokens: int = 0
+    context_max_turns: int = 50
+    context_max_conversations: int = 10000
+
+    # Webhook dispatch queue
+    dispatch_workers: int = 32
+    dispatch_max_per_profile: int = 4
+    dispatch_max_per_origin: int = 16
+    dispatch_max_queue_depth: int = 1000
+    dispatch_max_queue_per_profile: int = 100
+    dispatch_durable: bool = False
+    # Durable jobs are leased to the worker running them; a lease not
+    # renewed for this long (the worker died) lets another worker recover it
+    dispatch_lease_seconds: float = 30.0
+
+    # Profile lookups: cached per worker, invalidated over the broker on
+    # change; the TTL only bounds staleness if a notification is lost
+    profile_cache_max_entries: int = 10000
+    profile_cache_ttl_seconds: float = 3600.0
+    profile_cache_negative_ttl_seconds: float = 30.0
+    # Fernet key for profiles' encrypted webhook credentials
+    webhook_credentials_key: str | None = None
+
+    # Readiness and deep health probes
+    health_cache_ttl_seconds: float = 5.0
+    health_probe_timeout_seconds: float = 2.0
+    health_webhook_paths: list[str] = []
+
+    # Bearer token auth for the API: on when a key is set (HMAC secret or
+    # PEM public key, matching the algorithms)
+    jwt_key: str | None = None
+    jwt_algorithms: list[str] = ["HS256"]
+    jwt_audience: str | None = None
+    jwt_issuer: str | None = None
+    jwt_leeway_seconds: float = 30.0
+    jwt_cache_size: int = 10000
+
+    # Asynchronous agent replies: on when both URL and secret are set
+    public_base_url: str | None = None
+    callback_secret: str | None = None
+    callback_timeout_seconds: float = 900.0
+
+    # LangSmith trace export (off unless an API key is set)
+    langsmith_api_key: str | None = None
+    langsmith_endpoint: str = "https://api.smith.langchain.com"
+    langsmith_project: str | None = "necta"
+    trace_queue_size: int = 10000
+    trace_batch_size: int = 100
+    trace_flush_interval_seconds: float = 1.0
+    trace_sample_above: float = 0.5
+
+    # Bearer token Prometheus presents on /metrics; without one the endpoint
+    # only answers loopback clients
+    metrics_token: str | None = None
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the process-wide settings instance."""
+    return Settings()
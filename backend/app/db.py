@@ -0,0 +1,140 @@
+"""
+Async database engine and sessions.
+
+SQLite is tuned for a concurrent async workload on every new connection:
+WAL lets readers proceed while a message is being written, and
+``synchronous=NORMAL`` only syncs at checkpoints (safe with WAL, much
+cheaper per commit than FULL). File databases get a connection pool sized
+by ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW``; in-memory databases share a
+single connection.
+"""
+from collections.abc import AsyncIterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from app.config import get_settings
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",
+    "temp_store": "MEMORY",
+    # Negative sizes are KiB: 64MB page cache, 256MB memory-mapped I/O
+    "cache_size": "-65536",
+    "mmap_size": "268435456",
+}
+
+
+def normalize_database_url(url: str) -> str:
+    """Use the async driver for URLs written for sync drivers."""
+    parsed = make_url(url)
+    if parsed.drivername == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    elif parsed.drivername in ("postgresql", "postgres"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def create_engine(
+    url: str,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_timeout: float = 30.0,
+    echo: bool = False,
+) -> AsyncEngine:
+    """
+    Create an async engine, tuning SQLite connections as they open.
+
+    Args:
+        url: Database URL
+        pool_size: Connections kept open
+        max_overflow: Extra connections allowed under load
+        pool_timeout: Seconds to wait for a free connection
+        echo: Log SQL statements
+    """
+    url = normalize_database_url(url)
+    parsed = make_url(url)
+    kwargs = {"echo": echo}
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        kwargs.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_pre_ping=parsed.get_backend_name() != "sqlite",
+        )
+    engine = create_async_engine(url, **kwargs)
+    if parsed.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+
+_engine: AsyncEngine | None = None
+_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
+
+def get_engine() -> AsyncEngine:
+    """Return the process-wide engine for ``DATABASE_URL``."""
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        _engine = create_engine(
+            settings.database_url,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            echo=settings.db_echo,
+        )
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """Session factory bound to the process-wide engine."""
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(get_engine(), expire_on_commit=False)
+    return _sessionmaker
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding a session for one request."""
+    async with get_sessionmaker()() as session:
+        yield session
+
+
+async def init_models() -> None:
+    """Create missing tables and indexes."""
+    from app.models import Base
+    from app.models.message import create_search_index
+
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Tables that already existed did not get the search index yet
+        await conn.run_sync(create_search_index)
+
+
+async def close_engine() -> None:
+    """Dispose of the process-wide engine's connections."""
+    global _engine, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _sessionmaker = None
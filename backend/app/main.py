@@ -1,18 +1,110 @@
-# NECTA Backend Main Application
-# This will be the FastAPI application entry point
+"""
+NECTA backend application factory.
+
+``create_app()`` builds the FastAPI application; ``app`` is the instance
+for ``uvicorn app.main:app`` (``uvicorn --factory app.main:create_app``
+works too).
+
+Importing this module must stay cheap: gunicorn and uvicorn workers import
+it on every (re)spawn, and it sits on the cold-start path. Subsystems that
+pull in heavy dependencies only for optional features are imported when
+the feature is first used, or by the lifespan when the feature is
+configured: JWT verification (python-jose, cryptography), MIME sniffing
+(libmagic), thumbnails (Pillow). ``tests/test_startup.py`` holds the
+import-time budget.
+"""
+
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-app = FastAPI(
-    title="NECTA Backend",
-    description="Chat Interface for n8n AI Agents - Backend API",
-    version="0.1.0",
-)
+from app.api import auth, callbacks, chat, health, metrics, profiles, realtime, uploads
+from app.config import get_settings
+from app.db import close_engine, init_models
+from app.services.auth import close_token_verifier, get_token_verifier
+from app.services.blob_store import close_blob_store, get_blob_store
+from app.services.broker import close_broker
+from app.services.callbacks import close_callback_registry, get_callback_registry
+from app.services.context import close_context_manager, get_context_manager
+from app.services.dispatcher import close_dispatcher, get_dispatcher
+from app.services.http_pool import close_http_registry, get_http_registry
+from app.services.message_sink import close_message_sink, get_message_sink
+from app.services.profiles import close_profile_cache, get_profile_cache
+from app.services.rate_limit import close_rate_limiter
+from app.services.realtime import close_connection_manager, get_connection_manager
+from app.services.redis_backend import close_redis
+from app.services.tracing import close_trace_exporter, get_trace_exporter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm shared resources on startup and release them on shutdown."""
+    settings = get_settings()
+    await init_models()
+    get_message_sink().start()
+    registry = get_http_registry()
+    registry.start()
+    if settings.n8n_base_url:
+        await registry.warm([settings.n8n_base_url])
+    exporter = get_trace_exporter()
+    if exporter is not None:
+        exporter.start()
+    callbacks = get_callback_registry()
+    if callbacks is not None:
+        await callbacks.start()
+    # Builds the verifier (importing python-jose) before the first request
+    verifier = get_token_verifier()
+    if verifier is not None:
+        await verifier.revocations.start()
+    await get_context_manager().start()
+    await get_profile_cache().start()
+    await get_dispatcher().start()
+    get_connection_manager().start()
+    get_blob_store().start(settings.blob_gc_interval_seconds, settings.blob_gc_grace_seconds)
+    yield
+    await close_blob_store()
+    await close_connection_manager()
+    await close_dispatcher()
+    await close_callback_registry()
+    # After the dispatcher, so replies to drained jobs are written too
+    await close_message_sink()
+    await close_trace_exporter()
+    await close_http_registry()
+    await close_token_verifier()
+    await close_context_manager()
+    await close_profile_cache()
+    await close_broker()
+    close_rate_limiter()
+    await close_redis()
+    await close_engine()
+
+
+def create_app() -> FastAPI:
+    """Build the NECTA API application."""
+    application = FastAPI(
+        title="NECTA Backend",
+        description="Chat Interface for n8n AI Agents - Backend API",
+        version="0.1.0",
+        lifespan=lifespan,
+    )
+    application.include_router(auth.router)
+    application.include_router(chat.router)
+    application.include_router(profiles.router)
+    application.include_router(uploads.router)
+    application.include_router(callbacks.router)
+    application.include_router(realtime.router)
+    application.include_router(metrics.router)
+    application.include_router(health.router)
+
+    @application.get("/")
+    async def root():
+        return {"message": "NECTA Backend API"}
+
+    @application.get("/health")
+    async def health_check():
+        return {"status": "healthy", "service": "necta-backend"}
+
+    return application
 
-@app.get("/")
-async def root():
-    return {"message": "NECTA Backend API"}
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "service": "necta-backend"}
\ No newline at end of file
+app = create_app()
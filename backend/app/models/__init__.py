@@ -1 +1,6 @@
-# Models Package
\ No newline at end of file
+# Models Package
+from app.models.base import Base
+from app.models.message import Message
+from app.models.profile import Profile
+
+__all__ = ["Base", "Message", "Profile"]
@@ -0,0 +1,35 @@
+"""
+Declarative base and shared column helpers for NECTA models.
+"""
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, String
+from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+def new_id() -> str:
+    """Primary keys are UUID4 strings, matching the shared schemas."""
+    return str(uuid.uuid4())
+
+
+def utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+class Base(AsyncAttrs, DeclarativeBase):
+    """Base class for all ORM models."""
+
+
+class TimestampMixin:
+    """``created_at`` / ``updated_at`` columns maintained by the ORM."""
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=utcnow, onupdate=utcnow, nullable=False
+    )
+
+
+class UUIDPrimaryKeyMixin:
+    """UUID string primary key generated on insert."""
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
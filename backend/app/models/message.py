@@ -0,0 +1,106 @@
+"""
+Chat messages (mirrors ``shared/schemas/message.ts``).
+
+On SQLite, message content is also indexed in the FTS5 table
+``messages_fts`` for search (see :mod:`app.services.search`). It is an
+external-content index over ``messages``: it stores only the inverted
+index, not a second copy of the text, and triggers keep it in step with
+every insert, update and delete, including the bulk inserts of the
+message sink and cascaded profile deletes. ``profile_id`` is indexed too,
+so a search within one conversation only scores that conversation's
+matches.
+"""
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import JSON, Connection, ForeignKey, Index, String, Text, event, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.models.base import Base, TimestampMixin, UUIDPrimaryKeyMixin
+
+if TYPE_CHECKING:
+    from app.models.profile import Profile
+
+
+class Message(UUIDPrimaryKeyMixin, TimestampMixin, Base):
+    """A user, agent or system message in a profile's conversation."""
+    __tablename__ = "messages"
+    __table_args__ = (
+        # Serves keyset pagination of a profile's history in both directions
+        Index("ix_messages_profile_created", "profile_id", "created_at", "id"),
+    )
+
+    profile_id: Mapped[str] = mapped_column(
+        String(36), ForeignKey("profiles.id", ondelete="CASCADE"), nullable=False
+    )
+    message_type: Mapped[str] = mapped_column(String(8), nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    content_format: Mapped[str] = mapped_column(String(8), nullable=False, default="markdown")
+    # ``metadata`` is reserved on declarative classes
+    message_metadata: Mapped[dict[str, Any]] = mapped_column("metadata", JSON, default=dict)
+    file_attachments: Mapped[list[dict[str, Any]]] = mapped_column(JSON, default=list)
+
+    profile: Mapped["Profile"] = relationship(back_populates="messages", lazy="raise")
+
+
+SEARCH_TABLE = "messages_fts"
+# The index's view of a message: profile ids lose their hyphens so each is
+# a single token, which FTS5 matches far more cheaply than a phrase
+SEARCH_SOURCE = "messages_fts_source"
+
+# Only the module's own table names are interpolated (hence the S608 noqa)
+_SEARCH_DDL = (
+    f"""CREATE VIEW IF NOT EXISTS {SEARCH_SOURCE} AS
+        SELECT rowid, content, replace(profile_id, '-', '') AS profile_id FROM messages""",  # noqa: S608
+    # unicode61 folds case and diacritics; the prefix indexes make 2 and 3
+    # character prefix queries (``he*``) index lookups instead of scans
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        content, profile_id, content='{SEARCH_SOURCE}', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, content, profile_id)
+        VALUES (new.rowid, new.content, replace(new.profile_id, '-', ''));
+    END""",  # noqa: S608
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content, profile_id)
+        VALUES ('delete', old.rowid, old.content, replace(old.profile_id, '-', ''));
+    END""",  # noqa: S608
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_update
+    AFTER UPDATE OF content, profile_id ON messages BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content, profile_id)
+        VALUES ('delete', old.rowid, old.content, replace(old.profile_id, '-', ''));
+        INSERT INTO {SEARCH_TABLE}(rowid, content, profile_id)
+        VALUES (new.rowid, new.content, replace(new.profile_id, '-', ''));
+    END""",  # noqa: S608
+)
+
+
+def create_search_index(connection: Connection) -> None:
+    """
+    Create the full-text index and its triggers if they are missing.
+
+    An index added to an existing database is built from the stored
+    messages once. Does nothing on databases other than SQLite.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE},
+    ).first()
+    for statement in _SEARCH_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))  # noqa: S608
+
+
+@event.listens_for(Message.__table__, "after_create")
+def _create_search_index(target, connection: Connection, **kw) -> None:
+    create_search_index(connection)
+
+
+@event.listens_for(Message.__table__, "before_drop")
+def _drop_search_index(target, connection: Connection, **kw) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+        connection.execute(text(f"DROP VIEW IF EXISTS {SEARCH_SOURCE}"))
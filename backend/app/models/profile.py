@@ -0,0 +1,65 @@
+"""
+Agent profiles (mirrors ``shared/schemas/profile.ts``).
+"""
+from typing import TYPE_CHECKING
+
+from sqlalchemy import JSON, Boolean, Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.models.base import Base, TimestampMixin, UUIDPrimaryKeyMixin
+
+if TYPE_CHECKING:
+    from app.models.message import Message
+
+
+class Profile(UUIDPrimaryKeyMixin, TimestampMixin, Base):
+    """
+    An n8n agent the user can chat with.
+
+    ``webhook_auth_config`` and ``langsmith_api_key`` hold Fernet ciphertext
+    (see :class:`app.services.credentials.SecureWebhookManager`).
+    """
+    __tablename__ = "profiles"
+
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    description: Mapped[str | None] = mapped_column(String(500))
+    dev_webhook_url: Mapped[str] = mapped_column(String(2048), nullable=False)
+    prod_webhook_url: Mapped[str] = mapped_column(String(2048), nullable=False)
+    # Equivalent production endpoints (other n8n workers, same workflow)
+    prod_webhook_replicas: Mapped[list[str]] = mapped_column(JSON, default=list)
+    webhook_auth_type: Mapped[str] = mapped_column(String(16), nullable=False, default="none")
+    webhook_auth_config: Mapped[bytes | None] = mapped_column(LargeBinary)
+    langsmith_api_key: Mapped[bytes | None] = mapped_column(LargeBinary)
+    environment: Mapped[str] = mapped_column(String(8), nullable=False, default="dev")
+    # Token budget of the conversation context sent to the agent (None: default)
+    context_max_tokens: Mapped[int | None] = mapped_column(Integer)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    # Bumped by the ORM on every UPDATE; caches use it to order changes
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": version}
+
+    # Never loaded implicitly: history is read a page at a time
+    messages: Mapped[list["Message"]] = relationship(
+        back_populates="profile",
+        lazy="noload",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    @property
+    def webhook_url(self) -> str:
+        """Webhook URL for the profile's current environment."""
+        return self.prod_webhook_url if self.environment == "prod" else self.dev_webhook_url
+
+    @property
+    def webhook_urls(self) -> list[str]:
+        """
+        Every equivalent webhook URL for the current environment.
+
+        The first is ``webhook_url``; in prod the replicas follow, for
+        :class:`app.services.routing.EndpointSelector` to choose among.
+        """
+        if self.environment != "prod":
+            return [self.dev_webhook_url]
+        return list(dict.fromkeys([self.prod_webhook_url, *(self.prod_webhook_replicas or [])]))
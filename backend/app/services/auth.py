@@ -0,0 +1,305 @@
+"""
+Bearer token (JWT) verification for API requests.
+
+Verifying a JWT from scratch means parsing the key, decoding three base64
+segments, parsing two JSON documents and checking a signature (an RSA
+verify is ~50us; parsing a PEM key is more), and the naive way then asks
+the database whether the token was revoked. A client sends the same token
+with every request until it expires, so :class:`TokenVerifier` does the
+full check once per token:
+
+* keys are parsed when the verifier is built, one per allowed algorithm
+* verified claims are kept in a bounded LRU keyed by the raw token; an
+  entry is only served until the token's ``exp``
+* revocation is a dictionary lookup of the token's ``jti`` in
+  :class:`RevocationList`, which every worker keeps in memory
+
+A cached request therefore costs about a microsecond, and revocation still
+applies to it: the ``jti`` is checked on every request, cached or not.
+
+Revocations are stored in Redis (so a starting worker loads them) and
+announced on the broker (so running workers apply them within
+milliseconds). Tokens without an ``exp`` are refused, so an entry is only
+needed until its token expires, after which the ``exp`` check rejects the
+token anyway; the list is pruned then, so it stays small and can be an
+exact set rather than a probabilistic one.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from app.config import get_settings
+from app.services.broker import InMemoryBroker, Subscription, get_broker
+from app.services.redis_backend import get_redis
+
+REVOCATION_CHANNEL = "necta:auth:revocations"
+REVOCATION_KEY = "necta:auth:revoked"
+
+Claims = dict[str, Any]
+
+
+class AuthenticationError(ValueError):
+    """A bearer token is missing, malformed, expired, revoked or forged."""
+
+
+class RevocationList:
+    """
+    Revoked token ids, shared between workers.
+
+    Args:
+        broker: Pub/sub broker announcing new revocations
+        redis: Optional Redis client holding revocations for new workers
+        clock: Wall-clock time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        broker: InMemoryBroker,
+        redis: Any | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.broker = broker
+        self.redis = redis
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._revoked: dict[str, float] = {}
+        self._next_prune = 0.0
+        self._subscription: Subscription | None = None
+        self._relay: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str | None) -> bool:
+        """Whether the token id has been revoked."""
+        return jti is not None and jti in self._revoked
+
+    async def revoke(self, jti: str, expires: float) -> None:
+        """
+        Revoke a token on every worker.
+
+        Args:
+            jti: The token's ``jti`` claim
+            expires: The token's ``exp``; the entry is dropped after it
+        """
+        self._add(jti, expires)
+        if self.redis is not None:
+            await self.redis.hset(REVOCATION_KEY, jti, expires)
+        await self.broker.publish(REVOCATION_CHANNEL, {"jti": jti, "exp": expires})
+
+    def _add(self, jti: str, expires: float) -> None:
+        now = self.clock()
+        if expires > now:
+            self._revoked[jti] = expires
+        if now >= self._next_prune:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        expired = [jti for jti, expires in self._revoked.items() if expires <= now]
+        for jti in expired:
+            del self._revoked[jti]
+        self._next_prune = now + 60
+        if expired and self.redis is not None:
+            asyncio.get_running_loop().create_task(self._forget(expired))
+
+    async def _forget(self, expired: Sequence[str]) -> None:
+        try:
+            await self.redis.hdel(REVOCATION_KEY, *expired)
+        except Exception as e:
+            self.logger.warning(f"Could not prune revoked tokens: {e}")
+
+    async def start(self) -> None:
+        """Load stored revocations and follow new ones."""
+        if self._subscription is not None:
+            return
+        # Subscribe first so nothing revoked while loading is missed
+        self._subscription = await self.broker.subscribe(REVOCATION_CHANNEL)
+        self._relay = asyncio.create_task(self._relay_loop(self._subscription))
+        if self.redis is not None:
+            for jti, expires in (await self.redis.hgetall(REVOCATION_KEY)).items():
+                self._add(jti, float(expires))
+
+    async def _relay_loop(self, subscription: Subscription) -> None:
+        async for payload in subscription:
+            try:
+                self._add(str(payload["jti"]), float(payload["exp"]))
+            except (KeyError, TypeError, ValueError):
+                self.logger.warning("Ignoring malformed revocation")
+
+    async def close(self) -> None:
+        """Stop following revocations."""
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+        if self._subscription is not None:
+            await self._subscription.close()
+            self._subscription = None
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens, caching each token's verified claims.
+
+    Args:
+        key: HMAC secret or PEM public key
+        algorithms: Accepted ``alg`` values, e.g. ``["HS256"]`` or ``["RS256"]``
+        revocations: Revoked token ids
+        audience: Required ``aud``, if any
+        issuer: Required ``iss``, if any
+        leeway: Seconds of clock skew tolerated for ``exp`` and ``nbf``
+        cache_size: Verified tokens kept
+        clock: Wall-clock time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        key: str,
+        algorithms: Sequence[str],
+        revocations: RevocationList,
+        audience: str | None = None,
+        issuer: str | None = None,
+        leeway: float = 0.0,
+        cache_size: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ):
+        # python-jose pulls in cryptography; loaded only when auth is on
+        from jose import jwk
+
+        if not algorithms:
+            raise ValueError("At least one algorithm is required")
+        # Parsed once; jose would otherwise rebuild the key for every token
+        self._keys = {alg: jwk.construct(key, alg) for alg in algorithms}
+        self.revocations = revocations
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.cache_size = cache_size
+        self.clock = clock
+        self._cache: OrderedDict[str, tuple[Claims, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def verify(self, token: str) -> Claims:
+        """
+        Return the claims of a valid token.
+
+        Raises:
+            AuthenticationError: If the token is invalid, has no ``exp``, is
+                expired or is revoked.
+        """
+        cached = self._cache.get(token)
+        if cached is not None:
+            claims, valid_until = cached
+            if self.clock() < valid_until:
+                if self.revocations.is_revoked(claims.get("jti")):
+                    self.rejected += 1
+                    raise AuthenticationError("Token has been revoked")
+                self._cache.move_to_end(token)
+                self.hits += 1
+                return claims
+            del self._cache[token]
+
+        self.misses += 1
+        try:
+            claims = self._decode(token)
+        except AuthenticationError:
+            self.rejected += 1
+            raise
+        if self.revocations.is_revoked(claims.get("jti")):
+            self.rejected += 1
+            raise AuthenticationError("Token has been revoked")
+        self._cache[token] = (claims, float(claims["exp"]) + self.leeway)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    def _decode(self, token: str) -> Claims:
+        from jose import jwt
+        from jose.exceptions import JOSEError
+
+        try:
+            alg = jwt.get_unverified_header(token).get("alg")
+            key = self._keys.get(alg)
+            if key is None:
+                raise AuthenticationError(f"Token algorithm {alg!r} is not accepted")
+            claims = jwt.decode(
+                token, key,
+                algorithms=[alg],
+                audience=self.audience,
+                issuer=self.issuer,
+                options={
+                    "verify_aud": self.audience is not None,
+                    "require_aud": self.audience is not None,
+                    "require_iss": self.issuer is not None,
+                    # Revocations and cache entries last until ``exp``
+                    "require_exp": True,
+                    "leeway": self.leeway,
+                },
+            )
+        except JOSEError as e:
+            raise AuthenticationError(f"Invalid token: {e}") from e
+        return claims
+
+    async def revoke(self, claims: Claims) -> None:
+        """Revoke the token these claims came from, on every worker."""
+        jti = claims.get("jti")
+        if jti is None:
+            raise AuthenticationError("Token has no jti and cannot be revoked")
+        await self.revocations.revoke(str(jti), float(claims["exp"]))
+
+    def stats(self) -> dict[str, int]:
+        """Cache and rejection counts, for metrics export."""
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "revoked": len(self.revocations),
+        }
+
+
+_verifier: TokenVerifier | None = None
+
+
+def get_token_verifier() -> TokenVerifier | None:
+    """
+    Return the process-wide token verifier.
+
+    Returns:
+        The verifier, or None when no ``JWT_KEY`` is set (requests are
+        then anonymous).
+    """
+    global _verifier
+    if _verifier is None:
+        settings = get_settings()
+        if not settings.jwt_key:
+            return None
+        _verifier = TokenVerifier(
+            settings.jwt_key,
+            settings.jwt_algorithms,
+            RevocationList(get_broker(), get_redis()),
+            audience=settings.jwt_audience,
+            issuer=settings.jwt_issuer,
+            leeway=settings.jwt_leeway_seconds,
+            cache_size=settings.jwt_cache_size,
+        )
+    return _verifier
+
+
+def current_token_verifier() -> TokenVerifier | None:
+    """The process-wide verifier if the application has created it, else None."""
+    return _verifier
+
+
+async def close_token_verifier() -> None:
+    """Stop the process-wide verifier's revocation relay."""
+    global _verifier
+    if _verifier is not None:
+        await _verifier.revocations.close()
+        _verifier = None
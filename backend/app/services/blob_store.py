@@ -0,0 +1,388 @@
+"""
+Content-addressed attachment storage.
+
+Uploaded files are stored once per distinct content, under their SHA-256
+digest (the blob id) in a sharded layout::
+
+    <root>/ab/cd/abcd...ef         blob bytes
+    <root>/ab/cd/abcd...ef.json    size, MIME type and reference count
+    <root>/derived/ab/cd/...       cached thumbnails
+
+Ingesting a file that is already stored only adds a reference, so popular
+files are neither written nor hashed or sniffed again. Blobs whose last
+reference is released are removed by :meth:`BlobStore.gc` after a grace
+period; :meth:`BlobStore.start` runs it periodically.
+
+Every worker process shares the store, so reference counts are changed
+under an exclusive ``flock`` on the blob's shard directory, and the
+collector takes the same lock before deleting anything.
+
+Uploads (``POST /api/uploads``) are ingested without a reference: a blob
+stays for the grace period, and each chat message that attaches it takes
+a reference of its own.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections.abc import AsyncIterable, Callable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import aiofiles
+
+from app.config import get_settings
+from app.services.uploads import (
+    CHUNK_SIZE,
+    MAX_TOTAL_BYTES,
+    AttachmentError,
+    sniff_mime,
+)
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNotFoundError(LookupError):
+    """No blob with the given id is stored."""
+
+
+@dataclass
+class BlobInfo:
+    """Metadata kept next to each blob."""
+    blob_id: str
+    size: int
+    mime_type: str
+    refs: int = 0
+    released_at: float | None = None
+
+
+class BlobStore:
+    """
+    Deduplicating, reference-counted blob store on the local filesystem.
+
+    Args:
+        root: Directory holding the blobs
+        chunk_size: Bytes read and written at a time while ingesting
+    """
+
+    def __init__(self, root: Path, chunk_size: int = CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger(__name__)
+        self._gc_task: asyncio.Task | None = None
+
+    def path_for(self, blob_id: str) -> Path:
+        """
+        Location of a blob's bytes.
+
+        Raises:
+            ValueError: If ``blob_id`` is not a SHA-256 hex digest.
+        """
+        if not _BLOB_ID.match(blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return self.root / blob_id[:2] / blob_id[2:4] / blob_id
+
+    def _meta_path(self, blob_id: str) -> Path:
+        return self.path_for(blob_id).with_suffix(".json")
+
+    def _derived_dir(self, blob_id: str) -> Path:
+        return self.root / "derived" / blob_id[:2] / blob_id[2:4]
+
+    @contextmanager
+    def _locked(self, blob_id: str) -> Iterator[None]:
+        """Hold the blob's shard lock, excluding every process using the store."""
+        shard = self.path_for(blob_id).parent
+        shard.mkdir(parents=True, exist_ok=True)
+        with open(shard / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _read_info(self, blob_id: str) -> BlobInfo | None:
+        try:
+            return BlobInfo(**json.loads(self._meta_path(blob_id).read_text()))
+        except FileNotFoundError:
+            return None
+
+    def _write_info(self, info: BlobInfo) -> None:
+        path = self._meta_path(info.blob_id)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        tmp.write_text(json.dumps(asdict(info)))
+        os.replace(tmp, path)
+
+    def _update(self, blob_id: str, change: Callable[[BlobInfo], None]) -> BlobInfo:
+        with self._locked(blob_id):
+            info = self._read_info(blob_id)
+            if info is None:
+                raise BlobNotFoundError(blob_id)
+            change(info)
+            self._write_info(info)
+            return info
+
+    async def info(self, blob_id: str) -> BlobInfo:
+        """
+        Metadata for a stored blob.
+
+        Raises:
+            BlobNotFoundError: If the blob does not exist.
+        """
+        info = await asyncio.to_thread(self._read_info, blob_id)
+        if info is None:
+            raise BlobNotFoundError(blob_id)
+        return info
+
+    async def ingest(
+        self,
+        source: Path | AsyncIterable[bytes],
+        filename: str = "",
+        take_ref: bool = True,
+        max_bytes: int | None = None,
+    ) -> BlobInfo:
+        """
+        Store content, by default taking a reference to it.
+
+        The content is written to a temporary file while it is hashed and
+        sniffed; if an identical blob already exists the copy is dropped.
+
+        Args:
+            source: A file path or an async iterable of byte chunks
+            filename: Original name, used for MIME detection fallback
+            take_ref: Count a reference; without one an unreferenced blob
+                starts (or restarts) its grace period
+            max_bytes: Largest accepted content
+
+        Returns:
+            The blob's metadata, with the new reference counted.
+
+        Raises:
+            AttachmentError: If the content exceeds ``max_bytes``.
+        """
+        tmp_dir = self.root / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp = tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        try:
+            async with aiofiles.open(tmp, "wb") as out:
+                async for chunk in self._chunks(source):
+                    if not head:
+                        head = chunk
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise AttachmentError(f"File exceeds {max_bytes} bytes")
+                    await out.write(chunk)
+            blob_id = digest.hexdigest()
+            mime_type = sniff_mime(head, filename or getattr(source, "name", ""))
+            return await asyncio.to_thread(self._commit, tmp, blob_id, size, mime_type, take_ref)
+        finally:
+            await asyncio.to_thread(tmp.unlink, missing_ok=True)
+
+    async def _chunks(self, source: Path | AsyncIterable[bytes]) -> AsyncIterable[bytes]:
+        if isinstance(source, Path):
+            async with aiofiles.open(source, "rb") as f:
+                while chunk := await f.read(self.chunk_size):
+                    yield chunk
+        else:
+            async for chunk in source:
+                yield chunk
+
+    def _commit(
+        self, tmp: Path, blob_id: str, size: int, mime_type: str, take_ref: bool
+    ) -> BlobInfo:
+        with self._locked(blob_id):
+            info = self._read_info(blob_id)
+            if info is None:
+                info = BlobInfo(blob_id=blob_id, size=size, mime_type=mime_type)
+                os.replace(tmp, self.path_for(blob_id))
+            if take_ref:
+                info.refs += 1
+            info.released_at = None if info.refs else time.time()
+            self._write_info(info)
+            return info
+
+    async def add_ref(self, blob_id: str) -> BlobInfo:
+        """
+        Take another reference to a stored blob without re-uploading it.
+
+        Raises:
+            BlobNotFoundError: If the blob does not exist.
+        """
+        def take(info: BlobInfo) -> None:
+            info.refs += 1
+            info.released_at = None
+
+        return await asyncio.to_thread(self._update, blob_id, take)
+
+    async def release(self, blob_id: str) -> BlobInfo:
+        """
+        Drop one reference. Unreferenced blobs stay until :meth:`gc`.
+
+        Raises:
+            BlobNotFoundError: If the blob does not exist.
+        """
+        def drop(info: BlobInfo) -> None:
+            info.refs = max(0, info.refs - 1)
+            if info.refs == 0:
+                info.released_at = time.time()
+
+        return await asyncio.to_thread(self._update, blob_id, drop)
+
+    async def attach(self, blob_ids: Sequence[str]) -> list[BlobInfo]:
+        """
+        Take a reference to each blob a message attaches.
+
+        All or nothing: on failure the references already taken are
+        released again.
+
+        Raises:
+            BlobNotFoundError: If a blob does not exist (or was collected).
+            AttachmentError: If the blobs exceed the per-message size limit.
+        """
+        taken: list[BlobInfo] = []
+        try:
+            for blob_id in blob_ids:
+                taken.append(await self.add_ref(blob_id))
+            if sum(info.size for info in taken) > MAX_TOTAL_BYTES:
+                raise AttachmentError("Total file size exceeds 16MB limit")
+        except BaseException:
+            await self.detach([info.blob_id for info in taken])
+            raise
+        return taken
+
+    async def detach(self, blob_ids: Sequence[str]) -> None:
+        """Release the references taken by :meth:`attach`."""
+        for blob_id in blob_ids:
+            await self.release(blob_id)
+
+    async def gc(self, grace_seconds: float = 3600.0, now: float | None = None) -> int:
+        """
+        Delete blobs (and their thumbnails) unreferenced for ``grace_seconds``.
+
+        Also removes temporary files left behind by interrupted ingests.
+
+        Returns:
+            Number of blobs deleted.
+        """
+        now = time.time() if now is None else now
+        return await asyncio.to_thread(self._collect, now - grace_seconds)
+
+    def _collect(self, cutoff: float) -> int:
+        removed = 0
+        for meta in self.root.glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*.json"):
+            blob_id = meta.stem
+            if not _BLOB_ID.match(blob_id):
+                continue
+            with self._locked(blob_id):
+                # Re-read under the lock: another worker may have attached it
+                info = self._read_info(blob_id)
+                if info is None or info.refs > 0 or info.released_at is None:
+                    continue
+                if info.released_at > cutoff:
+                    continue
+                self.path_for(blob_id).unlink(missing_ok=True)
+                for derived in self._derived_dir(blob_id).glob(f"{blob_id}_*"):
+                    derived.unlink(missing_ok=True)
+                meta.unlink()
+            removed += 1
+        tmp_dir = self.root / "tmp"
+        if tmp_dir.is_dir():
+            for tmp in tmp_dir.iterdir():
+                try:
+                    if tmp.stat().st_mtime < cutoff:
+                        tmp.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def start(self, interval: float = 600.0, grace_seconds: float = 3600.0) -> None:
+        """Run :meth:`gc` every ``interval`` seconds in the background."""
+        if self._gc_task is None:
+            self._gc_task = asyncio.create_task(self._gc_loop(interval, grace_seconds))
+
+    async def _gc_loop(self, interval: float, grace_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.gc(grace_seconds)
+            except Exception:
+                self.logger.exception("Blob garbage collection failed")
+            else:
+                if removed:
+                    self.logger.info(f"Collected {removed} unreferenced blobs")
+
+    async def close(self) -> None:
+        """Stop the background collector."""
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            await asyncio.gather(self._gc_task, return_exceptions=True)
+            self._gc_task = None
+
+    async def thumbnail(self, blob_id: str, size: tuple[int, int] = (256, 256)) -> Path:
+        """
+        Path of a cached thumbnail of an image blob, rendering it on first use.
+
+        Args:
+            blob_id: Image blob
+            size: Bounding box; the aspect ratio is kept
+
+        Raises:
+            BlobNotFoundError: If the blob does not exist.
+            ValueError: If the blob is not an image.
+        """
+        info = await self.info(blob_id)
+        if not info.mime_type.startswith("image/"):
+            raise ValueError(f"Blob {blob_id} is not an image ({info.mime_type})")
+        target = self._derived_dir(blob_id) / f"{blob_id}_{size[0]}x{size[1]}.webp"
+        if not await asyncio.to_thread(target.exists):
+            await asyncio.to_thread(self._render_thumbnail, self.path_for(blob_id), target, size)
+        return target
+
+    @staticmethod
+    def _render_thumbnail(source: Path, target: Path, size: tuple[int, int]) -> None:
+        from PIL import Image
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+        with Image.open(source) as image:
+            image.thumbnail(size)
+            image.save(tmp, format="WEBP")
+        os.replace(tmp, target)
+
+    def stats(self) -> dict[str, int]:
+        """Blob count, stored bytes and total references (walks the store)."""
+        blobs = stored = refs = 0
+        for meta in self.root.glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*.json"):
+            info = self._read_info(meta.stem)
+            if info is None:  # collected meanwhile
+                continue
+            blobs += 1
+            stored += info.size
+            refs += info.refs
+        return {"blobs": blobs, "bytes": stored, "refs": refs}
+
+
+_blob_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store (``<UPLOAD_DIR>/blobs``)."""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(Path(get_settings().upload_dir) / "blobs")
+    return _blob_store
+
+
+async def close_blob_store() -> None:
+    """Stop the process-wide store's background collector."""
+    global _blob_store
+    if _blob_store is not None:
+        await _blob_store.close()
+        _blob_store = None
@@ -0,0 +1,193 @@
+"""
+Publish/subscribe for events that must reach every worker.
+
+A user's browser tabs may be connected to different uvicorn workers or
+nodes, so chat events are published to a channel rather than written to a
+socket directly. ``RedisBroker`` carries them over Redis pub/sub;
+``InMemoryBroker`` is the single-process fallback and the test fake.
+
+Each process holds at most one upstream subscription per channel, however
+many local subscribers it has; messages are fanned out to them in process.
+"""
+
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator
+from typing import Any
+
+from app.services.redis_backend import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    A local subscriber's view of one channel.
+
+    Messages are buffered up to ``maxsize``; when a subscriber falls that
+    far behind, the oldest message is dropped rather than growing memory.
+    """
+
+    def __init__(self, broker: "InMemoryBroker", channel: str, maxsize: int = 256):
+        self.broker = broker
+        self.channel = channel
+        self.dropped = 0
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize)
+
+    def _put(self, message: dict[str, Any]) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def get(self) -> dict[str, Any]:
+        """Wait for the next message."""
+        return await self._queue.get()
+
+    def __aiter__(self) -> AsyncIterator[dict[str, Any]]:
+        return self._iter()
+
+    async def _iter(self) -> AsyncIterator[dict[str, Any]]:
+        while True:
+            yield await self._queue.get()
+
+    async def close(self) -> None:
+        """Stop receiving messages."""
+        await self.broker._unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Process-local broker; also the local fan-out layer of RedisBroker."""
+
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscription]] = {}
+        self.published = 0
+
+    async def publish(self, channel: str, message: dict[str, Any]) -> None:
+        """Deliver a JSON-serialisable message to every subscriber of ``channel``."""
+        self.published += 1
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: dict[str, Any]) -> None:
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription._put(message)
+
+    async def subscribe(self, channel: str, maxsize: int = 256) -> Subscription:
+        """Start receiving messages published to ``channel``."""
+        subscription = Subscription(self, channel, maxsize)
+        subscribers = self._subscribers.get(channel)
+        if subscribers is None:
+            subscribers = self._subscribers[channel] = set()
+            await self._channel_opened(channel)
+        subscribers.add(subscription)
+        return subscription
+
+    async def _unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.channel)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.channel]
+            await self._channel_closed(subscription.channel)
+
+    async def _channel_opened(self, channel: str) -> None:
+        """Hook: first local subscriber for ``channel``."""
+
+    async def _channel_closed(self, channel: str) -> None:
+        """Hook: last local subscriber for ``channel`` left."""
+
+    def stats(self) -> dict[str, int]:
+        """Channel and subscriber counts for metrics export."""
+        return {
+            "channels": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+        }
+
+    async def close(self) -> None:
+        """Drop every subscription."""
+        self._subscribers.clear()
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Broker over Redis pub/sub.
+
+    One pub/sub connection per process reads every subscribed channel and
+    hands messages to the local subscribers.
+
+    Args:
+        redis: A ``redis.asyncio.Redis`` client (``decode_responses=True``)
+    """
+
+    def __init__(self, redis: Any):
+        super().__init__()
+        self.redis = redis
+        self._pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        self._reader: asyncio.Task | None = None
+
+    async def publish(self, channel: str, message: dict[str, Any]) -> None:
+        self.published += 1
+        await self.redis.publish(channel, json.dumps(message))
+
+    async def _channel_opened(self, channel: str) -> None:
+        await self._pubsub.subscribe(channel)
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read())
+
+    async def _channel_closed(self, channel: str) -> None:
+        await self._pubsub.unsubscribe(channel)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Redis pub/sub read failed")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            try:
+                payload = json.loads(message["data"])
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring malformed message on {message.get('channel')}")
+                continue
+            self._deliver(message["channel"], payload)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        await self._pubsub.aclose()
+        await super().close()
+
+
+_broker: InMemoryBroker | None = None
+
+
+def get_broker() -> InMemoryBroker:
+    """Return the process-wide broker: Redis when configured, else in-memory."""
+    global _broker
+    if _broker is None:
+        redis = get_redis()
+        _broker = RedisBroker(redis) if redis is not None else InMemoryBroker()
+    return _broker
+
+
+def current_broker() -> InMemoryBroker | None:
+    """The process-wide broker if the application has created it, else None."""
+    return _broker
+
+
+async def close_broker() -> None:
+    """Close the process-wide broker."""
+    global _broker
+    if _broker is not None:
+        await _broker.close()
+        _broker = None
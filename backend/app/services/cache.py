@@ -0,0 +1,183 @@
+"""
+Request coalescing and response caching for idempotent webhook calls.
+
+``SingleFlight`` lets identical in-flight calls share one upstream request.
+``TTLCache`` is a size-bounded LRU with per-entry expiry and hit/miss
+counters, used for connectivity tests and deterministic agents so repeated
+identical requests do not cost another n8n execution.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import (
+    Any,
+    Generic,
+    TypeVar,
+)
+
+from app.config import get_settings
+
+T = TypeVar("T")
+
+
+def payload_key(*parts: Any) -> str:
+    """
+    Stable digest of JSON-serialisable key parts.
+
+    Dict keys are sorted, so logically equal payloads hash the same.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class SingleFlight(Generic[T]):
+    """
+    Deduplicate concurrent calls that share a key.
+
+    The first caller for a key starts the function in its own task; every
+    caller, the first included, awaits that task's result (or exception).
+    A caller that is cancelled only stops waiting: the call carries on for
+    the others. Nothing is kept once the call completes.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task[T]] = {}
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` unless a call for ``key`` is already in flight."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # Shield so a caller going away does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task[T]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark retrieved: the exception may have no caller left to see it
+            task.exception()
+
+
+class TTLCache(Generic[T]):
+    """
+    Size-bounded LRU cache with a time-to-live per entry.
+
+    Args:
+        max_entries: Entries kept before the least recently used is evicted
+        ttl: Seconds an entry stays valid
+        clock: Monotonic time source (injectable for tests)
+        on_evict: Called with each value that leaves the cache, whether by
+            LRU eviction, expiry, invalidation or clearing
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        on_evict: Callable[[T], None] | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.on_evict = on_evict
+        self._entries: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> T | None:
+        """Return a live entry (refreshing its LRU position) or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if self.clock() >= expires_at:
+            del self._entries[key]
+            self._evicted(value)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> T | None:
+        """Return an entry, live or expired, without touching LRU order or counters."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[1]
+
+    def set(self, key: Hashable, value: T, ttl: float | None = None) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        previous = self._entries.get(key)
+        self._entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        if previous is not None and previous[1] is not value:
+            self._evicted(previous[1])
+        while len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evicted(evicted)
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop one entry; returns whether it was present."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._evicted(entry[1])
+        return True
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        entries, self._entries = self._entries, OrderedDict()
+        for _, value in entries.values():
+            self._evicted(value)
+
+    def _evicted(self, value: T) -> None:
+        if self.on_evict is not None:
+            self.on_evict(value)
+
+    def stats(self) -> dict[str, int]:
+        """Counters for metrics export."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_response_cache: TTLCache | None = None
+
+
+def get_response_cache() -> TTLCache:
+    """Return the process-wide webhook response cache."""
+    global _response_cache
+    if _response_cache is None:
+        settings = get_settings()
+        _response_cache = TTLCache(
+            max_entries=settings.response_cache_max_entries,
+            ttl=settings.response_cache_ttl_seconds,
+        )
+    return _response_cache
+
+
+def current_response_cache() -> TTLCache | None:
+    """The process-wide cache if the application has created it, else None."""
+    return _response_cache
@@ -0,0 +1,213 @@
+"""
+Asynchronous agent replies delivered by callback.
+
+Long-running agents (browsing, multi-step tool use) should not hold an HTTP
+connection and a dispatch worker for their whole run. In callback mode the
+webhook client adds a signed ``callback_url`` to the message metadata; the
+workflow acknowledges straight away (HTTP 202, or 200 without a
+``response``) and later POSTs its result to that URL.
+
+The URL carries an expiry and an HMAC-SHA256 signature over the message id
+and expiry, so a result is only accepted for the message it was issued for.
+The callback may land on any worker: results are published on the broker
+and resolved by whichever worker holds the waiting session.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from collections.abc import Callable
+from urllib.parse import quote, urlencode
+
+from app.config import get_settings
+from app.services.broker import InMemoryBroker, Subscription, get_broker
+from app.services.webhook_models import WebhookResponse
+
+CALLBACK_CHANNEL = "necta:callbacks"
+
+
+class CallbackRegistry:
+    """
+    Issues signed callback URLs and wakes the sessions waiting on them.
+
+    Args:
+        secret: HMAC key for callback URLs; share it between all workers
+        public_base_url: Base URL under which n8n can reach this backend
+        broker: Pub/sub broker shared with the other workers
+        timeout: Seconds an agent has to call back
+        clock: Wall-clock time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        public_base_url: str,
+        broker: InMemoryBroker,
+        timeout: float = 900.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._secret = secret.encode()
+        self.public_base_url = public_base_url.rstrip("/")
+        self.broker = broker
+        self.timeout = timeout
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._waiters: dict[str, asyncio.Future[WebhookResponse]] = {}
+        self._started: dict[str, float] = {}
+        self._subscription: Subscription | None = None
+        self._relay: asyncio.Task | None = None
+        self.resolved = 0
+        self.expired = 0
+
+    def stats(self) -> dict[str, int]:
+        """Callback counts for metrics export."""
+        return {
+            "pending": len(self._waiters),
+            "resolved": self.resolved,
+            "expired": self.expired,
+        }
+
+    def sign(self, message_id: str, expires: int) -> str:
+        """HMAC-SHA256 signature binding a message id to an expiry time."""
+        return hmac.new(
+            self._secret, f"{message_id}.{expires}".encode(), hashlib.sha256
+        ).hexdigest()
+
+    def callback_url(self, message_id: str) -> str:
+        """Signed URL the agent POSTs its result to."""
+        expires = int(self.clock() + self.timeout)
+        query = urlencode({"expires": expires, "signature": self.sign(message_id, expires)})
+        return f"{self.public_base_url}/api/callbacks/{quote(message_id, safe='')}?{query}"
+
+    def verify(self, message_id: str, expires: int, signature: str) -> bool:
+        """Check a callback's signature and that it has not expired."""
+        if expires < self.clock():
+            return False
+        return hmac.compare_digest(self.sign(message_id, expires), signature)
+
+    def expect(self, message_id: str) -> None:
+        """
+        Register interest in a message's result.
+
+        Call before sending the message, so a callback that beats the
+        acknowledgement is not lost.
+        """
+        if message_id not in self._waiters:
+            self._waiters[message_id] = asyncio.get_running_loop().create_future()
+            self._started[message_id] = time.monotonic()
+
+    def discard(self, message_id: str) -> None:
+        """Stop waiting for a message (it was answered synchronously or failed)."""
+        future = self._waiters.pop(message_id, None)
+        self._started.pop(message_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+
+    async def wait(self, message_id: str, timeout: float | None = None) -> WebhookResponse:
+        """
+        Wait for the agent's callback.
+
+        Returns:
+            The agent's result, or a failed WebhookResponse if it does not
+            arrive within ``timeout`` (default: the registry timeout).
+        """
+        self.expect(message_id)
+        future = self._waiters[message_id]
+        started = self._started[message_id]
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            response = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except TimeoutError:
+            self.expired += 1
+            return WebhookResponse(
+                success=False,
+                message_id=message_id,
+                error=f"Agent did not call back within {timeout:g}s",
+                metadata={"callback_timeout": True},
+            )
+        finally:
+            self.discard(message_id)
+        if response.processing_time_ms is None:
+            elapsed_ms = int((time.monotonic() - started) * 1000)
+            response = response.model_copy(update={"processing_time_ms": elapsed_ms})
+        return response
+
+    async def resolve(self, response: WebhookResponse) -> None:
+        """Hand an agent's result to the session waiting for it, on any worker."""
+        if self._set(response):
+            return
+        await self.broker.publish(CALLBACK_CHANNEL, response.model_dump(mode="json"))
+
+    def _set(self, response: WebhookResponse) -> bool:
+        future = self._waiters.get(response.message_id)
+        if future is None or future.done():
+            return False
+        future.set_result(response)
+        self.resolved += 1
+        return True
+
+    async def start(self) -> None:
+        """Start receiving results that arrived on other workers."""
+        if self._subscription is None:
+            self._subscription = await self.broker.subscribe(CALLBACK_CHANNEL)
+            self._relay = asyncio.create_task(self._relay_loop(self._subscription))
+
+    async def _relay_loop(self, subscription: Subscription) -> None:
+        async for payload in subscription:
+            try:
+                self._set(WebhookResponse.model_validate(payload))
+            except ValueError:
+                self.logger.warning("Ignoring malformed callback result")
+
+    async def close(self) -> None:
+        """Stop relaying and cancel every pending wait."""
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+        if self._subscription is not None:
+            await self._subscription.close()
+            self._subscription = None
+        for message_id in list(self._waiters):
+            self.discard(message_id)
+
+
+_registry: CallbackRegistry | None = None
+
+
+def get_callback_registry() -> CallbackRegistry | None:
+    """
+    Return the process-wide callback registry.
+
+    Returns:
+        The registry, or None when ``PUBLIC_BASE_URL`` or
+        ``CALLBACK_SECRET`` is not set (callback mode is off).
+    """
+    global _registry
+    if _registry is None:
+        settings = get_settings()
+        if not (settings.public_base_url and settings.callback_secret):
+            return None
+        _registry = CallbackRegistry(
+            settings.callback_secret,
+            settings.public_base_url,
+            get_broker(),
+            timeout=settings.callback_timeout_seconds,
+        )
+    return _registry
+
+
+def current_callback_registry() -> CallbackRegistry | None:
+    """The process-wide registry if the application has created it, else None."""
+    return _registry
+
+
+async def close_callback_registry() -> None:
+    """Cancel pending waits and stop relaying callback results."""
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
@@ -0,0 +1,364 @@
+"""
+Pre-trimmed conversation context for n8n agents.
+
+Without it every turn reaches n8n as a lone ``content`` and the workflow's
+chat-memory node reloads the conversation from the database. With a context
+budget, NECTA sends the recent turns itself, trimmed to the budget, in the
+message's ``metadata.context``::
+
+    {"summary": "...", "turns": [{"role": "user", "content": "..."}], "tokens": 812}
+
+Each conversation's window is kept in memory and updated incrementally: a
+turn's tokens are counted once, when it is appended, and the window's total
+is maintained as turns enter and leave, so nothing is re-tokenised. Turns
+pushed out of the budget leave a one-line gist in a bounded summary. Windows
+are kept for the most recently active conversations only; a worker that has
+not seen a conversation yet seeds it from the stored history.
+
+Workers are not sticky: consecutive messages of a conversation may reach
+different workers. A worker that adds a turn to a stored conversation
+announces it on the broker, and every other worker drops its window of
+that conversation, to be rebuilt from history when next used. Sending
+therefore costs no query in the steady state. A turn another worker has
+not flushed yet cannot be seen, so a rebuilt window may still miss a turn
+taken moments before.
+"""
+
+import asyncio
+import logging
+import math
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.services.broker import InMemoryBroker, Subscription, get_broker
+from app.services.history import list_messages
+from app.services.message_sink import MessageSink
+
+CONTEXT_CHANNEL = "necta:context:changes"
+
+# Roughly four characters per token for English text with BPE tokenizers;
+# pass ``count_tokens`` for an exact count
+CHARS_PER_TOKEN = 4
+
+TokenCounter = Callable[[str], int]
+
+# Stored message types that belong in the context, and their roles
+ROLES = {"user": "user", "agent": "assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def gist(text: str, max_chars: int = 160) -> str:
+    """First sentence or line of ``text``, cut to ``max_chars``."""
+    text = " ".join(text.split())
+    for end in (". ", "? ", "! "):
+        index = text.find(end)
+        if 0 < index < max_chars:
+            return text[:index + 1]
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+@dataclass(frozen=True)
+class Turn:
+    """One message in a context window, with its token count."""
+    role: str
+    content: str
+    tokens: int
+
+
+class ContextWindow:
+    """
+    Recent turns of one conversation within a token budget.
+
+    Args:
+        max_tokens: Budget for turns plus summary
+        max_turns: Upper bound on kept turns, whatever their size
+        summary_share: Fraction of the budget the summary may use
+        count_tokens: Token counter applied once per turn
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        max_turns: int = 50,
+        summary_share: float = 0.2,
+        count_tokens: TokenCounter = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summary_budget = int(max_tokens * summary_share)
+        self.count_tokens = count_tokens
+        self.turns: deque[Turn] = deque()
+        self.turn_tokens = 0
+        self.summary: deque[Turn] = deque()
+        self.summary_tokens = 0
+        self._payload: dict[str, Any] | None = None
+
+    @property
+    def tokens(self) -> int:
+        """Tokens currently in the window, summary included."""
+        return self.turn_tokens + self.summary_tokens
+
+    def append(self, role: str, content: str) -> None:
+        """Add a turn, evicting the oldest ones into the summary to fit the budget."""
+        turn = Turn(role, content, self.count_tokens(content))
+        self.turns.append(turn)
+        self.turn_tokens += turn.tokens
+        self._payload = None
+        while self.turns and (
+            self.tokens > self.max_tokens or len(self.turns) > self.max_turns
+        ):
+            if len(self.turns) == 1:
+                # A single turn over budget is cut rather than dropped
+                self.turns[0] = self._truncate(self.turns[0])
+                self.turn_tokens = self.turns[0].tokens
+                self._trim_summary(max(0, self.max_tokens - self.turn_tokens))
+                break
+            evicted = self.turns.popleft()
+            self.turn_tokens -= evicted.tokens
+            self._summarise(evicted)
+
+    def _summarise(self, turn: Turn) -> None:
+        if self.summary_budget <= 0:
+            return
+        line = f"{turn.role}: {gist(turn.content)}"
+        entry = Turn(turn.role, line, self.count_tokens(line) + 1)
+        self.summary.append(entry)
+        self.summary_tokens += entry.tokens
+        self._trim_summary(self.summary_budget)
+
+    def _trim_summary(self, budget: int) -> None:
+        while self.summary and self.summary_tokens > budget:
+            self.summary_tokens -= self.summary.popleft().tokens
+
+    def _truncate(self, turn: Turn) -> Turn:
+        # Keep the end of the turn: the latest part matters most
+        chars = self.max_tokens * CHARS_PER_TOKEN
+        content = turn.content[-chars:]
+        return Turn(turn.role, content, min(self.count_tokens(content), self.max_tokens))
+
+    def payload(self) -> dict[str, Any]:
+        """The window as sent to n8n; built once per change."""
+        if self._payload is None:
+            self._payload = {
+                "summary": "\n".join(entry.content for entry in self.summary) or None,
+                "turns": [{"role": t.role, "content": t.content} for t in self.turns],
+                "tokens": self.tokens,
+            }
+        return self._payload
+
+
+class ContextManager:
+    """
+    Context windows for the most recently active conversations.
+
+    Args:
+        default_max_tokens: Budget for profiles without their own (0 disables)
+        max_conversations: Windows kept in memory, least recently used evicted
+        max_turns: Upper bound on turns per window
+        count_tokens: Token counter applied once per turn
+        broker: Pub/sub broker shared with the other workers; without one
+            the manager assumes it is the only worker
+    """
+
+    def __init__(
+        self,
+        default_max_tokens: int = 0,
+        max_conversations: int = 10000,
+        max_turns: int = 50,
+        count_tokens: TokenCounter = estimate_tokens,
+        broker: InMemoryBroker | None = None,
+    ):
+        self.default_max_tokens = default_max_tokens
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.count_tokens = count_tokens
+        self.broker = broker
+        self.worker_id = uuid.uuid4().hex
+        self.logger = logging.getLogger(__name__)
+        self._budgets: dict[str, int] = {}
+        self._windows: OrderedDict[str, ContextWindow] = OrderedDict()
+        self._subscription: Subscription | None = None
+        self._relay: asyncio.Task | None = None
+        self.seeded = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def set_budget(self, profile_id: str, max_tokens: int | None) -> None:
+        """
+        Set a profile's context budget.
+
+        Args:
+            profile_id: Profile to configure
+            max_tokens: Budget in tokens; 0 disables context for the profile,
+                None falls back to the default
+        """
+        if max_tokens is None:
+            self._budgets.pop(profile_id, None)
+        else:
+            self._budgets[profile_id] = max_tokens
+        window = self._windows.get(profile_id)
+        if window is not None and window.max_tokens != self.budget(profile_id):
+            del self._windows[profile_id]
+
+    def budget(self, profile_id: str) -> int:
+        """The profile's context budget in tokens (0 when disabled)."""
+        return self._budgets.get(profile_id, self.default_max_tokens)
+
+    def enabled(self, profile_id: str) -> bool:
+        return self.budget(profile_id) > 0
+
+    def window(self, conversation_id: str) -> ContextWindow | None:
+        """The conversation's window, or None if it has to be seeded first."""
+        window = self._windows.get(conversation_id)
+        if window is not None:
+            self._windows.move_to_end(conversation_id)
+        return window
+
+    def seed(self, conversation_id: str, turns: Iterable[tuple[str, str]]) -> ContextWindow:
+        """
+        Create (or replace) a conversation's window from stored history.
+
+        Args:
+            conversation_id: Conversation (profile) id
+            turns: Past ``(role, content)`` pairs, oldest first
+        """
+        window = ContextWindow(
+            self.budget(conversation_id), self.max_turns, count_tokens=self.count_tokens
+        )
+        for role, content in turns:
+            window.append(role, content)
+        self._windows[conversation_id] = window
+        self._windows.move_to_end(conversation_id)
+        self.seeded += 1
+        while len(self._windows) > self.max_conversations:
+            self._windows.popitem(last=False)
+            self.evicted += 1
+        return window
+
+    def record(self, conversation_id: str, role: str, content: str) -> None:
+        """Append a turn to the conversation's window, if it is in memory."""
+        window = self._windows.get(conversation_id)
+        if window is not None and content:
+            window.append(role, content)
+
+    def invalidate(self, conversation_id: str) -> None:
+        """Drop a conversation's window; it is seeded again when next used."""
+        if self._windows.pop(conversation_id, None) is not None:
+            self.invalidated += 1
+
+    async def announce(self, conversation_id: str) -> None:
+        """Tell the other workers this worker stored a turn of the conversation."""
+        if self.broker is not None:
+            await self.broker.publish(
+                CONTEXT_CHANNEL, {"conversation_id": conversation_id, "worker": self.worker_id}
+            )
+
+    async def start(self) -> None:
+        """Follow the other workers' announcements."""
+        if self.broker is None or self._subscription is not None:
+            return
+        self._subscription = await self.broker.subscribe(CONTEXT_CHANNEL)
+        self._relay = asyncio.create_task(self._relay_loop(self._subscription))
+
+    async def _relay_loop(self, subscription: Subscription) -> None:
+        async for payload in subscription:
+            try:
+                if payload["worker"] != self.worker_id:
+                    self.invalidate(str(payload["conversation_id"]))
+            except (KeyError, TypeError):
+                self.logger.warning("Ignoring malformed context announcement")
+
+    async def close(self) -> None:
+        """Stop following announcements."""
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+        if self._subscription is not None:
+            await self._subscription.close()
+            self._subscription = None
+
+    def stats(self) -> dict[str, int]:
+        """Window counts, for metrics export."""
+        return {
+            "conversations": len(self._windows),
+            "seeded": self.seeded,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+        }
+
+
+async def prepare_context(
+    manager: ContextManager,
+    session: AsyncSession,
+    profile_id: str,
+    content: str,
+    sink: MessageSink | None = None,
+) -> dict[str, Any] | None:
+    """
+    Context to send with a new user message, then record the message.
+
+    Seeds the window from stored history the first time this worker sees
+    the conversation, or after another worker announced a change (flushing
+    ``sink`` first so this worker's recent turns are included). With a
+    ``sink`` the conversation is persisted, so the new turn is announced.
+
+    Returns:
+        The context payload, or None if the profile has no context budget.
+    """
+    if not manager.enabled(profile_id):
+        return None
+    window = manager.window(profile_id)
+    if window is None:
+        if sink is not None:
+            await sink.sync(profile_id)
+        page = await list_messages(session, profile_id, limit=manager.max_turns)
+        window = manager.seed(profile_id, (
+            (ROLES[m.message_type], m.content)
+            for m in reversed(page.items) if m.message_type in ROLES
+        ))
+    context = window.payload()
+    window.append("user", content)
+    if sink is not None:
+        await manager.announce(profile_id)
+    return context
+
+
+_context_manager: ContextManager | None = None
+
+
+def get_context_manager() -> ContextManager:
+    """Return the process-wide context manager, configured from settings."""
+    global _context_manager
+    if _context_manager is None:
+        settings = get_settings()
+        _context_manager = ContextManager(
+            default_max_tokens=settings.context_max_tokens,
+            max_conversations=settings.context_max_conversations,
+            max_turns=settings.context_max_turns,
+            broker=get_broker(),
+        )
+    return _context_manager
+
+
+def current_context_manager() -> ContextManager | None:
+    """The process-wide manager if the application has created it, else None."""
+    return _context_manager
+
+
+async def close_context_manager() -> None:
+    """Stop the process-wide manager's relay."""
+    global _context_manager
+    if _context_manager is not None:
+        await _context_manager.close()
+        _context_manager = None
@@ -0,0 +1,180 @@
+"""
+Encrypted webhook credentials.
+
+Profiles store their webhook auth configuration Fernet-encrypted. Decrypting
+it means a Fernet decrypt, a JSON parse and Pydantic validation, and turning
+it into headers means string building and base64 - work that would repeat
+for every message. ``SecureWebhookManager`` keeps a small, bounded cache of
+the decrypted configuration and its request headers, keyed by a digest of
+the ciphertext.
+"""
+
+import asyncio
+import hashlib
+import json
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from cryptography.fernet import Fernet
+
+from app.config import get_settings
+from app.services.cache import TTLCache
+from app.services.webhook import WebhookAuthConfig, build_auth_headers
+
+_SECRET_FIELDS = ("username", "password", "header_key", "header_value", "jwt_token")
+
+
+@dataclass
+class _CredentialEntry:
+    config: WebhookAuthConfig
+    headers: dict[str, str]
+
+    def scrub(self) -> None:
+        """
+        Drop the entry's references to secret values.
+
+        Python strings are immutable, so this cannot overwrite memory that
+        other references still hold; it makes the cached objects useless
+        once evicted and lets the strings be reclaimed.
+        """
+        self.headers.clear()
+        for field in _SECRET_FIELDS:
+            setattr(self.config, field, None)
+
+
+def ciphertext_digest(encrypted_config: bytes) -> str:
+    """Cache key for an encrypted configuration."""
+    return hashlib.sha256(encrypted_config).hexdigest()
+
+
+class SecureWebhookManager:
+    """
+    Manages webhook configurations with proper security practices.
+
+    Decrypted configurations are cached for ``cache_ttl`` seconds (at most
+    ``cache_max_entries`` of them). Callers receive copies, so scrubbing an
+    evicted entry never changes a configuration that is in use.
+    """
+
+    def __init__(
+        self,
+        encryption_key: bytes,
+        cache_ttl: float = 300.0,
+        cache_max_entries: int = 1024,
+    ):
+        self.cipher = Fernet(encryption_key)
+        self._cache: TTLCache[_CredentialEntry] = TTLCache(
+            max_entries=cache_max_entries,
+            ttl=cache_ttl,
+            on_evict=_CredentialEntry.scrub,
+        )
+
+    def encrypt_webhook_config(self, config: WebhookAuthConfig) -> bytes:
+        """Encrypt webhook configuration for storage."""
+        config_json = config.model_dump_json()
+        return self.cipher.encrypt(config_json.encode())
+
+    def _decrypt(self, encrypted_config: bytes) -> _CredentialEntry:
+        plaintext = bytearray(self.cipher.decrypt(encrypted_config))
+        try:
+            config = WebhookAuthConfig(**json.loads(plaintext))
+        finally:
+            # Wipe our mutable copy of the plaintext
+            plaintext[:] = bytes(len(plaintext))
+        return _CredentialEntry(config=config, headers=build_auth_headers(config))
+
+    def _entry(self, encrypted_config: bytes) -> _CredentialEntry:
+        key = ciphertext_digest(encrypted_config)
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = self._decrypt(encrypted_config)
+            self._cache.set(key, entry)
+        return entry
+
+    def decrypt_webhook_config(self, encrypted_config: bytes) -> WebhookAuthConfig:
+        """Decrypt webhook configuration from storage."""
+        return self._entry(encrypted_config).config.model_copy()
+
+    def auth_headers(self, encrypted_config: bytes) -> dict[str, str]:
+        """
+        Request headers for an encrypted configuration.
+
+        Returns:
+            A fresh dict the caller may modify.
+        """
+        return dict(self._entry(encrypted_config).headers)
+
+    def decrypt_many(self, encrypted_configs: Iterable[bytes]) -> list[WebhookAuthConfig]:
+        """
+        Decrypt many configurations, e.g. every profile at startup.
+
+        Each distinct ciphertext is decrypted once and left in the cache,
+        so the first message of every profile is served warm.
+
+        Returns:
+            Configurations in the same order as the input.
+        """
+        entries: dict[bytes, _CredentialEntry] = {}
+        results = []
+        for encrypted_config in encrypted_configs:
+            entry = entries.get(encrypted_config)
+            if entry is None:
+                entry = entries[encrypted_config] = self._entry(encrypted_config)
+            results.append(entry.config.model_copy())
+        return results
+
+    async def adecrypt_many(self, encrypted_configs: Iterable[bytes]) -> list[WebhookAuthConfig]:
+        """
+        Like :meth:`decrypt_many`, but decrypts in a worker thread.
+
+        Only the crypto runs off the event loop; the cache is updated on
+        the loop, so concurrent lookups never race with the bulk load.
+        """
+        items = list(encrypted_configs)
+        # Copy as we go: a later cache insert may evict (and scrub) an entry
+        configs: dict[bytes, WebhookAuthConfig] = {}
+        for encrypted_config in items:
+            cached = self._cache.get(ciphertext_digest(encrypted_config))
+            if cached is not None:
+                configs[encrypted_config] = cached.config.model_copy()
+        missing = [enc for enc in dict.fromkeys(items) if enc not in configs]
+        decrypted = await asyncio.to_thread(lambda: [self._decrypt(enc) for enc in missing])
+        for encrypted_config, entry in zip(missing, decrypted, strict=True):
+            configs[encrypted_config] = entry.config.model_copy()
+            self._cache.set(ciphertext_digest(encrypted_config), entry)
+        return [configs[enc].model_copy() for enc in items]
+
+    def invalidate(self, encrypted_config: bytes | None = None) -> None:
+        """
+        Forget cached credentials, e.g. after a profile's auth config changes.
+
+        Args:
+            encrypted_config: The old ciphertext, or None to clear everything
+        """
+        if encrypted_config is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(ciphertext_digest(encrypted_config))
+
+    def cache_stats(self) -> dict[str, int]:
+        """Hit/miss counters of the credential cache."""
+        return self._cache.stats()
+
+
+_manager: SecureWebhookManager | None = None
+
+
+def get_webhook_manager() -> SecureWebhookManager | None:
+    """
+    Return the process-wide credentials manager.
+
+    Returns:
+        The manager, or None when no ``WEBHOOK_CREDENTIALS_KEY`` is set.
+    """
+    global _manager
+    if _manager is None:
+        key = get_settings().webhook_credentials_key
+        if not key:
+            return None
+        _manager = SecureWebhookManager(key.encode())
+    return _manager
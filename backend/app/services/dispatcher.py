@@ -0,0 +1,587 @@
+"""
+Webhook dispatch queue with admission control.
+
+Chat messages are not sent inline: they are queued and executed by a
+bounded pool of workers. Concurrency is capped per profile and per n8n
+origin, profiles are served round-robin so a noisy profile cannot starve
+the others, and the queue sheds load with :class:`QueueFullError` (HTTP 429)
+instead of letting a burst pile up in memory. Pending jobs can optionally be
+persisted in Redis so they survive a worker restart; each persisted job is
+leased to one worker, and only jobs whose lease lapsed are recovered.
+
+When a workflow defers its answer to a callback (see
+:mod:`app.services.callbacks`), the job gives up its worker and concurrency
+slots as soon as n8n acknowledges, and completes when the callback arrives.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from app.config import get_settings
+from app.services.http_pool import origin_of
+from app.services.profiles import ProfileConfig, get_profile_cache
+from app.services.redis_backend import (
+    COMPARE_AND_DELETE,
+    COMPARE_AND_PEXPIRE,
+    get_redis,
+)
+from app.services.tracing import get_trace_exporter
+from app.services.webhook import (
+    WebhookClient,
+    WebhookMessage,
+    WebhookPayloadFormat,
+    WebhookResponse,
+    webhook_client_from_settings,
+)
+
+ClientResolver = Callable[[str, ProfileConfig | None], Awaitable[WebhookClient]]
+ResultHandler = Callable[["DispatchJob", WebhookResponse], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    """Raised when a job is rejected to shed load."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class DispatchLimits:
+    """Concurrency and queue-depth limits for a dispatcher."""
+    workers: int = 32
+    max_per_profile: int = 4
+    max_per_origin: int = 16
+    max_queue_depth: int = 1000
+    max_queue_per_profile: int = 100
+
+
+@dataclass
+class DispatchJob:
+    """A queued webhook call."""
+    profile_id: str
+    webhook_path: str
+    message: WebhookMessage
+    origin: str
+    job_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    enqueued_at: float = field(default_factory=time.monotonic)
+    client: WebhookClient | None = None
+    future: Optional["asyncio.Future[WebhookResponse]"] = None
+    # Resolved by the caller; not persisted, so recovered jobs look it up again
+    profile: ProfileConfig | None = None
+
+    def to_json(self) -> str:
+        """Serialise the durable part of the job."""
+        return json.dumps({
+            "job_id": self.job_id,
+            "profile_id": self.profile_id,
+            "webhook_path": self.webhook_path,
+            "origin": self.origin,
+            "message": self.message.model_dump(mode="json"),
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "DispatchJob":
+        """Rebuild a job persisted with :meth:`to_json`."""
+        raw = json.loads(data)
+        return cls(
+            job_id=raw["job_id"],
+            profile_id=raw["profile_id"],
+            webhook_path=raw["webhook_path"],
+            origin=raw["origin"],
+            message=WebhookMessage.model_validate(raw["message"]),
+        )
+
+
+class RedisJobStore:
+    """
+    Durable record of accepted-but-unfinished jobs in a Redis hash.
+
+    Jobs are written on submit and removed once they complete, giving
+    at-least-once delivery across restarts. Every worker shares the hash,
+    so each job is also leased (``SET NX PX``) to the worker that accepted
+    it; the owner keeps its leases alive with :meth:`renew`, and
+    :meth:`claim_expired` only hands out jobs whose owner stopped renewing.
+
+    Args:
+        redis: ``redis.asyncio.Redis``-compatible client
+        key: Hash holding the pending jobs
+        lease_seconds: How long a lease outlives its last renewal
+        owner: This worker's lease token (random by default)
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        key: str = "necta:dispatch:pending",
+        lease_seconds: float = 30.0,
+        owner: str | None = None,
+    ):
+        self.redis = redis
+        self.key = key
+        self.lease_ms = int(lease_seconds * 1000)
+        self.owner = owner or uuid.uuid4().hex
+        self._owned: set[str] = set()
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{self.key}:lease:{job_id}"
+
+    async def _claim(self, job_id: str) -> bool:
+        if await self.redis.set(self._lease_key(job_id), self.owner, px=self.lease_ms, nx=True):
+            self._owned.add(job_id)
+            return True
+        return False
+
+    async def save(self, job: DispatchJob) -> None:
+        """
+        Lease and persist a new job.
+
+        Raises:
+            RuntimeError: If another worker already holds the job's lease.
+        """
+        # Lease before publishing, so no other worker can claim it in between
+        if not await self._claim(job.job_id):
+            # Job ids are random, so this is a collision: keep the other job
+            raise RuntimeError(f"Job {job.job_id} is leased by another worker")
+        await self.redis.hset(self.key, job.job_id, job.to_json())
+
+    async def delete(self, job: DispatchJob) -> None:
+        await self.redis.hdel(self.key, job.job_id)
+        await self.release(job)
+
+    async def release(self, job: DispatchJob) -> None:
+        """Give up a job's lease, leaving it for another worker to claim."""
+        self._owned.discard(job.job_id)
+        await self.redis.eval(COMPARE_AND_DELETE, 1, self._lease_key(job.job_id), self.owner)
+
+    async def renew(self) -> None:
+        """Extend the lease of every job this worker holds."""
+        for job_id in list(self._owned):
+            renewed = await self.redis.eval(
+                COMPARE_AND_PEXPIRE, 1, self._lease_key(job_id), self.owner, self.lease_ms
+            )
+            if not renewed:
+                # Expired (and perhaps taken over) while this worker stalled
+                self._owned.discard(job_id)
+
+    async def claim_expired(self) -> list[DispatchJob]:
+        """Lease and return the pending jobs that no live worker holds."""
+        pending = await self.redis.hgetall(self.key)
+        claimed = []
+        for job_id, data in pending.items():
+            if job_id not in self._owned and await self._claim(job_id):
+                claimed.append(DispatchJob.from_json(data))
+        return claimed
+
+
+class WebhookDispatcher:
+    """
+    Bounded, fair worker pool for webhook calls.
+
+    Args:
+        resolver: Returns the WebhookClient for a profile id, given the
+            profile when the caller has already resolved it
+        limits: Concurrency and queue limits
+        store: Optional durable job store (see :class:`RedisJobStore`)
+        on_result: Called with the result of every job, including recovered
+            jobs that have no waiting caller
+    """
+
+    def __init__(
+        self,
+        resolver: ClientResolver,
+        limits: DispatchLimits | None = None,
+        store: RedisJobStore | None = None,
+        on_result: ResultHandler | None = None,
+    ):
+        self.resolver = resolver
+        self.limits = limits or DispatchLimits()
+        self.store = store
+        self.on_result = on_result
+        self.logger = logging.getLogger(__name__)
+
+        self._queues: dict[str, deque[DispatchJob]] = {}
+        self._rotation: deque[str] = deque()
+        self._depth = 0
+        self._in_flight_profile: dict[str, int] = {}
+        self._in_flight_origin: dict[str, int] = {}
+        self._cond = asyncio.Condition()
+        self._workers: list[asyncio.Task] = []
+        self._awaiting: dict[asyncio.Task, DispatchJob] = {}
+        # Jobs taken by a worker, by id
+        self._running: dict[str, DispatchJob] = {}
+        self._maintainer: asyncio.Task | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a worker."""
+        return self._depth
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs currently being executed."""
+        return sum(self._in_flight_profile.values())
+
+    def stats(self) -> dict[str, Any]:
+        """Queue occupancy for metrics and diagnostics."""
+        return {
+            "queued": self._depth,
+            "in_flight": self.in_flight,
+            "workers": len(self._workers),
+            "awaiting_callback": len(self._awaiting),
+            "queued_by_profile": {pid: len(q) for pid, q in self._queues.items()},
+        }
+
+    async def start(self) -> None:
+        """Start workers and take over jobs whose owner's lease expired."""
+        if self._workers:
+            return
+        if self.store is not None:
+            await self._recover()
+            self._maintainer = asyncio.create_task(self._maintain())
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.limits.workers)
+        ]
+
+    async def _recover(self) -> None:
+        for job in await self.store.claim_expired():
+            try:
+                await self._enqueue(job)
+            except QueueFullError:
+                self.logger.warning(f"Deferring recovered job {job.job_id}: queue full")
+                await self.store.release(job)
+
+    async def _maintain(self) -> None:
+        """Renew this worker's leases and recover jobs abandoned by others."""
+        interval = self.store.lease_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.store.renew()
+                await self._recover()
+            except Exception:
+                self.logger.exception("Dispatch lease maintenance failed")
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """
+        Stop the workers, first giving queued jobs ``drain_timeout`` seconds.
+
+        Jobs still queued or running afterwards, and jobs waiting for a
+        callback, stay in the durable store (if any) and their callers
+        receive ``asyncio.CancelledError``.
+        """
+        deadline = time.monotonic() + drain_timeout
+        while (self._depth or self.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            await asyncio.gather(self._maintainer, return_exceptions=True)
+            self._maintainer = None
+        # Taken before cancelling, as cancelled workers forget their jobs
+        abandoned = list(self._running.values())
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        abandoned.extend(job for queue in self._queues.values() for job in queue)
+        abandoned.extend(self._awaiting.values())
+        for task in self._awaiting:
+            task.cancel()
+        await asyncio.gather(*self._awaiting, return_exceptions=True)
+        self._awaiting.clear()
+        for job in abandoned:
+            if job.future is not None and not job.future.done():
+                job.future.cancel()
+            if self.store is not None:
+                # Hand the job to another worker now rather than at lease expiry
+                await self.store.release(job)
+        self._queues.clear()
+        self._rotation.clear()
+        self._depth = 0
+
+    async def submit(
+        self,
+        profile_id: str,
+        webhook_path: str,
+        message: WebhookMessage,
+        profile: ProfileConfig | None = None,
+    ) -> "asyncio.Future[WebhookResponse]":
+        """
+        Queue a message for delivery.
+
+        Args:
+            profile: The stored profile, if the caller has already looked
+                it up; it is handed to the resolver instead of a second lookup
+
+        Returns:
+            Future resolved with the WebhookResponse.
+
+        Raises:
+            QueueFullError: If the global or per-profile queue is full.
+            LookupError: If the resolver does not know the profile.
+        """
+        client = await self.resolver(profile_id, profile)
+        job = DispatchJob(
+            profile_id=profile_id,
+            webhook_path=webhook_path,
+            message=message,
+            origin=origin_of(client.base_url),
+            client=client,
+            future=asyncio.get_running_loop().create_future(),
+            profile=profile,
+        )
+        # Persist first so a fast worker cannot finish (and delete) it before
+        # it is saved
+        if self.store is not None:
+            await self.store.save(job)
+        try:
+            await self._enqueue(job)
+        except QueueFullError:
+            if self.store is not None:
+                await self.store.delete(job)
+            raise
+        return job.future
+
+    async def dispatch(
+        self, profile_id: str, webhook_path: str, message: WebhookMessage
+    ) -> WebhookResponse:
+        """Queue a message and wait for its response."""
+        future = await self.submit(profile_id, webhook_path, message)
+        # Shield so a disconnecting caller does not cancel the queued job
+        return await asyncio.shield(future)
+
+    async def _enqueue(self, job: DispatchJob) -> None:
+        async with self._cond:
+            if self._depth >= self.limits.max_queue_depth:
+                raise QueueFullError("Dispatch queue is full")
+            queue = self._queues.get(job.profile_id)
+            if queue is not None and len(queue) >= self.limits.max_queue_per_profile:
+                raise QueueFullError(f"Too many queued messages for profile {job.profile_id}")
+            if queue is None:
+                queue = self._queues[job.profile_id] = deque()
+                self._rotation.append(job.profile_id)
+            queue.append(job)
+            self._depth += 1
+            self._cond.notify()
+
+    def _pick(self) -> DispatchJob | None:
+        """Next runnable job, visiting profiles round-robin. Caller holds the lock."""
+        for _ in range(len(self._rotation)):
+            profile_id = self._rotation[0]
+            self._rotation.rotate(-1)
+            if self._in_flight_profile.get(profile_id, 0) >= self.limits.max_per_profile:
+                continue
+            queue = self._queues[profile_id]
+            job = queue[0]
+            if self._in_flight_origin.get(job.origin, 0) >= self.limits.max_per_origin:
+                continue
+            queue.popleft()
+            if not queue:
+                del self._queues[profile_id]
+                self._rotation.remove(profile_id)
+            self._depth -= 1
+            self._in_flight_profile[profile_id] = self._in_flight_profile.get(profile_id, 0) + 1
+            self._in_flight_origin[job.origin] = self._in_flight_origin.get(job.origin, 0) + 1
+            return job
+        return None
+
+    async def _release(self, job: DispatchJob) -> None:
+        async with self._cond:
+            self._in_flight_profile[job.profile_id] -= 1
+            if not self._in_flight_profile[job.profile_id]:
+                del self._in_flight_profile[job.profile_id]
+            self._in_flight_origin[job.origin] -= 1
+            if not self._in_flight_origin[job.origin]:
+                del self._in_flight_origin[job.origin]
+            self._cond.notify_all()
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._cond:
+                job = self._pick()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._pick()
+            self._running[job.job_id] = job
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Keep the worker: one failing job must not shrink the pool
+                self.logger.exception(f"Dispatch worker failed on job {job.job_id}")
+                self._fail(job, e)
+            finally:
+                self._running.pop(job.job_id, None)
+
+    async def _run(self, job: DispatchJob) -> None:
+        try:
+            response = await self._execute(job)
+        finally:
+            await self._release(job)
+        if response.metadata.get("deferred"):
+            task = asyncio.create_task(self._await_callback(job))
+            self._awaiting[task] = job
+            task.add_done_callback(lambda t: self._awaiting.pop(t, None))
+            return
+        await self._complete(job, response)
+
+    def _fail(self, job: DispatchJob, error: Exception) -> None:
+        """Answer a job's caller with ``error`` if it has no answer yet."""
+        if job.future is not None and not job.future.done():
+            job.future.set_result(WebhookResponse(
+                success=False, message_id=job.message.message_id, error=str(error)
+            ))
+
+    async def _await_callback(self, job: DispatchJob) -> None:
+        """Complete a job whose answer arrives on its callback URL."""
+        try:
+            response = await job.client.callbacks.wait(job.message.message_id)
+            await self._complete(job, response)
+        except Exception as e:
+            self.logger.exception(f"Waiting for the callback of job {job.job_id} failed")
+            self._fail(job, e)
+
+    async def _complete(self, job: DispatchJob, response: WebhookResponse) -> None:
+        if job.future is not None and not job.future.done():
+            job.future.set_result(response)
+        if self.store is not None:
+            try:
+                await self.store.delete(job)
+            except Exception:
+                # Left in the store: its lease lapses and the job is replayed
+                self.logger.exception(f"Could not remove finished job {job.job_id}")
+        if self.on_result is not None:
+            try:
+                await self.on_result(job, response)
+            except Exception:
+                self.logger.exception(f"Result handler failed for job {job.job_id}")
+
+    async def _execute(self, job: DispatchJob) -> WebhookResponse:
+        try:
+            if job.client is None:
+                job.client = await self.resolver(job.profile_id, job.profile)
+            # Files can only travel as multipart parts
+            payload_format = (
+                WebhookPayloadFormat.BINARY
+                if job.message.files or job.message.attachments
+                else WebhookPayloadFormat.JSON
+            )
+            return await job.client.send_message(
+                job.webhook_path, job.message, payload_format, await_callback=False
+            )
+        except Exception as e:
+            self.logger.exception(f"Dispatch of job {job.job_id} failed")
+            return WebhookResponse(
+                success=False, message_id=job.message.message_id, error=str(e)
+            )
+
+
+async def resolve_configured_client(
+    profile_id: str, profile: ProfileConfig | None = None
+) -> WebhookClient:
+    """
+    Default resolver: every profile uses the configured n8n instance.
+
+    Raises:
+        LookupError: When no n8n base URL is configured.
+    """
+    client = webhook_client_from_settings()
+    if client is None:
+        raise LookupError("n8n integration is not configured")
+    return client
+
+
+async def resolve_profile_client(
+    profile_id: str, profile: ProfileConfig | None = None
+) -> WebhookClient:
+    """
+    Default resolver: stored profiles use their own webhook.
+
+    Profiles come from the profile cache, so resolving needs no query in
+    the steady state. A stored profile's client is rooted at the webhook
+    URL of its current environment (prod replicas become routing
+    endpoints), so its jobs are submitted with an empty webhook path. Ids
+    that are not stored fall back to the configured n8n instance. A
+    ``profile`` passed by the caller is used as is.
+
+    Raises:
+        LookupError: When the profile is inactive, its credentials cannot
+            be decrypted, or no n8n base URL is configured.
+    """
+    if profile is None:
+        profile = await get_profile_cache().get(profile_id)
+    if profile is None:
+        return await resolve_configured_client(profile_id)
+    if not profile.is_active:
+        raise LookupError(f"Profile {profile_id} is not active")
+    auth_headers = None
+    if profile.webhook_auth_type != "none" and profile.webhook_auth_config:
+        # cryptography is only needed once a profile has credentials
+        from app.services.credentials import get_webhook_manager
+
+        manager = get_webhook_manager()
+        if manager is None:
+            raise LookupError(
+                f"Profile {profile_id} has webhook credentials but no WEBHOOK_CREDENTIALS_KEY is set"
+            )
+        auth_headers = manager.auth_headers(profile.webhook_auth_config)
+    return webhook_client_from_settings(
+        profile.webhook_url,
+        endpoints=list(profile.webhook_urls[1:]),
+        profile_id=profile.id,
+        environment=profile.environment,
+        auth_headers=auth_headers,
+    )
+
+
+async def trace_result(job: DispatchJob, response: WebhookResponse) -> None:
+    """Result handler that records each exchange with the trace exporter."""
+    exporter = get_trace_exporter()
+    if exporter is not None:
+        exporter.record_exchange(job.profile_id, job.webhook_path, job.message, response)
+
+
+_dispatcher: WebhookDispatcher | None = None
+
+
+def get_dispatcher() -> WebhookDispatcher:
+    """Return the process-wide dispatcher, creating it from settings on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        settings = get_settings()
+        redis = get_redis() if settings.dispatch_durable else None
+        _dispatcher = WebhookDispatcher(
+            resolver=resolve_profile_client,
+            limits=DispatchLimits(
+                workers=settings.dispatch_workers,
+                max_per_profile=settings.dispatch_max_per_profile,
+                max_per_origin=settings.dispatch_max_per_origin,
+                max_queue_depth=settings.dispatch_max_queue_depth,
+                max_queue_per_profile=settings.dispatch_max_queue_per_profile,
+            ),
+            store=(
+                RedisJobStore(redis, lease_seconds=settings.dispatch_lease_seconds)
+                if redis is not None else None
+            ),
+            on_result=trace_result if get_trace_exporter() is not None else None,
+        )
+    return _dispatcher
+
+
+def current_dispatcher() -> WebhookDispatcher | None:
+    """The process-wide dispatcher if the application has created it, else None."""
+    return _dispatcher
+
+
+async def close_dispatcher() -> None:
+    """Drain and stop the process-wide dispatcher."""
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
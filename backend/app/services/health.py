@@ -0,0 +1,198 @@
+"""
+Dependency probes for readiness and deep health checks.
+
+Probes run concurrently, each under its own timeout, and results are cached
+for a short TTL: however often load balancers poll ``/ready``, each
+dependency is probed at most once per TTL per worker, and concurrent polls
+share one in-flight probe. Webhooks are probed with ``OPTIONS`` so no agent
+run is triggered.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import get_settings
+from app.db import get_engine
+from app.services.cache import SingleFlight, TTLCache
+from app.services.http_pool import HttpClientRegistry, get_http_registry
+from app.services.redis_backend import get_redis
+from app.services.webhook import WebhookClient, webhook_client_from_settings
+
+# A probe returns an optional detail string and raises on failure
+Probe = Callable[[], Awaitable[str | None]]
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """Outcome of one probe."""
+    ok: bool
+    latency_ms: int
+    detail: str | None = None
+    critical: bool = True
+
+
+class HealthChecker:
+    """
+    Runs registered probes concurrently with caching.
+
+    Args:
+        ttl: Seconds a probe result is reused
+        timeout: Per-probe timeout in seconds
+        clock: Monotonic time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        ttl: float = 5.0,
+        timeout: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.timeout = timeout
+        self._probes: dict[str, Probe] = {}
+        self._critical: dict[str, bool] = {}
+        self._cache: TTLCache[ProbeResult] = TTLCache(max_entries=256, ttl=ttl, clock=clock)
+        self._in_flight: SingleFlight[ProbeResult] = SingleFlight()
+
+    def add(self, name: str, probe: Probe, critical: bool = True) -> None:
+        """
+        Register a probe.
+
+        Args:
+            name: Key in the check results
+            probe: Coroutine function; raising or timing out means unhealthy
+            critical: Whether a failure makes the service not ready
+        """
+        self._probes[name] = probe
+        self._critical[name] = critical
+
+    @property
+    def critical(self) -> Iterable[str]:
+        """Names of the probes that gate readiness."""
+        return [name for name, critical in self._critical.items() if critical]
+
+    async def check(self, names: Iterable[str] | None = None) -> dict[str, ProbeResult]:
+        """
+        Probe dependencies concurrently.
+
+        Args:
+            names: Probes to run (default: all)
+
+        Returns:
+            Results keyed by probe name.
+        """
+        names = list(self._probes if names is None else names)
+        results = await asyncio.gather(*(self._result(name) for name in names))
+        return dict(zip(names, results, strict=True))
+
+    async def _result(self, name: str) -> ProbeResult:
+        cached = self._cache.get(name)
+        if cached is not None:
+            return cached
+        return await self._in_flight.do(name, lambda: self._run(name))
+
+    async def _run(self, name: str) -> ProbeResult:
+        critical = self._critical[name]
+        start = time.monotonic()
+        try:
+            detail = await asyncio.wait_for(self._probes[name](), self.timeout)
+            ok = True
+        except TimeoutError:
+            ok, detail = False, f"Timed out after {self.timeout:g}s"
+        except Exception as e:
+            ok, detail = False, str(e) or type(e).__name__
+        result = ProbeResult(
+            ok=ok,
+            latency_ms=int((time.monotonic() - start) * 1000),
+            detail=detail,
+            critical=critical,
+        )
+        self._cache.set(name, result)
+        return result
+
+
+def database_probe(engine: Callable[[], AsyncEngine] = get_engine) -> Probe:
+    """Probe that runs ``SELECT 1`` on the engine returned by ``engine()``."""
+    async def probe() -> str | None:
+        async with engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return None
+    return probe
+
+
+def redis_probe(redis: Callable[[], Any] = get_redis) -> Probe:
+    """Probe that sends ``PING`` to the client returned by ``redis()``."""
+    async def probe() -> str | None:
+        client = redis()
+        if client is None:
+            return "not configured"
+        await client.ping()
+        return None
+    return probe
+
+
+def n8n_probe(
+    base_url: str, registry: Callable[[], HttpClientRegistry] = get_http_registry
+) -> Probe:
+    """Probe n8n's own ``/healthz`` endpoint."""
+    url = f"{base_url.rstrip('/')}/healthz"
+
+    async def probe() -> str | None:
+        response = await registry().get_client(url).get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return None
+    return probe
+
+
+def webhook_probe(
+    webhook_path: str,
+    client: Callable[[], WebhookClient | None] = webhook_client_from_settings,
+    timeout: float = 2.0,
+) -> Probe:
+    """Probe a webhook with ``OPTIONS``, which does not run the workflow."""
+    async def probe() -> str | None:
+        webhook_client = client()
+        if webhook_client is None:
+            return "not configured"
+        try:
+            result = await webhook_client.probe(webhook_path, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Request error: {str(e)}") from e
+        if not result["reachable"]:
+            raise RuntimeError(f"HTTP {result['status_code']}")
+        return None
+    return probe
+
+
+_checker: HealthChecker | None = None
+
+
+def get_health_checker() -> HealthChecker:
+    """
+    Return the process-wide checker with the configured probes.
+
+    The database and Redis (when configured) gate readiness; n8n and the
+    webhooks in ``HEALTH_WEBHOOK_PATHS`` are reported by the deep check
+    only, since chats fail gracefully while n8n is down.
+    """
+    global _checker
+    if _checker is None:
+        settings = get_settings()
+        timeout = settings.health_probe_timeout_seconds
+        checker = HealthChecker(ttl=settings.health_cache_ttl_seconds, timeout=timeout)
+        checker.add("database", database_probe())
+        if settings.redis_url:
+            checker.add("redis", redis_probe())
+        if settings.n8n_base_url:
+            checker.add("n8n", n8n_probe(settings.n8n_base_url), critical=False)
+            for path in settings.health_webhook_paths:
+                checker.add(f"webhook:{path}", webhook_probe(path, timeout=timeout), critical=False)
+        _checker = checker
+    return _checker
@@ -0,0 +1,89 @@
+"""
+Chat history queries with keyset pagination.
+
+Pages are addressed by an opaque cursor encoding the ``(created_at, id)``
+of the last message returned, not by an OFFSET. Each page is a range scan
+on ``ix_messages_profile_created``, so fetching page 1000 of a long
+conversation costs the same as fetching page 1.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Message
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    """A pagination cursor could not be decoded."""
+
+
+def encode_cursor(created_at: datetime, message_id: str) -> str:
+    """Opaque cursor for the position just after a message."""
+    raw = json.dumps([created_at.isoformat(), message_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Inverse of :func:`encode_cursor`.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(message_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from e
+
+
+@dataclass
+class MessagePage:
+    """One page of history, newest first."""
+    items: list[Message] = field(default_factory=list)
+    next_cursor: str | None = None
+
+
+async def list_messages(
+    session: AsyncSession,
+    profile_id: str,
+    limit: int = 50,
+    cursor: str | None = None,
+) -> MessagePage:
+    """
+    Load a page of a profile's messages, newest first.
+
+    Args:
+        session: Database session
+        profile_id: Conversation to read
+        limit: Page size (capped at ``MAX_PAGE_SIZE``)
+        cursor: ``next_cursor`` of the previous page, or None for the latest
+
+    Returns:
+        MessagePage whose ``next_cursor`` is None on the last page.
+
+    Raises:
+        InvalidCursorError: If ``cursor`` is malformed.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(Message).where(Message.profile_id == profile_id)
+    if cursor is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) < decode_cursor(cursor))
+    # One extra row tells us whether another page exists
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+
+    rows = list((await session.scalars(query)).all())
+    page = MessagePage(items=rows[:limit])
+    if len(rows) > limit:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor(last.created_at, last.id)
+    return page
+
@@ -0,0 +1,277 @@
+"""
+Shared outbound HTTP connection pools for n8n webhooks.
+
+Every profile talks to an n8n instance, and most profiles share a handful of
+instances. Instead of one ``httpx.AsyncClient`` per ``WebhookClient`` (one
+pool, one TLS handshake and one set of sockets per profile), clients are kept
+in a process-wide registry keyed by origin (scheme, host and port). A profile
+switch or a new chat then reuses warm keep-alive connections.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import get_settings
+
+# HTTP/2 needs the optional ``h2`` package (``httpx[http2]``)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def origin_of(url: str) -> str:
+    """
+    Normalise a URL to its origin.
+
+    Args:
+        url: Absolute URL (webhook URL or n8n base URL)
+
+    Returns:
+        ``scheme://host:port`` with the default port made explicit.
+
+    Raises:
+        ValueError: If the URL has no scheme or host.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if not scheme or not host:
+        raise ValueError(f"Not an absolute URL: {url!r}")
+    port = parts.port or _DEFAULT_PORTS.get(scheme)
+    if ":" in host:
+        host = f"[{host}]"
+    return f"{scheme}://{host}:{port}"
+
+
+@dataclass(frozen=True)
+class PoolLimits:
+    """Connection limits for a single origin's pool."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+
+
+@dataclass
+class _PooledClient:
+    client: httpx.AsyncClient
+    limits: PoolLimits
+    last_used: float
+
+
+class HttpClientRegistry:
+    """
+    Process-wide registry of pooled ``httpx.AsyncClient`` instances.
+
+    Clients are created lazily on first use of an origin and closed again
+    once they have been idle for ``idle_ttl`` seconds. Request timeouts are
+    per call, so a single pool can serve profiles with different timeouts.
+    """
+
+    def __init__(
+        self,
+        default_limits: PoolLimits | None = None,
+        timeout: float = 30.0,
+        idle_ttl: float = 300.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.default_limits = default_limits or PoolLimits()
+        self.timeout = timeout
+        self.idle_ttl = idle_ttl
+        self._transport = transport
+        self._origin_limits: dict[str, PoolLimits] = {}
+        self._clients: dict[str, _PooledClient] = {}
+        self._reaper: asyncio.Task | None = None
+        self.logger = logging.getLogger(__name__)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def configure_origin(self, url: str, limits: PoolLimits) -> None:
+        """
+        Override pool limits for one origin.
+
+        Takes effect for the next client created for that origin; an existing
+        pool keeps its limits until it is evicted.
+        """
+        self._origin_limits[origin_of(url)] = limits
+
+    def limits_for(self, url: str) -> PoolLimits:
+        """Return the limits that apply to the origin of ``url``."""
+        return self._origin_limits.get(origin_of(url), self.default_limits)
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """
+        Return the shared client for the origin of ``url``.
+
+        Args:
+            url: Any absolute URL on the target origin
+
+        Returns:
+            A pooled client; callers must not close it.
+        """
+        origin = origin_of(url)
+        pooled = self._clients.get(origin)
+        now = time.monotonic()
+        if pooled is None or pooled.client.is_closed:
+            pooled = _PooledClient(
+                client=self._build_client(origin),
+                limits=self.limits_for(origin),
+                last_used=now,
+            )
+            self._clients[origin] = pooled
+        pooled.last_used = now
+        return pooled.client
+
+    def _build_client(self, origin: str) -> httpx.AsyncClient:
+        limits = self.limits_for(origin)
+        if self._transport is not None:
+            return httpx.AsyncClient(transport=self._transport, timeout=self.timeout)
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=limits.max_connections,
+                max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry,
+            ),
+            http2=limits.http2 and HTTP2_AVAILABLE,
+        )
+
+    async def warm(self, urls: Iterable[str], timeout: float = 2.0) -> dict[str, bool]:
+        """
+        Open a connection to each origin ahead of the first real request.
+
+        A cheap ``HEAD`` on the origin root performs DNS, TCP and TLS setup
+        so that the first chat message finds a keep-alive connection. Failures
+        are logged and reported, never raised.
+
+        Returns:
+            Dict mapping each origin to whether the warm-up request succeeded.
+        """
+        origins = {origin_of(url) for url in urls}
+
+        async def _warm_one(origin: str) -> bool:
+            try:
+                await self.get_client(origin).head(origin + "/", timeout=timeout)
+                return True
+            except httpx.HTTPError as e:
+                self.logger.info(f"Connection warm-up failed for {origin}: {e}")
+                return False
+
+        results = await asyncio.gather(*(_warm_one(o) for o in origins))
+        return dict(zip(origins, results, strict=True))
+
+    async def evict_idle(self, now: float | None = None) -> int:
+        """
+        Close clients that have not been used for ``idle_ttl`` seconds.
+
+        Returns:
+            Number of clients closed.
+        """
+        now = time.monotonic() if now is None else now
+        expired = [
+            origin for origin, pooled in self._clients.items()
+            if now - pooled.last_used >= self.idle_ttl
+        ]
+        for origin in expired:
+            pooled = self._clients.pop(origin)
+            await pooled.client.aclose()
+        return len(expired)
+
+    def start(self, interval: float | None = None) -> None:
+        """Start the background task that evicts idle pools."""
+        if self._reaper is None or self._reaper.done():
+            period = interval if interval is not None else max(self.idle_ttl / 2, 1.0)
+            self._reaper = asyncio.create_task(self._reap_forever(period))
+
+    async def _reap_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                evicted = await self.evict_idle()
+                if evicted:
+                    self.logger.debug(f"Evicted {evicted} idle HTTP pool(s)")
+            except Exception:  # pragma: no cover - keep the reaper alive
+                self.logger.exception("Idle HTTP pool eviction failed")
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Per-origin pool information for diagnostics."""
+        now = time.monotonic()
+        return {
+            origin: {
+                "idle_seconds": now - pooled.last_used,
+                "max_connections": pooled.limits.max_connections,
+                "http2": float(pooled.limits.http2 and HTTP2_AVAILABLE),
+            }
+            for origin, pooled in self._clients.items()
+        }
+
+    def connection_counts(self) -> dict[str, dict[str, int]]:
+        """
+        Open connections per origin, split into active and idle.
+
+        Read from the httpcore pool behind each client; origins served by
+        a custom transport report nothing.
+        """
+        counts: dict[str, dict[str, int]] = {}
+        for origin, pooled in self._clients.items():
+            pool = getattr(getattr(pooled.client, "_transport", None), "_pool", None)
+            connections = getattr(pool, "connections", None)
+            if connections is None:
+                continue
+            idle = sum(1 for conn in connections if conn.is_idle())
+            counts[origin] = {"active": len(connections) - idle, "idle": idle}
+        return counts
+
+    async def aclose(self) -> None:
+        """Stop the reaper and close every pooled client."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(p.client.aclose() for p in clients.values()))
+
+
+_registry: HttpClientRegistry | None = None
+
+
+def get_http_registry() -> HttpClientRegistry:
+    """Return the process-wide registry, creating it from settings on first use."""
+    global _registry
+    if _registry is None:
+        settings = get_settings()
+        _registry = HttpClientRegistry(
+            default_limits=PoolLimits(
+                max_connections=settings.http_pool_max_connections,
+                max_keepalive_connections=settings.http_pool_max_keepalive,
+                keepalive_expiry=settings.http_pool_keepalive_expiry_seconds,
+                http2=settings.http2_enabled,
+            ),
+            timeout=settings.webhook_timeout,
+            idle_ttl=settings.http_pool_idle_ttl_seconds,
+        )
+    return _registry
+
+
+def current_http_registry() -> HttpClientRegistry | None:
+    """The process-wide registry if the application has created it, else None."""
+    return _registry
+
+
+async def close_http_registry() -> None:
+    """Close and discard the process-wide registry."""
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
@@ -0,0 +1,302 @@
+"""
+Write-behind persistence for chat messages.
+
+Committing every user message and agent reply on its own makes SQLite sync
+the WAL once per message, which caps throughput at the disk's sync rate.
+``MessageSink`` accepts rows without waiting and inserts them in multi-row
+transactions, flushing when ``max_batch`` rows are pending or
+``flush_interval`` seconds after the first one arrived, whichever is sooner.
+
+Reads that must see their own writes call :meth:`MessageSink.sync` first;
+it only flushes when the profile actually has unwritten rows. The FastAPI
+lifespan flushes everything on shutdown.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.db import get_sessionmaker
+from app.models import Message
+from app.models.base import new_id
+from app.services.webhook import WebhookResponse
+
+# (row, failed attempts)
+_Pending = tuple[dict[str, Any], int]
+
+
+class MessageSink:
+    """
+    Batching write-behind buffer for :class:`~app.models.Message` rows.
+
+    Args:
+        sessionmaker: Session factory for the target database
+        max_batch: Rows per transaction; reaching it flushes immediately
+        flush_interval: Longest time a row waits before being written
+        max_pending: Unwritten rows beyond which writers wait for a flush
+        max_attempts: Tries for a batch that fails with a transient error
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        max_batch: int = 256,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        max_attempts: int = 3,
+    ):
+        self.sessionmaker = sessionmaker
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+
+        self._pending: deque[_Pending] = deque()
+        # Rows not yet committed (queued or in a running flush), per profile
+        self._unflushed: dict[str, int] = {}
+        self._has_rows = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        """Rows accepted but not yet committed."""
+        return sum(self._unflushed.values())
+
+    def stats(self) -> dict[str, int]:
+        """Counters for metrics export."""
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and write everything still pending."""
+        if self._task is not None:
+            # Let a flush in progress finish rather than cancel it mid-write
+            self._closing = True
+            self._has_rows.set()
+            self._batch_full.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Each failed flush uses up an attempt, so this terminates
+        while self._pending:
+            await self.flush()
+
+    async def write(
+        self,
+        profile_id: str,
+        message_type: str,
+        content: str,
+        content_format: str = "markdown",
+        metadata: dict[str, Any] | None = None,
+        file_attachments: list[dict[str, Any]] | None = None,
+        message_id: str | None = None,
+        created_at: datetime | None = None,
+    ) -> str:
+        """
+        Queue a message for insertion.
+
+        The id and ``created_at`` are assigned now, so history order follows
+        arrival rather than flush time.
+
+        Returns:
+            The message id.
+        """
+        if self.pending >= self.max_pending:
+            # Backpressure: let the database catch up before accepting more
+            await self.flush()
+        now = created_at or datetime.utcnow()
+        row = {
+            "id": message_id or new_id(),
+            "profile_id": profile_id,
+            "message_type": message_type,
+            "content": content,
+            "content_format": content_format,
+            "message_metadata": metadata or {},
+            "file_attachments": file_attachments or [],
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._pending.append((row, 0))
+        self._unflushed[profile_id] = self._unflushed.get(profile_id, 0) + 1
+        self._has_rows.set()
+        if len(self._pending) >= self.max_batch:
+            self._batch_full.set()
+        return row["id"]
+
+    async def sync(self, profile_id: str | None = None) -> None:
+        """
+        Make earlier writes visible to reads.
+
+        Args:
+            profile_id: Only wait if this profile has unwritten rows; None
+                waits for every pending row
+        """
+        if profile_id is None and self.pending:
+            await self.flush()
+        elif self._unflushed.get(profile_id):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending rows now, ``max_batch`` per transaction."""
+        async with self._flush_lock:
+            # Rows re-queued by a failed batch wait for the next flush
+            remaining = len(self._pending)
+            while remaining and self._pending:
+                size = min(self.max_batch, remaining, len(self._pending))
+                batch = [self._pending.popleft() for _ in range(size)]
+                remaining -= size
+                await self._write_batch(batch)
+            self._batch_full.clear()
+            if not self._pending:
+                self._has_rows.clear()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            await self._has_rows.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                self.logger.exception("Message flush failed")
+
+    async def _write_batch(self, batch: list[_Pending]) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            try:
+                async with self.sessionmaker() as session:
+                    await session.execute(insert(Message), rows)
+                    await session.commit()
+            except IntegrityError:
+                # One bad row (e.g. an unknown profile) must not sink the others
+                await self._write_individually(batch)
+                return
+        except Exception as e:
+            # Database errors, and anything unexpected, must not kill the flusher
+            self._retry(batch, e)
+            return
+        except BaseException:
+            # Cancelled mid-write: keep the rows for the next flush
+            self._pending.extendleft(reversed(batch))
+            raise
+        self.batches += 1
+        self._done(rows, True)
+
+    async def _write_individually(self, batch: list[_Pending]) -> None:
+        written, rejected = [], []
+        async with self.sessionmaker() as session:
+            for row, _ in batch:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(Message), [row])
+                except IntegrityError as e:
+                    self.logger.error(f"Dropping message {row['id']}: {e.orig}")
+                    rejected.append(row)
+                else:
+                    written.append(row)
+            await session.commit()
+        # Only once committed, so a failed commit retries the whole batch
+        self._done(rejected, False)
+        self._done(written, True)
+        self.batches += 1
+
+    def _retry(self, batch: list[_Pending], error: Exception) -> None:
+        """Re-queue a failed batch, dropping rows out of attempts."""
+        retry = [(row, attempts + 1) for row, attempts in batch if attempts + 1 < self.max_attempts]
+        self.logger.warning(f"Message batch of {len(batch)} failed: {error}")
+        self._done([row for row, attempts in batch if attempts + 1 >= self.max_attempts], False)
+        # Back at the front so order is kept for the next flush
+        self._pending.extendleft(reversed(retry))
+
+    def _done(self, rows: list[dict[str, Any]], written: bool) -> None:
+        for row in rows:
+            profile_id = row["profile_id"]
+            self._unflushed[profile_id] -= 1
+            if not self._unflushed[profile_id]:
+                del self._unflushed[profile_id]
+        if written:
+            self.written += len(rows)
+        else:
+            self.dropped += len(rows)
+
+
+async def record_reply(sink: MessageSink, profile_id: str, response: WebhookResponse) -> str:
+    """
+    Persist an agent reply, or a system message describing the failure.
+
+    Returns:
+        The stored message's id.
+    """
+    metadata = {
+        key: value for key, value in {
+            "response_time_ms": response.processing_time_ms,
+            "webhook_attempts": response.metadata.get("webhook_attempts"),
+            "token_count": response.metadata.get("token_count"),
+            "cost_estimate": response.metadata.get("cost_estimate"),
+        }.items() if value is not None
+    }
+    if response.success:
+        return await sink.write(
+            profile_id, "agent", response.agent_response or "", response.response_format,
+            metadata=metadata,
+        )
+    else:
+        metadata["error_details"] = response.error
+        return await sink.write(
+            profile_id, "system", "The agent could not be reached.", "text", metadata=metadata
+        )
+
+
+_message_sink: MessageSink | None = None
+
+
+def get_message_sink() -> MessageSink:
+    """Return the process-wide message sink, creating it from settings."""
+    global _message_sink
+    if _message_sink is None:
+        settings = get_settings()
+        _message_sink = MessageSink(
+            get_sessionmaker(),
+            max_batch=settings.message_sink_max_batch,
+            flush_interval=settings.message_sink_flush_interval_seconds,
+            max_pending=settings.message_sink_max_pending,
+        )
+    return _message_sink
+
+
+def current_message_sink() -> MessageSink | None:
+    """The process-wide sink if the application has created it, else None."""
+    return _message_sink
+
+
+async def close_message_sink() -> None:
+    """Flush and stop the process-wide message sink."""
+    global _message_sink
+    if _message_sink is not None:
+        await _message_sink.close()
+        _message_sink = None
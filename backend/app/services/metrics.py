@@ -0,0 +1,258 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Hot-path instruments (counters and histograms) are plain Python objects
+updated without locks: a worker runs a single event loop, so updates never
+race, and each worker exposes its own series on ``/metrics`` (scrape every
+worker or sum across them). Recording is a dict lookup, a bisect and two
+additions.
+
+Histograms use fixed buckets, so p50/p95/p99 are available with
+``histogram_quantile()`` in Prometheus or :meth:`HistogramChild.quantile`
+locally. Occupancy gauges cost nothing on the hot path: they are collected
+from the components' ``stats()`` at scrape time.
+"""
+
+import abc
+import math
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass, field
+
+# Upper bounds in milliseconds; webhook calls range from cached (a few ms)
+# to long agent runs (the default timeout is 30s)
+LATENCY_BUCKETS_MS: tuple[float, ...] = (
+    5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000,
+)
+
+LabelValues = tuple[str, ...]
+
+
+@dataclass
+class MetricFamily:
+    """A metric and its samples, as rendered on ``/metrics``."""
+    name: str
+    kind: str
+    help: str
+    # (name suffix such as "_bucket", labels, value)
+    samples: list[tuple[str, dict[str, str], float]] = field(default_factory=list)
+
+    def add(self, value: float, suffix: str = "", **labels: str) -> "MetricFamily":
+        self.samples.append((suffix, labels, value))
+        return self
+
+
+Collector = Callable[[], Iterable[MetricFamily]]
+
+
+class CounterChild:
+    """One labelled series of a counter."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class HistogramChild:
+    """One labelled series of a histogram."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate a quantile by interpolating within its bucket.
+
+        Returns:
+            The estimate, or None before the first observation. Values in
+            the overflow bucket are reported as the largest bound.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.bounds):
+                    return float(self.bounds[-1])
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / count
+            seen += count
+        return float(self.bounds[-1])
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[LabelValues, object] = {}
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A new, empty series."""
+
+    def labels(self, *values: str):
+        """Return the series for ``values`` (in ``labelnames`` order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _labels_for(self, values: LabelValues) -> dict[str, str]:
+        return dict(zip(self.labelnames, values, strict=True))
+
+
+class Counter(_Metric):
+    """Monotonic count of events."""
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def collect(self) -> Iterable[MetricFamily]:
+        family = MetricFamily(self.name, self.kind, self.help)
+        for values, child in self._children.items():
+            family.add(child.value, **self._labels_for(values))
+        yield family
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS_MS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def collect(self) -> Iterable[MetricFamily]:
+        family = MetricFamily(self.name, self.kind, self.help)
+        for values, child in self._children.items():
+            labels = self._labels_for(values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts, strict=True):
+                cumulative += count
+                family.add(cumulative, "_bucket", **labels, le=_format(bound))
+            family.add(child.sum, "_sum", **labels)
+            family.add(child.count, "_count", **labels)
+        yield family
+
+
+class MetricsRegistry:
+    """Instruments and scrape-time collectors rendered together."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Collector] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS_MS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        """Register a function called on every scrape for gauge-like metrics."""
+        self._collectors.append(collector)
+
+    def collect(self) -> Iterable[MetricFamily]:
+        for metric in self._metrics.values():
+            yield from metric.collect()
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self) -> str:
+        """The registry in Prometheus text format (version 0.0.4)."""
+        lines: list[str] = []
+        for family in self.collect():
+            lines.append(f"# HELP {family.name} {_escape_help(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for suffix, labels, value in family.samples:
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape_label(str(value))}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+WEBHOOK_LATENCY = REGISTRY.histogram(
+    "necta_webhook_latency_ms",
+    "Latency of webhook HTTP attempts in milliseconds",
+    ("profile", "environment", "outcome"),
+)
+WEBHOOK_RETRIES = REGISTRY.counter(
+    "necta_webhook_retries_total",
+    "Webhook attempts retried after a failure",
+    ("profile", "environment"),
+)
+WEBHOOK_TIMEOUTS = REGISTRY.counter(
+    "necta_webhook_timeouts_total",
+    "Webhook attempts that timed out",
+    ("profile", "environment"),
+)
+WEBHOOK_HEDGES = REGISTRY.counter(
+    "necta_webhook_hedges_total",
+    "Slow webhook attempts raced against a second endpoint",
+    ("profile", "environment"),
+)
@@ -0,0 +1,260 @@
+"""
+Read-through cache of profile configuration.
+
+Every chat message resolves its profile (environment, webhook URLs, auth,
+context budget). :class:`ProfileCache` keeps an immutable
+:class:`ProfileConfig` per profile in each worker, so in the steady state
+a send does not touch the database:
+
+* lookups are served from a bounded LRU; concurrent misses for the same
+  profile share one query
+* unknown profile ids are cached too (for a shorter time), so a client
+  sending to a missing profile cannot turn every request into a query;
+  ids that are not UUIDs (such as ``default``) never reach the database
+* each entry carries the row's ``version``, which the ORM bumps on every
+  UPDATE
+
+A worker that changes a profile announces ``(id, version)`` on the broker
+(Redis pub/sub when Redis is configured), and every worker drops entries
+older than that version, so a dev/prod toggle applies everywhere within
+milliseconds. A load that was in flight when the notification arrived is
+returned to its callers but not cached, since it may have read the old
+row. The TTL only bounds staleness if a notification is lost.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.db import get_sessionmaker
+from app.models.profile import Profile
+from app.services.broker import InMemoryBroker, Subscription, get_broker
+from app.services.cache import SingleFlight, TTLCache
+
+PROFILE_CHANNEL = "necta:profiles:changed"
+
+
+@dataclass(frozen=True)
+class ProfileConfig:
+    """The parts of a profile needed to send a message."""
+    id: str
+    name: str
+    environment: str
+    webhook_urls: tuple[str, ...]
+    webhook_auth_type: str
+    webhook_auth_config: bytes | None
+    context_max_tokens: int | None
+    is_active: bool
+    version: int
+
+    @classmethod
+    def from_model(cls, profile: Profile) -> "ProfileConfig":
+        return cls(
+            id=profile.id,
+            name=profile.name,
+            environment=profile.environment,
+            webhook_urls=tuple(profile.webhook_urls),
+            webhook_auth_type=profile.webhook_auth_type,
+            webhook_auth_config=profile.webhook_auth_config,
+            context_max_tokens=profile.context_max_tokens,
+            is_active=profile.is_active,
+            version=profile.version,
+        )
+
+    @property
+    def webhook_url(self) -> str:
+        """Primary webhook URL for the current environment."""
+        return self.webhook_urls[0]
+
+
+def canonical_profile_id(value: str) -> str | None:
+    """
+    The id a stored profile would have for ``value``.
+
+    Profile ids are UUIDs stored in lower case; a UUID in upper or mixed
+    case names the same profile.
+
+    Returns:
+        The lower-case id, or None if ``value`` is not a hyphenated UUID
+        (so no stored profile has it).
+    """
+    try:
+        canonical = str(uuid.UUID(value))
+    except ValueError:
+        return None
+    return canonical if canonical == value.lower() else None
+
+
+class _Missing:
+    """Cached marker for a profile id that does not exist."""
+
+
+_MISSING = _Missing()
+
+
+class ProfileCache:
+    """
+    Per-worker profile cache, kept coherent over the broker.
+
+    Args:
+        sessionmaker: Session factory used on a miss
+        broker: Pub/sub broker carrying change notifications
+        max_entries: Profiles kept before the least recently used is evicted
+        ttl: Seconds a profile is cached
+        negative_ttl: Seconds an unknown profile id is cached
+        clock: Monotonic time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        broker: InMemoryBroker,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        negative_ttl: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.sessionmaker = sessionmaker
+        self.broker = broker
+        self.negative_ttl = negative_ttl
+        self.logger = logging.getLogger(__name__)
+        self._entries: TTLCache[ProfileConfig | _Missing] = TTLCache(
+            max_entries=max_entries, ttl=ttl, clock=clock
+        )
+        self._flight: SingleFlight[ProfileConfig | None] = SingleFlight()
+        # Loads in flight, with the number of changes seen while they ran
+        self._loading: dict[str, int] = {}
+        self._subscription: Subscription | None = None
+        self._relay: asyncio.Task | None = None
+        self.loads = 0
+        self.invalidations = 0
+
+    async def get(self, profile_id: str) -> ProfileConfig | None:
+        """
+        Return a profile's configuration.
+
+        The id may be given in any case (see :func:`canonical_profile_id`).
+
+        Returns:
+            The configuration, or None if there is no such profile.
+        """
+        key = canonical_profile_id(profile_id)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return await self._flight.do(key, lambda: self._load(key))
+        return None if entry is _MISSING else entry
+
+    async def _load(self, profile_id: str) -> ProfileConfig | None:
+        self._loading[profile_id] = 0
+        try:
+            async with self.sessionmaker() as session:
+                profile = await session.get(Profile, profile_id)
+                config = None if profile is None else ProfileConfig.from_model(profile)
+        finally:
+            changed = self._loading.pop(profile_id)
+        self.loads += 1
+        if not changed:
+            if config is None:
+                self._entries.set(profile_id, _MISSING, ttl=self.negative_ttl)
+            else:
+                self._entries.set(profile_id, config)
+        return config
+
+    def _apply(self, profile_id: str, version: int | None) -> None:
+        """Drop what this worker knows about a profile older than ``version``."""
+        if profile_id in self._loading:
+            self._loading[profile_id] += 1
+        entry = self._entries.peek(profile_id)
+        if isinstance(entry, ProfileConfig) and version is not None and entry.version >= version:
+            return
+        if self._entries.invalidate(profile_id):
+            self.invalidations += 1
+
+    async def updated(self, profile: Profile) -> None:
+        """
+        Announce a created or updated profile; call after committing.
+
+        This worker caches the new configuration right away; the others
+        drop their older copy and reload it on next use.
+        """
+        config = ProfileConfig.from_model(profile)
+        self._apply(config.id, config.version)
+        self._entries.set(config.id, config)
+        await self.broker.publish(PROFILE_CHANNEL, {"id": config.id, "version": config.version})
+
+    async def deleted(self, profile_id: str) -> None:
+        """Announce a deleted profile; call after committing."""
+        self._apply(profile_id, None)
+        await self.broker.publish(PROFILE_CHANNEL, {"id": profile_id, "version": None})
+
+    async def start(self) -> None:
+        """Follow change notifications from other workers."""
+        if self._subscription is not None:
+            return
+        self._subscription = await self.broker.subscribe(PROFILE_CHANNEL)
+        self._relay = asyncio.create_task(self._relay_loop(self._subscription))
+
+    async def _relay_loop(self, subscription: Subscription) -> None:
+        async for payload in subscription:
+            try:
+                version = payload["version"]
+                self._apply(str(payload["id"]), None if version is None else int(version))
+            except (KeyError, TypeError, ValueError):
+                self.logger.warning("Ignoring malformed profile notification")
+
+    async def close(self) -> None:
+        """Stop following change notifications."""
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+        if self._subscription is not None:
+            await self._subscription.close()
+            self._subscription = None
+
+    def stats(self) -> dict[str, int]:
+        """Cache counters, for metrics export."""
+        return {
+            **self._entries.stats(),
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+        }
+
+
+_profile_cache: ProfileCache | None = None
+
+
+def get_profile_cache() -> ProfileCache:
+    """Return the process-wide profile cache."""
+    global _profile_cache
+    if _profile_cache is None:
+        settings = get_settings()
+        _profile_cache = ProfileCache(
+            get_sessionmaker(),
+            get_broker(),
+            max_entries=settings.profile_cache_max_entries,
+            ttl=settings.profile_cache_ttl_seconds,
+            negative_ttl=settings.profile_cache_negative_ttl_seconds,
+        )
+    return _profile_cache
+
+
+def current_profile_cache() -> ProfileCache | None:
+    """The process-wide cache if the application has created it, else None."""
+    return _profile_cache
+
+
+async def close_profile_cache() -> None:
+    """Stop the process-wide cache's notification relay."""
+    global _profile_cache
+    if _profile_cache is not None:
+        await _profile_cache.close()
+        _profile_cache = None
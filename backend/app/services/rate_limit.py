@@ -0,0 +1,303 @@
+"""
+Adaptive rate limiting for outbound webhook calls.
+
+Self-hosted n8n instances degrade sharply once they run more executions than
+they can handle, and answer with 429/503. Each n8n origin and each profile
+gets its own request rate, tuned by AIMD (additive increase, multiplicative
+decrease) like TCP congestion control:
+
+- every healthy answer raises the rate by about ``increase`` requests/s per
+  second of traffic;
+- a 429/503/504, a timeout or an answer slower than ``latency_target`` cuts the
+  rate by ``decrease``, at most once per ``cooldown`` so one overload episode
+  is not punished once per in-flight request.
+
+The rate converges on the highest throughput n8n sustains. Callers over the
+rate wait in line (up to a deadline) instead of failing.
+
+Locally the limit is a GCRA token bucket. With Redis, workers share it:
+admissions are counted in one-second windows under ``necta:ratelimit:*`` and
+the adapted rate is published so every worker follows the same value. While
+Redis is unreachable each worker falls back to its local bucket.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import get_settings
+from app.services.http_pool import origin_of
+from app.services.redis_backend import get_redis
+
+KEY_PREFIX = "necta:ratelimit:"
+
+# HTTP statuses that mean "slow down"
+OVERLOAD_STATUSES = frozenset({429, 503, 504})
+
+
+@dataclass
+class AdaptiveLimit:
+    """Rate and bucket state for one key."""
+    rate: float
+    tat: float = 0.0            # GCRA theoretical arrival time
+    last_decrease: float = float("-inf")
+    synced_at: float = float("-inf")
+    published_at: float = float("-inf")
+    waits: int = 0
+    rejected: int = 0
+    decreases: int = 0
+
+
+class AdaptiveRateLimiter:
+    """
+    AIMD-tuned token buckets keyed by origin and profile.
+
+    Args:
+        initial_rate: Starting requests/second for a new key
+        min_rate: Floor for the adapted rate
+        max_rate: Ceiling for the adapted rate
+        burst: Requests allowed back to back before pacing starts
+        increase: Additive increase, in requests/s per second at full rate
+        decrease: Multiplicative decrease factor on overload
+        latency_target: Answers slower than this many seconds count as
+            overload (None disables the latency signal)
+        cooldown: Minimum seconds between two decreases of one key
+        redis: Optional Redis client to share limits across workers
+        sync_interval: Seconds between reads of the shared rate
+        clock: Monotonic time source (injectable for tests)
+        wall_clock: Epoch time source for the shared windows
+        sleep: Coroutine used to wait (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 10.0,
+        min_rate: float = 1.0,
+        max_rate: float = 100.0,
+        burst: int = 10,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: float | None = None,
+        cooldown: float = 1.0,
+        redis: Any | None = None,
+        sync_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self._limits: dict[str, AdaptiveLimit] = {}
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def keys(url: str, profile_id: str | None = None) -> list[str]:
+        """Limiter keys for a webhook call: the profile (if any), then the origin."""
+        keys = [f"origin:{origin_of(url)}"]
+        if profile_id:
+            keys.insert(0, f"profile:{profile_id}")
+        return keys
+
+    def limit(self, key: str) -> AdaptiveLimit:
+        """Return the state for ``key``, creating it on first use."""
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = AdaptiveLimit(rate=self.initial_rate)
+        return limit
+
+    def rate(self, key: str) -> float:
+        """Current rate for ``key`` in requests/second."""
+        return self.limit(key).rate
+
+    async def acquire(self, keys: Iterable[str], timeout: float) -> bool:
+        """
+        Wait for a slot under every key.
+
+        Args:
+            keys: Limiter keys, from :meth:`keys`
+            timeout: Longest total wait in seconds
+
+        Returns:
+            True once admitted; False if a slot would not free up in time.
+            Keys admitted before a rejection keep their slot used.
+        """
+        deadline = self.clock() + max(0.0, timeout)
+        for key in keys:
+            if self.redis is not None:
+                admitted = await self._acquire_shared(key, deadline)
+            else:
+                admitted = await self._acquire_local(key, deadline)
+            if not admitted:
+                self.limit(key).rejected += 1
+                return False
+        return True
+
+    async def _acquire_local(self, key: str, deadline: float) -> bool:
+        limit = self.limit(key)
+        now = self.clock()
+        interval = 1 / limit.rate
+        tolerance = (self.burst - 1) * interval
+        tat = max(limit.tat, now)
+        wait = tat - tolerance - now
+        if wait > 0 and now + wait > deadline:
+            return False
+        # Reserve before sleeping so waiters are served in arrival order
+        limit.tat = tat + interval
+        if wait > 0:
+            limit.waits += 1
+            await self.sleep(wait)
+        return True
+
+    async def _acquire_shared(self, key: str, deadline: float) -> bool:
+        limit = self.limit(key)
+        await self._sync(key, limit)
+        waited = False
+        while True:
+            now = self.wall_clock()
+            window = int(now)
+            counter = f"{KEY_PREFIX}{key}:{window}"
+            try:
+                count = await self.redis.incr(counter)
+                if count == 1:
+                    await self.redis.expire(counter, 2)
+            except Exception as e:
+                self.logger.warning(
+                    f"Shared rate limit for {key} unavailable, limiting locally: {str(e)}"
+                )
+                return await self._acquire_local(key, deadline)
+            if count <= max(1, math.floor(limit.rate)):
+                return True
+            wait = window + 1 - now
+            if self.clock() + wait > deadline:
+                return False
+            if not waited:
+                limit.waits += 1
+                waited = True
+            await self.sleep(wait)
+
+    async def record(
+        self,
+        keys: Iterable[str],
+        status_code: int | None = None,
+        latency: float | None = None,
+        timed_out: bool = False,
+    ) -> None:
+        """
+        Adapt the rates of ``keys`` to the outcome of one call.
+
+        Args:
+            keys: Limiter keys the call was admitted under
+            status_code: HTTP status, or None if no answer arrived
+            latency: Seconds until the answer
+            timed_out: Whether the call timed out
+        """
+        overloaded = timed_out or status_code in OVERLOAD_STATUSES or (
+            self.latency_target is not None
+            and latency is not None
+            and latency > self.latency_target
+        )
+        if not overloaded and (status_code is None or status_code >= 500):
+            return  # Connection errors and failures are the breaker's business
+
+        now = self.clock()
+        for key in keys:
+            limit = self.limit(key)
+            if overloaded:
+                if now - limit.last_decrease < self.cooldown:
+                    continue
+                limit.rate = max(self.min_rate, limit.rate * self.decrease)
+                limit.last_decrease = now
+                limit.decreases += 1
+                self.logger.info(f"Rate limit for {key} decreased to {limit.rate:.2f}/s")
+                await self._publish(key, limit, force=True)
+            else:
+                limit.rate = min(self.max_rate, limit.rate + self.increase / limit.rate)
+                await self._publish(key, limit)
+
+    async def _sync(self, key: str, limit: AdaptiveLimit) -> None:
+        """Adopt the shared rate, at most once per ``sync_interval``."""
+        now = self.clock()
+        if now - limit.synced_at < self.sync_interval:
+            return
+        limit.synced_at = now
+        try:
+            shared = await self.redis.get(f"{KEY_PREFIX}{key}:rate")
+        except Exception as e:
+            self.logger.warning(f"Could not read shared rate for {key}: {str(e)}")
+            return
+        if shared is not None:
+            limit.rate = min(self.max_rate, max(self.min_rate, float(shared)))
+
+    async def _publish(self, key: str, limit: AdaptiveLimit, force: bool = False) -> None:
+        """Share the rate; increases are published at most once per ``sync_interval``."""
+        if self.redis is None:
+            return
+        now = self.clock()
+        if not force and now - limit.published_at < self.sync_interval:
+            return
+        limit.published_at = now
+        try:
+            await self.redis.set(f"{KEY_PREFIX}{key}:rate", f"{limit.rate:.4f}", ex=3600)
+        except Exception as e:
+            self.logger.warning(f"Could not publish rate for {key}: {str(e)}")
+
+    def stats(self) -> dict[str, dict[str, float | int]]:
+        """Rate and counters per key, for metrics export."""
+        return {
+            key: {
+                "rate": limit.rate,
+                "waits": limit.waits,
+                "rejected": limit.rejected,
+                "decreases": limit.decreases,
+            }
+            for key, limit in self._limits.items()
+        }
+
+
+_limiter: AdaptiveRateLimiter | None = None
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter | None:
+    """
+    Return the process-wide limiter, or None if ``RATE_LIMIT_ENABLED`` is off.
+
+    The limiter shares state through Redis when ``REDIS_URL`` is set.
+    """
+    global _limiter
+    settings = get_settings()
+    if _limiter is None and settings.rate_limit_enabled:
+        _limiter = AdaptiveRateLimiter(
+            initial_rate=settings.rate_limit_initial_rps,
+            min_rate=settings.rate_limit_min_rps,
+            max_rate=settings.rate_limit_max_rps,
+            burst=settings.rate_limit_burst,
+            latency_target=settings.rate_limit_latency_target_seconds,
+            redis=get_redis(),
+        )
+    return _limiter
+
+
+def current_rate_limiter() -> AdaptiveRateLimiter | None:
+    """The process-wide limiter if the application has created it, else None."""
+    return _limiter
+
+
+def close_rate_limiter() -> None:
+    """Discard the process-wide limiter (it holds the Redis client)."""
+    global _limiter
+    _limiter = None
@@ -0,0 +1,242 @@
+"""
+WebSocket connection registry and event fan-out.
+
+Events for a user (agent replies, typing indicators) are published to the
+user's broker channel, and every worker holding a connection for that user
+forwards them. A worker subscribes once per connected user, not once per
+connection.
+
+Connections are cheap to hold: each has a small bounded outbox and one
+writer task. The server pings every ``heartbeat_interval`` seconds and a
+reaper closes connections that have sent nothing for ``idle_timeout``
+seconds, so abandoned tabs do not accumulate.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+from app.config import get_settings
+from app.services.broker import InMemoryBroker, Subscription, get_broker
+
+# Close code sent to connections reaped for inactivity
+IDLE_CLOSE_CODE = 4000
+
+
+def user_channel(user_id: str) -> str:
+    """Broker channel carrying events for one user."""
+    return f"necta:user:{user_id}"
+
+
+class Socket(Protocol):
+    """The subset of ``starlette.websockets.WebSocket`` the manager uses."""
+
+    async def send_json(self, data: Any) -> None: ...
+
+    async def close(self, code: int = 1000) -> None: ...
+
+
+@dataclass(eq=False)
+class Connection:
+    """One client connection held by this worker."""
+    user_id: str
+    socket: Socket
+    connection_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    last_seen: float = field(default_factory=time.monotonic)
+    outbox: "asyncio.Queue[dict[str, Any]]" = field(default_factory=lambda: asyncio.Queue(64))
+    dropped: int = 0
+    writer: asyncio.Task | None = None
+
+    def enqueue(self, event: dict[str, Any]) -> None:
+        """Queue an event, dropping the oldest if the client is not reading."""
+        if self.outbox.full():
+            self.outbox.get_nowait()
+            self.dropped += 1
+        self.outbox.put_nowait(event)
+
+
+class ConnectionManager:
+    """
+    Tracks this worker's WebSocket connections and relays broker events.
+
+    Args:
+        broker: Pub/sub broker shared with the other workers
+        heartbeat_interval: Seconds between server pings
+        idle_timeout: Seconds without client traffic before a connection is closed
+        clock: Monotonic time source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        broker: InMemoryBroker,
+        heartbeat_interval: float = 25.0,
+        idle_timeout: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.broker = broker
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+        self._connections: dict[str, set[Connection]] = {}
+        self._relays: dict[str, asyncio.Task] = {}
+        # None while the first connection of the user is still subscribing
+        self._subscriptions: dict[str, Subscription | None] = {}
+        self._heartbeat: asyncio.Task | None = None
+        self.reaped = 0
+
+    def __len__(self) -> int:
+        return sum(len(conns) for conns in self._connections.values())
+
+    def stats(self) -> dict[str, int]:
+        """Connection counts for metrics export."""
+        return {
+            "connections": len(self),
+            "users": len(self._connections),
+            "reaped": self.reaped,
+        }
+
+    def start(self) -> None:
+        """Start the heartbeat and idle reaper."""
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self) -> None:
+        """Close every connection and stop background tasks."""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        for conns in list(self._connections.values()):
+            for conn in list(conns):
+                await self.disconnect(conn, code=1001)
+
+    async def connect(self, user_id: str, socket: Socket) -> Connection:
+        """
+        Register an accepted socket and start relaying the user's events.
+
+        Returns:
+            The connection, to pass to :meth:`touch` and :meth:`disconnect`.
+        """
+        conn = Connection(user_id=user_id, socket=socket, last_seen=self.clock())
+        conn.writer = asyncio.create_task(self._write(conn))
+        conns = self._connections.setdefault(user_id, set())
+        conns.add(conn)
+        if user_id in self._subscriptions:
+            return conn
+        # Reserve before awaiting, so a concurrent connect does not subscribe too
+        self._subscriptions[user_id] = None
+        try:
+            subscription = await self.broker.subscribe(user_channel(user_id))
+        except BaseException:
+            if user_id in self._subscriptions and self._subscriptions[user_id] is None:
+                del self._subscriptions[user_id]
+            await self.disconnect(conn)
+            raise
+        if user_id in self._subscriptions and self._subscriptions[user_id] is None:
+            self._subscriptions[user_id] = subscription
+            self._relays[user_id] = asyncio.create_task(self._relay(user_id, subscription))
+        else:
+            # Every connection left meanwhile (and maybe another connect
+            # reserved again): this subscription is not needed
+            await subscription.close()
+        return conn
+
+    async def disconnect(self, conn: Connection, code: int = 1000) -> None:
+        """Forget a connection, closing the socket if it is still open."""
+        conns = self._connections.get(conn.user_id)
+        if conns is None or conn not in conns:
+            return
+        conns.discard(conn)
+        if conn.writer is not None:
+            conn.writer.cancel()
+        try:
+            await conn.socket.close(code=code)
+        except Exception as e:
+            # Usually already closed by the client
+            self.logger.debug(f"Closing WebSocket failed: {str(e)}")
+        if not conns:
+            del self._connections[conn.user_id]
+            relay = self._relays.pop(conn.user_id, None)
+            if relay is not None:
+                relay.cancel()
+            # None if the subscribing connect has not finished; it closes its own
+            subscription = self._subscriptions.pop(conn.user_id, None)
+            if subscription is not None:
+                await subscription.close()
+
+    def touch(self, conn: Connection) -> None:
+        """Record client activity (any inbound frame counts)."""
+        conn.last_seen = self.clock()
+
+    async def publish(self, user_id: str, event: dict[str, Any]) -> None:
+        """Send an event to every connection of ``user_id`` on every worker."""
+        await self.broker.publish(user_channel(user_id), event)
+
+    async def _relay(self, user_id: str, subscription: Subscription) -> None:
+        async for event in subscription:
+            exclude = event.get("exclude_connection")
+            for conn in list(self._connections.get(user_id, ())):
+                if conn.connection_id != exclude:
+                    conn.enqueue(event)
+
+    async def _write(self, conn: Connection) -> None:
+        while True:
+            event = await conn.outbox.get()
+            event = {k: v for k, v in event.items() if k != "exclude_connection"}
+            try:
+                await conn.socket.send_json(event)
+            except Exception:
+                self.logger.debug(f"Dropping connection {conn.connection_id}: send failed")
+                asyncio.create_task(self.disconnect(conn))
+                return
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self.sweep()
+
+    async def sweep(self) -> None:
+        """Ping live connections and close idle ones."""
+        now = self.clock()
+        for conns in list(self._connections.values()):
+            for conn in list(conns):
+                if now - conn.last_seen >= self.idle_timeout:
+                    self.reaped += 1
+                    await self.disconnect(conn, code=IDLE_CLOSE_CODE)
+                else:
+                    conn.enqueue({"type": "ping"})
+
+
+_manager: ConnectionManager | None = None
+
+
+def get_connection_manager() -> ConnectionManager:
+    """Return the process-wide connection manager."""
+    global _manager
+    if _manager is None:
+        settings = get_settings()
+        _manager = ConnectionManager(
+            get_broker(),
+            heartbeat_interval=settings.ws_heartbeat_interval_seconds,
+            idle_timeout=settings.ws_idle_timeout_seconds,
+        )
+    return _manager
+
+
+def current_connection_manager() -> ConnectionManager | None:
+    """The process-wide manager if the application has created it, else None."""
+    return _manager
+
+
+async def close_connection_manager() -> None:
+    """Close all connections held by this worker."""
+    global _manager
+    if _manager is not None:
+        await _manager.close()
+        _manager = None
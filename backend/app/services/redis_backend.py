@@ -0,0 +1,184 @@
+"""
+Redis access for cross-worker state.
+
+Redis is optional: ``create_redis`` returns None when no ``REDIS_URL`` is
+configured or the ``redis`` package is not installed, and callers fall back
+to process-local state. ``InMemoryRedis`` implements the subset of the
+``redis.asyncio.Redis`` API that NECTA uses, for tests and single-process
+development.
+"""
+
+import logging
+import time
+from typing import Any
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+Value = str | bytes | int | float
+
+
+def create_redis(url: str | None) -> Any | None:
+    """
+    Connect to Redis if configured.
+
+    Args:
+        url: Redis URL, e.g. ``redis://:password@redis:6379/0``
+
+    Returns:
+        A ``redis.asyncio.Redis`` client with string responses, or None.
+    """
+    if not url:
+        return None
+    try:
+        import redis.asyncio as redis_asyncio
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed")
+        return None
+    return redis_asyncio.from_url(url, decode_responses=True)
+
+
+_redis: Any | None = None
+
+
+def get_redis() -> Any | None:
+    """Return the process-wide Redis client, or None if Redis is not configured."""
+    global _redis
+    if _redis is None:
+        _redis = create_redis(get_settings().redis_url)
+    return _redis
+
+
+async def close_redis() -> None:
+    """Close the process-wide Redis client."""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+# Lease operations: act on a key only while it still holds this owner's
+# token, atomically, so an expired lease taken by another owner is left alone
+COMPARE_AND_DELETE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+COMPARE_AND_PEXPIRE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class InMemoryRedis:
+    """
+    Process-local stand-in for ``redis.asyncio.Redis``.
+
+    Values are stored as strings, like a client created with
+    ``decode_responses=True``.
+    """
+
+    def __init__(self):
+        self._data: dict[str, Any] = {}
+        self._expiry: dict[str, float] = {}
+
+    def _expire_if_due(self, key: str) -> None:
+        expires_at = self._expiry.get(key)
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+
+    async def get(self, key: str) -> str | None:
+        self._expire_if_due(key)
+        value = self._data.get(key)
+        return value if isinstance(value, str) or value is None else None
+
+    async def set(
+        self,
+        key: str,
+        value: Value,
+        ex: float | None = None,
+        px: int | None = None,
+        nx: bool = False,
+    ) -> bool | None:
+        self._expire_if_due(key)
+        if nx and key in self._data:
+            return None
+        self._data[key] = str(value)
+        if px is not None:
+            ex = px / 1000
+        if ex is not None:
+            self._expiry[key] = time.monotonic() + ex
+        else:
+            self._expiry.pop(key, None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            self._expire_if_due(key)
+            if self._data.pop(key, None) is not None:
+                removed += 1
+            self._expiry.pop(key, None)
+        return removed
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        self._expire_if_due(key)
+        value = int(self._data.get(key, 0)) + amount
+        self._data[key] = str(value)
+        return value
+
+    async def expire(self, key: str, seconds: float) -> bool:
+        self._expire_if_due(key)
+        if key not in self._data:
+            return False
+        self._expiry[key] = time.monotonic() + seconds
+        return True
+
+    async def pexpire(self, key: str, milliseconds: int) -> bool:
+        return await self.expire(key, milliseconds / 1000)
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: Value) -> int:
+        """Run one of the scripts above (arbitrary Lua is not supported)."""
+        keys, args = keys_and_args[:numkeys], [str(arg) for arg in keys_and_args[numkeys:]]
+        if script == COMPARE_AND_DELETE:
+            if await self.get(keys[0]) == args[0]:
+                return await self.delete(keys[0])
+            return 0
+        if script == COMPARE_AND_PEXPIRE:
+            if await self.get(keys[0]) == args[0]:
+                return int(await self.pexpire(keys[0], int(args[1])))
+            return 0
+        raise NotImplementedError("InMemoryRedis only runs NECTA's own scripts")
+
+    async def hset(self, name: str, key: str, value: Value) -> int:
+        self._expire_if_due(name)
+        bucket = self._data.setdefault(name, {})
+        created = key not in bucket
+        bucket[key] = str(value)
+        return int(created)
+
+    async def hget(self, name: str, key: str) -> str | None:
+        self._expire_if_due(name)
+        return self._data.get(name, {}).get(key)
+
+    async def hdel(self, name: str, *keys: str) -> int:
+        bucket = self._data.get(name, {})
+        removed = sum(1 for key in keys if bucket.pop(key, None) is not None)
+        if name in self._data and not bucket:
+            del self._data[name]
+        return removed
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        self._expire_if_due(name)
+        return dict(self._data.get(name, {}))
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self) -> None:
+        """Match the client API; nothing to release."""
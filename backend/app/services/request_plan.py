@@ -0,0 +1,232 @@
+"""
+Precompiled webhook request plans.
+
+Everything about a webhook request that does not depend on the message -
+the resolved URL, the auth and content headers - is computed once per
+(webhook, payload format) and frozen into a :class:`RequestPlan`. Per message
+only the body is serialised, straight to bytes, and handed to httpx as
+``content=`` so nothing is encoded twice.
+
+Clients are built per message, so :func:`cached_plan` keeps plans
+process-wide, keyed on everything that goes into them. Cached plans hold no
+credentials: the client's auth headers, which come from the TTL'd
+credential cache, are passed to :meth:`RequestPlan.build` per request.
+"""
+
+import functools
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode, urljoin
+
+from pydantic import TypeAdapter
+
+from app.services.uploads import MultipartUpload, resolve_attachments
+from app.services.webhook_models import WebhookMessage, WebhookPayloadFormat
+
+HeaderList = tuple[tuple[bytes, bytes], ...]
+
+_MESSAGE_JSON = TypeAdapter(WebhookMessage)
+# Stored file paths are NECTA-internal; the files themselves go as parts
+_NOT_SENT = {"files"}
+
+# RAW_BODY sends only the message content; these carry the rest
+MESSAGE_ID_HEADER = "X-NECTA-Message-Id"
+USER_ID_HEADER = "X-NECTA-User-Id"
+FORMAT_HEADER = "X-NECTA-Format"
+
+_RAW_CONTENT_TYPES = {
+    "text": "text/plain; charset=utf-8",
+    "markdown": "text/markdown; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+}
+
+_CONTENT_TYPES = {
+    WebhookPayloadFormat.JSON: "application/json",
+    WebhookPayloadFormat.FORM_DATA: "application/x-www-form-urlencoded",
+}
+
+
+def _freeze(headers: Mapping[str, str]) -> HeaderList:
+    return tuple((k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items())
+
+
+def _message_json(message: WebhookMessage) -> bytes:
+    return _MESSAGE_JSON.dump_json(message, exclude=_NOT_SENT)
+
+
+def freeze_auth_headers(auth_headers: Mapping[str, str]) -> HeaderList:
+    """Auth headers in the form :meth:`RequestPlan.build` adds them."""
+    return _freeze({k: v for k, v in auth_headers.items() if k.lower() != "content-type"})
+
+
+def form_encode(message: WebhookMessage) -> bytes:
+    """
+    URL-encode a message for n8n's form-data webhooks.
+
+    Lists become repeated fields and nested objects JSON strings, so n8n
+    receives every value losslessly.
+    """
+    fields: list[tuple[str, str]] = []
+    for key, value in message.model_dump(mode="json", exclude=_NOT_SENT).items():
+        if isinstance(value, list):
+            fields.extend((key, str(item)) for item in value)
+        elif isinstance(value, dict):
+            fields.append((key, json.dumps(value, separators=(",", ":"))))
+        else:
+            fields.append((key, "" if value is None else str(value)))
+    return urlencode(fields).encode("ascii")
+
+
+@dataclass(frozen=True)
+class RequestPlan:
+    """
+    Message-independent part of a webhook request.
+
+    Attributes:
+        url: Fully resolved webhook URL
+        payload_format: Body encoding used by :meth:`build`
+        headers: Frozen header bytes, including Content-Type where fixed
+        upload_dir: Root that BINARY attachments are resolved against
+    """
+    url: str
+    payload_format: WebhookPayloadFormat
+    headers: HeaderList
+    upload_dir: Path | None = None
+
+    async def build(
+        self, message: WebhookMessage, auth_headers: HeaderList = ()
+    ) -> dict[str, Any]:
+        """
+        Serialise a message into ``client.post`` keyword arguments.
+
+        Args:
+            message: Message to send
+            auth_headers: Per-request headers from :func:`freeze_auth_headers`
+
+        Returns:
+            Dict with ``headers`` and ``content``: bytes, or for BINARY a
+            re-iterable :class:`~app.services.uploads.MultipartUpload`.
+
+        Raises:
+            AttachmentError: If BINARY attachments are invalid.
+        """
+        fmt = self.payload_format
+        headers = auth_headers + self.headers
+        if fmt == WebhookPayloadFormat.JSON:
+            return {"headers": headers, "content": _message_json(message)}
+        if fmt == WebhookPayloadFormat.FORM_DATA:
+            return {"headers": headers, "content": form_encode(message)}
+        if fmt == WebhookPayloadFormat.RAW_BODY:
+            content_type = _RAW_CONTENT_TYPES.get(message.format, "text/plain; charset=utf-8")
+            headers += _freeze({
+                "Content-Type": content_type,
+                MESSAGE_ID_HEADER: message.message_id,
+                USER_ID_HEADER: message.user_id,
+                FORMAT_HEADER: message.format,
+            })
+            return {"headers": headers, "content": message.content.encode("utf-8")}
+        return await self._build_multipart(message, headers)
+
+    async def _build_multipart(
+        self, message: WebhookMessage, headers: HeaderList
+    ) -> dict[str, Any]:
+        """
+        Streaming multipart body: the message as JSON plus one part per
+        attachment, which n8n exposes as binary properties ``file0``...
+
+        ``attachments`` are sent under their own names and ``files`` under
+        their ``filename``.
+        """
+        upload = MultipartUpload(
+            {"message": _message_json(message).decode()},
+            resolve_attachments(
+                self.upload_dir or Path("."),
+                [*message.attachments, *(f.path for f in message.files)],
+            ),
+            filenames=[
+                *(Path(a).name for a in message.attachments),
+                *(f.filename for f in message.files),
+            ],
+        )
+        headers += _freeze({"Content-Type": upload.content_type})
+        return {"headers": headers, "content": upload}
+
+
+def compile_plan(
+    base_url: str,
+    webhook_path: str,
+    auth_headers: Mapping[str, str],
+    payload_format: WebhookPayloadFormat = WebhookPayloadFormat.JSON,
+    extra_headers: Mapping[str, str] | None = None,
+    upload_dir: Path | None = None,
+) -> RequestPlan:
+    """
+    Compile the request plan for one webhook and payload format.
+
+    Args:
+        base_url: n8n base URL
+        webhook_path: Webhook endpoint path
+        auth_headers: Headers from ``build_auth_headers``, frozen into the
+            plan; pass ``{}`` for a plan that may be shared or cached
+        payload_format: Body encoding
+        extra_headers: Additional fixed headers (e.g. ``Accept``)
+        upload_dir: Root for BINARY attachments
+    """
+    headers = {k: v for k, v in auth_headers.items() if k.lower() != "content-type"}
+    content_type = _CONTENT_TYPES.get(payload_format)
+    if content_type is not None:
+        headers["Content-Type"] = content_type
+    headers.update(extra_headers or {})
+    return RequestPlan(
+        url=urljoin(base_url, webhook_path),
+        payload_format=payload_format,
+        headers=_freeze(headers),
+        upload_dir=upload_dir,
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_plan(
+    base_url: str,
+    webhook_path: str,
+    payload_format: WebhookPayloadFormat,
+    extra_headers: tuple[tuple[str, str], ...],
+    upload_dir: Path | None,
+) -> RequestPlan:
+    return compile_plan(
+        base_url,
+        webhook_path,
+        {},
+        payload_format,
+        extra_headers=dict(extra_headers),
+        upload_dir=upload_dir,
+    )
+
+
+def cached_plan(
+    base_url: str,
+    webhook_path: str,
+    payload_format: WebhookPayloadFormat = WebhookPayloadFormat.JSON,
+    extra_headers: Mapping[str, str] | None = None,
+    upload_dir: Path | None = None,
+) -> RequestPlan:
+    """
+    Like :func:`compile_plan` without auth, but shared by every client in
+    the process.
+
+    Two clients with the same base URL and upload root get the same plan
+    object, so sending with a freshly built client costs no compile. The
+    plan never sees credentials, so nothing secret outlives the credential
+    cache here; auth headers go to :meth:`RequestPlan.build`.
+    """
+    return _cached_plan(
+        base_url,
+        webhook_path,
+        payload_format,
+        tuple((extra_headers or {}).items()),
+        upload_dir,
+    )
@@ -0,0 +1,227 @@
+"""
+Retry policy and circuit breakers for outbound webhook calls.
+
+Retries use exponential backoff with full jitter inside a total deadline
+budget, and only for failures that are safe and worth retrying. A circuit
+breaker per webhook stops a failing n8n workflow from being hammered: once
+it trips, calls fail fast until a probe request succeeds.
+"""
+
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from enum import StrEnum
+
+import httpx
+
+from app.config import get_settings
+
+# Transport errors raised before the request reached n8n; retrying them
+# cannot execute a workflow twice.
+RETRIABLE_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Backoff and budget settings for one logical request.
+
+    Attributes:
+        max_retries: Retries after the first attempt
+        base_delay: Backoff ceiling for the first retry, in seconds
+        max_delay: Upper bound for any single backoff
+        multiplier: Growth factor of the backoff ceiling per retry
+        deadline: Total time budget across all attempts, in seconds
+        retry_statuses: HTTP statuses that are worth retrying
+        respect_retry_after: Honour ``Retry-After`` on 429/503 responses
+    """
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    multiplier: float = 2.0
+    deadline: float | None = 45.0
+    retry_statuses: frozenset[int] = frozenset({429, 502, 503, 504})
+    respect_retry_after: bool = True
+
+    def backoff(self, retry: int) -> float:
+        """
+        Full-jitter backoff before retry number ``retry`` (0-based).
+
+        Returns:
+            A delay drawn uniformly from ``[0, min(max_delay, base * mult**retry)]``.
+        """
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** retry))
+        return random.uniform(0, ceiling)  # noqa: S311 - jitter, not crypto
+
+    def should_retry_status(self, status_code: int) -> bool:
+        """Whether a response status is retriable under this policy."""
+        return status_code in self.retry_statuses
+
+    def should_retry_exception(self, exc: Exception) -> bool:
+        """Whether a transport error is safe to retry."""
+        return isinstance(exc, RETRIABLE_EXCEPTIONS)
+
+    def delay_for(self, retry: int, response: httpx.Response | None = None) -> float:
+        """
+        Delay before the next attempt, honouring ``Retry-After`` when present.
+        """
+        delay = self.backoff(retry)
+        if response is not None and self.respect_retry_after:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a ``Retry-After`` header (delta-seconds or HTTP-date).
+
+    Returns:
+        Seconds to wait, or None when the header is missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+
+
+class CircuitState(StrEnum):
+    """Circuit breaker states."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for a single webhook.
+
+    CLOSED passes every call. After ``failure_threshold`` consecutive
+    failures it goes OPEN and rejects calls for ``recovery_timeout`` seconds,
+    then HALF_OPEN lets ``half_open_max_calls`` probes through: a success
+    closes the circuit, a failure opens it again.
+    """
+    failure_threshold: int = 5
+    recovery_timeout: float = 30.0
+    half_open_max_calls: int = 1
+    clock: Callable[[], float] = time.monotonic
+    consecutive_failures: int = 0
+    trips: int = 0
+    _state: CircuitState = CircuitState.CLOSED
+    _opened_at: float = 0.0
+    _half_open_calls: int = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state, moving OPEN to HALF_OPEN once the timeout elapsed."""
+        if (
+            self._state == CircuitState.OPEN
+            and self.clock() - self._opened_at >= self.recovery_timeout
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Reserve a call slot; False means fail fast."""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """
+        Give back a slot from :meth:`allow_request` whose call recorded no
+        outcome (it was cancelled, abandoned or crashed), so a half-open
+        circuit is not left with every probe slot taken.
+        """
+        if self._state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """Record a healthy response and close the circuit."""
+        self.consecutive_failures = 0
+        self._state = CircuitState.CLOSED
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """Record a failed call, tripping the breaker when warranted."""
+        self.consecutive_failures += 1
+        if self._state == CircuitState.HALF_OPEN or (
+            self._state == CircuitState.CLOSED
+            and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._state = CircuitState.OPEN
+            self._opened_at = self.clock()
+            self.trips += 1
+
+    def snapshot(self) -> dict[str, str | int]:
+        """State summary for metrics and diagnostics."""
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+        }
+
+
+@dataclass
+class CircuitBreakerRegistry:
+    """Circuit breakers keyed by webhook URL, sharing one configuration."""
+    failure_threshold: int = 5
+    recovery_timeout: float = 30.0
+    half_open_max_calls: int = 1
+    clock: Callable[[], float] = time.monotonic
+    _breakers: dict[str, CircuitBreaker] = field(default_factory=dict)
+
+    def get(self, key: str) -> CircuitBreaker:
+        """Return the breaker for ``key``, creating it on first use."""
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=self.failure_threshold,
+                recovery_timeout=self.recovery_timeout,
+                half_open_max_calls=self.half_open_max_calls,
+                clock=self.clock,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    def states(self) -> dict[str, dict[str, str | int]]:
+        """Snapshot of every breaker, for metrics export."""
+        return {key: breaker.snapshot() for key, breaker in self._breakers.items()}
+
+
+_breakers: CircuitBreakerRegistry | None = None
+
+
+def get_breaker_registry() -> CircuitBreakerRegistry:
+    """Return the process-wide circuit breaker registry."""
+    global _breakers
+    if _breakers is None:
+        settings = get_settings()
+        _breakers = CircuitBreakerRegistry(
+            failure_threshold=settings.circuit_failure_threshold,
+            recovery_timeout=settings.circuit_recovery_seconds,
+        )
+    return _breakers
+
+
+def current_breaker_registry() -> CircuitBreakerRegistry | None:
+    """The process-wide registry if the application has created it, else None."""
+    return _breakers
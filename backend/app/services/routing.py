@@ -0,0 +1,206 @@
+"""
+Latency-aware routing across equivalent n8n endpoints, with hedging.
+
+Production profiles may list several n8n workers that serve the same
+webhooks. :class:`EndpointSelector` spreads calls across them with the
+power of two choices: sample two healthy endpoints and take the one with the
+lower expected cost, ``EWMA latency x (in-flight + 1)``. This tracks slow or
+busy workers within a few calls without the herding of always picking the
+single fastest one. Endpoints that have not answered yet cost nothing, so
+each is tried early.
+
+Hedging trims the tail further: if an answer has not arrived after the
+recent p95 latency, a second attempt goes to another endpoint and the first
+answer wins. The delay keeps the extra load to roughly 5% of calls. Since
+both attempts may run the workflow, hedging is opt-in and meant for agents
+without side effects.
+"""
+
+import math
+import random
+from collections import deque
+from collections.abc import Callable, Collection, Sequence
+from dataclasses import dataclass
+
+from app.config import get_settings
+
+
+@dataclass
+class EndpointStats:
+    """Latency and load estimate for one endpoint."""
+    ewma: float | None = None    # seconds
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+
+    def cost(self) -> float:
+        return (self.ewma or 0.0) * (self.in_flight + 1)
+
+
+class EndpointSelector:
+    """
+    Picks among equivalent endpoints and derives the hedging delay.
+
+    Args:
+        endpoints: Equivalent endpoint URLs
+        alpha: EWMA weight of the newest latency sample
+        failure_penalty: Latency in seconds recorded for a failed call
+        hedge_quantile: Latency quantile after which a call is hedged
+        min_hedge_delay: Lower bound for the hedging delay, in seconds
+        min_samples: Samples needed before hedging starts
+        rng: Random source (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[str],
+        alpha: float = 0.3,
+        failure_penalty: float = 5.0,
+        hedge_quantile: float = 0.95,
+        min_hedge_delay: float = 0.05,
+        min_samples: int = 20,
+        rng: random.Random | None = None,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self._rng = rng or random.Random()  # noqa: S311 - load spreading, not security
+        self._stats: dict[str, EndpointStats] = {url: EndpointStats() for url in self.endpoints}
+        self._latencies: deque[float] = deque(maxlen=512)
+        self._hedge_delay: float | None = None
+        self._new_samples = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def pick(
+        self,
+        exclude: Collection[str] = (),
+        healthy: Callable[[str], bool] | None = None,
+    ) -> str | None:
+        """
+        Choose an endpoint by the power of two choices.
+
+        Args:
+            exclude: Endpoints not to use (e.g. the one that just failed)
+            healthy: Predicate excluding endpoints (e.g. with an open circuit)
+
+        Returns:
+            An endpoint URL. Unhealthy endpoints are used only when no other
+            is left; None only if every endpoint is excluded.
+        """
+        candidates = [url for url in self.endpoints if url not in exclude]
+        if healthy is not None:
+            candidates = [url for url in candidates if healthy(url)] or candidates
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        first, second = self._rng.sample(candidates, 2)
+        return first if self._stats[first].cost() <= self._stats[second].cost() else second
+
+    def begin(self, url: str) -> None:
+        """Count a call to ``url`` as in flight."""
+        stats = self._stats[url]
+        stats.in_flight += 1
+        stats.requests += 1
+
+    def end(self, url: str, latency: float | None, ok: bool = True) -> None:
+        """
+        Record a finished call.
+
+        Args:
+            url: Endpoint called
+            latency: Seconds until the answer, or None if the call was
+                cancelled (it then only stops counting as in flight)
+            ok: Whether the endpoint answered usefully
+        """
+        stats = self._stats[url]
+        stats.in_flight = max(0, stats.in_flight - 1)
+        if latency is None:
+            return
+        if not ok:
+            stats.failures += 1
+            latency = max(latency, self.failure_penalty)
+        else:
+            self._latencies.append(latency)
+            self._new_samples += 1
+        stats.ewma = latency if stats.ewma is None else (
+            self.alpha * latency + (1 - self.alpha) * stats.ewma
+        )
+
+    def hedge_delay(self) -> float | None:
+        """
+        Seconds to wait before hedging, or None while there is too little data.
+
+        The quantile is recomputed after every 16 new samples.
+        """
+        if len(self._latencies) < self.min_samples:
+            return None
+        if self._hedge_delay is None or self._new_samples >= 16:
+            ordered = sorted(self._latencies)
+            rank = max(0, math.ceil(self.hedge_quantile * len(ordered)) - 1)
+            self._hedge_delay = max(self.min_hedge_delay, ordered[rank])
+            self._new_samples = 0
+        return self._hedge_delay
+
+    def stats(self) -> dict[str, int | dict[str, dict[str, float | None]]]:
+        """Per-endpoint estimates and hedging counters, for metrics export."""
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": {
+                url: {
+                    "ewma_ms": None if s.ewma is None else s.ewma * 1000,
+                    "in_flight": s.in_flight,
+                    "requests": s.requests,
+                    "failures": s.failures,
+                }
+                for url, s in self._stats.items()
+            },
+        }
+
+
+class SelectorRegistry:
+    """
+    Selectors keyed by endpoint list.
+
+    Webhook clients are short-lived, so the latency estimates live here and
+    are shared by every client calling the same endpoints.
+    """
+
+    def __init__(self, **selector_options):
+        self.selector_options = selector_options
+        self._selectors: dict[tuple[str, ...], EndpointSelector] = {}
+
+    def get(self, endpoints: Sequence[str]) -> EndpointSelector:
+        """Return the selector for ``endpoints``, creating it on first use."""
+        key = tuple(endpoints)
+        selector = self._selectors.get(key)
+        if selector is None:
+            selector = self._selectors[key] = EndpointSelector(key, **self.selector_options)
+        return selector
+
+    def stats(self) -> dict[str, dict]:
+        """Stats of every selector, keyed by its first endpoint."""
+        return {key[0]: selector.stats() for key, selector in self._selectors.items()}
+
+
+_selectors: SelectorRegistry | None = None
+
+
+def get_selector_registry() -> SelectorRegistry:
+    """Return the process-wide selector registry."""
+    global _selectors
+    if _selectors is None:
+        _selectors = SelectorRegistry(
+            min_hedge_delay=get_settings().hedge_min_delay_seconds
+        )
+    return _selectors
+
+
+def current_selector_registry() -> SelectorRegistry | None:
+    """The process-wide registry if the application has created it, else None."""
+    return _selectors
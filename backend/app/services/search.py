@@ -0,0 +1,184 @@
+"""
+Ranked full-text search over chat history.
+
+Searches go through the SQLite FTS5 index ``messages_fts`` (see
+:mod:`app.models.message`) instead of a ``LIKE '%term%'`` scan, so their
+cost follows the number of matching messages rather than the size of the
+table. Within a conversation, the profile is part of the MATCH, so only
+that conversation's matches are scored. Ranking and paging happen on the
+index alone; message rows are read for the returned page only (unless a
+type or date filter needs them).
+
+Results are ranked by BM25 and paged with an opaque cursor on the rank and
+the index rowid: like history pages, each page is a keyset continuation,
+not an OFFSET. Ranks move slightly as messages are added, so a page
+fetched much later may skip or repeat a result at its edge.
+
+Query syntax is deliberately small and never passed to FTS5 verbatim:
+
+* words must all match (``invoice march``)
+* ``"double quotes"`` match a phrase
+* a trailing ``*`` matches a prefix (``inv*``)
+"""
+import base64
+import binascii
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import column, func, literal_column, select, table, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Message
+from app.models.message import SEARCH_TABLE
+from app.services.history import MAX_PAGE_SIZE, InvalidCursorError
+
+MAX_QUERY_TERMS = 16
+
+_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+class InvalidSearchQueryError(ValueError):
+    """A search query has nothing to search for."""
+
+
+class SearchUnavailableError(RuntimeError):
+    """The database has no full-text index (only SQLite is supported)."""
+
+
+def build_match(query: str, profile_id: str | None = None) -> str:
+    """
+    Translate a user query into an FTS5 MATCH expression.
+
+    Every term becomes a quoted phrase, so FTS5 operators and column
+    filters typed by users are matched as text, not interpreted. Terms only
+    match message content; ``profile_id`` narrows the match to one
+    conversation inside the index.
+
+    Raises:
+        InvalidSearchQueryError: If the query contains no words.
+    """
+    phrases = []
+    for match in _TERM.finditer(query):
+        quoted, bare = match.groups()
+        words = _WORD.findall(quoted if quoted is not None else bare)
+        if not words:
+            continue
+        phrase = '"' + " ".join(words) + '"'
+        if bare is not None and bare.endswith("*"):
+            phrase += "*"
+        phrases.append(phrase)
+    if not phrases:
+        raise InvalidSearchQueryError(f"Nothing to search for in {query!r}")
+    match = "content : (" + " ".join(phrases[:MAX_QUERY_TERMS]) + ")"
+    if profile_id is not None:
+        # Indexed without hyphens (see app.models.message.SEARCH_SOURCE)
+        token = " ".join(_WORD.findall(profile_id.replace("-", "")))
+        match += f' AND profile_id : "{token}"'
+    return match
+
+
+def encode_cursor(rank: float, rowid: int) -> str:
+    """Opaque cursor for the position just after a result."""
+    raw = json.dumps([rank, rowid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Inverse of :func:`encode_cursor`.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, rowid = json.loads(base64.urlsafe_b64decode(padded))
+        return float(rank), int(rowid)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from e
+
+
+@dataclass
+class SearchHit:
+    """A matching message and its relevance (higher is better)."""
+    message: Message
+    score: float
+
+
+@dataclass
+class SearchPage:
+    """One page of search results, best match first."""
+    items: list[SearchHit] = field(default_factory=list)
+    next_cursor: str | None = None
+
+
+async def search_messages(
+    session: AsyncSession,
+    query: str,
+    profile_id: str | None = None,
+    message_type: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = 20,
+    cursor: str | None = None,
+) -> SearchPage:
+    """
+    Find messages matching ``query``, best match first.
+
+    Args:
+        session: Database session
+        query: Search terms (see the module docstring for the syntax)
+        profile_id: Only search this conversation
+        message_type: Only return ``user``, ``agent`` or ``system`` messages
+        since: Only messages created at or after this time
+        until: Only messages created before this time
+        limit: Page size (capped at ``MAX_PAGE_SIZE``)
+        cursor: ``next_cursor`` of the previous page, or None for the first
+
+    Returns:
+        SearchPage whose ``next_cursor`` is None on the last page.
+
+    Raises:
+        InvalidSearchQueryError: If the query contains no words.
+        InvalidCursorError: If ``cursor`` is malformed.
+        SearchUnavailableError: If the database is not SQLite.
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        raise SearchUnavailableError("Full-text search requires SQLite FTS5")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    index = table(SEARCH_TABLE, column("rowid"))
+    message_rowid = literal_column("messages.rowid")
+    # BM25 is negative, lower for better matches; profile_id does not count
+    rank = func.bm25(literal_column(SEARCH_TABLE), 1.0, 0.0)
+
+    matches = select(index.c.rowid, rank.label("rank")).where(
+        literal_column(SEARCH_TABLE).op("MATCH")(build_match(query, profile_id))
+    )
+    filters = []
+    if message_type is not None:
+        filters.append(Message.message_type == message_type)
+    if since is not None:
+        filters.append(Message.created_at >= since)
+    if until is not None:
+        filters.append(Message.created_at < until)
+    if filters:
+        matches = matches.join(Message, message_rowid == index.c.rowid).where(*filters)
+    if cursor is not None:
+        matches = matches.where(tuple_(rank, index.c.rowid) > decode_cursor(cursor))
+    # One extra row tells us whether another page exists
+    matches = matches.order_by(rank, index.c.rowid).limit(limit + 1).subquery()
+
+    statement = (
+        select(Message, matches.c.rank, matches.c.rowid)
+        .join(matches, message_rowid == matches.c.rowid)
+        .order_by(matches.c.rank, matches.c.rowid)
+    )
+    rows = (await session.execute(statement)).all()
+    page = SearchPage(items=[SearchHit(message, -value) for message, value, _ in rows[:limit]])
+    if len(rows) > limit:
+        _, value, rowid = rows[limit - 1]
+        page.next_cursor = encode_cursor(value, rowid)
+    return page
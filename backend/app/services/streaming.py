@@ -0,0 +1,121 @@
+"""
+Incremental parsing of streamed n8n agent responses.
+
+n8n can answer a webhook with Server-Sent Events, newline-delimited JSON
+(the format of its streaming "Respond to Webhook" mode) or a plain chunked
+body. The parsers here turn any of those into text deltas as bytes arrive,
+so the first tokens reach the user before the agent has finished.
+"""
+
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import httpx
+from pydantic import BaseModel, Field
+
+# Keys that carry generated text in the JSON objects n8n and common LLM
+# nodes emit, in order of preference.
+_DELTA_KEYS = ("content", "delta", "token", "text", "response", "output")
+
+# n8n streaming envelope types that carry no text
+_CONTROL_TYPES = {"begin", "end", "error"}
+
+SSE_CONTENT_TYPES = ("text/event-stream",)
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+
+class StreamChunk(BaseModel):
+    """A piece of an agent response forwarded to the chat client."""
+    message_id: str
+    delta: str = ""
+    done: bool = False
+    error: str | None = None
+    metadata: dict = Field(default_factory=dict)
+
+
+def extract_delta(item: Any) -> str | None:
+    """
+    Pull the text delta out of one decoded stream item.
+
+    Args:
+        item: A decoded JSON value or raw string
+
+    Returns:
+        The text to append, or None for control/empty items.
+    """
+    if isinstance(item, str):
+        return item or None
+    if not isinstance(item, dict):
+        return None
+    if item.get("type") in _CONTROL_TYPES:
+        return None
+    for key in _DELTA_KEYS:
+        value = item.get(key)
+        if isinstance(value, str):
+            return value or None
+    return None
+
+
+def _decode(data: str) -> Any:
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield text deltas from a ``text/event-stream`` body."""
+    data_lines = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
+        elif not line and data_lines:
+            data = "\n".join(data_lines)
+            data_lines = []
+            if data == "[DONE]":
+                return
+            delta = extract_delta(_decode(data))
+            if delta:
+                yield delta
+    if data_lines:
+        delta = extract_delta(_decode("\n".join(data_lines)))
+        if delta:
+            yield delta
+
+
+async def iter_ndjson(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield text deltas from a newline-delimited JSON body."""
+    async for line in response.aiter_lines():
+        line = line.strip()
+        if not line:
+            continue
+        delta = extract_delta(_decode(line))
+        if delta:
+            yield delta
+
+
+async def iter_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Yield text deltas from a streamed webhook response of any supported type.
+
+    A plain ``application/json`` body is not incremental; its ``response``
+    field is yielded once, which keeps non-streaming workflows working.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type in SSE_CONTENT_TYPES:
+        async for delta in iter_sse(response):
+            yield delta
+    elif content_type in NDJSON_CONTENT_TYPES:
+        async for delta in iter_ndjson(response):
+            yield delta
+    elif content_type == "application/json":
+        body = await response.aread()
+        delta = extract_delta(_decode(body.decode(response.encoding or "utf-8")))
+        if delta:
+            yield delta
+    else:
+        async for text in response.aiter_text():
+            if text:
+                yield text
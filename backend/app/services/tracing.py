@@ -0,0 +1,391 @@
+"""
+Background export of chat traces to LangSmith.
+
+Tracing must never slow a chat down, so recording a run only appends to an
+in-memory ring buffer. A background task drains the buffer in batches to
+the LangSmith ``POST /runs/batch`` endpoint, gzip-compressed, and a run's
+start and end events that land in the same batch are merged into one.
+
+Under overload the exporter sheds traces instead of pushing back:
+
+- once the buffer is more than ``sample_above`` full, new traces are kept
+  with a probability that falls linearly to zero as the buffer fills;
+- when the buffer is full anyway, the oldest event is overwritten.
+
+Batches that fail with a network error, 429 or 5xx go back to the front of
+the buffer (up to ``max_attempts`` tries); other errors drop the batch.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import random
+import uuid
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any
+
+import httpx
+
+from app.config import get_settings
+from app.services.http_pool import HttpClientRegistry, get_http_registry
+from app.services.webhook_models import WebhookMessage, WebhookResponse
+
+# (event kind, run fields, attempts so far)
+_Event = tuple[str, dict[str, Any], int]
+
+
+@dataclass(frozen=True)
+class RunRef:
+    """Identifies a recorded run, for ending it or parenting child runs."""
+    id: str
+    trace_id: str
+    dotted_order: str
+
+
+def _iso(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return moment.astimezone(UTC).isoformat()
+
+
+class TraceExporter:
+    """
+    Buffers LangSmith runs and exports them in the background.
+
+    Args:
+        api_key: LangSmith API key
+        endpoint: LangSmith API base URL
+        project: Project (session) runs are filed under
+        max_queue: Ring buffer capacity, in events
+        max_batch: Events per request
+        flush_interval: Seconds between flushes of a partial batch
+        sample_above: Buffer fill ratio at which traces start being sampled
+        max_attempts: Tries per event before it is dropped
+        compress: Gzip request bodies
+        registry: HTTP connection pools (defaults to the shared registry)
+        rng: Random source for sampling (injectable for tests)
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        endpoint: str = "https://api.smith.langchain.com",
+        project: str | None = None,
+        max_queue: int = 10000,
+        max_batch: int = 100,
+        flush_interval: float = 1.0,
+        sample_above: float = 0.5,
+        max_attempts: int = 3,
+        compress: bool = True,
+        registry: HttpClientRegistry | None = None,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.api_key = api_key
+        self.url = f"{endpoint.rstrip('/')}/runs/batch"
+        self.project = project
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.sample_above = sample_above
+        self.max_attempts = max_attempts
+        self.compress = compress
+        self.registry = registry if registry is not None else get_http_registry()
+        self.rng = rng
+        self.logger = logging.getLogger(__name__)
+
+        self._buffer: deque[_Event] = deque(maxlen=max_queue)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.exported = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    @property
+    def pending(self) -> int:
+        """Events waiting to be exported."""
+        return len(self._buffer)
+
+    def stats(self) -> dict[str, int]:
+        """Export counters for metrics."""
+        return {
+            "pending": self.pending,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+        }
+
+    def _sampled_out(self) -> bool:
+        capacity = self._buffer.maxlen
+        fill = len(self._buffer) / capacity
+        if fill <= self.sample_above:
+            return False
+        keep = (1.0 - fill) / (1.0 - self.sample_above) if self.sample_above < 1 else 0.0
+        if self.rng() < keep:
+            return False
+        self.sampled_out += 1
+        return True
+
+    def _record(self, kind: str, run: dict[str, Any]) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((kind, run, 0))
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    def start_run(
+        self,
+        name: str,
+        inputs: dict[str, Any],
+        run_type: str = "chain",
+        parent: RunRef | None = None,
+        start_time: datetime | None = None,
+        outputs: dict[str, Any] | None = None,
+        end_time: datetime | None = None,
+        error: str | None = None,
+        extra: dict[str, Any] | None = None,
+        tags: list[str] | None = None,
+    ) -> RunRef | None:
+        """
+        Record the start of a run (or a whole run, if ``end_time`` is given).
+
+        Never blocks and never raises for export problems.
+
+        Returns:
+            A reference for :meth:`end_run` and child runs, or None if the
+            trace was sampled out (skip its end and children).
+        """
+        if parent is None and self._sampled_out():
+            return None
+        start_time = start_time or datetime.now(UTC)
+        run_id = str(uuid.uuid4())
+        stamp = start_time.astimezone(UTC) if start_time.tzinfo else start_time
+        order = f"{stamp:%Y%m%dT%H%M%S%f}Z{run_id}"
+        ref = RunRef(
+            id=run_id,
+            trace_id=parent.trace_id if parent is not None else run_id,
+            dotted_order=f"{parent.dotted_order}.{order}" if parent is not None else order,
+        )
+        run: dict[str, Any] = {
+            "id": ref.id,
+            "trace_id": ref.trace_id,
+            "dotted_order": ref.dotted_order,
+            "name": name,
+            "run_type": run_type,
+            "inputs": inputs,
+            "start_time": _iso(start_time),
+        }
+        if parent is not None:
+            run["parent_run_id"] = parent.id
+        if self.project:
+            run["session_name"] = self.project
+        if extra:
+            run["extra"] = extra
+        if tags:
+            run["tags"] = tags
+        if end_time is not None:
+            run.update(self._end_fields(outputs, error, end_time))
+        self._record("post", run)
+        return ref
+
+    def end_run(
+        self,
+        ref: RunRef | None,
+        outputs: dict[str, Any] | None = None,
+        error: str | None = None,
+        end_time: datetime | None = None,
+    ) -> None:
+        """Record the end of a run started with :meth:`start_run`."""
+        if ref is None:
+            return
+        run = {"id": ref.id, "trace_id": ref.trace_id, "dotted_order": ref.dotted_order}
+        run.update(self._end_fields(outputs, error, end_time))
+        self._record("patch", run)
+
+    @staticmethod
+    def _end_fields(
+        outputs: dict[str, Any] | None,
+        error: str | None,
+        end_time: datetime | None,
+    ) -> dict[str, Any]:
+        fields: dict[str, Any] = {"end_time": _iso(end_time or datetime.now(UTC))}
+        if outputs is not None:
+            fields["outputs"] = outputs
+        if error is not None:
+            fields["error"] = error
+        return fields
+
+    def record_exchange(
+        self,
+        profile_id: str,
+        webhook_path: str,
+        message: WebhookMessage,
+        response: WebhookResponse,
+    ) -> RunRef | None:
+        """Record one chat message and the agent's answer as a single run."""
+        metadata = {
+            "profile_id": profile_id,
+            "message_id": message.message_id,
+            "processing_time_ms": response.processing_time_ms,
+        }
+        if "webhook_attempts" in response.metadata:
+            metadata["webhook_attempts"] = response.metadata["webhook_attempts"]
+        return self.start_run(
+            name=f"n8n {webhook_path}",
+            inputs={"content": message.content, "format": message.format},
+            start_time=message.timestamp,
+            outputs={"response": response.agent_response, "format": response.response_format},
+            end_time=datetime.now(UTC),
+            error=response.error,
+            extra={"metadata": metadata},
+            tags=["necta"],
+        )
+
+    def _take(self) -> list[_Event]:
+        """Pop up to one batch, merging end events into their start events."""
+        events: list[_Event] = []
+        posts: dict[str, dict[str, Any]] = {}
+        for _ in range(min(self.max_batch, len(self._buffer))):
+            kind, run, attempts = self._buffer.popleft()
+            if kind == "patch" and run["id"] in posts:
+                posts[run["id"]].update(run)
+                continue
+            if kind == "post":
+                run = posts[run["id"]] = dict(run)
+            events.append((kind, run, attempts))
+        return events
+
+    async def flush(self) -> bool:
+        """
+        Export everything buffered, batch by batch.
+
+        Returns:
+            False if a batch failed and was re-queued (try again later).
+        """
+        while self._buffer:
+            if not await self._export(self._take()):
+                return False
+        return True
+
+    async def _export(self, events: list[_Event]) -> bool:
+        body = json.dumps({
+            "post": [run for kind, run, _ in events if kind == "post"],
+            "patch": [run for kind, run, _ in events if kind == "patch"],
+        }, default=str).encode()
+        headers = {"X-API-Key": self.api_key, "Content-Type": "application/json"}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        self.batches += 1
+        try:
+            response = await self.registry.get_client(self.url).post(
+                self.url, content=body, headers=headers, timeout=10.0
+            )
+        except httpx.HTTPError as e:
+            self.logger.warning(f"LangSmith export failed: {str(e)}")
+            return self._requeue(events)
+        except asyncio.CancelledError:
+            # Not a failed attempt: keep the batch for whoever flushes next
+            for event in reversed(events):
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.dropped += 1
+                else:
+                    self._buffer.appendleft(event)
+            raise
+        if response.is_success:
+            self.exported += len(events)
+            return True
+        if response.status_code == 429 or response.status_code >= 500:
+            self.logger.warning(f"LangSmith export failed: HTTP {response.status_code}")
+            return self._requeue(events)
+        self.logger.error(
+            f"LangSmith rejected {len(events)} runs: HTTP {response.status_code}: {response.text}"
+        )
+        self.failed_batches += 1
+        self.dropped += len(events)
+        return True
+
+    def _requeue(self, events: list[_Event]) -> bool:
+        self.failed_batches += 1
+        for kind, run, attempts in reversed(events):
+            if attempts + 1 >= self.max_attempts or len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            else:
+                self._buffer.appendleft((kind, run, attempts + 1))
+        return False
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                self.logger.exception("LangSmith flush failed")
+
+    async def close(self) -> None:
+        """Stop the flusher and make a last attempt to export buffered runs."""
+        if self._task is not None:
+            # Let an export in progress finish rather than cancel it mid-flush
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+_exporter: TraceExporter | None = None
+
+
+def get_trace_exporter() -> TraceExporter | None:
+    """
+    Return the process-wide trace exporter.
+
+    Returns:
+        The exporter, or None when ``LANGSMITH_API_KEY`` is not set.
+    """
+    global _exporter
+    if _exporter is None:
+        settings = get_settings()
+        if not settings.langsmith_api_key:
+            return None
+        _exporter = TraceExporter(
+            settings.langsmith_api_key,
+            endpoint=settings.langsmith_endpoint,
+            project=settings.langsmith_project,
+            max_queue=settings.trace_queue_size,
+            max_batch=settings.trace_batch_size,
+            flush_interval=settings.trace_flush_interval_seconds,
+            sample_above=settings.trace_sample_above,
+        )
+    return _exporter
+
+
+def current_trace_exporter() -> TraceExporter | None:
+    """The process-wide exporter if the application has created it, else None."""
+    return _exporter
+
+
+async def close_trace_exporter() -> None:
+    """Flush and stop the process-wide trace exporter."""
+    global _exporter
+    if _exporter is not None:
+        await _exporter.close()
+        _exporter = None
@@ -0,0 +1,201 @@
+"""
+Streaming attachment uploads to n8n.
+
+Attachments are streamed from the upload directory into a multipart body in
+fixed-size chunks, so memory per upload stays at one chunk however large the
+files are. The SHA-256 digest and the sniffed MIME type of each file are
+computed in the same pass that sends it; the digests follow the files as a
+final ``attachments`` part, and are available on the stream afterwards.
+
+Limits mirror ``shared/schemas/message.ts``: at most 10 files and 16MB in
+total per message.
+"""
+
+import functools
+import hashlib
+import json
+import mimetypes
+import os
+import uuid
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import aiofiles
+
+MAX_ATTACHMENTS = 10
+MAX_TOTAL_BYTES = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Signatures checked when python-magic is unavailable
+_SIGNATURES: tuple[tuple[bytes, str], ...] = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"ID3", "audio/mpeg"),
+    (b"OggS", "audio/ogg"),
+)
+
+
+@functools.cache
+def _magic() -> Any | None:
+    # Loads libmagic, so only on the first file sniffed, not at startup
+    try:
+        import magic
+    except ImportError:  # libmagic bindings are optional
+        return None
+    return magic
+
+
+class AttachmentError(ValueError):
+    """An attachment is missing, outside the upload directory or too large."""
+
+
+def sniff_mime(head: bytes, filename: str) -> str:
+    """
+    Detect a file's MIME type from its first bytes.
+
+    Uses libmagic when python-magic is installed, then a table of common
+    signatures, then the file extension.
+
+    Args:
+        head: The first chunk of the file
+        filename: File name, used as the last resort
+    """
+    magic = _magic()
+    if magic is not None and head:
+        detected = magic.from_buffer(head, mime=True)
+        if detected and detected != "application/octet-stream":
+            return detected
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+@dataclass
+class AttachmentInfo:
+    """What was sent for one attachment."""
+    field: str
+    filename: str
+    size: int
+    sha256: str | None = None
+    mime_type: str | None = None
+
+
+def resolve_attachments(upload_dir: Path, attachments: Sequence[str]) -> list[Path]:
+    """
+    Resolve and check attachment paths against the per-message limits.
+
+    Raises:
+        AttachmentError: If a path escapes ``upload_dir``, does not exist,
+            or the files exceed the count or size limits.
+    """
+    if len(attachments) > MAX_ATTACHMENTS:
+        raise AttachmentError(f"Too many file attachments (maximum {MAX_ATTACHMENTS})")
+    root = upload_dir.resolve()
+    paths = []
+    total = 0
+    for attachment in attachments:
+        path = (root / attachment).resolve()
+        if not path.is_relative_to(root):
+            raise AttachmentError(f"Attachment outside upload directory: {attachment}")
+        if not path.is_file():
+            raise AttachmentError(f"Attachment not found: {attachment}")
+        total += path.stat().st_size
+        paths.append(path)
+    if total > MAX_TOTAL_BYTES:
+        raise AttachmentError("Total file size exceeds 16MB limit")
+    return paths
+
+
+class MultipartUpload:
+    """
+    Re-iterable streaming ``multipart/form-data`` body.
+
+    Parts are the ``message`` JSON, one ``fileN`` part per attachment and a
+    closing ``attachments`` JSON part with each file's size, digest and
+    MIME type. Every iteration re-reads the files, so retries send the body
+    again from the start.
+
+    Args:
+        fields: Form fields sent before the files
+        paths: Attachment paths from :func:`resolve_attachments`
+        chunk_size: Bytes read and sent at a time
+        filenames: Names the files are sent under, one per path; defaults
+            to the names on disk
+    """
+
+    def __init__(
+        self,
+        fields: dict[str, str],
+        paths: Sequence[Path],
+        chunk_size: int = CHUNK_SIZE,
+        filenames: Sequence[str] | None = None,
+    ):
+        self.fields = fields
+        self.paths = list(paths)
+        self.filenames = list(filenames) if filenames is not None else [p.name for p in self.paths]
+        if len(self.filenames) != len(self.paths):
+            raise ValueError("Need one filename per attachment")
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        self.attachments: list[AttachmentInfo] = []
+
+    @property
+    def content_type(self) -> str:
+        """Content-Type header value, including the boundary."""
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _part_header(self, name: str, filename: str | None = None,
+                     content_type: str | None = None) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            quoted = filename.replace("\\", "\\\\").replace('"', '\\"')
+            disposition += f'; filename="{quoted}"'
+        lines = [f"--{self.boundary}", f"Content-Disposition: {disposition}"]
+        if content_type is not None:
+            lines.append(f"Content-Type: {content_type}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    async def _stream_file(self, info: AttachmentInfo, path: Path) -> AsyncIterator[bytes]:
+        """Yield one file part, hashing and sniffing as it goes."""
+        digest = hashlib.sha256()
+        remaining = info.size
+        async with aiofiles.open(path, "rb") as f:
+            # Never send more than was stat'ed, even if the file grows
+            chunk = await f.read(min(self.chunk_size, remaining))
+            info.mime_type = sniff_mime(chunk, info.filename)
+            yield self._part_header(info.field, info.filename, info.mime_type)
+            while chunk:
+                digest.update(chunk)
+                remaining -= len(chunk)
+                yield chunk
+                if remaining <= 0:
+                    break
+                chunk = await f.read(min(self.chunk_size, remaining))
+        info.size -= remaining
+        info.sha256 = digest.hexdigest()
+        yield b"\r\n"
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self.attachments = [
+            AttachmentInfo(field=f"file{i}", filename=filename, size=os.stat(path).st_size)
+            for i, (path, filename) in enumerate(zip(self.paths, self.filenames, strict=True))
+        ]
+        for name, value in self.fields.items():
+            yield self._part_header(name) + value.encode() + b"\r\n"
+        for info, path in zip(self.attachments, self.paths, strict=True):
+            async for piece in self._stream_file(info, path):
+                yield piece
+        manifest = json.dumps([asdict(info) for info in self.attachments])
+        yield self._part_header("attachments", content_type="application/json")
+        yield manifest.encode() + b"\r\n"
+        yield f"--{self.boundary}--\r\n".encode()
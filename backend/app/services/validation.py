@@ -0,0 +1,266 @@
+"""
+Server-side message validation, mirroring ``shared/schemas/message.ts``.
+
+The frontend validates with Zod, but a client can skip it, so the backend
+applies the same rules: field formats, dangerous HTML, JSON depth and size,
+and attachment count, total size and MIME types. Error messages match the
+TypeScript ones. ``shared/fixtures/message_validation.json`` is run
+against both implementations (``tests/test_validation.py`` here,
+``frontend/__tests__/shared-schemas.test.ts`` there) to keep them in step.
+
+The work is front-loaded so each request does little:
+
+* the models are Pydantic v2 classes, compiled to validators once at
+  import, with field patterns run by pydantic-core
+* the seven HTML danger patterns are one precompiled alternation, skipped
+  entirely for text that cannot match
+* JSON content is checked for depth and size while it is tokenised, before
+  it is parsed, so a deeply nested or oversized document is rejected at
+  the first offending bracket without building any objects
+"""
+
+import json
+import re
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Annotated, Any, Literal, Protocol
+
+from pydantic import (
+    AnyUrl,
+    BaseModel,
+    ConfigDict,
+    Field,
+    Strict,
+    StrictStr,
+    model_validator,
+)
+
+from app.services.uploads import MAX_ATTACHMENTS, MAX_TOTAL_BYTES
+
+MAX_CONTENT_LENGTH = 32000
+MAX_JSON_DEPTH = 10
+MAX_JSON_LENGTH = 10000
+
+ALLOWED_MIME_TYPES = frozenset({
+    "text/plain",
+    "text/csv",
+    "application/pdf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.ms-excel",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+})
+
+# Zod's uuid() and datetime() (UTC, ``Z`` suffix) formats
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+DATETIME_PATTERN = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z$"
+
+# validateHTMLContent's patterns; ASCII mode matches JavaScript's \w and \b
+_DANGEROUS_HTML = re.compile(
+    "|".join((
+        r"<script\b[^<]*(?:(?!</script>)<[^<]*)*</script>",
+        r"<iframe\b[^>]*>",
+        r"<object\b[^>]*>",
+        r"<embed\b[^>]*>",
+        r"<link\b[^>]*>",
+        r"javascript:",
+        r"on\w+\s*=",
+    )),
+    re.IGNORECASE | re.ASCII,
+)
+
+# Strings, brackets and runs of anything else; JSON whitespace is skipped
+_JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"?|[\[\]{}]|[^ \t\n\r"\[\]{}]+')
+
+Uuid = Annotated[StrictStr, Field(pattern=UUID_PATTERN)]
+ContentFormat = Literal["text", "markdown", "html", "json"]
+Filename = Annotated[StrictStr, Field(min_length=1, max_length=255, pattern=r"^[a-zA-Z0-9._-]+$")]
+BlobId = Annotated[StrictStr, Field(pattern=r"^[0-9a-f]{64}$")]
+Number = Annotated[float, Strict()]
+
+
+def check_html(content: str) -> None:
+    """
+    Reject HTML with scripts, embeds, ``javascript:`` URLs or event handlers.
+
+    Raises:
+        ValueError: If a dangerous pattern is found.
+    """
+    if "<" not in content and "=" not in content and ":" not in content:
+        return
+    if _DANGEROUS_HTML.search(content):
+        raise ValueError("HTML content contains potentially dangerous elements")
+
+
+def _reject_constant(name: str) -> None:
+    # Python accepts NaN and Infinity; JSON.parse does not
+    raise ValueError(f"Invalid constant {name}")
+
+
+def check_json(
+    content: str,
+    max_depth: int = MAX_JSON_DEPTH,
+    max_length: int = MAX_JSON_LENGTH,
+) -> None:
+    """
+    Reject invalid, deeply nested or oversized JSON.
+
+    Depth counts nested objects and arrays, like ``getObjectDepth``. Length
+    is that of the compact serialisation in UTF-16 code units, like
+    ``JSON.stringify(parsed).length``; escapes and numbers are counted as
+    written, which is exact for JSON produced by ``JSON.stringify``. Both are
+    checked while scanning, and the document is only parsed once it is
+    known to be within the limits.
+
+    Raises:
+        ValueError: If the content is too deep, too large or not JSON.
+    """
+    depth = length = 0
+    for match in _JSON_TOKEN.finditer(content):
+        lexeme = match.group()
+        if lexeme in "[{":
+            depth += 1
+            if depth > max_depth:
+                raise ValueError("JSON content is too deeply nested")
+        elif lexeme in "]}":
+            depth -= 1
+        length += len(lexeme) if lexeme.isascii() else len(lexeme.encode("utf-16-le")) // 2
+        if length > max_length:
+            raise ValueError("JSON content is too large")
+    try:
+        json.loads(content, parse_constant=_reject_constant)
+    except ValueError:
+        raise ValueError("Invalid JSON content") from None
+
+
+def check_content(content: str, content_format: str) -> None:
+    """
+    Apply the security checks for a message's format.
+
+    Raises:
+        ValueError: If the content is not acceptable.
+    """
+    if content_format == "html":
+        check_html(content)
+    elif content_format == "json":
+        check_json(content)
+
+
+class FileAttachment(BaseModel):
+    """A file attached to a message (``FileAttachmentSchema``)."""
+    id: Uuid
+    filename: Filename
+    size: Number = Field(ge=1, le=MAX_TOTAL_BYTES)
+    mime_type: StrictStr = Field(
+        pattern=r"^[a-zA-Z0-9][a-zA-Z0-9!#$&\-\^]*/[a-zA-Z0-9][a-zA-Z0-9!#$&\-\^]*$"
+    )
+    url: AnyUrl
+    blob_id: BlobId | None = None
+    uploaded_at: datetime
+
+
+class Attached(Protocol):
+    """What :func:`check_attachments` needs of a file: a FileAttachment or a stored blob."""
+    size: int | float
+    mime_type: str
+
+
+def check_mime_type(mime_type: str) -> None:
+    """
+    Reject a file type that may not be attached.
+
+    Raises:
+        ValueError: If the MIME type is not in ``ALLOWED_MIME_TYPES``.
+    """
+    if mime_type not in ALLOWED_MIME_TYPES:
+        raise ValueError(f"File type not allowed: {mime_type}")
+
+
+def check_attachments(attachments: Sequence[Attached]) -> None:
+    """
+    Reject too many, too large in total or disallowed attachments.
+
+    Raises:
+        ValueError: If a limit is exceeded or a MIME type is not allowed.
+    """
+    if len(attachments) > MAX_ATTACHMENTS:
+        raise ValueError(f"Too many file attachments (maximum {MAX_ATTACHMENTS})")
+    if sum(file.size for file in attachments) > MAX_TOTAL_BYTES:
+        raise ValueError("Total file size exceeds 16MB limit")
+    for file in attachments:
+        check_mime_type(file.mime_type)
+
+
+class MessageContent(BaseModel):
+    """
+    The content of a user message, with its security checks.
+
+    Shared by :class:`CreateMessage` and the chat endpoints' request models.
+    """
+    content: StrictStr = Field(min_length=1, max_length=MAX_CONTENT_LENGTH)
+    content_format: ContentFormat = "markdown"
+
+    @model_validator(mode="after")
+    def _check_content(self) -> "MessageContent":
+        check_content(self.content, self.content_format)
+        return self
+
+
+class CreateMessage(MessageContent):
+    """
+    A message submitted by a user (``CreateMessageSchema``).
+
+    Validation includes the checks of ``validateMessageCreation``.
+    """
+    profile_id: Uuid
+    file_attachments: list[FileAttachment] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def _check_attachments(self) -> "CreateMessage":
+        if self.file_attachments:
+            check_attachments(self.file_attachments)
+        return self
+
+
+class WebhookPayloadMetadata(BaseModel):
+    """Metadata of a webhook payload; extra keys are kept."""
+    model_config = ConfigDict(extra="allow")
+
+    profile_id: Uuid
+    environment: Literal["dev", "prod"]
+
+
+class WebhookPayload(BaseModel):
+    """A message as delivered to n8n (``WebhookPayloadSchema``)."""
+    message_id: Uuid
+    user_id: Uuid | None = None
+    content: StrictStr
+    format: ContentFormat
+    timestamp: Annotated[StrictStr, Field(pattern=DATETIME_PATTERN)]
+    attachments: list[StrictStr] | None = None
+    metadata: WebhookPayloadMetadata
+
+
+def validate_message_creation(data: Any) -> CreateMessage:
+    """
+    Validate a user message (``validateMessageCreation``).
+
+    Raises:
+        pydantic.ValidationError: If any rule is broken.
+    """
+    return CreateMessage.model_validate(data)
+
+
+def validate_webhook_payload(data: Any) -> WebhookPayload:
+    """
+    Validate a webhook payload (``validateWebhookPayload``).
+
+    Raises:
+        pydantic.ValidationError: If any rule is broken.
+    """
+    return WebhookPayload.model_validate(data)
+
@@ -0,0 +1,865 @@
+"""
+n8n webhook communication for NECTA.
+
+Backend implementation of the pattern in
+``examples/patterns/webhook_communication.py``: authentication, retries and
+error handling for messages sent to n8n workflows. Connections come from the
+shared per-origin pools in :mod:`app.services.http_pool`.
+"""
+
+import asyncio
+import base64
+import logging
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+from urllib.parse import urljoin
+
+import httpx
+
+from app.config import get_settings
+from app.services.cache import SingleFlight, TTLCache, get_response_cache, payload_key
+from app.services.callbacks import CallbackRegistry, get_callback_registry
+from app.services.http_pool import HttpClientRegistry, get_http_registry
+from app.services.metrics import (
+    WEBHOOK_HEDGES,
+    WEBHOOK_LATENCY,
+    WEBHOOK_RETRIES,
+    WEBHOOK_TIMEOUTS,
+)
+from app.services.rate_limit import AdaptiveRateLimiter, get_rate_limiter
+from app.services.request_plan import (
+    HeaderList,
+    RequestPlan,
+    cached_plan,
+    freeze_auth_headers,
+)
+from app.services.retry import (
+    CircuitBreakerRegistry,
+    CircuitState,
+    RetryPolicy,
+    get_breaker_registry,
+)
+from app.services.routing import (
+    EndpointSelector,
+    SelectorRegistry,
+    get_selector_registry,
+)
+from app.services.streaming import StreamChunk, iter_deltas
+from app.services.webhook_models import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookMessage,
+    WebhookPayloadFormat,
+    WebhookResponse,
+)
+
+
+def build_auth_headers(auth_config: WebhookAuthConfig) -> dict[str, str]:
+    """
+    Build request headers for a webhook authentication configuration.
+
+    Args:
+        auth_config: Decrypted authentication configuration
+
+    Returns:
+        Dict containing appropriate headers for the auth method.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": "NECTA-WebhookClient/1.0"
+    }
+
+    if auth_config.auth_type == WebhookAuthType.BASIC:
+        credentials = f"{auth_config.username}:{auth_config.password}"
+        encoded_credentials = base64.b64encode(credentials.encode()).decode()
+        headers["Authorization"] = f"Basic {encoded_credentials}"
+
+    elif auth_config.auth_type == WebhookAuthType.HEADER:
+        headers[auth_config.header_key] = auth_config.header_value
+
+    elif auth_config.auth_type == WebhookAuthType.JWT:
+        headers["Authorization"] = f"Bearer {auth_config.jwt_token}"
+
+    return headers
+
+
+def _reply_data(response: httpx.Response) -> dict[str, Any]:
+    """
+    The body of a successful webhook answer.
+
+    A workflow that answers with plain text (or with JSON that is not an
+    object) is taken to be replying in text, rather than failing the call.
+    """
+    if not response.content:
+        return {}
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        return data
+    return {"response": response.text, "format": "text"}
+
+
+STREAM_ACCEPT = "text/event-stream, application/x-ndjson, application/json"
+
+# Shared by every client so identical calls coalesce across profiles' clients
+_in_flight: SingleFlight[WebhookResponse] = SingleFlight()
+
+
+class WebhookClient:
+    """
+    Async client for communicating with n8n webhooks.
+
+    Handles authentication, retries, and error recovery. Retries follow a
+    RetryPolicy (jittered exponential backoff within a deadline budget) and
+    every webhook URL has a circuit breaker that fails fast while n8n is
+    down. The underlying connection pool is shared with every other client
+    on the same origin.
+
+    Connectivity tests, and every message when ``deterministic`` is set, are
+    coalesced with identical in-flight calls and served from
+    ``response_cache`` when one is given.
+
+    URL and fixed headers for each webhook and payload format are compiled
+    once per process into a :class:`~app.services.request_plan.RequestPlan`
+    shared by every client with the same configuration; per message only
+    the body is serialised and the client's auth headers added.
+
+    With ``callbacks`` set, messages carry a signed ``callback_url`` and the
+    workflow may acknowledge at once and deliver its answer later (see
+    :mod:`app.services.callbacks`). Coalesced and cached calls always
+    expect a synchronous answer.
+
+    With ``rate_limiter`` set, every attempt first waits for a slot under the
+    profile's and the origin's adaptive rate (at most ``max_rate_wait``
+    seconds, within the retry deadline) and reports its outcome back so the
+    rates track what n8n sustains.
+
+    ``endpoints`` lists further n8n base URLs that serve the same webhooks.
+    Each attempt then goes to the endpoint picked by an
+    :class:`~app.services.routing.EndpointSelector`, and retries avoid
+    endpoints that already failed. With ``hedge`` set, a call still running
+    after the webhook's p95 latency is raced against a second endpoint
+    (never for callback or BINARY sends, and only if the rate limiter has a
+    slot to spare).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        auth_config: WebhookAuthConfig,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+        registry: HttpClientRegistry | None = None,
+        retry_policy: RetryPolicy | None = None,
+        breakers: CircuitBreakerRegistry | None = None,
+        profile_id: str | None = None,
+        environment: str = "dev",
+        response_cache: TTLCache | None = None,
+        deterministic: bool = False,
+        auth_headers: dict[str, str] | None = None,
+        upload_dir: Path | None = None,
+        callbacks: CallbackRegistry | None = None,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        max_rate_wait: float = 10.0,
+        endpoints: list[str] | None = None,
+        hedge: bool = False,
+        selectors: SelectorRegistry | None = None,
+    ):
+        self.base_url = base_url
+        self.auth_config = auth_config
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_retries=max_retries, base_delay=retry_delay
+        )
+        self.max_retries = self.retry_policy.max_retries
+        self.breakers = breakers if breakers is not None else get_breaker_registry()
+        self.registry = registry if registry is not None else get_http_registry()
+        self.profile_id = profile_id
+        self.environment = environment
+        self.response_cache = response_cache
+        self.deterministic = deterministic
+        # Precomputed by SecureWebhookManager.auth_headers to skip rebuilding
+        self.auth_headers = auth_headers
+        self.upload_dir = upload_dir if upload_dir is not None else Path(get_settings().upload_dir)
+        self.callbacks = callbacks
+        self.rate_limiter = rate_limiter
+        self.max_rate_wait = max_rate_wait
+        self.endpoints = list(dict.fromkeys([base_url, *(endpoints or [])]))
+        self.hedge = hedge
+        self.selectors = selectors if selectors is not None else get_selector_registry()
+        self._frozen_auth: HeaderList | None = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client for this webhook's origin."""
+        return self.registry.get_client(self.base_url)
+
+    async def __aenter__(self):
+        """Async context manager entry."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit (the shared pool stays open)."""
+
+    def _prepare_headers(self) -> dict[str, str]:
+        """
+        Prepare headers based on authentication configuration.
+
+        Returns:
+            Dict containing appropriate headers for the auth method.
+        """
+        if self.auth_headers is not None:
+            return dict(self.auth_headers)
+        return build_auth_headers(self.auth_config)
+
+    def _plan(
+        self,
+        webhook_path: str,
+        payload_format: WebhookPayloadFormat,
+        stream: bool = False
+    ) -> RequestPlan:
+        """
+        Return the compiled request plan for a webhook.
+
+        Args:
+            webhook_path: Webhook endpoint path
+            payload_format: Format for the payload
+            stream: Whether the plan asks n8n for a streamed answer
+        """
+        return cached_plan(
+            self.base_url,
+            webhook_path,
+            payload_format,
+            extra_headers={"Accept": STREAM_ACCEPT} if stream else None,
+            upload_dir=self.upload_dir,
+        )
+
+    def _auth(self) -> HeaderList:
+        """This client's auth headers, added to each request built from a plan."""
+        if self._frozen_auth is None:
+            self._frozen_auth = freeze_auth_headers(self._prepare_headers())
+        return self._frozen_auth
+
+    def selector(self, webhook_path: str) -> EndpointSelector | None:
+        """Endpoint selector for a webhook, or None with a single endpoint."""
+        if len(self.endpoints) == 1:
+            return None
+        return self.selectors.get([urljoin(base, webhook_path) for base in self.endpoints])
+
+    def _healthy(self, url: str) -> bool:
+        return self.breakers.get(url).state != CircuitState.OPEN
+
+    async def send_message(
+        self,
+        webhook_path: str,
+        message: WebhookMessage,
+        payload_format: WebhookPayloadFormat = WebhookPayloadFormat.JSON,
+        await_callback: bool = True
+    ) -> WebhookResponse:
+        """
+        Send message to n8n webhook with retry logic.
+
+        Args:
+            webhook_path: Webhook endpoint path
+            message: Message to send
+            payload_format: Format for the payload
+            await_callback: When the workflow defers its answer, wait for the
+                callback; if False, return the acknowledgement (metadata
+                ``deferred``) and let the caller wait on ``self.callbacks``
+
+        Returns:
+            WebhookResponse with agent's reply or error information
+        """
+        if self.deterministic:
+            return await self._send_coalesced(webhook_path, message, payload_format)
+        if self.callbacks is None:
+            return await self._send(webhook_path, message, payload_format)
+
+        try:
+            response = await self._send(webhook_path, message, payload_format, use_callback=True)
+        except BaseException:
+            self.callbacks.discard(message.message_id)
+            raise
+        if not response.metadata.get("deferred"):
+            self.callbacks.discard(message.message_id)
+        elif await_callback:
+            return await self.callbacks.wait(message.message_id)
+        return response
+
+    def _cache_key(
+        self,
+        webhook_path: str,
+        message: WebhookMessage,
+        payload_format: WebhookPayloadFormat
+    ) -> str:
+        """Key identifying identical requests, ignoring per-message ids and times."""
+        return payload_key(
+            self.profile_id,
+            self.environment,
+            self._plan(webhook_path, payload_format).url,
+            payload_format.value,
+            message.model_dump(mode="json", exclude={"message_id", "timestamp"}),
+        )
+
+    async def _send_coalesced(
+        self,
+        webhook_path: str,
+        message: WebhookMessage,
+        payload_format: WebhookPayloadFormat
+    ) -> WebhookResponse:
+        """Send through the response cache and single-flight layer."""
+        key = self._cache_key(webhook_path, message, payload_format)
+        if self.response_cache is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached.model_copy(update={"message_id": message.message_id})
+
+        async def fetch() -> WebhookResponse:
+            response = await self._send(webhook_path, message, payload_format)
+            if response.success and self.response_cache is not None:
+                self.response_cache.set(key, response)
+            return response
+
+        response = await _in_flight.do(key, fetch)
+        if response.message_id != message.message_id:
+            response = response.model_copy(update={"message_id": message.message_id})
+        return response
+
+    async def _send(
+        self,
+        webhook_path: str,
+        message: WebhookMessage,
+        payload_format: WebhookPayloadFormat,
+        use_callback: bool = False
+    ) -> WebhookResponse:
+        """
+        Deliver one message with retries and circuit breaking.
+
+        With ``use_callback``, an acknowledgement without an answer (HTTP 202,
+        or 200 without ``response``) returns a ``deferred`` WebhookResponse
+        and the result is expected on the message's callback URL; the caller
+        must :meth:`~CallbackRegistry.discard` the wait for any other outcome.
+        """
+        if use_callback:
+            message = message.model_copy(update={"metadata": {
+                **message.metadata,
+                "callback_url": self.callbacks.callback_url(message.message_id),
+            }})
+        plan = self._plan(webhook_path, payload_format)
+        url = plan.url
+        try:
+            request = await plan.build(message, self._auth())
+        except (OSError, ValueError) as e:
+            return WebhookResponse(
+                success=False,
+                message_id=message.message_id,
+                error=f"Invalid attachment: {str(e)}",
+                metadata={"webhook_attempts": 0}
+            )
+
+        policy = self.retry_policy
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline if policy.deadline is not None else None
+        error_msg = "Maximum retries exceeded"
+        processing_time_ms = None
+        attempts = 0
+        labels = (self.profile_id or "default", self.environment)
+        if use_callback:
+            # Before sending: the callback may arrive before the acknowledgement
+            self.callbacks.expect(message.message_id)
+
+        selector = self.selector(webhook_path)
+        hedge = self.hedge and not use_callback and isinstance(request["content"], bytes)
+        failed: set[str] = set()
+
+        for attempt in range(policy.max_retries + 1):
+            if selector is not None:
+                url = selector.pick(failed, self._healthy) or selector.pick(healthy=self._healthy)
+            breaker = self.breakers.get(url)
+            limit_keys = AdaptiveRateLimiter.keys(url, self.profile_id)
+            # Cheap refusals first, so they never spend a rate limiter slot
+            if deadline is not None and deadline <= loop.time():
+                error_msg = f"{error_msg} (deadline exceeded)"
+                break
+            if not breaker.allow_request():
+                self.logger.warning(f"Circuit open for {url}, failing fast")
+                return WebhookResponse(
+                    success=False,
+                    message_id=message.message_id,
+                    error=f"Circuit open for {url}",
+                    metadata={"circuit_state": breaker.state.value, "webhook_attempts": attempts}
+                )
+            if not await self._admit(limit_keys, deadline):
+                breaker.release()
+                self.logger.warning(f"Rate limit for {url} not available in time")
+                return WebhookResponse(
+                    success=False,
+                    message_id=message.message_id,
+                    error=f"Rate limited: no slot for {url} in time",
+                    metadata={"rate_limited": True, "webhook_attempts": attempts}
+                )
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    breaker.release()
+                    error_msg = f"{error_msg} (deadline exceeded)"
+                    break
+
+            attempts += 1
+            retry_response = None
+            try:
+                start_time = loop.time()
+
+                response, winner = await self._post(url, timeout, request, selector, hedge)
+                if winner != url:
+                    # The hedge answered; the primary's probe slot goes unused
+                    breaker.release()
+                    url = winner
+                    breaker = self.breakers.get(url)
+                    limit_keys = AdaptiveRateLimiter.keys(url, self.profile_id)
+
+                end_time = loop.time()
+                processing_time_ms = int((end_time - start_time) * 1000)
+                outcome = "ok" if response.status_code in (200, 202) else "http_error"
+                WEBHOOK_LATENCY.labels(*labels, outcome).observe((end_time - start_time) * 1000)
+                await self._record(limit_keys, response.status_code, end_time - start_time)
+
+                # Handle response
+                if use_callback and response.status_code in (200, 202):
+                    breaker.record_success()
+                    response_data = _reply_data(response)
+                    if response.status_code == 202 or "response" not in response_data:
+                        # Acknowledged; the answer will arrive on the callback URL
+                        return WebhookResponse(
+                            success=True,
+                            message_id=message.message_id,
+                            processing_time_ms=processing_time_ms,
+                            metadata={"deferred": True, "webhook_attempts": attempts}
+                        )
+                elif response.status_code == 200:
+                    breaker.record_success()
+                    response_data = _reply_data(response)
+
+                if response.status_code == 200:
+                    return WebhookResponse(
+                        success=True,
+                        message_id=message.message_id,
+                        agent_response=response_data.get("response", ""),
+                        response_format=response_data.get("format", "markdown"),
+                        processing_time_ms=processing_time_ms,
+                        metadata=response_data.get("metadata", {})
+                    )
+
+                error_msg = f"HTTP {response.status_code}: {response.text}"
+                self.logger.warning(
+                    f"Webhook request failed (attempt {attempt + 1}): {error_msg}"
+                )
+                # Only overload and server errors count against the breaker
+                if response.status_code == 429 or response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                if not policy.should_retry_status(response.status_code):
+                    break
+                retry_response = response
+
+            except (httpx.RequestError, httpx.TimeoutException) as e:
+                breaker.record_failure()
+                error_msg = f"Request error: {str(e)}"
+                processing_time_ms = None
+                timed_out = isinstance(e, httpx.TimeoutException)
+                if timed_out:
+                    WEBHOOK_TIMEOUTS.labels(*labels).inc()
+                await self._record(limit_keys, timed_out=timed_out)
+                WEBHOOK_LATENCY.labels(*labels, "timeout" if timed_out else "error").observe(
+                    (loop.time() - start_time) * 1000
+                )
+                self.logger.warning(
+                    f"Webhook request failed (attempt {attempt + 1}): {error_msg}"
+                )
+                if not policy.should_retry_exception(e):
+                    break
+            except BaseException:
+                # Cancelled or crashed before an outcome was recorded
+                breaker.release()
+                raise
+
+            failed.add(url)
+            if attempt == policy.max_retries:
+                break
+
+            # Back off, but never past the request's deadline
+            delay = policy.delay_for(attempt, retry_response)
+            if deadline is not None and loop.time() + delay >= deadline:
+                error_msg = f"{error_msg} (retry budget exhausted)"
+                break
+            WEBHOOK_RETRIES.labels(*labels).inc()
+            await asyncio.sleep(delay)
+
+        return WebhookResponse(
+            success=False,
+            message_id=message.message_id,
+            error=error_msg,
+            processing_time_ms=processing_time_ms,
+            metadata={"webhook_attempts": attempts}
+        )
+
+    async def _post(
+        self,
+        url: str,
+        timeout: float,
+        request: dict,
+        selector: EndpointSelector | None,
+        hedge: bool
+    ) -> tuple[httpx.Response, str]:
+        """
+        POST one attempt, hedging it when enabled.
+
+        Returns:
+            The response and the URL that produced it.
+        """
+        if selector is None:
+            return await self.registry.get_client(url).post(url=url, timeout=timeout, **request), url
+        delay = selector.hedge_delay() if hedge else None
+        if delay is None or delay >= timeout:
+            return await self._tracked_post(selector, url, timeout, request), url
+
+        urls = {asyncio.create_task(self._tracked_post(selector, url, timeout, request)): url}
+        try:
+            done, pending = await asyncio.wait(urls, timeout=delay)
+            alternate = None if done else selector.pick({url}, self._healthy)
+            if (
+                alternate is not None
+                and self._healthy(alternate)
+                and await self._admit_hedge(alternate)
+            ):
+                selector.hedges += 1
+                WEBHOOK_HEDGES.labels(self.profile_id or "default", self.environment).inc()
+                hedged = asyncio.create_task(
+                    self._tracked_post(selector, alternate, timeout - delay, request)
+                )
+                urls[hedged] = alternate
+                pending.add(hedged)
+
+            # First useful answer wins; an error only if both attempts fail
+            fallback: tuple[httpx.Response, str] | None = None
+            error: BaseException | None = None
+            while True:
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    response = task.result()
+                    if response.status_code < 500 and response.status_code != 429:
+                        if urls[task] != url:
+                            selector.hedge_wins += 1
+                        return response, urls[task]
+                    fallback = fallback or (response, urls[task])
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            for task in urls:
+                task.cancel()
+
+    async def _tracked_post(
+        self,
+        selector: EndpointSelector,
+        url: str,
+        timeout: float,
+        request: dict
+    ) -> httpx.Response:
+        """POST to ``url``, feeding latency and outcome to ``selector``."""
+        loop = asyncio.get_running_loop()
+        selector.begin(url)
+        start = loop.time()
+        latency, ok = None, False
+        try:
+            response = await self.registry.get_client(url).post(url=url, timeout=timeout, **request)
+            latency = loop.time() - start
+            ok = response.status_code < 500 and response.status_code != 429
+            return response
+        except (httpx.RequestError, httpx.TimeoutException):
+            latency = loop.time() - start
+            raise
+        finally:
+            # latency stays None if the attempt lost a hedge race
+            selector.end(url, latency, ok)
+
+    async def _admit_hedge(self, url: str) -> bool:
+        """Take a rate limiter slot for a hedge only if one is free now."""
+        if self.rate_limiter is None:
+            return True
+        return await self.rate_limiter.acquire(
+            AdaptiveRateLimiter.keys(url, self.profile_id), timeout=0
+        )
+
+    async def _admit(self, keys: list[str], deadline: float | None) -> bool:
+        """Wait for a rate limiter slot, within the retry deadline."""
+        if self.rate_limiter is None:
+            return True
+        wait = self.max_rate_wait
+        if deadline is not None:
+            wait = min(wait, deadline - asyncio.get_running_loop().time())
+        return await self.rate_limiter.acquire(keys, wait)
+
+    async def _record(
+        self,
+        keys: list[str],
+        status_code: int | None = None,
+        latency: float | None = None,
+        timed_out: bool = False
+    ) -> None:
+        """Feed one attempt's outcome to the rate limiter."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.record(keys, status_code, latency, timed_out)
+
+    async def stream_message(
+        self,
+        webhook_path: str,
+        message: WebhookMessage,
+        payload_format: WebhookPayloadFormat = WebhookPayloadFormat.JSON
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Send a message and yield the agent's answer as it is generated.
+
+        Retries and the circuit breaker apply until the response headers
+        arrive; once n8n has started streaming, a failure ends the stream
+        with an error chunk instead of replaying the request.
+
+        Args:
+            webhook_path: Webhook endpoint path
+            message: Message to send
+            payload_format: Format for the payload
+
+        Yields:
+            StreamChunk deltas, always ending with a ``done`` chunk.
+        """
+        plan = self._plan(webhook_path, payload_format, stream=True)
+        url = plan.url
+        try:
+            request = await plan.build(message, self._auth())
+        except (OSError, ValueError) as e:
+            yield StreamChunk(
+                message_id=message.message_id,
+                done=True,
+                error=f"Invalid attachment: {str(e)}"
+            )
+            return
+
+        policy = self.retry_policy
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        deadline = start_time + policy.deadline if policy.deadline is not None else None
+        error_msg = "Maximum retries exceeded"
+        selector = self.selector(webhook_path)
+        failed: set[str] = set()
+
+        for attempt in range(policy.max_retries + 1):
+            if selector is not None:
+                url = selector.pick(failed, self._healthy) or selector.pick(healthy=self._healthy)
+            breaker = self.breakers.get(url)
+            limit_keys = AdaptiveRateLimiter.keys(url, self.profile_id)
+            # Cheap refusals first, so they never spend a rate limiter slot
+            if deadline is not None and deadline <= loop.time():
+                error_msg = f"{error_msg} (deadline exceeded)"
+                break
+            if not breaker.allow_request():
+                error_msg = f"Circuit open for {url}"
+                break
+            if not await self._admit(limit_keys, deadline):
+                breaker.release()
+                error_msg = f"Rate limited: no slot for {url} in time"
+                break
+
+            retry_response = None
+            tracked = selector is not None
+            try:
+                attempt_start = loop.time()
+                if tracked:
+                    selector.begin(url)
+                async with self.registry.get_client(url).stream(
+                    "POST", url, timeout=self.timeout, **request
+                ) as response:
+                    # Latency to the headers; a long stream is not overload
+                    latency = loop.time() - attempt_start
+                    if tracked:
+                        tracked = False
+                        selector.end(url, latency, ok=response.status_code < 500
+                                     and response.status_code != 429)
+                    await self._record(limit_keys, response.status_code, latency)
+                    if response.status_code == 200:
+                        breaker.record_success()
+                        first_token_ms = None
+                        try:
+                            async for delta in iter_deltas(response):
+                                if first_token_ms is None:
+                                    first_token_ms = int((loop.time() - start_time) * 1000)
+                                yield StreamChunk(message_id=message.message_id, delta=delta)
+                        except (httpx.RequestError, httpx.TimeoutException) as e:
+                            # Partial output was already delivered; never replay
+                            yield StreamChunk(
+                                message_id=message.message_id,
+                                done=True,
+                                error=f"Stream interrupted: {str(e)}"
+                            )
+                            return
+                        yield StreamChunk(
+                            message_id=message.message_id,
+                            done=True,
+                            metadata={
+                                "webhook_attempts": attempt + 1,
+                                "first_token_ms": first_token_ms,
+                                "response_time_ms": int((loop.time() - start_time) * 1000),
+                            }
+                        )
+                        return
+
+                    await response.aread()
+                    error_msg = f"HTTP {response.status_code}: {response.text}"
+                    if response.status_code == 429 or response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    if not policy.should_retry_status(response.status_code):
+                        break
+                    retry_response = response
+
+            except (httpx.RequestError, httpx.TimeoutException) as e:
+                breaker.record_failure()
+                error_msg = f"Request error: {str(e)}"
+                if tracked:
+                    selector.end(url, loop.time() - attempt_start, ok=False)
+                await self._record(limit_keys, timed_out=isinstance(e, httpx.TimeoutException))
+                if not policy.should_retry_exception(e):
+                    break
+            except BaseException:
+                breaker.release()
+                if tracked:
+                    selector.end(url, None)
+                raise
+
+            self.logger.warning(
+                f"Webhook stream failed (attempt {attempt + 1}): {error_msg}"
+            )
+            failed.add(url)
+            if attempt == policy.max_retries:
+                break
+            delay = policy.delay_for(attempt, retry_response)
+            if deadline is not None and loop.time() + delay >= deadline:
+                error_msg = f"{error_msg} (retry budget exhausted)"
+                break
+            await asyncio.sleep(delay)
+
+        yield StreamChunk(message_id=message.message_id, done=True, error=error_msg)
+
+    async def probe(self, webhook_path: str, timeout: float = 2.0) -> dict[str, bool | int | str]:
+        """
+        Check that a webhook is reachable without executing its workflow.
+
+        Sends an ``OPTIONS`` request, which n8n answers for registered
+        webhooks (CORS preflight) without running the workflow. Unlike
+        :meth:`test_webhook`, nothing reaches the agent and the circuit
+        breaker is left alone.
+
+        Args:
+            webhook_path: Webhook endpoint path
+            timeout: Seconds to wait for the answer
+
+        Returns:
+            Dict with ``reachable`` and the HTTP ``status_code``.
+
+        Raises:
+            httpx.HTTPError: If n8n cannot be reached.
+        """
+        url = self._plan(webhook_path, WebhookPayloadFormat.JSON).url
+        response = await self.client.options(url, timeout=timeout)
+        return {
+            "reachable": response.status_code < 400,
+            "status_code": response.status_code,
+        }
+
+    async def test_webhook(self, webhook_path: str) -> dict[str, bool | str]:
+        """
+        Test webhook connectivity without sending a real message.
+
+        Concurrent tests of the same webhook share one request, and results
+        are cached when the client has a response cache, so dashboards
+        polling many profiles do not multiply n8n executions.
+
+        Args:
+            webhook_path: Webhook endpoint path
+
+        Returns:
+            Dict with test results
+        """
+        test_message = WebhookMessage(
+            message_id="test-connection",
+            user_id="system",
+            content="Connection test",
+            metadata={"test": True}
+        )
+
+        try:
+            response = await self._send_coalesced(
+                webhook_path, test_message, WebhookPayloadFormat.JSON
+            )
+            return {
+                "success": response.success,
+                "status": "connected" if response.success else "failed",
+                "error": response.error,
+                "response_time_ms": response.processing_time_ms
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "status": "error",
+                "error": str(e)
+            }
+
+
+def webhook_client_from_settings(
+    base_url: str | None = None, **options: Any
+) -> WebhookClient | None:
+    """
+    Build a client for the configured n8n instance.
+
+    Args:
+        base_url: Base URL to use instead of ``N8N_BASE_URL``
+        **options: WebhookClient arguments overriding the configured ones
+
+    Returns:
+        A WebhookClient, or None if no base URL is given or configured.
+    """
+    settings = get_settings()
+    base_url = base_url or settings.n8n_base_url
+    if not base_url:
+        return None
+    kwargs: dict[str, Any] = {
+        "auth_config": WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        "timeout": settings.webhook_timeout,
+        "retry_policy": RetryPolicy(
+            max_retries=settings.webhook_max_retries,
+            base_delay=settings.webhook_retry_delay_seconds,
+            deadline=settings.webhook_retry_deadline_seconds,
+        ),
+        "response_cache": get_response_cache(),
+        "callbacks": get_callback_registry(),
+        "rate_limiter": get_rate_limiter(),
+        "max_rate_wait": settings.rate_limit_max_wait_seconds,
+        "endpoints": settings.n8n_replica_urls,
+        "hedge": settings.webhook_hedging,
+    }
+    kwargs.update(options)
+    return WebhookClient(base_url=base_url, **kwargs)
+
@@ -0,0 +1,69 @@
+"""
+Data models for n8n webhook communication.
+
+Kept apart from :mod:`app.services.webhook` so request plans and other
+helpers can use them without importing the client.
+"""
+
+from datetime import datetime
+from enum import StrEnum
+
+from pydantic import BaseModel, Field
+
+
+class WebhookAuthType(StrEnum):
+    """Supported n8n webhook authentication methods."""
+    NONE = "none"
+    BASIC = "basic"
+    HEADER = "header"
+    JWT = "jwt"
+
+
+class WebhookPayloadFormat(StrEnum):
+    """Supported webhook payload formats."""
+    JSON = "json"
+    FORM_DATA = "form_data"
+    RAW_BODY = "raw_body"
+    BINARY = "binary"
+
+
+class WebhookAuthConfig(BaseModel):
+    """Configuration for webhook authentication."""
+    auth_type: WebhookAuthType
+    username: str | None = None
+    password: str | None = None
+    header_key: str | None = None
+    header_value: str | None = None
+    jwt_token: str | None = None
+
+
+class WebhookAttachment(BaseModel):
+    """A stored file sent with a message as a BINARY part."""
+    path: str = Field(..., description="Path relative to the upload directory")
+    filename: str = Field(..., description="Name the file is sent under")
+
+
+class WebhookMessage(BaseModel):
+    """Message structure for n8n webhook communication."""
+    message_id: str = Field(..., description="Unique message identifier")
+    user_id: str = Field(..., description="User identifier")
+    content: str = Field(..., description="Message content")
+    format: str = Field(default="markdown", description="Content format")
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    attachments: list[str] = Field(default_factory=list, description="File paths")
+    # Never serialised into a webhook body: paths are internal to NECTA
+    files: list[WebhookAttachment] = Field(
+        default_factory=list, description="Stored files, sent only as BINARY parts"
+    )
+    metadata: dict = Field(default_factory=dict, description="Additional data")
+
+
+class WebhookResponse(BaseModel):
+    """Response from n8n webhook."""
+    success: bool
+    message_id: str
+    agent_response: str | None = None
+    response_format: str = "markdown"
+    processing_time_ms: int | None = None
+    error: str | None = None
+    metadata: dict = Field(default_factory=dict)
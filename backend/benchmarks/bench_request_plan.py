@@ -0,0 +1,80 @@
+"""
+Micro-benchmark: per-message request preparation, before and after plans.
+
+Measures building an ``httpx.Request`` for one message - the work done on
+every send before any I/O - the old way (headers, base64, ``urljoin``,
+``model_dump`` then httpx's JSON encoding) and from a compiled RequestPlan.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_request_plan [--iterations N]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urljoin
+
+import httpx
+
+from app.services.request_plan import compile_plan
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookMessage,
+    build_auth_headers,
+)
+
+BASE_URL = "https://n8n.example.com"
+WEBHOOK_PATH = "/webhook/chat"
+AUTH = WebhookAuthConfig(auth_type=WebhookAuthType.BASIC, username="necta", password="s3cret")
+MESSAGE = WebhookMessage(
+    message_id="msg-1",
+    user_id="user-1",
+    content="Summarise the attached quarterly report in three bullet points. " * 8,
+    metadata={"session": "abc", "history": [{"role": "user", "content": "hi"}] * 5},
+)
+
+
+def legacy(message: WebhookMessage) -> httpx.Request:
+    url = urljoin(BASE_URL, WEBHOOK_PATH)
+    headers = build_auth_headers(AUTH)
+    return httpx.Request("POST", url, headers=headers, json=message.model_dump(mode="json"))
+
+
+async def planned(plan, message: WebhookMessage) -> httpx.Request:
+    return httpx.Request("POST", plan.url, **await plan.build(message))
+
+
+async def run(iterations: int) -> dict:
+    plan = compile_plan(BASE_URL, WEBHOOK_PATH, build_auth_headers(AUTH))
+    assert json.loads(legacy(MESSAGE).content) == json.loads((await planned(plan, MESSAGE)).content)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        legacy(MESSAGE)
+    legacy_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await planned(plan, MESSAGE)
+    plan_us = (time.perf_counter() - start) / iterations * 1e6
+
+    return {
+        "iterations": iterations,
+        "legacy_us_per_message": round(legacy_us, 2),
+        "plan_us_per_message": round(plan_us, 2),
+        "speedup": round(legacy_us / plan_us, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.iterations)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark: chat history search, ``LIKE`` scan versus the FTS5 index.
+
+Builds a synthetic corpus (1M messages by default, spread over many
+profiles, words drawn from a Zipf-like vocabulary so there are common,
+medium and rare terms), reports the insert rate with the index triggers in
+place, then times each query kind both ways: a ``LIKE '%term%'`` scan of
+the profile's messages and :func:`app.services.search.search_messages`.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_search [--messages N] [--profiles N] [--db PATH]
+
+The corpus is written to a temporary file unless ``--db`` is given; an
+existing ``--db`` is reused as is, which makes repeated query runs cheap.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db import create_engine
+from app.models import Base, Message, Profile
+from app.models.base import new_id
+from app.services.search import search_messages
+
+CONSONANTS = "bcdfghklmnprstvz"
+VOWELS = "aeiou"
+BATCH = 10000
+
+
+def vocabulary(size: int) -> list[str]:
+    """Distinct pronounceable words, the first ones the most frequent."""
+    syllables = [c + v for c, v in itertools.product(CONSONANTS, VOWELS)]
+    words = []
+    for length in itertools.count(2):
+        for parts in itertools.product(syllables, repeat=length):
+            words.append("".join(parts))
+            if len(words) == size:
+                return words
+    return words
+
+
+def corpus_rows(rng: random.Random, words: list[str], profiles: list[str], count: int):
+    """Message rows in batches of ``BATCH``, a few minutes apart per profile."""
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    start = datetime(2024, 1, 1)
+    for offset in range(0, count, BATCH):
+        batch = []
+        for i in range(offset, min(offset + BATCH, count)):
+            created = start + timedelta(minutes=3 * i)
+            content = " ".join(rng.choices(words, cum_weights=weights, k=rng.randint(8, 40)))
+            batch.append({
+                "id": new_id(),
+                "profile_id": profiles[i % len(profiles)],
+                "message_type": "user" if i % 2 == 0 else "agent",
+                "content": content.capitalize() + ".",
+                "content_format": "markdown",
+                "message_metadata": {},
+                "file_attachments": [],
+                "created_at": created,
+                "updated_at": created,
+            })
+        yield batch
+
+
+async def build(sessionmaker: async_sessionmaker, messages: int, profiles: int, words: list[str]) -> dict:
+    rng = random.Random(0)
+    profile_ids = [new_id() for _ in range(profiles)]
+    async with sessionmaker() as session:
+        await session.execute(insert(Profile), [
+            {
+                "id": pid,
+                "name": f"Profile {n}",
+                "dev_webhook_url": "https://n8n.example.com/webhook/dev",
+                "prod_webhook_url": "https://n8n.example.com/webhook/prod",
+            }
+            for n, pid in enumerate(profile_ids)
+        ])
+        await session.commit()
+
+    start = time.perf_counter()
+    for batch in corpus_rows(rng, words, profile_ids, messages):
+        async with sessionmaker() as session:
+            await session.execute(insert(Message), batch)
+            await session.commit()
+    seconds = time.perf_counter() - start
+    return {"messages": messages, "profiles": profiles, "inserts_per_second": round(messages / seconds)}
+
+
+async def like_scan(session: AsyncSession, term: str, profile_id: str) -> int:
+    # What search looked like without the index
+    pattern = f"%{term.rstrip('*')}%"
+    query = (
+        select(Message)
+        .where(Message.profile_id == profile_id, Message.content.ilike(pattern))
+        .order_by(Message.created_at.desc())
+        .limit(20)
+    )
+    return len((await session.scalars(query)).all())
+
+
+async def fts_search(session: AsyncSession, term: str, profile_id: str) -> int:
+    return len((await search_messages(session, term, profile_id=profile_id)).items)
+
+
+async def time_queries(
+    sessionmaker: async_sessionmaker,
+    search: Callable[[AsyncSession, str, str], Awaitable[int]],
+    term: str,
+    profile_ids: list[str],
+) -> dict:
+    timings = []
+    async with sessionmaker() as session:
+        await search(session, term, profile_ids[0])  # warm the page cache
+        for profile_id in profile_ids:
+            start = time.perf_counter()
+            await search(session, term, profile_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="necta-search-"), "bench.db")
+    fresh = not os.path.exists(path)
+    engine = create_engine(f"sqlite:///{path}")
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    words = vocabulary(args.vocabulary)
+    report: dict = {"db": path}
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        if fresh:
+            report["build"] = await build(sessionmaker, args.messages, args.profiles, words)
+        async with sessionmaker() as session:
+            report["corpus_messages"] = await session.scalar(select(func.count()).select_from(Message))
+            profile_ids = list((await session.scalars(select(Profile.id).limit(args.queries))).all())
+
+        terms = {
+            "common": words[5],
+            "medium": words[len(words) // 10],
+            "rare": words[-1],
+            "prefix": words[len(words) // 10][:4] + "*",
+            "two_words": f"{words[5]} {words[len(words) // 10]}",
+        }
+        report["queries"] = {}
+        for kind, term in terms.items():
+            like = await time_queries(sessionmaker, like_scan, term.split()[-1], profile_ids)
+            fts = await time_queries(sessionmaker, fts_search, term, profile_ids)
+            report["queries"][kind] = {
+                "term": term,
+                "like": like,
+                "fts": fts,
+                "speedup_p50": round(like["p50_ms"] / max(fts["p50_ms"], 1e-6), 1),
+            }
+    finally:
+        await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--profiles", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=20, help="Profiles searched per query kind")
+    parser.add_argument("--db", help="Corpus database to create or reuse")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Load driver: throughput, latency percentiles and memory against mock n8n.
+
+Targets:
+
+- ``client``: ``WebhookClient.send_message`` straight to the mock;
+- ``endpoint``: ``POST /api/chat/messages`` through the FastAPI app,
+  dispatch queue included;
+- ``stream``: ``WebhookClient.stream_message`` (latency is time to the
+  last chunk; ``first_token_ms`` is reported too).
+
+Each concurrency level is run in turn and the results are written as JSON,
+tagged with the current commit, so runs can be compared::
+
+    python -m benchmarks.load --target client --concurrency 1,16,64 \\
+        --requests 2000 --latency lognormal:50:0.5 --output after.json
+    python -m benchmarks.load --compare before.json after.json
+
+Run from ``backend/``. By default the mock is called in process; with
+``--socket`` it is served by uvicorn on localhost.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+import httpx
+
+from app.api.deps import get_dispatcher, get_message_sink
+from app.main import app
+from app.services.dispatcher import DispatchLimits, WebhookDispatcher
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+from benchmarks.mock_n8n import Latency, MockN8nServer, serve
+
+WEBHOOK_PATH = "/webhook/chat"
+CONTENT = "Summarise the latest support tickets and suggest next steps."
+
+# One request by index; returns whether it succeeded
+Call = Callable[[int], Awaitable[bool]]
+
+
+@dataclass
+class RunResult:
+    """Measurements for one target at one concurrency level."""
+    target: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration_s: float
+    throughput_rps: float
+    latency_ms: dict[str, float]
+    rss_peak_kib: int
+    alloc_peak_kib: int | None = None
+    extra: dict[str, float] = field(default_factory=dict)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of pre-sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarise(latencies_ms: list[float]) -> dict[str, float]:
+    values = sorted(latencies_ms)
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else 0.0,
+        "mean": sum(values) / len(values) if values else 0.0,
+    }
+
+
+async def drive(call: Call, requests: int, concurrency: int) -> tuple:
+    """
+    Issue ``requests`` calls from ``concurrency`` concurrent workers.
+
+    Returns:
+        (latencies in ms, error count, wall-clock seconds)
+    """
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal errors, next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                ok = await call(index)
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def _message(index: int) -> WebhookMessage:
+    return WebhookMessage(message_id=f"bench-{index}", user_id="bench", content=CONTENT)
+
+
+def make_client(base_url: str, transport: httpx.AsyncBaseTransport | None) -> WebhookClient:
+    """A client with retries off and a breaker that never trips."""
+    return WebhookClient(
+        base_url,
+        WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        registry=HttpClientRegistry(transport=transport),
+        retry_policy=RetryPolicy(max_retries=0, deadline=None),
+        breakers=CircuitBreakerRegistry(failure_threshold=10**9),
+        profile_id="bench",
+    )
+
+
+@contextlib.asynccontextmanager
+async def target_call(target: str, client: WebhookClient, concurrency: int, requests: int):
+    """Yield the per-request coroutine for ``target`` (and extra stats)."""
+    extra: dict[str, list[float]] = {"first_token_ms": []}
+
+    if target == "client":
+        async def call(index: int) -> bool:
+            return (await client.send_message(WEBHOOK_PATH, _message(index))).success
+        yield call, extra
+
+    elif target == "stream":
+        async def call(index: int) -> bool:
+            start = time.perf_counter()
+            first_token = True
+            ok = True
+            async for chunk in client.stream_message(WEBHOOK_PATH, _message(index)):
+                if chunk.delta and first_token:
+                    extra["first_token_ms"].append((time.perf_counter() - start) * 1000)
+                    first_token = False
+                ok = chunk.error is None
+            return ok
+        yield call, extra
+
+    elif target == "endpoint":
+        async def resolve(profile_id: str, profile=None) -> WebhookClient:
+            return client
+
+        dispatcher = WebhookDispatcher(resolve, DispatchLimits(
+            workers=max(32, concurrency),
+            max_per_profile=concurrency,
+            max_per_origin=concurrency,
+            max_queue_depth=requests,
+            max_queue_per_profile=requests,
+        ))
+        await dispatcher.start()
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        try:
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://necta"
+            ) as http:
+                async def call(index: int) -> bool:
+                    response = await http.post("/api/chat/messages", json={
+                        "profile_id": "bench", "webhook_path": WEBHOOK_PATH, "content": CONTENT,
+                    })
+                    return response.status_code == 200 and response.json()["success"]
+                yield call, extra
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+    else:
+        raise ValueError(f"Unknown target: {target}")
+
+
+async def run_level(
+    target: str,
+    client: WebhookClient,
+    requests: int,
+    concurrency: int,
+    trace_memory: bool = False,
+) -> RunResult:
+    """Benchmark one target at one concurrency level."""
+    async with target_call(target, client, concurrency, requests) as (call, extra):
+        await drive(call, min(requests, concurrency * 2), concurrency)  # warm up
+        extra["first_token_ms"].clear()
+        if trace_memory:
+            tracemalloc.start()
+        latencies, errors, duration = await drive(call, requests, concurrency)
+        alloc_peak = None
+        if trace_memory:
+            alloc_peak = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+    first_tokens = sorted(extra["first_token_ms"])
+    return RunResult(
+        target=target,
+        concurrency=concurrency,
+        requests=requests,
+        errors=errors,
+        duration_s=round(duration, 4),
+        throughput_rps=round(requests / duration, 1) if duration else 0.0,
+        latency_ms={k: round(v, 3) for k, v in summarise(latencies).items()},
+        rss_peak_kib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        alloc_peak_kib=alloc_peak,
+        extra={"first_token_p50_ms": round(percentile(first_tokens, 0.5), 3)} if first_tokens else {},
+    )
+
+
+def parse_latency(spec: str) -> Latency:
+    """``10`` (constant ms), ``uniform:5:50`` or ``lognormal:50:0.5``."""
+    kind, _, rest = spec.partition(":")
+    if not rest:
+        return Latency.constant(float(kind))
+    args = [float(x) for x in rest.split(":")]
+    if kind == "uniform":
+        return Latency.uniform(*args)
+    if kind == "lognormal":
+        return Latency.lognormal(*args)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    server = MockN8nServer(
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        mode="stream" if args.target == "stream" else args.mode,
+        record=False,
+        seed=args.seed,
+    )
+    results = []
+    with contextlib.ExitStack() as stack:
+        if args.socket:
+            base_url, transport = stack.enter_context(serve(server, port=args.port)), None
+        else:
+            base_url, transport = "http://mock-n8n", server.transport()
+        for concurrency in args.concurrency:
+            client = make_client(base_url, transport)
+            result = await run_level(
+                args.target, client, args.requests, concurrency, args.trace_memory
+            )
+            await client.registry.aclose()
+            results.append(asdict(result))
+            print(
+                f"{args.target:>8} c={concurrency:<4} {result.throughput_rps:>9.1f} msg/s  "
+                f"p50={result.latency_ms['p50']:.2f}ms p95={result.latency_ms['p95']:.2f}ms "
+                f"p99={result.latency_ms['p99']:.2f}ms errors={result.errors}"
+            )
+    return {
+        "commit": _commit(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "target": args.target,
+            "requests": args.requests,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "mode": args.mode,
+            "socket": args.socket,
+        },
+        "results": results,
+    }
+
+
+def compare(before: dict[str, Any], after: dict[str, Any], threshold: float) -> int:
+    """
+    Print throughput and p99 changes per level.
+
+    Returns:
+        1 if any level regressed by more than ``threshold`` (a fraction).
+    """
+    baseline = {(r["target"], r["concurrency"]): r for r in before["results"]}
+    regressed = False
+    for r in after["results"]:
+        old = baseline.get((r["target"], r["concurrency"]))
+        if old is None:
+            continue
+        rps = (r["throughput_rps"] - old["throughput_rps"]) / (old["throughput_rps"] or 1)
+        p99 = (r["latency_ms"]["p99"] - old["latency_ms"]["p99"]) / (old["latency_ms"]["p99"] or 1)
+        flag = ""
+        if rps < -threshold or p99 > threshold:
+            regressed, flag = True, "  REGRESSION"
+        print(f"{r['target']:>8} c={r['concurrency']:<4} throughput {rps:+.1%}  p99 {p99:+.1%}{flag}")
+    return 1 if regressed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=["client", "endpoint", "stream"], default="client")
+    parser.add_argument("--concurrency", default="1,8,32,128",
+                        type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency", default="0", help="ms, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mode", choices=["json", "slow_body"], default="json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--socket", action="store_true", help="serve the mock with uvicorn")
+    parser.add_argument("--port", type=int, default=5679)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report peak Python allocations (slows the run)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_before, open(args.compare[1]) as f_after:
+            return compare(json.load(f_before), json.load(f_after), args.threshold)
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
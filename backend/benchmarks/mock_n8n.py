@@ -0,0 +1,246 @@
+"""
+A local stand-in for n8n, served as a plain ASGI application.
+
+It answers webhook POSTs the way an n8n "Respond to Webhook" node does,
+with configurable behaviour:
+
+- latency drawn from a :class:`Latency` distribution (constant, uniform or
+  log-normal, the usual shape of LLM response times);
+- a random error rate (HTTP 500);
+- ``json``: one JSON answer; ``stream``: n8n's NDJSON streaming envelope,
+  one token per chunk; ``slow_body``: a JSON answer trickled out in small
+  chunks, for testing read timeouts.
+
+It also answers ``OPTIONS`` on webhooks and ``GET /healthz`` like n8n.
+
+Use it in process through ``httpx.ASGITransport`` (``server.transport()``),
+or on a real socket with :func:`serve` when uvicorn is installed.
+"""
+
+import asyncio
+import contextlib
+import json
+import math
+import random
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+
+@dataclass
+class Latency:
+    """
+    Response latency distribution, in milliseconds.
+
+    Args:
+        kind: ``constant``, ``uniform`` (``low``..``high``) or ``lognormal``
+            (median ``median``, shape ``sigma``)
+    """
+    kind: str = "constant"
+    median: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+    sigma: float = 0.5
+
+    @classmethod
+    def constant(cls, ms: float) -> "Latency":
+        return cls("constant", median=ms)
+
+    @classmethod
+    def uniform(cls, low: float, high: float) -> "Latency":
+        return cls("uniform", low=low, high=high)
+
+    @classmethod
+    def lognormal(cls, median: float, sigma: float = 0.5) -> "Latency":
+        return cls("lognormal", median=median, sigma=sigma)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.low, self.high)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(max(self.median, 1e-9)), self.sigma)
+        return self.median
+
+
+@dataclass
+class RecordedRequest:
+    """A request received by the mock."""
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+@dataclass
+class MockN8nServer:
+    """
+    Configurable mock n8n instance (an ASGI application).
+
+    Attributes:
+        response: JSON answered in ``json`` mode
+        status_code: Status for non-error answers
+        latency: Delay before answering
+        error_rate: Probability of answering HTTP 500 instead
+        mode: ``json``, ``stream`` or ``slow_body``
+        chunk_delay: Seconds between chunks in ``stream``/``slow_body`` modes
+        record: Keep every request in ``requests`` (off for long load runs)
+        seed: Seed for latency and error sampling
+    """
+    response: dict[str, Any] = field(default_factory=lambda: {"response": "Mock response"})
+    status_code: int = 200
+    latency: Latency = field(default_factory=Latency)
+    error_rate: float = 0.0
+    mode: str = "json"
+    chunk_delay: float = 0.0
+    record: bool = True
+    seed: int | None = None
+    requests: list[RecordedRequest] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self.served = 0
+        self.errors = 0
+
+    # Kept from the original test double's API
+    @property
+    def delay(self) -> float:
+        return self.latency.median / 1000
+
+    def set_response(self, response: dict, status_code: int = 200, delay: float = 0) -> None:
+        self.response = response
+        self.status_code = status_code
+        self.latency = Latency.constant(delay * 1000)
+
+    def get_requests(self) -> list[RecordedRequest]:
+        return self.requests.copy()
+
+    def clear_requests(self) -> None:
+        self.requests.clear()
+
+    def transport(self) -> httpx.ASGITransport:
+        """In-process transport for ``HttpClientRegistry(transport=...)``."""
+        return httpx.ASGITransport(app=self)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        method, path = scope["method"], scope["path"]
+        if self.record:
+            headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+            self.requests.append(RecordedRequest(method, path, headers, body))
+
+        if method == "GET" and path == "/healthz":
+            return await _respond(send, 200, {"status": "ok"})
+        if method == "OPTIONS":
+            return await _respond(send, 204, None)
+        if method != "POST":
+            return await _respond(send, 404, {"message": "Webhook not registered"})
+
+        delay = self.latency.sample(self._rng) / 1000
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.served += 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return await _respond(send, 500, {"message": "Workflow execution failed"})
+
+        if self.mode == "stream":
+            return await self._stream(send)
+        if self.mode == "slow_body":
+            return await self._slow_body(send)
+        return await _respond(send, self.status_code, self.response)
+
+    async def _stream(self, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        text = str(self.response.get("response", ""))
+        items = [{"type": "begin"}]
+        tokens = text.split(" ")
+        items += [
+            {"type": "item", "content": token if i == 0 else f" {token}"}
+            for i, token in enumerate(tokens)
+        ]
+        items.append({"type": "end"})
+        for i, item in enumerate(items):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            await send({
+                "type": "http.response.body",
+                "body": json.dumps(item).encode() + b"\n",
+                "more_body": True,
+            })
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _slow_body(self, send, chunk_size: int = 8) -> None:
+        payload = json.dumps(self.response).encode()
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        for start in range(0, len(payload), chunk_size):
+            await asyncio.sleep(self.chunk_delay)
+            await send({
+                "type": "http.response.body",
+                "body": payload[start:start + chunk_size],
+                "more_body": True,
+            })
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def _respond(send, status: int, payload: Any | None) -> None:
+    body = b"" if payload is None else json.dumps(payload).encode()
+    headers = [(b"content-type", b"application/json")] if payload is not None else []
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+@contextlib.contextmanager
+def serve(app: Any, host: str = "127.0.0.1", port: int = 5679) -> Iterator[str]:
+    """
+    Serve an ASGI app on a real socket in a background thread.
+
+    Yields:
+        The base URL. Requires uvicorn.
+    """
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Mock n8n server did not start")
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
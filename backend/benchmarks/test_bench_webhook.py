@@ -0,0 +1,69 @@
+"""
+pytest-benchmark suite for the webhook hot path, against mock n8n.
+
+Not collected by the default test run. Run from ``backend/`` and compare
+against a saved baseline::
+
+    pytest benchmarks/test_bench_webhook.py --benchmark-autosave
+    pytest benchmarks/test_bench_webhook.py --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.load import WEBHOOK_PATH, _message, drive, make_client  # noqa: E402
+from benchmarks.mock_n8n import MockN8nServer  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def _client(mode: str = "json"):
+    server = MockN8nServer(mode=mode, record=False, seed=0)
+    return make_client("http://mock-n8n", server.transport())
+
+
+def test_send_message(benchmark, loop):
+    """One send_message round trip."""
+    client = _client()
+    message = _message(0)
+
+    result = benchmark(lambda: loop.run_until_complete(client.send_message(WEBHOOK_PATH, message)))
+
+    assert result.success
+    loop.run_until_complete(client.registry.aclose())
+
+
+def test_stream_message(benchmark, loop):
+    """One streamed answer, consumed to the end."""
+    client = _client(mode="stream")
+    message = _message(0)
+
+    async def consume():
+        return [chunk async for chunk in client.stream_message(WEBHOOK_PATH, message)]
+
+    chunks = benchmark(lambda: loop.run_until_complete(consume()))
+
+    assert chunks[-1].done and chunks[-1].error is None
+    loop.run_until_complete(client.registry.aclose())
+
+
+@pytest.mark.parametrize("concurrency", [1, 16, 64])
+def test_send_message_concurrent(benchmark, loop, concurrency):
+    """100 messages at a given concurrency."""
+    client = _client()
+
+    async def call(index: int) -> bool:
+        return (await client.send_message(WEBHOOK_PATH, _message(index))).success
+
+    _, errors, _ = benchmark(lambda: loop.run_until_complete(drive(call, 100, concurrency)))
+
+    assert errors == 0
+    loop.run_until_complete(client.registry.aclose())
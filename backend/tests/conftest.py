@@ -4,22 +4,25 @@ Test configuration and fixtures for NECTA backend tests.
 import asyncio
 import os
 import tempfile
-from typing import AsyncGenerator, Generator
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
-from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.main import app
-
 # Test database configuration
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
+# Keep the app's own engine (used by the lifespan) off the working directory
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL)
+
+from app.main import app  # noqa: E402
+from benchmarks.mock_n8n import MockN8nServer as MockWebhookServer  # noqa: E402
+
 # Create test engine
 test_engine = create_async_engine(
     TEST_DATABASE_URL,
@@ -48,15 +51,15 @@ def event_loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     """Create a test database session."""
     from app.models import Base  # Import your models here when created
-    
+
     # Create tables
     async with test_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
+
     # Create session
     async with TestSessionLocal() as session:
         yield session
-    
+
     # Drop tables
     async with test_engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -105,7 +108,7 @@ def mock_env_vars(monkeypatch) -> None:
         "WEBHOOK_MAX_RETRIES": "3",
         "WEBHOOK_RETRY_DELAY_SECONDS": "1",  # Faster for tests
     }
-    
+
     for key, value in test_env.items():
         monkeypatch.setenv(key, value)
 
@@ -162,31 +165,15 @@ def mock_webhook_response() -> dict:
     }
 
 
-class MockWebhookServer:
-    """Mock webhook server for testing n8n integration."""
-    
-    def __init__(self):
-        self.requests = []
-        self.response = {"message": "Mock response"}
-        self.status_code = 200
-        self.delay = 0
-    
-    def set_response(self, response: dict, status_code: int = 200, delay: float = 0):
-        self.response = response
-        self.status_code = status_code
-        self.delay = delay
-    
-    def get_requests(self) -> list:
-        return self.requests.copy()
-    
-    def clear_requests(self):
-        self.requests.clear()
-
-
 @pytest.fixture
 def mock_webhook_server() -> MockWebhookServer:
-    """Create a mock webhook server for testing."""
-    return MockWebhookServer()
+    """
+    A local mock n8n instance.
+
+    Pass ``mock_webhook_server.transport()`` to ``HttpClientRegistry`` to
+    route webhook calls to it.
+    """
+    return MockWebhookServer(seed=0)
 
 
 # Security testing fixtures
@@ -215,4 +202,4 @@ def malicious_input_samples() -> list:
         "\\x00\\x01\\x02",  # Binary data
         "A" * 10000,  # Large input
         "{{constructor.constructor('return process')().exit()}}",  # JS injection
-    ]
\ No newline at end of file
+    ]
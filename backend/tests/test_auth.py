@@ -0,0 +1,200 @@
+"""
+Tests for cached bearer token verification and revocation.
+"""
+import asyncio
+import time
+import uuid
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from httpx import AsyncClient
+from jose import jwt
+
+from app.api.deps import get_token_verifier
+from app.main import app
+from app.services.auth import AuthenticationError, RevocationList, TokenVerifier
+from app.services.broker import InMemoryBroker
+from app.services.redis_backend import InMemoryRedis
+
+SECRET = "test-secret"
+
+
+def _token(key: str = SECRET, algorithm: str = "HS256", ttl: float = 3600, **claims) -> str:
+    claims = {"sub": "user-1", "jti": str(uuid.uuid4()), "exp": int(time.time() + ttl), **claims}
+    return jwt.encode(claims, key, algorithm=algorithm)
+
+
+def _verifier(**kwargs) -> TokenVerifier:
+    kwargs.setdefault("revocations", RevocationList(InMemoryBroker()))
+    return TokenVerifier(SECRET, ["HS256"], **kwargs)
+
+
+class TestTokenVerifier:
+    """Test verification and the verified-token cache."""
+
+    def test_second_request_is_a_cache_hit(self):
+        """Test that a token is verified in full only once."""
+        verifier = _verifier()
+        token = _token()
+
+        assert verifier.verify(token)["sub"] == "user-1"
+        assert verifier.verify(token)["sub"] == "user-1"
+
+        assert verifier.stats()["misses"] == 1
+        assert verifier.stats()["hits"] == 1
+
+    def test_cache_entry_ends_at_expiry(self):
+        """Test that a cached token is not served past its ``exp``."""
+        now = [time.time()]
+        verifier = _verifier(clock=lambda: now[0])
+        token = _token(ttl=60)
+        verifier.verify(token)
+
+        now[0] += 61
+        verifier.verify(token)
+
+        assert verifier.stats()["misses"] == 2
+
+    @pytest.mark.parametrize("token", [
+        _token(key="wrong-secret"),
+        _token(algorithm="HS512"),
+        _token(ttl=-120),
+        _token(aud="other-app"),
+        _token(),
+        "not.a.token",
+    ])
+    def test_invalid_tokens(self, token):
+        """Test that forged, expired, foreign, audience-less and malformed tokens are rejected."""
+        verifier = _verifier(audience="necta")
+
+        with pytest.raises(AuthenticationError):
+            verifier.verify(token)
+        assert verifier.stats()["cached"] == 0
+
+    def test_token_without_expiry_is_rejected(self):
+        """Test that every accepted token has an ``exp`` to bound its revocation."""
+        verifier = _verifier()
+        token = jwt.encode({"sub": "user-1", "jti": str(uuid.uuid4())}, SECRET, algorithm="HS256")
+
+        with pytest.raises(AuthenticationError):
+            verifier.verify(token)
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used tokens are evicted."""
+        verifier = _verifier(cache_size=2)
+        first, second, third = _token(), _token(), _token()
+        for token in (first, second, first, third):
+            verifier.verify(token)
+
+        verifier.verify(first)
+        verifier.verify(second)
+
+        assert verifier.stats()["cached"] == 2
+        assert verifier.stats()["hits"] == 2
+
+    def test_public_key_is_parsed_once(self):
+        """Test RS256 verification with a PEM public key."""
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+        public = private.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        verifier = TokenVerifier(public, ["RS256"], RevocationList(InMemoryBroker()))
+
+        assert verifier.verify(_token(key=pem, algorithm="RS256"))["sub"] == "user-1"
+        with pytest.raises(AuthenticationError):
+            verifier.verify(_token())
+
+
+class TestRevocation:
+    """Test revocation across workers."""
+
+    @pytest.mark.asyncio
+    async def test_revoked_cached_token_is_rejected(self):
+        """Test that revocation applies to tokens already in the cache."""
+        verifier = _verifier()
+        token = _token()
+        claims = verifier.verify(token)
+
+        await verifier.revoke(claims)
+
+        with pytest.raises(AuthenticationError, match="revoked"):
+            verifier.verify(token)
+
+    @pytest.mark.asyncio
+    async def test_revocation_reaches_other_workers(self):
+        """Test that running workers hear of revocations and new ones load them."""
+        broker, redis = InMemoryBroker(), InMemoryRedis()
+        worker_a = RevocationList(broker, redis)
+        worker_b = RevocationList(broker, redis)
+        await worker_a.start()
+        await worker_b.start()
+        try:
+            await worker_a.revoke("jti-1", time.time() + 60)
+            await asyncio.sleep(0)
+            late = RevocationList(InMemoryBroker(), redis)
+            await late.start()
+
+            assert worker_b.is_revoked("jti-1")
+            assert late.is_revoked("jti-1")
+            assert not worker_b.is_revoked("jti-2")
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+    @pytest.mark.asyncio
+    async def test_expired_revocations_are_pruned(self):
+        """Test that entries are dropped once their token has expired."""
+        now = [1000.0]
+        redis = InMemoryRedis()
+        revocations = RevocationList(InMemoryBroker(), redis, clock=lambda: now[0])
+        await revocations.revoke("old", 1010)
+
+        now[0] += 61
+        await revocations.revoke("new", 2000)
+        await asyncio.sleep(0)
+
+        assert not revocations.is_revoked("old")
+        assert revocations.is_revoked("new")
+        assert list(await redis.hgetall("necta:auth:revoked")) == ["new"]
+
+
+class TestAuthEndpoints:
+    """Test the bearer dependency on the API."""
+
+    @pytest.mark.asyncio
+    async def test_logout_revokes_token(self, async_client: AsyncClient):
+        """Test that chat needs a token and a logged-out token stops working."""
+        verifier = _verifier()
+        token = _token()
+        headers = {"Authorization": f"Bearer {token}"}
+        app.dependency_overrides[get_token_verifier] = lambda: verifier
+        try:
+            anonymous = await async_client.get("/api/chat/search", params={"q": "x"})
+            logout = await async_client.post("/api/auth/logout", headers=headers)
+            again = await async_client.post("/api/auth/logout", headers=headers)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert anonymous.status_code == 401
+        assert anonymous.headers["WWW-Authenticate"] == "Bearer"
+        assert logout.status_code == 204
+        assert again.status_code == 401
+        assert "revoked" in again.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_auth_off_by_default(self, async_client: AsyncClient):
+        """Test that logout reports that auth is not configured."""
+        app.dependency_overrides[get_token_verifier] = lambda: None
+        try:
+            response = await async_client.post("/api/auth/logout")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 404
@@ -0,0 +1,305 @@
+"""
+Tests for the content-addressed attachment store.
+"""
+import asyncio
+import hashlib
+import io
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+
+from app.api.deps import get_blob_store, get_dispatcher
+from app.config import get_settings
+from app.main import app
+from app.services.blob_store import BlobNotFoundError, BlobStore
+from app.services.dispatcher import WebhookDispatcher
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import WebhookAuthConfig, WebhookAuthType, WebhookClient
+
+
+def _png(width: int = 800, height: int = 600) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "teal").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestIngest:
+    """Test hashing, sharding and deduplication."""
+
+    @pytest.mark.asyncio
+    async def test_sharded_layout(self, tmp_path):
+        """Test that blobs are stored under their digest in two shard levels."""
+        store = BlobStore(tmp_path)
+        source = tmp_path / "report.pdf"
+        source.write_bytes(b"%PDF-1.4 quarterly numbers")
+
+        info = await store.ingest(source)
+
+        digest = hashlib.sha256(source.read_bytes()).hexdigest()
+        assert info.blob_id == digest
+        assert info.mime_type == "application/pdf"
+        assert store.path_for(digest) == tmp_path / digest[:2] / digest[2:4] / digest
+        assert store.path_for(digest).read_bytes() == source.read_bytes()
+
+    @pytest.mark.asyncio
+    async def test_duplicate_content_is_stored_once(self, tmp_path):
+        """Test that re-uploads only add references."""
+        store = BlobStore(tmp_path / "blobs")
+
+        async def upload(data: bytes):
+            yield data[:5]
+            yield data[5:]
+
+        first = await store.ingest(upload(b"same bytes"), filename="a.txt")
+        second = await store.ingest(upload(b"same bytes"), filename="b.txt")
+
+        assert first.blob_id == second.blob_id
+        assert second.refs == 2
+        assert store.stats() == {"blobs": 1, "bytes": 10, "refs": 2}
+        assert list((tmp_path / "blobs" / "tmp").iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_invalid_blob_id(self, tmp_path):
+        """Test that ids must be SHA-256 hex digests."""
+        store = BlobStore(tmp_path)
+        with pytest.raises(ValueError):
+            store.path_for("../../etc/passwd")
+        with pytest.raises(BlobNotFoundError):
+            await store.info("0" * 64)
+
+
+class TestGarbageCollection:
+    """Test reference counting and collection."""
+
+    @pytest.mark.asyncio
+    async def test_only_unreferenced_blobs_past_grace_are_collected(self, tmp_path):
+        """Test that GC respects references and the grace period."""
+        store = BlobStore(tmp_path)
+
+        async def upload(data: bytes):
+            yield data
+
+        kept = await store.ingest(upload(b"kept"))
+        dropped = await store.ingest(upload(b"dropped"))
+        released = await store.release(dropped.blob_id)
+
+        assert released.refs == 0
+        assert await store.gc(grace_seconds=60, now=released.released_at + 30) == 0
+        assert await store.gc(grace_seconds=60, now=released.released_at + 61) == 1
+        assert not store.path_for(dropped.blob_id).exists()
+        assert (await store.info(kept.blob_id)).refs == 1
+
+    @pytest.mark.asyncio
+    async def test_new_reference_cancels_pending_collection(self, tmp_path):
+        """Test that a re-upload after release keeps the blob."""
+        store = BlobStore(tmp_path)
+
+        async def upload(data: bytes):
+            yield data
+
+        info = await store.ingest(upload(b"popular"))
+        await store.release(info.blob_id)
+        await store.add_ref(info.blob_id)
+
+        assert await store.gc(grace_seconds=0, now=info.released_at or 1e12) == 0
+
+
+class TestReferenceCounting:
+    """Test references shared by several workers."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_workers_lose_no_references(self, tmp_path):
+        """Test that stores on the same root serialise their updates."""
+        workers = [BlobStore(tmp_path), BlobStore(tmp_path)]
+
+        async def upload():
+            yield b"shared"
+
+        info = await workers[0].ingest(upload())
+        await asyncio.gather(*(workers[i % 2].add_ref(info.blob_id) for i in range(40)))
+
+        assert (await workers[1].info(info.blob_id)).refs == 41
+
+    @pytest.mark.asyncio
+    async def test_unreferenced_upload_waits_for_a_message(self, tmp_path):
+        """Test that an upload without a reference is only kept for the grace period."""
+        store = BlobStore(tmp_path)
+
+        async def upload():
+            yield b"draft"
+
+        info = await store.ingest(upload(), take_ref=False)
+
+        assert info.refs == 0
+        assert await store.gc(grace_seconds=60, now=info.released_at + 30) == 0
+        assert await store.gc(grace_seconds=60, now=info.released_at + 61) == 1
+
+    @pytest.mark.asyncio
+    async def test_attach_is_all_or_nothing(self, tmp_path):
+        """Test that a failed attach releases the references it took."""
+        store = BlobStore(tmp_path)
+
+        async def upload():
+            yield b"kept"
+
+        info = await store.ingest(upload(), take_ref=False)
+        with pytest.raises(BlobNotFoundError):
+            await store.attach([info.blob_id, "0" * 64])
+
+        assert (await store.info(info.blob_id)).refs == 0
+
+
+class TestUploadEndpoint:
+    """Test uploading files and attaching them to messages."""
+
+    @pytest.mark.asyncio
+    async def test_upload_then_attach(self, tmp_path, async_client: AsyncClient, monkeypatch):
+        """Test that an attached upload is referenced and sent as a named file part."""
+        monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+        store = BlobStore(tmp_path / "blobs")
+        sent = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            sent.append(request.read())
+            return httpx.Response(200, json={"response": "ok"})
+
+        async def resolve(profile_id: str, profile=None) -> WebhookClient:
+            return WebhookClient(
+                "https://n8n.example.com",
+                WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+                registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+
+        dispatcher = WebhookDispatcher(resolve)
+        await dispatcher.start()
+        app.dependency_overrides[get_blob_store] = lambda: store
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        try:
+            uploaded = await async_client.post(
+                "/api/uploads", params={"filename": "report.pdf"}, content=b"%PDF-1.4 numbers"
+            )
+            blob_id = uploaded.json()["blob_id"]
+            message = await async_client.post("/api/chat/messages", json={
+                "profile_id": "p1",
+                "webhook_path": "/webhook/chat",
+                "content": "see attached",
+                "file_attachments": [{"blob_id": blob_id, "filename": "report.pdf"}],
+            })
+            unknown = await async_client.post("/api/chat/messages", json={
+                "profile_id": "p1",
+                "webhook_path": "/webhook/chat",
+                "content": "see attached",
+                "file_attachments": [{"blob_id": "0" * 64, "filename": "gone.pdf"}],
+            })
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+        assert uploaded.status_code == 201
+        assert uploaded.json()["mime_type"] == "application/pdf"
+        assert message.status_code == 200
+        assert b'name="file0"; filename="report.pdf"' in sent[0]
+        assert b"%PDF-1.4 numbers" in sent[0]
+        # The blob's location stays internal
+        assert b"blobs/" not in sent[0]
+        # "p1" is not a stored profile, so no message keeps the upload
+        assert (await store.info(blob_id)).refs == 0
+        assert unknown.status_code == 422
+        assert len(sent) == 1
+
+    @pytest.mark.asyncio
+    async def test_oversized_upload_is_refused(self, tmp_path, async_client: AsyncClient, monkeypatch):
+        """Test that an upload over the size limit is rejected with 413."""
+        from app.api import uploads
+
+        monkeypatch.setattr(uploads, "MAX_TOTAL_BYTES", 8)
+        store = BlobStore(tmp_path)
+        app.dependency_overrides[get_blob_store] = lambda: store
+        try:
+            response = await async_client.post(
+                "/api/uploads", params={"filename": "big.bin"}, content=b"0123456789"
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 413
+        assert store.stats()["blobs"] == 0
+
+    @pytest.mark.asyncio
+    async def test_disallowed_type_is_refused(self, tmp_path, async_client: AsyncClient):
+        """Test that an upload of a type outside the allowlist is rejected with 415."""
+        store = BlobStore(tmp_path)
+        app.dependency_overrides[get_blob_store] = lambda: store
+        try:
+            response = await async_client.post(
+                "/api/uploads", params={"filename": "setup.exe"}, content=b"MZ\x90\x00\x03"
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 415
+        assert response.json()["detail"].startswith("File type not allowed")
+
+    @pytest.mark.asyncio
+    async def test_disallowed_type_is_not_attached(self, tmp_path, async_client: AsyncClient):
+        """Test that a stored blob of a disallowed type cannot be attached."""
+        store = BlobStore(tmp_path)
+        source = tmp_path / "setup.exe"
+        source.write_bytes(b"MZ\x90\x00\x03")
+        info = await store.ingest(source, take_ref=False)
+        app.dependency_overrides[get_blob_store] = lambda: store
+        try:
+            response = await async_client.post("/api/chat/messages", json={
+                "profile_id": "p1",
+                "webhook_path": "/webhook/chat",
+                "content": "see attached",
+                "file_attachments": [{"blob_id": info.blob_id, "filename": "setup.exe"}],
+            })
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 422
+        assert response.json()["detail"].startswith("File type not allowed")
+        assert (await store.info(info.blob_id)).refs == 0
+
+
+class TestThumbnails:
+    """Test cached image derivatives."""
+
+    @pytest.mark.asyncio
+    async def test_thumbnail_rendered_once_and_collected(self, tmp_path):
+        """Test that thumbnails are cached and removed with their blob."""
+        store = BlobStore(tmp_path)
+        source = tmp_path / "photo.png"
+        source.write_bytes(_png())
+        info = await store.ingest(source)
+
+        thumb = await store.thumbnail(info.blob_id, (128, 128))
+        mtime = thumb.stat().st_mtime_ns
+        again = await store.thumbnail(info.blob_id, (128, 128))
+
+        assert again == thumb
+        assert thumb.stat().st_mtime_ns == mtime
+        with Image.open(thumb) as image:
+            assert image.size == (128, 96)
+
+        released = await store.release(info.blob_id)
+        await store.gc(grace_seconds=0, now=released.released_at + 1)
+        assert not thumb.exists()
+
+    @pytest.mark.asyncio
+    async def test_thumbnail_requires_image(self, tmp_path):
+        """Test that non-image blobs are rejected."""
+        store = BlobStore(tmp_path)
+
+        async def upload():
+            yield b"%PDF-1.4"
+
+        info = await store.ingest(upload())
+        with pytest.raises(ValueError):
+            await store.thumbnail(info.blob_id)
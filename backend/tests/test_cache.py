@@ -0,0 +1,207 @@
+"""
+Tests for request coalescing and the webhook response cache.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.cache import SingleFlight, TTLCache, payload_key
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _client(calls: list, **kwargs) -> WebhookClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"response": f"answer {len(calls)}"})
+
+    return WebhookClient(
+        "https://n8n.example.com",
+        WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+        retry_policy=RetryPolicy(max_retries=0),
+        breakers=CircuitBreakerRegistry(),
+        **kwargs,
+    )
+
+
+class TestTTLCache:
+    """Test LRU eviction, expiry and counters."""
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_expiry_and_counters(self):
+        """Test that entries expire after their TTL."""
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set("k", "v")
+
+        assert cache.get("k") == "v"
+        clock.now = 10
+        assert cache.get("k") is None
+        assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1, "evictions": 0}
+
+    def test_payload_key_ignores_dict_order(self):
+        """Test that equal payloads produce equal keys."""
+        assert payload_key("p", {"a": 1, "b": 2}) == payload_key("p", {"b": 2, "a": 1})
+        assert payload_key("p", {"a": 1}) != payload_key("q", {"a": 1})
+
+
+class TestSingleFlight:
+    """Test deduplication of concurrent calls."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        """Test that only the first caller runs the function."""
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+        assert results == ["result"] * 5
+        assert len(runs) == 1
+        assert flight.shared == 4
+        assert len(flight) == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_all_waiters(self):
+        """Test that a failure is shared and not cached."""
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("k", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert len(flight) == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_first_caller_does_not_cancel_waiters(self):
+        """Test that cancelling the caller that started a call only detaches it."""
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "result"
+        assert first.cancelled()
+        assert len(flight) == 0
+
+
+class TestWebhookClientCaching:
+    """Test coalescing and caching in WebhookClient."""
+
+    @pytest.mark.asyncio
+    async def test_connectivity_tests_coalesce(self):
+        """Test that concurrent health checks send a single request."""
+        calls: list = []
+        client = _client(calls, profile_id="p1")
+
+        results = await asyncio.gather(*(client.test_webhook("/webhook/chat") for _ in range(10)))
+
+        assert all(r["success"] for r in results)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_connectivity_results_cached(self):
+        """Test that polling within the TTL is served from the cache."""
+        calls: list = []
+        cache = TTLCache(ttl=60)
+        client = _client(calls, profile_id="p1", response_cache=cache)
+
+        await client.test_webhook("/webhook/chat")
+        await client.test_webhook("/webhook/chat")
+
+        assert len(calls) == 1
+        assert cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_cache_keyed_by_profile_and_environment(self):
+        """Test that profiles and environments never share entries."""
+        calls: list = []
+        cache = TTLCache(ttl=60)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="2+2?")
+
+        for profile_id, environment in [("p1", "dev"), ("p1", "prod"), ("p2", "dev"), ("p1", "dev")]:
+            client = _client(
+                calls, profile_id=profile_id, environment=environment,
+                response_cache=cache, deterministic=True,
+            )
+            await client.send_message("/webhook/chat", message)
+
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_deterministic_cache_hit_keeps_message_id(self):
+        """Test that cached replies carry the caller's message id."""
+        calls: list = []
+        client = _client(calls, response_cache=TTLCache(ttl=60), deterministic=True)
+
+        first = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m1", user_id="u1", content="2+2?")
+        )
+        second = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m2", user_id="u1", content="2+2?")
+        )
+
+        assert len(calls) == 1
+        assert second.agent_response == first.agent_response
+        assert second.message_id == "m2"
+
+    @pytest.mark.asyncio
+    async def test_regular_messages_not_cached(self):
+        """Test that non-deterministic agents always reach n8n."""
+        calls: list = []
+        client = _client(calls, response_cache=TTLCache(ttl=60))
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hello")
+
+        await client.send_message("/webhook/chat", message)
+        await client.send_message("/webhook/chat", message)
+
+        assert len(calls) == 2
@@ -0,0 +1,234 @@
+"""
+Tests for asynchronous agent replies delivered by callback.
+"""
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from app.api.deps import get_callback_registry
+from app.main import app
+from app.services.broker import InMemoryBroker
+from app.services.callbacks import CallbackRegistry
+from app.services.dispatcher import DispatchLimits, WebhookDispatcher
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+    WebhookResponse,
+)
+
+
+def _registry(broker=None, **kwargs) -> CallbackRegistry:
+    return CallbackRegistry(
+        "test-secret", "https://necta.example.com/", broker or InMemoryBroker(), **kwargs
+    )
+
+
+def _client(handler, callbacks: CallbackRegistry) -> WebhookClient:
+    return WebhookClient(
+        "https://n8n.example.com",
+        WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+        retry_policy=RetryPolicy(max_retries=0),
+        breakers=CircuitBreakerRegistry(),
+        callbacks=callbacks,
+    )
+
+
+def _message(message_id: str = "m1") -> WebhookMessage:
+    return WebhookMessage(message_id=message_id, user_id="u1", content="Browse the web")
+
+
+class AcceptingWorkflow:
+    """Acknowledges every message and remembers its callback URL."""
+
+    def __init__(self):
+        self.callback_urls: list[str] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.callback_urls.append(json.loads(request.content)["metadata"]["callback_url"])
+        return httpx.Response(202)
+
+
+def _path(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}"
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestSignedUrls:
+    """Test callback URL signing."""
+
+    def test_url_verifies_only_for_its_message(self):
+        """Test that the signature binds message id and expiry."""
+        clock = lambda: 1000.0  # noqa: E731
+        registry = _registry(timeout=60, clock=clock)
+        url = registry.callback_url("m1")
+        assert url.startswith("https://necta.example.com/api/callbacks/m1?expires=1060&")
+        signature = url.rsplit("signature=", 1)[1]
+
+        assert registry.verify("m1", 1060, signature)
+        assert not registry.verify("m2", 1060, signature)
+        assert not registry.verify("m1", 1061, signature)
+
+    def test_expired_url_is_rejected(self):
+        """Test that a correctly signed but expired URL fails verification."""
+        now = [1000.0]
+        registry = _registry(timeout=60, clock=lambda: now[0])
+        signature = registry.sign("m1", 1060)
+        now[0] = 1061.0
+
+        assert not registry.verify("m1", 1060, signature)
+
+
+class TestWebhookClientCallbacks:
+    """Test the client's asynchronous mode."""
+
+    @pytest.mark.asyncio
+    async def test_synchronous_answer_still_works(self):
+        """Test that a workflow answering inline needs no callback."""
+        registry = _registry()
+        client = _client(lambda request: httpx.Response(200, json={"response": "Done"}), registry)
+
+        response = await client.send_message("/webhook/agent", _message())
+
+        assert response.agent_response == "Done"
+        assert registry.stats()["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """Test that an agent that never calls back yields an error response."""
+        registry = _registry(timeout=0.01)
+        client = _client(AcceptingWorkflow(), registry)
+
+        response = await client.send_message("/webhook/agent", _message())
+
+        assert not response.success
+        assert response.metadata == {"callback_timeout": True}
+        assert registry.stats() == {"pending": 0, "resolved": 0, "expired": 1}
+
+    @pytest.mark.asyncio
+    async def test_result_reaches_waiter_on_another_worker(self):
+        """Test that a callback received by one worker wakes a session on another."""
+        broker = InMemoryBroker()
+        worker_a, worker_b = _registry(broker), _registry(broker)
+        await worker_a.start()
+        await worker_b.start()
+        try:
+            waiting = asyncio.create_task(worker_a.wait("m1"))
+            await _settle()
+            await worker_b.resolve(WebhookResponse(success=True, message_id="m1", agent_response="Hi"))
+
+            response = await asyncio.wait_for(waiting, 1)
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+        assert response.agent_response == "Hi"
+        assert response.processing_time_ms is not None
+
+
+class TestCallbackEndpoint:
+    """Test POST /api/callbacks/{message_id}."""
+
+    @pytest.mark.asyncio
+    async def test_callback_wakes_waiting_session(self, async_client: AsyncClient):
+        """Test the full round trip: acknowledge, call back, answer."""
+        registry = _registry()
+        workflow = AcceptingWorkflow()
+        client = _client(workflow, registry)
+        app.dependency_overrides[get_callback_registry] = lambda: registry
+        try:
+            waiting = asyncio.create_task(client.send_message("/webhook/agent", _message()))
+            while not workflow.callback_urls:
+                await asyncio.sleep(0)
+            result = await async_client.post(
+                _path(workflow.callback_urls[0]),
+                json={"response": "Found 3 flights", "metadata": {"tools": ["airtop"]}},
+            )
+            response = await asyncio.wait_for(waiting, 1)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert result.status_code == 202
+        assert response.success
+        assert response.agent_response == "Found 3 flights"
+        assert response.metadata == {"tools": ["airtop"]}
+
+    @pytest.mark.asyncio
+    async def test_forged_signature_is_rejected(self, async_client: AsyncClient):
+        """Test that a callback for another message id is refused."""
+        registry = _registry()
+        url = registry.callback_url("m1")
+        app.dependency_overrides[get_callback_registry] = lambda: registry
+        try:
+            result = await async_client.post(
+                _path(url).replace("/m1?", "/m2?"), json={"response": "spoofed"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert result.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_agent_error_is_reported(self, async_client: AsyncClient):
+        """Test that an ``error`` in the callback body fails the message."""
+        registry = _registry()
+        registry.expect("m1")
+        app.dependency_overrides[get_callback_registry] = lambda: registry
+        try:
+            await async_client.post(
+                _path(registry.callback_url("m1")), json={"error": "Browser session crashed"}
+            )
+            response = await asyncio.wait_for(registry.wait("m1"), 1)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert not response.success
+        assert response.error == "Browser session crashed"
+
+
+class TestDispatcherCallbacks:
+    """Test that deferred jobs do not hold dispatch capacity."""
+
+    @pytest.mark.asyncio
+    async def test_deferred_jobs_release_worker(self):
+        """Test that one worker can start many long-running agents."""
+        registry = _registry()
+        client = _client(AcceptingWorkflow(), registry)
+
+        async def resolve(profile_id: str, profile=None) -> WebhookClient:
+            return client
+
+        dispatcher = WebhookDispatcher(resolve, DispatchLimits(workers=1, max_per_profile=1))
+        await dispatcher.start()
+        try:
+            futures = [
+                await dispatcher.submit("p1", "/webhook/agent", _message(f"m{i}"))
+                for i in range(3)
+            ]
+            while dispatcher.stats()["awaiting_callback"] < 3:
+                await asyncio.sleep(0.001)
+            assert dispatcher.in_flight == 0
+
+            for i in range(3):
+                await registry.resolve(WebhookResponse(
+                    success=True, message_id=f"m{i}", agent_response=f"answer {i}"
+                ))
+            responses = await asyncio.wait_for(asyncio.gather(*futures), 1)
+        finally:
+            await dispatcher.stop()
+
+        assert [r.agent_response for r in responses] == ["answer 0", "answer 1", "answer 2"]
+        assert dispatcher.stats()["awaiting_callback"] == 0
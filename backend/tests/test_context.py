@@ -0,0 +1,309 @@
+"""
+Tests for trimmed conversation context.
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.deps import (
+    get_context_manager,
+    get_db_session,
+    get_dispatcher,
+    get_message_sink,
+    get_profile_cache,
+)
+from app.db import create_engine
+from app.main import app
+from app.models import Base, Profile
+from app.services.broker import InMemoryBroker
+from app.services.context import (
+    ContextManager,
+    ContextWindow,
+    estimate_tokens,
+    gist,
+    prepare_context,
+)
+from app.services.dispatcher import WebhookDispatcher
+from app.services.http_pool import HttpClientRegistry
+from app.services.message_sink import MessageSink
+from app.services.profiles import ProfileCache
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import WebhookAuthConfig, WebhookAuthType, WebhookClient
+
+
+class CountingTokenizer:
+    """Token counter (one token per word) that records what it counted."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text: str) -> int:
+        self.calls.append(text)
+        return len(text.split())
+
+
+@pytest_asyncio.fixture
+async def sessionmaker(tmp_path):
+    """Session factory for a file-backed SQLite database."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'context.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _profile(sessionmaker) -> str:
+    async with sessionmaker() as session:
+        profile = Profile(
+            name="Agent",
+            dev_webhook_url="https://n8n.example.com/webhook/dev",
+            prod_webhook_url="https://n8n.example.com/webhook/prod",
+        )
+        session.add(profile)
+        await session.commit()
+        return profile.id
+
+
+class TestContextWindow:
+    """Test the incrementally maintained window."""
+
+    def test_each_turn_is_counted_once(self):
+        """Test that appending never re-tokenises earlier turns."""
+        tokenizer = CountingTokenizer()
+        window = ContextWindow(100, count_tokens=tokenizer)
+
+        window.append("user", "one two three")
+        window.append("assistant", "four five")
+        window.payload()
+
+        assert tokenizer.calls == ["one two three", "four five"]
+        assert window.tokens == 5
+
+    def test_old_turns_move_to_summary(self):
+        """Test that turns over the budget leave a gist behind."""
+        window = ContextWindow(18, summary_share=0.5, count_tokens=CountingTokenizer())
+
+        window.append("user", "What is the weather in Oslo today? Be brief please")
+        window.append("assistant", "It is raining with a light wind")
+        window.append("user", "And tomorrow")
+
+        payload = window.payload()
+        assert [t["content"] for t in payload["turns"]] == [
+            "It is raining with a light wind", "And tomorrow",
+        ]
+        assert payload["summary"] == "user: What is the weather in Oslo today?"
+        assert payload["tokens"] == window.tokens == 18
+
+    def test_max_turns(self):
+        """Test that the turn limit applies however small the turns are."""
+        window = ContextWindow(1000, max_turns=3, summary_share=0)
+
+        for i in range(5):
+            window.append("user", str(i))
+
+        assert [t["content"] for t in window.payload()["turns"]] == ["2", "3", "4"]
+        assert window.payload()["summary"] is None
+
+    def test_oversized_turn_keeps_its_end(self):
+        """Test that a single turn over the budget is truncated, not dropped."""
+        window = ContextWindow(10)
+
+        window.append("user", "a" * 100 + "the end")
+
+        turns = window.payload()["turns"]
+        assert len(turns) == 1
+        assert turns[0]["content"].endswith("the end")
+        assert window.tokens <= 10
+
+    def test_payload_is_cached_until_change(self):
+        """Test that the payload is rebuilt only after an append."""
+        window = ContextWindow(100)
+        window.append("user", "hi")
+        first = window.payload()
+
+        assert window.payload() is first
+        window.append("assistant", "hello")
+        assert window.payload() is not first
+
+    def test_helpers(self):
+        """Test the token estimate and the gist."""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcde") == 2
+        assert gist("First.  Second sentence.") == "First."
+        assert len(gist("x" * 500, max_chars=20)) == 20
+
+
+class TestContextManager:
+    """Test budgets and the window cache."""
+
+    def test_budgets(self):
+        """Test the default budget and per-profile overrides."""
+        manager = ContextManager(default_max_tokens=100)
+        manager.seed("p1", [])
+
+        manager.set_budget("p1", 0)
+        assert not manager.enabled("p1")
+        assert manager.window("p1") is None
+        manager.set_budget("p1", None)
+        assert manager.budget("p1") == 100
+        assert not ContextManager().enabled("p1")
+
+    def test_least_recently_used_evicted(self):
+        """Test that only the most recently active conversations are kept."""
+        manager = ContextManager(default_max_tokens=100, max_conversations=2)
+        manager.seed("a", [])
+        manager.seed("b", [])
+        manager.window("a")
+        manager.seed("c", [])
+
+        assert manager.window("b") is None
+        assert manager.window("a") is not None
+        assert manager.stats() == {"conversations": 2, "seeded": 3, "evicted": 1, "invalidated": 0}
+
+    def test_record_needs_a_window(self):
+        """Test that replies for unseeded conversations are not kept."""
+        manager = ContextManager(default_max_tokens=100)
+
+        manager.record("p1", "assistant", "hello")
+
+        assert manager.window("p1") is None
+
+    @pytest.mark.asyncio
+    async def test_seeded_from_history(self, sessionmaker):
+        """Test that a new worker rebuilds the window from stored messages."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        await sink.write(profile_id, "user", "Hello")
+        await sink.write(profile_id, "agent", "Hi there")
+        await sink.write(profile_id, "system", "ignored")
+        manager = ContextManager(default_max_tokens=1000)
+
+        async with sessionmaker() as session:
+            context = await prepare_context(manager, session, profile_id, "How are you?", sink)
+
+        assert context["turns"] == [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi there"},
+        ]
+        assert manager.window(profile_id).payload()["turns"][-1]["content"] == "How are you?"
+
+    @pytest.mark.asyncio
+    async def test_window_catches_up_with_other_workers(self, sessionmaker):
+        """Test that turns stored by another worker are picked up before sending."""
+        profile_id = await _profile(sessionmaker)
+        broker = InMemoryBroker()
+        sink_a = MessageSink(sessionmaker, flush_interval=60)
+        sink_b = MessageSink(sessionmaker, flush_interval=60)
+        worker_a = ContextManager(default_max_tokens=1000, broker=broker)
+        worker_b = ContextManager(default_max_tokens=1000, broker=broker)
+        await worker_a.start()
+        await worker_b.start()
+
+        async def exchange(manager, sink, content, reply):
+            async with sessionmaker() as session:
+                context = await prepare_context(manager, session, profile_id, content, sink)
+            await sink.write(profile_id, "user", content)
+            await sink.write(profile_id, "agent", reply)
+            manager.record(profile_id, "assistant", reply)
+            await manager.announce(profile_id)
+            await sink.flush()
+            await asyncio.sleep(0)
+            return context
+
+        try:
+            await exchange(worker_a, sink_a, "Hello", "Hi")
+            await exchange(worker_a, sink_a, "Still me", "Yes")
+            await exchange(worker_b, sink_b, "Other tab", "Noted")
+            context = await exchange(worker_a, sink_a, "Back again", "Welcome back")
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+        assert [turn["content"] for turn in context["turns"]] == [
+            "Hello", "Hi", "Still me", "Yes", "Other tab", "Noted",
+        ]
+        assert worker_a.stats()["seeded"] == 2
+        assert worker_a.stats()["invalidated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_window_in_step_needs_no_query(self, sessionmaker):
+        """Test that a worker's own turns neither rebuild its window nor query history."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        manager = ContextManager(default_max_tokens=1000, broker=InMemoryBroker())
+        await manager.start()
+
+        async with sessionmaker() as session:
+            await prepare_context(manager, session, profile_id, "One", sink)
+        try:
+            for content in ("Two", "Three"):
+                manager.record(profile_id, "assistant", "ok")
+                await manager.announce(profile_id)
+                await asyncio.sleep(0)
+                # No session: the window is used without reading the database
+                await prepare_context(manager, None, profile_id, content, sink)
+        finally:
+            await manager.close()
+
+        assert manager.stats()["seeded"] == 1
+        assert manager.window(profile_id).payload()["turns"][-1]["content"] == "Three"
+
+
+class TestChatEndpointContext:
+    """Test that the chat endpoint sends the conversation along."""
+
+    @pytest.mark.asyncio
+    async def test_second_message_carries_first_exchange(self, sessionmaker, async_client: AsyncClient):
+        """Test that n8n receives the previous turns in ``metadata.context``."""
+        profile_id = await _profile(sessionmaker)
+        sent = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            sent.append(request)
+            return httpx.Response(200, json={"response": f"Reply {len(sent)}"})
+
+        registry = HttpClientRegistry(transport=httpx.MockTransport(handler))
+
+        async def resolve(pid: str, profile=None) -> WebhookClient:
+            return WebhookClient(
+                "https://n8n.example.com",
+                WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+
+        async def session():
+            async with sessionmaker() as db_session:
+                yield db_session
+
+        dispatcher = WebhookDispatcher(resolve)
+        await dispatcher.start()
+        contexts = ContextManager(default_max_tokens=1000)
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        app.dependency_overrides[get_db_session] = session
+        app.dependency_overrides[get_context_manager] = lambda: contexts
+        app.dependency_overrides[get_profile_cache] = lambda: ProfileCache(sessionmaker, InMemoryBroker())
+        try:
+            for content in ("Hello", "And again"):
+                response = await async_client.post(
+                    "/api/chat/messages",
+                    json={"profile_id": profile_id, "webhook_path": "/webhook/chat", "content": content},
+                )
+                assert response.status_code == 200
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+        first, second = (json.loads(request.content) for request in sent)
+        assert first["metadata"]["context"]["turns"] == []
+        assert second["metadata"]["context"]["turns"] == [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Reply 1"},
+        ]
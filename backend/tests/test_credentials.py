@@ -0,0 +1,89 @@
+"""
+Tests for encrypted webhook credentials and their cache.
+"""
+import pytest
+from cryptography.fernet import Fernet
+
+from app.services.credentials import SecureWebhookManager, ciphertext_digest
+from app.services.webhook import WebhookAuthConfig, WebhookAuthType
+
+
+@pytest.fixture
+def manager() -> SecureWebhookManager:
+    return SecureWebhookManager(Fernet.generate_key(), cache_max_entries=2)
+
+
+def _basic(password: str = "s3cret") -> WebhookAuthConfig:
+    return WebhookAuthConfig(auth_type=WebhookAuthType.BASIC, username="n8n", password=password)
+
+
+class TestSecureWebhookManager:
+    """Test encryption round trips and the decrypted-credential cache."""
+
+    def test_round_trip(self, manager: SecureWebhookManager):
+        """Test that a configuration survives encryption."""
+        encrypted = manager.encrypt_webhook_config(_basic())
+        assert b"s3cret" not in encrypted
+        assert manager.decrypt_webhook_config(encrypted) == _basic()
+
+    def test_repeat_decrypts_hit_cache(self, manager: SecureWebhookManager):
+        """Test that the hot path decrypts once."""
+        encrypted = manager.encrypt_webhook_config(_basic())
+        manager.decrypt_webhook_config(encrypted)
+        manager.auth_headers(encrypted)
+        manager.decrypt_webhook_config(encrypted)
+
+        assert manager.cache_stats()["misses"] == 1
+        assert manager.cache_stats()["hits"] == 2
+
+    def test_auth_headers_precomputed(self, manager: SecureWebhookManager):
+        """Test that cached headers match the client's header builder."""
+        encrypted = manager.encrypt_webhook_config(
+            WebhookAuthConfig(auth_type=WebhookAuthType.JWT, jwt_token="tok")
+        )
+        headers = manager.auth_headers(encrypted)
+        headers["X-Extra"] = "mutated"
+
+        assert manager.auth_headers(encrypted)["Authorization"] == "Bearer tok"
+        assert "X-Extra" not in manager.auth_headers(encrypted)
+
+    def test_eviction_scrubs_cached_secrets(self, manager: SecureWebhookManager):
+        """Test that evicted entries drop secrets but handed-out copies survive."""
+        first = manager.encrypt_webhook_config(_basic("one"))
+        config = manager.decrypt_webhook_config(first)
+        cached = manager._cache.get(ciphertext_digest(first))
+
+        manager.invalidate(first)
+
+        assert cached.config.password is None
+        assert cached.headers == {}
+        assert config.password == "one"
+
+    def test_lru_bound(self, manager: SecureWebhookManager):
+        """Test that the cache never exceeds its size limit."""
+        for i in range(5):
+            manager.decrypt_webhook_config(manager.encrypt_webhook_config(_basic(str(i))))
+        assert manager.cache_stats()["entries"] == 2
+        assert manager.cache_stats()["evictions"] == 3
+
+    def test_decrypt_many_dedupes(self, manager: SecureWebhookManager):
+        """Test bulk decryption preserves order and decrypts duplicates once."""
+        a = manager.encrypt_webhook_config(_basic("a"))
+        b = manager.encrypt_webhook_config(_basic("b"))
+
+        configs = manager.decrypt_many([a, b, a])
+
+        assert [c.password for c in configs] == ["a", "b", "a"]
+        assert manager.cache_stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_async_bulk_decrypt(self, manager: SecureWebhookManager):
+        """Test the thread-offloaded bulk loader warms the cache."""
+        encrypted = [manager.encrypt_webhook_config(_basic(str(i))) for i in range(2)]
+
+        configs = await manager.adecrypt_many(encrypted + encrypted)
+
+        assert [c.password for c in configs] == ["0", "1", "0", "1"]
+        manager.decrypt_webhook_config(encrypted[1])
+        assert manager.cache_stats()["hits"] == 1
+
@@ -0,0 +1,318 @@
+"""
+Tests for the webhook dispatch queue.
+"""
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from app.api.deps import get_dispatcher
+from app.main import app
+from app.services.dispatcher import (
+    DispatchJob,
+    DispatchLimits,
+    QueueFullError,
+    RedisJobStore,
+    WebhookDispatcher,
+)
+from app.services.http_pool import HttpClientRegistry
+from app.services.redis_backend import InMemoryRedis
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+class FakeN8n:
+    """Records request order and peak concurrency per host."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.order: list[str] = []
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        self.order.append(request.read().decode())
+        await asyncio.sleep(self.delay)
+        self.active[host] -= 1
+        return httpx.Response(200, json={"response": "ok"})
+
+    def resolver(self, hosts: dict[str, str]):
+        registry = HttpClientRegistry(transport=httpx.MockTransport(self.handler))
+
+        async def resolve(profile_id: str, profile=None) -> WebhookClient:
+            if profile_id not in hosts:
+                raise LookupError(profile_id)
+            return WebhookClient(
+                f"https://{hosts[profile_id]}",
+                WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+
+        return resolve
+
+
+def _message(content: str) -> WebhookMessage:
+    return WebhookMessage(message_id=content, user_id="u1", content=content)
+
+
+class TestScheduling:
+    """Test fairness and concurrency limits."""
+
+    @pytest.mark.asyncio
+    async def test_round_robin_across_profiles(self):
+        """Test that a quiet profile is not stuck behind a noisy one."""
+        n8n = FakeN8n()
+        dispatcher = WebhookDispatcher(
+            n8n.resolver({"noisy": "a.example.com", "quiet": "b.example.com"}),
+            DispatchLimits(workers=1),
+        )
+        futures = [await dispatcher.submit("noisy", "/webhook/x", _message(f"noisy-{i}")) for i in range(5)]
+        futures.append(await dispatcher.submit("quiet", "/webhook/x", _message("quiet-0")))
+
+        await dispatcher.start()
+        await asyncio.gather(*futures)
+        await dispatcher.stop()
+
+        positions = [i for i, body in enumerate(n8n.order) if "quiet-0" in body]
+        assert positions == [1]
+
+    @pytest.mark.asyncio
+    async def test_per_profile_and_origin_limits(self):
+        """Test that in-flight calls never exceed the configured caps."""
+        n8n = FakeN8n(delay=0.01)
+        hosts = {"p1": "shared.example.com", "p2": "shared.example.com", "p3": "solo.example.com"}
+        dispatcher = WebhookDispatcher(
+            n8n.resolver(hosts),
+            DispatchLimits(workers=10, max_per_profile=2, max_per_origin=3),
+        )
+        await dispatcher.start()
+        futures = [
+            await dispatcher.submit(pid, "/webhook/x", _message(f"{pid}-{i}"))
+            for i in range(6) for pid in hosts
+        ]
+        await asyncio.gather(*futures)
+        await dispatcher.stop()
+
+        assert n8n.peak["shared.example.com"] == 3
+        assert n8n.peak["solo.example.com"] == 2
+
+
+class TestAdmissionControl:
+    """Test load shedding."""
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_limits(self):
+        """Test that full queues reject new work."""
+        n8n = FakeN8n()
+        dispatcher = WebhookDispatcher(
+            n8n.resolver({"p1": "a.example.com", "p2": "a.example.com"}),
+            DispatchLimits(max_queue_depth=3, max_queue_per_profile=2),
+        )
+        await dispatcher.submit("p1", "/webhook/x", _message("1"))
+        await dispatcher.submit("p1", "/webhook/x", _message("2"))
+        with pytest.raises(QueueFullError):
+            await dispatcher.submit("p1", "/webhook/x", _message("3"))
+        await dispatcher.submit("p2", "/webhook/x", _message("4"))
+        with pytest.raises(QueueFullError):
+            await dispatcher.submit("p2", "/webhook/x", _message("5"))
+        assert dispatcher.queue_depth == 3
+        await dispatcher.stop(drain_timeout=0)
+
+    @pytest.mark.asyncio
+    async def test_endpoint_sheds_with_429(self, async_client: AsyncClient):
+        """Test that the chat endpoint maps a full queue to 429."""
+        n8n = FakeN8n()
+        dispatcher = WebhookDispatcher(
+            n8n.resolver({"p1": "a.example.com"}),
+            DispatchLimits(max_queue_depth=0),
+        )
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        try:
+            response = await async_client.post(
+                "/api/chat/messages",
+                json={"profile_id": "p1", "webhook_path": "/webhook/chat", "content": "hi"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+
+    @pytest.mark.asyncio
+    async def test_endpoint_returns_agent_reply(self, async_client: AsyncClient):
+        """Test the happy path through the queue."""
+        n8n = FakeN8n()
+        dispatcher = WebhookDispatcher(n8n.resolver({"p1": "a.example.com"}))
+        await dispatcher.start()
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        try:
+            response = await async_client.post(
+                "/api/chat/messages",
+                json={"profile_id": "p1", "webhook_path": "/webhook/chat", "content": "hi"},
+            )
+            unknown = await async_client.post(
+                "/api/chat/messages",
+                json={"profile_id": "nope", "webhook_path": "/webhook/chat", "content": "hi"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+        assert response.status_code == 200
+        assert response.json()["agent_response"] == "ok"
+        assert unknown.status_code == 404
+
+
+class TestDurableQueue:
+    """Test recovery of persisted jobs."""
+
+    @pytest.mark.asyncio
+    async def test_recovered_jobs_are_delivered(self):
+        """Test that jobs of a worker whose lease lapsed are replayed and cleared."""
+        redis = InMemoryRedis()
+        dead_worker = RedisJobStore(redis, lease_seconds=0.01)
+        await dead_worker.save(DispatchJob(
+            profile_id="p1",
+            webhook_path="/webhook/x",
+            message=_message("left-over"),
+            origin="https://a.example.com:443",
+        ))
+        await asyncio.sleep(0.02)
+
+        results = []
+
+        async def on_result(job: DispatchJob, response) -> None:
+            results.append((job.message.content, response.success))
+
+        n8n = FakeN8n()
+        store = RedisJobStore(redis)
+        dispatcher = WebhookDispatcher(
+            n8n.resolver({"p1": "a.example.com"}), store=store, on_result=on_result
+        )
+        await dispatcher.start()
+        await dispatcher.stop()
+
+        assert results == [("left-over", True)]
+        assert await redis.hgetall(store.key) == {}
+
+    @pytest.mark.asyncio
+    async def test_live_workers_jobs_are_not_replayed(self):
+        """Test that a starting worker leaves jobs leased by a live worker alone."""
+        redis = InMemoryRedis()
+        live_worker = RedisJobStore(redis)
+        job = DispatchJob(
+            profile_id="p1",
+            webhook_path="/webhook/x",
+            message=_message("in-flight"),
+            origin="https://a.example.com:443",
+        )
+        await live_worker.save(job)
+
+        assert await RedisJobStore(redis).claim_expired() == []
+
+        await live_worker.release(job)
+        claimed = await RedisJobStore(redis).claim_expired()
+        assert [claimed_job.job_id for claimed_job in claimed] == [job.job_id]
+
+    @pytest.mark.asyncio
+    async def test_renewed_lease_survives_expiry(self):
+        """Test that renewing keeps a job leased past its original lease."""
+        redis = InMemoryRedis()
+        owner = RedisJobStore(redis, lease_seconds=0.05)
+        await owner.save(DispatchJob(
+            profile_id="p1",
+            webhook_path="/webhook/x",
+            message=_message("long-running"),
+            origin="https://a.example.com:443",
+        ))
+
+        await asyncio.sleep(0.03)
+        await owner.renew()
+        await asyncio.sleep(0.03)
+
+        assert await RedisJobStore(redis).claim_expired() == []
+
+    @pytest.mark.asyncio
+    async def test_release_leaves_another_owners_lease(self):
+        """Test that releasing a lapsed lease does not drop its new owner's lease."""
+        redis = InMemoryRedis()
+        stalled = RedisJobStore(redis, lease_seconds=0.01)
+        job = DispatchJob(
+            profile_id="p1",
+            webhook_path="/webhook/x",
+            message=_message("taken-over"),
+            origin="https://a.example.com:443",
+        )
+        await stalled.save(job)
+        await asyncio.sleep(0.02)
+        assert len(await RedisJobStore(redis).claim_expired()) == 1
+
+        await stalled.release(job)
+        await stalled.renew()
+
+        assert await RedisJobStore(redis).claim_expired() == []
+
+    @pytest.mark.asyncio
+    async def test_save_refuses_a_leased_job_id(self):
+        """Test that saving a job whose id is leased elsewhere does not overwrite it."""
+        redis = InMemoryRedis()
+        job = DispatchJob(
+            profile_id="p1",
+            webhook_path="/webhook/x",
+            message=_message("first"),
+            origin="https://a.example.com:443",
+        )
+        await RedisJobStore(redis).save(job)
+
+        with pytest.raises(RuntimeError):
+            await RedisJobStore(redis).save(job)
+
+
+class TestWorkerFailures:
+    """Test that job failures and shutdown always answer the caller."""
+
+    @pytest.mark.asyncio
+    async def test_worker_survives_store_errors(self):
+        """Test that a failing store delete neither kills the worker nor the reply."""
+
+        class FlakyStore(RedisJobStore):
+            async def delete(self, job: DispatchJob) -> None:
+                raise ConnectionError("redis went away")
+
+        n8n = FakeN8n()
+        dispatcher = WebhookDispatcher(
+            n8n.resolver({"p1": "a.example.com"}),
+            DispatchLimits(workers=1),
+            store=FlakyStore(InMemoryRedis()),
+        )
+        await dispatcher.start()
+        first = await dispatcher.submit("p1", "/webhook/x", _message("one"))
+        second = await dispatcher.submit("p1", "/webhook/x", _message("two"))
+        responses = await asyncio.wait_for(asyncio.gather(first, second), 1)
+        await dispatcher.stop()
+
+        assert [response.success for response in responses] == [True, True]
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_running_jobs(self):
+        """Test that jobs still being sent at shutdown do not leave callers waiting."""
+        n8n = FakeN8n(delay=10)
+        dispatcher = WebhookDispatcher(n8n.resolver({"p1": "a.example.com"}))
+        await dispatcher.start()
+        future = await dispatcher.submit("p1", "/webhook/x", _message("slow"))
+        await asyncio.sleep(0.05)
+        await dispatcher.stop(drain_timeout=0.01)
+
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(future, 1)
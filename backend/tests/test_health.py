@@ -0,0 +1,182 @@
+"""
+Tests for dependency probes and the readiness endpoints.
+"""
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from app.api.deps import get_health_checker
+from app.db import create_engine
+from app.main import app
+from app.services.health import HealthChecker, database_probe, webhook_probe
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry
+from app.services.webhook import WebhookAuthConfig, WebhookAuthType, WebhookClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _ok():
+    return None
+
+
+async def _down():
+    raise ConnectionError("connection refused")
+
+
+class TestHealthChecker:
+    """Test concurrency, timeouts and caching."""
+
+    @pytest.mark.asyncio
+    async def test_probes_run_concurrently(self):
+        """Test that every probe starts before any finishes."""
+        started = []
+        release = asyncio.Event()
+
+        def blocking(name):
+            async def probe():
+                started.append(name)
+                await release.wait()
+            return probe
+
+        checker = HealthChecker()
+        checker.add("a", blocking("a"))
+        checker.add("b", blocking("b"))
+        task = asyncio.create_task(checker.check())
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        release.set()
+
+        results = await task
+        assert all(r.ok for r in results.values())
+
+    @pytest.mark.asyncio
+    async def test_slow_probe_times_out(self):
+        """Test that one hung dependency cannot hang the check."""
+        checker = HealthChecker(timeout=0.01)
+        checker.add("slow", lambda: asyncio.sleep(10))
+        checker.add("fast", _ok)
+
+        results = await checker.check()
+
+        assert not results["slow"].ok
+        assert results["slow"].detail == "Timed out after 0.01s"
+        assert results["fast"].ok
+
+    @pytest.mark.asyncio
+    async def test_results_cached_for_ttl(self):
+        """Test that polling does not amplify into upstream traffic."""
+        calls = []
+
+        async def counting():
+            calls.append(1)
+            await asyncio.sleep(0)
+
+        clock = FakeClock()
+        checker = HealthChecker(ttl=5, clock=clock)
+        checker.add("db", counting)
+
+        await asyncio.gather(*(checker.check() for _ in range(10)))
+        clock.now = 4
+        await checker.check()
+        assert len(calls) == 1
+
+        clock.now = 6
+        await checker.check()
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_database_probe(self):
+        """Test SELECT 1 against a real engine."""
+        engine = create_engine("sqlite:///:memory:")
+        checker = HealthChecker()
+        checker.add("database", database_probe(lambda: engine))
+        try:
+            results = await checker.check()
+        finally:
+            await engine.dispose()
+
+        assert results["database"].ok
+
+
+class TestWebhookProbe:
+    """Test the lightweight webhook probe."""
+
+    @pytest.mark.asyncio
+    async def test_probe_does_not_post(self):
+        """Test that the probe uses OPTIONS and reports unregistered webhooks."""
+        methods = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            methods.append(request.method)
+            return httpx.Response(204 if request.url.path == "/webhook/chat" else 404)
+
+        client = WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            breakers=CircuitBreakerRegistry(),
+        )
+        checker = HealthChecker()
+        checker.add("chat", webhook_probe("/webhook/chat", lambda: client))
+        checker.add("gone", webhook_probe("/webhook/gone", lambda: client))
+
+        results = await checker.check()
+
+        assert methods == ["OPTIONS", "OPTIONS"]
+        assert results["chat"].ok
+        assert not results["gone"].ok and results["gone"].detail == "HTTP 404"
+
+
+class TestEndpoints:
+    """Test /ready and /health/deep."""
+
+    @pytest.mark.asyncio
+    async def test_ready_fails_on_critical_dependency(self, async_client: AsyncClient):
+        """Test that a down database makes the worker not ready."""
+        checker = HealthChecker()
+        checker.add("database", _down)
+        app.dependency_overrides[get_health_checker] = lambda: checker
+        try:
+            response = await async_client.get("/ready")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 503
+        body = response.json()
+        assert body["status"] == "not_ready"
+        assert body["checks"]["database"]["detail"] == "connection refused"
+
+    @pytest.mark.asyncio
+    async def test_n8n_outage_is_degraded_not_unready(self, async_client: AsyncClient):
+        """Test that non-critical failures only show in the deep check."""
+        checker = HealthChecker()
+        checker.add("database", _ok)
+        checker.add("n8n", _down, critical=False)
+        app.dependency_overrides[get_health_checker] = lambda: checker
+        try:
+            ready = await async_client.get("/ready")
+            deep = await async_client.get("/health/deep")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert ready.status_code == 200
+        assert set(ready.json()["checks"]) == {"database"}
+        assert deep.status_code == 200
+        assert deep.json()["status"] == "degraded"
+
+    @pytest.mark.asyncio
+    async def test_default_checker_probes_database(self, async_client: AsyncClient):
+        """Test the configured checker against the test database."""
+        response = await async_client.get("/ready")
+
+        assert response.status_code == 200
+        assert response.json()["checks"]["database"]["ok"] is True
@@ -0,0 +1,135 @@
+"""
+Tests for the persistence layer and keyset-paginated chat history.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_db_session
+from app.db import create_engine, normalize_database_url
+from app.main import app
+from app.models import Message, Profile
+from app.services.history import InvalidCursorError, list_messages
+
+
+async def _conversation(session: AsyncSession, count: int, ties: bool = True) -> Profile:
+    profile = Profile(
+        name="Support agent",
+        dev_webhook_url="https://n8n.example.com/webhook/dev",
+        prod_webhook_url="https://n8n.example.com/webhook/prod",
+    )
+    session.add(profile)
+    await session.flush()
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        session.add(Message(
+            profile_id=profile.id,
+            message_type="user" if i % 2 == 0 else "agent",
+            content=f"message {i}",
+            # Pairs share a timestamp so the id tie-breaker is exercised
+            created_at=start + timedelta(seconds=i // 2 if ties else i),
+        ))
+    await session.commit()
+    return profile
+
+
+class TestEngine:
+    """Test SQLite tuning."""
+
+    @pytest.mark.asyncio
+    async def test_file_database_uses_wal(self, tmp_path):
+        """Test that new connections get WAL and synchronous=NORMAL."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'necta.db'}")
+        try:
+            async with engine.connect() as conn:
+                journal = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                synchronous = (await conn.execute(text("PRAGMA synchronous"))).scalar()
+                foreign_keys = (await conn.execute(text("PRAGMA foreign_keys"))).scalar()
+        finally:
+            await engine.dispose()
+
+        assert journal == "wal"
+        assert synchronous == 1
+        assert foreign_keys == 1
+        assert engine.pool.size() == 5
+
+    def test_sync_urls_use_async_drivers(self):
+        """Test that compose-style URLs are upgraded."""
+        assert normalize_database_url("sqlite:///./necta.db") == "sqlite+aiosqlite:///./necta.db"
+        assert normalize_database_url("postgresql://u:p@db/necta") == "postgresql+asyncpg://u:p@db/necta"
+
+
+class TestKeysetPagination:
+    """Test cursor pagination of chat history."""
+
+    @pytest.mark.asyncio
+    async def test_pages_cover_history_exactly_once(self, db_session: AsyncSession):
+        """Test that walking all pages returns every message newest first."""
+        profile = await _conversation(db_session, 25)
+
+        seen, cursor = [], None
+        while True:
+            page = await list_messages(db_session, profile.id, limit=7, cursor=cursor)
+            seen.extend(m.content for m in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert len(seen) == 25
+        assert len(set(seen)) == 25
+        assert seen[0] == "message 24"
+
+    @pytest.mark.asyncio
+    async def test_query_is_an_index_range_scan(self, db_session: AsyncSession):
+        """Test that SQLite serves a page from the composite index without sorting."""
+        query = (
+            select(Message)
+            .where(Message.profile_id == "p")
+            .where(tuple_(Message.created_at, Message.id) < (datetime(2024, 1, 1), "x"))
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(51)
+        )
+        compiled = query.compile(compile_kwargs={"literal_binds": True})
+        plan = (await db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+        details = " ".join(row[-1] for row in plan)
+
+        assert "ix_messages_profile_created" in details
+        assert "TEMP B-TREE" not in details
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, db_session: AsyncSession):
+        """Test that a tampered cursor is rejected."""
+        with pytest.raises(InvalidCursorError):
+            await list_messages(db_session, "p", cursor="not-a-cursor")
+
+
+class TestHistoryEndpoint:
+    """Test GET /api/chat/messages."""
+
+    @pytest.mark.asyncio
+    async def test_history_pages(self, db_session: AsyncSession, async_client: AsyncClient):
+        """Test that the endpoint returns pages and a usable cursor."""
+        profile = await _conversation(db_session, 5, ties=False)
+        app.dependency_overrides[get_db_session] = lambda: db_session
+        try:
+            first = await async_client.get(
+                "/api/chat/messages", params={"profile_id": profile.id, "limit": 3}
+            )
+            second = await async_client.get(
+                "/api/chat/messages",
+                params={"profile_id": profile.id, "limit": 3, "cursor": first.json()["next_cursor"]},
+            )
+            bad = await async_client.get(
+                "/api/chat/messages", params={"profile_id": profile.id, "cursor": "!!"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert first.status_code == 200
+        assert [m["content"] for m in first.json()["items"]] == ["message 4", "message 3", "message 2"]
+        assert [m["content"] for m in second.json()["items"]] == ["message 1", "message 0"]
+        assert second.json()["next_cursor"] is None
+        assert bad.status_code == 400
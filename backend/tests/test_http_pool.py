@@ -0,0 +1,126 @@
+"""
+Tests for the shared per-origin HTTP client registry.
+"""
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.http_pool import HttpClientRegistry, PoolLimits, origin_of
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+def _ok_transport(calls: list) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"response": "hi"})
+
+    return httpx.MockTransport(handler)
+
+
+class TestOriginNormalisation:
+    """Test origin keys used by the registry."""
+
+    def test_default_port_is_explicit(self):
+        """Test that default ports collapse to the same origin."""
+        assert origin_of("https://n8n.example.com/webhook/a") == "https://n8n.example.com:443"
+        assert origin_of("https://N8N.example.com:443/x") == "https://n8n.example.com:443"
+
+    def test_different_ports_are_different_origins(self):
+        """Test that scheme and port are part of the key."""
+        assert origin_of("http://localhost:5678/a") != origin_of("http://localhost:5679/a")
+        assert origin_of("http://host/a") != origin_of("https://host/a")
+
+    def test_relative_url_rejected(self):
+        """Test that relative URLs cannot be pooled."""
+        with pytest.raises(ValueError):
+            origin_of("/webhook/chat")
+
+
+class TestHttpClientRegistry:
+    """Test client sharing, limits and eviction."""
+
+    @pytest.mark.asyncio
+    async def test_clients_shared_per_origin(self):
+        """Test that webhook clients on one origin share a single pool."""
+        registry = HttpClientRegistry(transport=_ok_transport([]))
+        auth = WebhookAuthConfig(auth_type=WebhookAuthType.NONE)
+
+        first = WebhookClient("https://n8n.example.com", auth, registry=registry)
+        second = WebhookClient("https://n8n.example.com/", auth, registry=registry)
+        other = WebhookClient("https://other.example.com", auth, registry=registry)
+
+        assert first.client is second.client
+        assert first.client is not other.client
+        assert len(registry) == 2
+        await registry.aclose()
+
+    @pytest.mark.asyncio
+    async def test_webhook_client_exit_keeps_pool_open(self):
+        """Test that leaving a WebhookClient context does not close the pool."""
+        calls: list = []
+        registry = HttpClientRegistry(transport=_ok_transport(calls))
+        auth = WebhookAuthConfig(auth_type=WebhookAuthType.NONE)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hello")
+
+        async with WebhookClient("https://n8n.example.com", auth, registry=registry) as c:
+            await c.send_message("/webhook/chat", message)
+        async with WebhookClient("https://n8n.example.com", auth, registry=registry) as c:
+            response = await c.send_message("/webhook/chat", message)
+
+        assert response.success
+        assert len(calls) == 2
+        assert not registry.get_client("https://n8n.example.com").is_closed
+        await registry.aclose()
+
+    def test_per_origin_limits(self):
+        """Test that configured limits override the defaults for one origin."""
+        registry = HttpClientRegistry(default_limits=PoolLimits(max_connections=10))
+        registry.configure_origin("https://busy.example.com", PoolLimits(max_connections=200))
+
+        assert registry.limits_for("https://busy.example.com/webhook/x").max_connections == 200
+        assert registry.limits_for("https://quiet.example.com").max_connections == 10
+
+    @pytest.mark.asyncio
+    async def test_idle_clients_evicted(self):
+        """Test that idle pools are closed and recreated on next use."""
+        registry = HttpClientRegistry(idle_ttl=60, transport=_ok_transport([]))
+        client = registry.get_client("https://n8n.example.com")
+
+        assert await registry.evict_idle(now=0) == 0
+        assert await registry.evict_idle(now=time.monotonic() + 61) == 1
+        assert client.is_closed
+        assert registry.get_client("https://n8n.example.com") is not client
+        await registry.aclose()
+
+    @pytest.mark.asyncio
+    async def test_warm_reports_failures(self):
+        """Test that warm-up never raises on unreachable origins."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused", request=request)
+
+        registry = HttpClientRegistry(transport=httpx.MockTransport(handler))
+        results = await registry.warm(["https://down.example.com/webhook/a"])
+
+        assert results == {"https://down.example.com:443": False}
+        await registry.aclose()
+
+
+class TestLifespan:
+    """Test the application lifespan hook."""
+
+    def test_lifespan_closes_registry(self):
+        """Test that the registry is created on startup and closed on shutdown."""
+        from app.services import http_pool
+
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            assert http_pool._registry is not None
+        assert http_pool._registry is None
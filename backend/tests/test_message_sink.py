@@ -0,0 +1,273 @@
+"""
+Tests for the write-behind message sink.
+"""
+import asyncio
+
+import httpx
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.deps import get_dispatcher, get_message_sink, get_profile_cache
+from app.db import create_engine
+from app.main import app
+from app.models import Base, Message, Profile
+from app.services.broker import InMemoryBroker
+from app.services.dispatcher import WebhookDispatcher
+from app.services.history import list_messages
+from app.services.http_pool import HttpClientRegistry
+from app.services.message_sink import MessageSink
+from app.services.profiles import ProfileCache
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import WebhookAuthConfig, WebhookAuthType, WebhookClient
+
+
+@pytest_asyncio.fixture
+async def sessionmaker(tmp_path):
+    """Session factory for a tuned, file-backed SQLite database."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'sink.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _profile(sessionmaker) -> str:
+    async with sessionmaker() as session:
+        profile = Profile(
+            name="Agent",
+            dev_webhook_url="https://n8n.example.com/webhook/dev",
+            prod_webhook_url="https://n8n.example.com/webhook/prod",
+        )
+        session.add(profile)
+        await session.commit()
+        return profile.id
+
+
+async def _count(sessionmaker) -> int:
+    async with sessionmaker() as session:
+        return await session.scalar(select(func.count()).select_from(Message))
+
+
+class TestBatching:
+    """Test size and time flush thresholds."""
+
+    @pytest.mark.asyncio
+    async def test_rows_are_written_in_batches(self, sessionmaker):
+        """Test that many writes cost one transaction per batch."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, max_batch=100)
+
+        for i in range(250):
+            await sink.write(profile_id, "user", f"message {i}")
+        await sink.flush()
+
+        assert await _count(sessionmaker) == 250
+        assert sink.stats() == {"pending": 0, "written": 250, "batches": 3, "dropped": 0}
+
+    @pytest.mark.asyncio
+    async def test_background_flush_after_interval(self, sessionmaker):
+        """Test that a partial batch is written once the interval passes."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, max_batch=100, flush_interval=0.01)
+        sink.start()
+        try:
+            await sink.write(profile_id, "user", "hello")
+            for _ in range(100):
+                if sink.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert await _count(sessionmaker) == 1
+        finally:
+            await sink.close()
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_pending_rows(self, sessionmaker):
+        """Test that shutdown loses nothing."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        sink.start()
+        await sink.write(profile_id, "user", "last words")
+        await sink.close()
+
+        assert await _count(sessionmaker) == 1
+
+
+    @pytest.mark.asyncio
+    async def test_close_waits_for_flush_in_progress(self, sessionmaker):
+        """Test that closing during a write lets the write finish instead of losing it."""
+        profile_id = await _profile(sessionmaker)
+        writing, proceed = asyncio.Event(), asyncio.Event()
+
+        class SlowSession:
+            def __init__(self):
+                self.session = sessionmaker()
+
+            async def __aenter__(self):
+                writing.set()
+                await proceed.wait()
+                return await self.session.__aenter__()
+
+            async def __aexit__(self, *exc):
+                return await self.session.__aexit__(*exc)
+
+        sink = MessageSink(SlowSession, flush_interval=0)
+        sink.start()
+        await sink.write(profile_id, "user", "in flight")
+        await writing.wait()
+        closing = asyncio.create_task(sink.close())
+        await asyncio.sleep(0.01)
+        proceed.set()
+        await closing
+
+        assert await _count(sessionmaker) == 1
+        assert sink.stats()["dropped"] == 0
+
+
+class TestReadYourWrites:
+    """Test that reads can see buffered writes."""
+
+    @pytest.mark.asyncio
+    async def test_sync_makes_writes_visible(self, sessionmaker):
+        """Test that sync flushes only when the profile has pending rows."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        await sink.write(profile_id, "user", "first")
+        await sink.write(profile_id, "agent", "second")
+
+        await sink.sync("some-other-profile")
+        assert sink.pending == 2
+
+        await sink.sync(profile_id)
+        async with sessionmaker() as session:
+            page = await list_messages(session, profile_id)
+        assert [m.content for m in page.items] == ["second", "first"]
+
+
+class TestFailures:
+    """Test that bad rows are isolated."""
+
+    @pytest.mark.asyncio
+    async def test_unknown_profile_does_not_sink_batch(self, sessionmaker):
+        """Test that a foreign-key violation only drops the offending row."""
+        profile_id = await _profile(sessionmaker)
+        sink = MessageSink(sessionmaker)
+        await sink.write(profile_id, "user", "good 1")
+        await sink.write("no-such-profile", "user", "orphan")
+        await sink.write(profile_id, "user", "good 2")
+
+        await sink.flush()
+
+        assert await _count(sessionmaker) == 2
+        assert sink.dropped == 1
+        assert sink.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_is_retried(self, sessionmaker):
+        """Test that a non-database error re-queues the batch and keeps the flusher alive."""
+        profile_id = await _profile(sessionmaker)
+        calls = []
+
+        def flaky_sessionmaker():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("connection pool exploded")
+            return sessionmaker()
+
+        sink = MessageSink(flaky_sessionmaker, flush_interval=0.01)
+        sink.start()
+        try:
+            await sink.write(profile_id, "user", "survivor")
+            for _ in range(100):
+                if sink.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await sink.close()
+
+        assert await _count(sessionmaker) == 1
+        assert sink.stats()["dropped"] == 0
+
+
+class TestChatEndpointPersistence:
+    """Test that the chat endpoint records both sides of the exchange."""
+
+    @pytest.mark.asyncio
+    async def test_message_and_reply_recorded(self, sessionmaker, async_client: AsyncClient):
+        """Test that the user message and agent reply go through the sink."""
+        profile_id = await _profile(sessionmaker)
+        registry = HttpClientRegistry(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"response": "Hi there"})
+        ))
+
+        async def resolve(pid: str, profile=None) -> WebhookClient:
+            return WebhookClient(
+                "https://n8n.example.com",
+                WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+
+        dispatcher = WebhookDispatcher(resolve)
+        await dispatcher.start()
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        app.dependency_overrides[get_message_sink] = lambda: sink
+        app.dependency_overrides[get_profile_cache] = lambda: ProfileCache(sessionmaker, InMemoryBroker())
+        try:
+            response = await async_client.post(
+                "/api/chat/messages",
+                json={"profile_id": profile_id, "webhook_path": "/webhook/chat", "content": "Hello"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+        assert response.status_code == 200
+        await sink.sync(profile_id)
+        async with sessionmaker() as session:
+            page = await list_messages(session, profile_id)
+        assert [(m.message_type, m.content) for m in page.items] == [
+            ("agent", "Hi there"), ("user", "Hello"),
+        ]
+        assert page.items[1].id == response.json()["message_id"]
+        assert "response_time_ms" in page.items[0].message_metadata
+
+    @pytest.mark.asyncio
+    async def test_ad_hoc_profile_is_not_persisted(self, sessionmaker, async_client: AsyncClient):
+        """Test that a profile id with no stored profile never reaches the sink."""
+        registry = HttpClientRegistry(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"response": "Hi there"})
+        ))
+
+        async def resolve(pid: str, profile=None) -> WebhookClient:
+            return WebhookClient(
+                "https://n8n.example.com",
+                WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+
+        dispatcher = WebhookDispatcher(resolve)
+        await dispatcher.start()
+        sink = MessageSink(sessionmaker, flush_interval=60)
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        app.dependency_overrides[get_message_sink] = lambda: sink
+        app.dependency_overrides[get_profile_cache] = lambda: ProfileCache(sessionmaker, InMemoryBroker())
+        try:
+            response = await async_client.post(
+                "/api/chat/messages",
+                json={"webhook_path": "/webhook/chat", "content": "Hello"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+            await dispatcher.stop()
+
+        assert response.status_code == 200
+        assert sink.pending == 0
+        await sink.close()
+        assert sink.stats()["dropped"] == 0
@@ -0,0 +1,163 @@
+"""
+Tests for in-process metrics and the /metrics endpoint.
+"""
+import httpx
+import pytest
+from httpx import AsyncClient
+
+from app.config import get_settings
+from app.main import app
+from app.services import dispatcher as dispatcher_module
+from app.services import retry as retry_module
+from app.services.http_pool import HttpClientRegistry
+from app.services.metrics import (
+    WEBHOOK_LATENCY,
+    WEBHOOK_RETRIES,
+    WEBHOOK_TIMEOUTS,
+    MetricsRegistry,
+)
+from app.services.realtime import get_connection_manager
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+class TestHistogram:
+    """Test bucketed histograms."""
+
+    def test_quantiles_interpolate_within_buckets(self):
+        """Test p50/p99 estimates from bucket counts."""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_ms", "Latency", buckets=(10, 100, 1000)).labels()
+        for _ in range(98):
+            latency.observe(5)
+        latency.observe(50)
+        latency.observe(500)
+
+        assert latency.quantile(0.5) == pytest.approx(5.1, rel=0.01)
+        assert 10 < latency.quantile(0.99) <= 100
+        assert latency.count == 100
+
+    def test_render_prometheus_text(self):
+        """Test cumulative buckets, sum, count and label escaping."""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_ms", "Latency", ("profile",), buckets=(10, 100))
+        latency.labels('a"b').observe(10)
+        latency.labels('a"b').observe(150)
+        registry.counter("events_total", "Events").labels().inc(3)
+
+        text = registry.render()
+
+        assert '# TYPE latency_ms histogram' in text
+        assert 'latency_ms_bucket{profile="a\\"b",le="10"} 1' in text
+        assert 'latency_ms_bucket{profile="a\\"b",le="100"} 1' in text
+        assert 'latency_ms_bucket{profile="a\\"b",le="+Inf"} 2' in text
+        assert 'latency_ms_sum{profile="a\\"b"} 160' in text
+        assert 'latency_ms_count{profile="a\\"b"} 2' in text
+        assert 'events_total 3' in text
+
+    def test_label_count_is_checked(self):
+        """Test that a series needs every declared label."""
+        counter = MetricsRegistry().counter("c_total", "C", ("profile", "environment"))
+        with pytest.raises(ValueError):
+            counter.labels("only-one")
+
+
+class TestWebhookInstrumentation:
+    """Test that WebhookClient records its calls."""
+
+    @pytest.mark.asyncio
+    async def test_latency_retries_and_timeouts_recorded(self):
+        """Test one timed-out attempt followed by a successful retry."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ConnectTimeout("n8n unreachable", request=request)
+            return httpx.Response(200, json={"response": "ok"})
+
+        client = WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0),
+            breakers=CircuitBreakerRegistry(),
+            profile_id="metrics-profile",
+            environment="prod",
+        )
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        response = await client.send_message("/webhook/chat", message)
+
+        assert response.success
+        assert WEBHOOK_LATENCY.labels("metrics-profile", "prod", "ok").count == 1
+        assert WEBHOOK_LATENCY.labels("metrics-profile", "prod", "timeout").count == 1
+        assert WEBHOOK_TIMEOUTS.labels("metrics-profile", "prod").value == 1
+        assert WEBHOOK_RETRIES.labels("metrics-profile", "prod").value == 1
+
+
+class TestMetricsEndpoint:
+    """Test GET /metrics."""
+
+    @pytest.mark.asyncio
+    async def test_scrape(self, async_client: AsyncClient):
+        """Test that the endpoint serves instruments and component gauges."""
+        get_connection_manager()
+        response = await async_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE necta_webhook_latency_ms histogram" in response.text
+        assert "# TYPE necta_ws_connections gauge" in response.text
+
+    @pytest.mark.asyncio
+    async def test_scrape_does_not_create_components(self, async_client: AsyncClient, monkeypatch):
+        """Test that a component the application has not created is skipped."""
+        monkeypatch.setattr(dispatcher_module, "_dispatcher", None)
+
+        response = await async_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "necta_dispatch_queued" not in response.text
+        assert dispatcher_module._dispatcher is None
+
+    @pytest.mark.asyncio
+    async def test_endpoints_are_labelled_without_their_url(self, async_client: AsyncClient, monkeypatch):
+        """Test that a webhook's path (which may hold a secret) is not exported."""
+        breakers = CircuitBreakerRegistry()
+        breakers.get("https://n8n.example.com:8443/webhook/s3cr3t-path")
+        monkeypatch.setattr(retry_module, "_breakers", breakers)
+
+        response = await async_client.get("/metrics")
+
+        assert "s3cr3t-path" not in response.text
+        assert 'necta_circuit_open{host="n8n.example.com:8443",endpoint="' in response.text
+
+    @pytest.mark.asyncio
+    async def test_remote_scrape_is_refused_without_a_token(self):
+        """Test that only loopback clients may scrape when no token is set."""
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.7", 4000))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/metrics")
+
+        assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_token_is_required_when_set(self, async_client: AsyncClient, monkeypatch):
+        """Test that a configured METRICS_TOKEN must be presented."""
+        monkeypatch.setattr(get_settings(), "metrics_token", "scrape-secret")
+
+        missing = await async_client.get("/metrics")
+        wrong = await async_client.get("/metrics", headers={"Authorization": "Bearer nope"})
+        right = await async_client.get(
+            "/metrics", headers={"Authorization": "Bearer scrape-secret"}
+        )
+
+        assert missing.status_code == 401
+        assert wrong.status_code == 401
+        assert right.status_code == 200
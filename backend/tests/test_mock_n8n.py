@@ -0,0 +1,122 @@
+"""
+Tests for the mock n8n server and the load driver.
+"""
+import argparse
+import random
+
+import httpx
+import pytest
+
+from app.services.webhook import WebhookMessage
+from benchmarks.load import compare, make_client, percentile, run
+from benchmarks.mock_n8n import Latency, MockN8nServer
+
+
+def _message() -> WebhookMessage:
+    return WebhookMessage(message_id="m1", user_id="u1", content="hello there")
+
+
+class TestMockN8nServer:
+    """Test the mock's webhook behaviour."""
+
+    def test_lognormal_latency_is_seeded(self):
+        """Test that a seed reproduces the latency sequence around the median."""
+        latency = Latency.lognormal(50, 0.5)
+        first = [latency.sample(random.Random(1)) for _ in range(3)]
+        second = [latency.sample(random.Random(1)) for _ in range(3)]
+        samples = sorted(latency.sample(random.Random(i)) for i in range(1001))
+
+        assert first == second
+        assert 40 < samples[500] < 60
+
+    @pytest.mark.asyncio
+    async def test_error_rate(self, mock_webhook_server: MockN8nServer):
+        """Test that roughly error_rate of the calls fail with HTTP 500."""
+        mock_webhook_server.error_rate = 0.2
+        client = make_client("http://mock-n8n", mock_webhook_server.transport())
+
+        results = [await client.send_message("/webhook/chat", _message()) for _ in range(200)]
+
+        failed = sum(not r.success for r in results)
+        assert failed == mock_webhook_server.errors
+        assert 20 < failed < 60
+
+    @pytest.mark.asyncio
+    async def test_records_requests(self, mock_webhook_server: MockN8nServer):
+        """Test that the posted payload is kept for assertions."""
+        mock_webhook_server.set_response({"response": "Hi!"})
+        client = make_client("http://mock-n8n", mock_webhook_server.transport())
+
+        response = await client.send_message("/webhook/chat", _message())
+
+        assert response.agent_response == "Hi!"
+        (request,) = mock_webhook_server.get_requests()
+        assert request.method == "POST" and request.path == "/webhook/chat"
+        assert request.json()["content"] == "hello there"
+
+    @pytest.mark.asyncio
+    async def test_stream_mode(self, mock_webhook_server: MockN8nServer):
+        """Test that the NDJSON envelope streams through stream_message."""
+        mock_webhook_server.mode = "stream"
+        mock_webhook_server.set_response({"response": "one two three"})
+        client = make_client("http://mock-n8n", mock_webhook_server.transport())
+
+        chunks = [c async for c in client.stream_message("/webhook/chat", _message())]
+
+        assert [c.delta for c in chunks if c.delta] == ["one", " two", " three"]
+        assert chunks[-1].done and chunks[-1].error is None
+
+    @pytest.mark.asyncio
+    async def test_health_and_options(self, mock_webhook_server: MockN8nServer):
+        """Test the endpoints used by dependency probes."""
+        async with httpx.AsyncClient(
+            transport=mock_webhook_server.transport(), base_url="http://mock-n8n"
+        ) as http:
+            health = await http.get("/healthz")
+            options = await http.options("/webhook/chat")
+
+        assert health.json() == {"status": "ok"}
+        assert options.status_code == 204
+        assert mock_webhook_server.served == 0
+
+
+class TestLoadDriver:
+    """Test the load driver's measurements and report."""
+
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles."""
+        values = [float(v) for v in range(1, 101)]
+
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) == 0.0
+
+    @pytest.mark.asyncio
+    async def test_run_report(self):
+        """Test a small endpoint run and its JSON shape."""
+        args = argparse.Namespace(
+            target="endpoint", concurrency=[1, 4], requests=20, latency="0",
+            error_rate=0.0, mode="json", seed=0, socket=False, port=0, trace_memory=True,
+        )
+
+        report = await run(args)
+
+        assert report["config"]["target"] == "endpoint"
+        assert [r["concurrency"] for r in report["results"]] == [1, 4]
+        for result in report["results"]:
+            assert result["errors"] == 0
+            assert result["throughput_rps"] > 0
+            assert set(result["latency_ms"]) == {"p50", "p95", "p99", "max", "mean"}
+            assert result["alloc_peak_kib"] is not None
+
+    def test_compare_flags_regressions(self, capsys):
+        """Test that a throughput drop beyond the threshold fails the comparison."""
+        def report(rps, p99):
+            return {"results": [{
+                "target": "client", "concurrency": 8,
+                "throughput_rps": rps, "latency_ms": {"p99": p99},
+            }]}
+
+        assert compare(report(1000, 10), report(950, 10.5), threshold=0.1) == 0
+        assert compare(report(1000, 10), report(800, 10), threshold=0.1) == 1
+        assert "REGRESSION" in capsys.readouterr().out
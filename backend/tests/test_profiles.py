@@ -0,0 +1,288 @@
+"""
+Tests for the profile cache and its cross-worker invalidation.
+"""
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api.deps import get_db_session, get_profile_cache
+from app.db import create_engine
+from app.main import app
+from app.models import Base, Profile
+from app.services import dispatcher as dispatcher_module
+from app.services.broker import InMemoryBroker
+from app.services.dispatcher import resolve_profile_client
+from app.services.profiles import PROFILE_CHANNEL, ProfileCache
+
+
+@pytest_asyncio.fixture
+async def sessionmaker(tmp_path):
+    """Session factory for a file-backed SQLite database."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiles.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _profile(sessionmaker, **fields) -> str:
+    async with sessionmaker() as session:
+        profile = Profile(
+            name="Agent",
+            dev_webhook_url="https://n8n.example.com/webhook/dev",
+            prod_webhook_url="https://n8n.example.com/webhook/prod",
+            **fields,
+        )
+        session.add(profile)
+        await session.commit()
+        return profile.id
+
+
+async def _set_environment(sessionmaker, cache: ProfileCache, profile_id: str, environment: str):
+    async with sessionmaker() as session:
+        profile = await session.get(Profile, profile_id)
+        profile.environment = environment
+        await session.commit()
+        await cache.updated(profile)
+
+
+class TestProfileCache:
+    """Test read-through lookups."""
+
+    @pytest.mark.asyncio
+    async def test_steady_state_needs_no_query(self, sessionmaker):
+        """Test that a profile is loaded once and then served from memory."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        first = await cache.get(profile_id)
+        second = await cache.get(profile_id)
+
+        assert first is second
+        assert first.webhook_url == "https://n8n.example.com/webhook/dev"
+        assert cache.stats()["loads"] == 1
+        assert cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_query(self, sessionmaker):
+        """Test that a burst for a cold profile queries the database once."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        results = await asyncio.gather(*(cache.get(profile_id) for _ in range(10)))
+
+        assert {result.id for result in results} == {profile_id}
+        assert cache.stats()["loads"] == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_profile_is_cached_briefly(self, sessionmaker):
+        """Test negative caching and its shorter lifetime."""
+        now = [0.0]
+        cache = ProfileCache(sessionmaker, InMemoryBroker(), negative_ttl=5, clock=lambda: now[0])
+        missing = str(uuid.uuid4())
+
+        assert await cache.get(missing) is None
+        assert await cache.get(missing) is None
+        assert cache.stats()["loads"] == 1
+
+        now[0] += 6
+        assert await cache.get(missing) is None
+        assert cache.stats()["loads"] == 2
+
+    @pytest.mark.asyncio
+    async def test_non_uuid_ids_skip_the_database(self, sessionmaker):
+        """Test that ids no stored profile can have are answered directly."""
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        assert await cache.get("default") is None
+        assert cache.stats()["loads"] == 0
+
+    @pytest.mark.asyncio
+    async def test_uppercase_ids_name_the_same_profile(self, sessionmaker):
+        """Test that a UUID in upper case finds the stored profile and shares its entry."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        upper = await cache.get(profile_id.upper())
+        lower = await cache.get(profile_id)
+
+        assert upper is not None
+        assert upper.id == profile_id
+        assert lower is upper
+        assert cache.stats()["loads"] == 1
+        assert await cache.get(profile_id.replace("-", "").upper()) is None
+
+    @pytest.mark.asyncio
+    async def test_updates_bump_the_version(self, sessionmaker):
+        """Test that the ORM increments the version on every update."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        await _set_environment(sessionmaker, cache, profile_id, "prod")
+
+        assert (await cache.get(profile_id)).version == 2
+        assert cache.stats()["loads"] == 0
+
+
+class TestInvalidation:
+    """Test that changes reach every worker."""
+
+    @pytest.mark.asyncio
+    async def test_toggle_reaches_other_workers(self, sessionmaker):
+        """Test that a dev/prod toggle on one worker applies on another."""
+        profile_id = await _profile(sessionmaker)
+        broker = InMemoryBroker()
+        worker_a = ProfileCache(sessionmaker, broker)
+        worker_b = ProfileCache(sessionmaker, broker)
+        await worker_a.start()
+        await worker_b.start()
+        try:
+            assert (await worker_b.get(profile_id)).environment == "dev"
+
+            await _set_environment(sessionmaker, worker_a, profile_id, "prod")
+            await asyncio.sleep(0)
+
+            profile = await worker_b.get(profile_id)
+            assert profile.environment == "prod"
+            assert profile.webhook_url == "https://n8n.example.com/webhook/prod"
+            assert worker_b.stats()["invalidations"] == 1
+            assert worker_a.stats()["loads"] == 0
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+    @pytest.mark.asyncio
+    async def test_stale_notifications_are_ignored(self, sessionmaker):
+        """Test that a notification older than the cached version keeps the entry."""
+        profile_id = await _profile(sessionmaker)
+        broker = InMemoryBroker()
+        cache = ProfileCache(sessionmaker, broker)
+        await cache.start()
+        try:
+            await cache.get(profile_id)
+            await broker.publish(PROFILE_CHANNEL, {"id": profile_id, "version": 1})
+            await asyncio.sleep(0)
+
+            await cache.get(profile_id)
+            assert cache.stats()["loads"] == 1
+        finally:
+            await cache.close()
+
+    @pytest.mark.asyncio
+    async def test_load_racing_a_change_is_not_cached(self, sessionmaker):
+        """Test that a load overlapping a notification is served but not kept."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        def racing_sessionmaker():
+            # The change lands while the load is reading the row
+            cache._apply(profile_id, 2)
+            return sessionmaker()
+
+        cache.sessionmaker = racing_sessionmaker
+        assert (await cache.get(profile_id)).version == 1
+        cache.sessionmaker = sessionmaker
+        await cache.get(profile_id)
+
+        assert cache.stats()["loads"] == 2
+
+    @pytest.mark.asyncio
+    async def test_deleted_profile_is_dropped(self, sessionmaker):
+        """Test that a deletion notice removes the cached profile."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+        await cache.get(profile_id)
+        async with sessionmaker() as session:
+            await session.delete(await session.get(Profile, profile_id))
+            await session.commit()
+
+        await cache.deleted(profile_id)
+
+        assert await cache.get(profile_id) is None
+
+
+class TestResolveProfileClient:
+    """Test the dispatcher's profile-aware resolver."""
+
+    @pytest.mark.asyncio
+    async def test_prod_profile_routes_to_its_replicas(self, sessionmaker, monkeypatch):
+        """Test that a prod profile's client targets its webhook and replicas."""
+        profile_id = await _profile(
+            sessionmaker,
+            environment="prod",
+            prod_webhook_replicas=["https://n8n-2.example.com/webhook/prod"],
+        )
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+        monkeypatch.setattr(dispatcher_module, "get_profile_cache", lambda: cache)
+
+        client = await resolve_profile_client(profile_id)
+
+        assert client.base_url == "https://n8n.example.com/webhook/prod"
+        assert client.endpoints == [
+            "https://n8n.example.com/webhook/prod",
+            "https://n8n-2.example.com/webhook/prod",
+        ]
+        assert client.environment == "prod"
+
+    @pytest.mark.asyncio
+    async def test_resolved_profile_is_not_looked_up_again(self, sessionmaker, monkeypatch):
+        """Test that a profile passed with the job is used without a cache lookup."""
+        profile_id = await _profile(sessionmaker, environment="prod")
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+        profile = await cache.get(profile_id)
+        monkeypatch.setattr(dispatcher_module, "get_profile_cache", lambda: None)
+
+        client = await resolve_profile_client(profile_id, profile)
+
+        assert client.base_url == "https://n8n.example.com/webhook/prod"
+
+    @pytest.mark.asyncio
+    async def test_inactive_profile_is_refused(self, sessionmaker, monkeypatch):
+        """Test that an inactive profile cannot be sent to."""
+        profile_id = await _profile(sessionmaker, is_active=False)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+        monkeypatch.setattr(dispatcher_module, "get_profile_cache", lambda: cache)
+
+        with pytest.raises(LookupError, match="not active"):
+            await resolve_profile_client(profile_id)
+
+
+class TestProfileEndpoints:
+    """Test reading and toggling profiles over the API."""
+
+    @pytest.mark.asyncio
+    async def test_toggle_environment(self, sessionmaker, async_client: AsyncClient):
+        """Test that a PATCH is visible to the next read without a query."""
+        profile_id = await _profile(sessionmaker)
+        cache = ProfileCache(sessionmaker, InMemoryBroker())
+
+        async def session():
+            async with sessionmaker() as db_session:
+                yield db_session
+
+        app.dependency_overrides[get_db_session] = session
+        app.dependency_overrides[get_profile_cache] = lambda: cache
+        try:
+            before = await async_client.get(f"/api/profiles/{profile_id}")
+            patched = await async_client.patch(
+                f"/api/profiles/{profile_id}", json={"environment": "prod"}
+            )
+            after = await async_client.get(f"/api/profiles/{profile_id}")
+            invalid = await async_client.patch(
+                f"/api/profiles/{profile_id}", json={"environment": None}
+            )
+            missing = await async_client.get(f"/api/profiles/{uuid.uuid4()}")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert before.json()["environment"] == "dev"
+        assert patched.status_code == 200
+        assert after.json()["environment"] == "prod"
+        assert after.json()["version"] == 2
+        assert cache.stats()["loads"] == 2  # the first read and the unknown id
+        assert invalid.status_code == 422
+        assert missing.status_code == 404
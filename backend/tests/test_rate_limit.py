@@ -0,0 +1,250 @@
+"""
+Tests for the adaptive outbound rate limiter.
+"""
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.rate_limit import AdaptiveRateLimiter
+from app.services.redis_backend import InMemoryRedis
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+KEY = "origin:https://n8n.example.com:443"
+
+
+class FakeClock:
+    """Clock whose sleeps advance time instantly."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+def _limiter(clock: FakeClock, **kwargs) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(clock=clock, wall_clock=clock, sleep=clock.sleep, **kwargs)
+
+
+class TestTokenBucket:
+    """Test pacing and deadlines of the local bucket."""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_paced(self):
+        """Test that calls beyond the burst are spaced at the rate."""
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=10, burst=2)
+
+        for _ in range(4):
+            assert await limiter.acquire([KEY], timeout=1)
+
+        assert clock.slept == [0.1, 0.1]
+        assert limiter.stats()[KEY]["waits"] == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_slot_is_past_deadline(self):
+        """Test that a caller gives up without consuming a slot."""
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=1, burst=1)
+
+        assert await limiter.acquire([KEY], timeout=0)
+        assert not await limiter.acquire([KEY], timeout=0.5)
+        assert await limiter.acquire([KEY], timeout=1)
+
+        assert clock.slept == [1.0]
+        assert limiter.stats()[KEY]["rejected"] == 1
+
+    def test_keys(self):
+        """Test that calls are limited per profile and per origin."""
+        keys = AdaptiveRateLimiter.keys("https://n8n.example.com/webhook/chat", "p1")
+
+        assert keys == ["profile:p1", KEY]
+
+
+class TestAIMD:
+    """Test how rates adapt to n8n's answers."""
+
+    @pytest.mark.asyncio
+    async def test_overload_halves_once_per_cooldown(self):
+        """Test that a burst of 429s counts as one overload."""
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=16, cooldown=1)
+
+        await limiter.record([KEY], 429, 0.1)
+        await limiter.record([KEY], 503, 0.1)
+        assert limiter.rate(KEY) == 8
+
+        clock.now += 1
+        await limiter.record([KEY], None, None, timed_out=True)
+        assert limiter.rate(KEY) == 4
+
+    @pytest.mark.asyncio
+    async def test_success_increases_additively(self):
+        """Test that one rate's worth of successes adds ``increase``."""
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=10, increase=1, max_rate=10.5)
+
+        for _ in range(10):
+            await limiter.record([KEY], 200, 0.1)
+
+        assert limiter.rate(KEY) == 10.5
+
+    @pytest.mark.asyncio
+    async def test_slow_answers_and_floor(self):
+        """Test the latency signal and the minimum rate."""
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=2, min_rate=1.5, latency_target=5, cooldown=0)
+
+        await limiter.record([KEY], 200, 4)
+        await limiter.record([KEY], 200, 6)
+        await limiter.record([KEY], 200, 6)
+
+        assert limiter.rate(KEY) == 1.5
+        assert limiter.stats()[KEY]["decreases"] == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_leave_rate_alone(self):
+        """Test that non-overload failures are left to the circuit breaker."""
+        limiter = _limiter(FakeClock(), initial_rate=10)
+
+        await limiter.record([KEY], 500, 0.1)
+        await limiter.record([KEY], None, None)
+
+        assert limiter.rate(KEY) == 10
+
+
+class TestSharedLimits:
+    """Test limits shared between workers through Redis."""
+
+    @pytest.mark.asyncio
+    async def test_workers_share_window_and_rate(self):
+        """Test that admissions and decreases are seen by every worker."""
+        clock = FakeClock()
+        redis = InMemoryRedis()
+        worker_a = _limiter(clock, initial_rate=2, redis=redis, sync_interval=0)
+        worker_b = _limiter(clock, initial_rate=2, redis=redis, sync_interval=0)
+
+        assert await worker_a.acquire([KEY], timeout=0)
+        assert await worker_b.acquire([KEY], timeout=0)
+        assert not await worker_a.acquire([KEY], timeout=0)
+        assert await worker_b.acquire([KEY], timeout=1)
+        assert clock.slept == [1.0]
+
+        worker_a.cooldown = 0
+        await worker_a.record([KEY], 429, 0.1)
+        await worker_a.record([KEY], 429, 0.1)
+        await worker_b.acquire([KEY], timeout=1)
+        assert worker_b.rate(KEY) == 1
+
+    @pytest.mark.asyncio
+    async def test_redis_outage_falls_back_to_local_bucket(self):
+        """Test that a failing Redis paces calls locally instead of raising."""
+
+        class DownRedis(InMemoryRedis):
+            async def incr(self, key, amount=1):
+                raise ConnectionError("connection refused")
+
+        clock = FakeClock()
+        limiter = _limiter(clock, initial_rate=10, burst=1, redis=DownRedis(), sync_interval=0)
+
+        assert await limiter.acquire([KEY], timeout=1)
+        assert await limiter.acquire([KEY], timeout=1)
+        assert not await limiter.acquire([KEY], timeout=0)
+
+        assert clock.slept == [0.1]
+
+
+class TestWebhookClientLimits:
+    """Test WebhookClient with a rate limiter."""
+
+    def _client(self, handler, limiter: AdaptiveRateLimiter, **kwargs) -> WebhookClient:
+        return WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0),
+            breakers=CircuitBreakerRegistry(),
+            rate_limiter=limiter,
+            **kwargs,
+        )
+
+    @pytest.mark.asyncio
+    async def test_429_slows_the_origin(self):
+        """Test that an overloaded answer lowers the rate before the retry."""
+        statuses = iter([429, 200])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(next(statuses), json={"response": "ok"})
+
+        limiter = AdaptiveRateLimiter(initial_rate=20, max_rate=20)
+        client = self._client(handler, limiter, profile_id="p1")
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        response = await client.send_message("/webhook/chat", message)
+
+        assert response.success
+        # Halved by the 429, then nudged up by the successful retry
+        assert limiter.rate(KEY) == pytest.approx(10.1)
+        assert limiter.rate("profile:p1") == pytest.approx(10.1)
+
+    @pytest.mark.asyncio
+    async def test_no_slot_in_time(self):
+        """Test that a caller past its wait budget gets a rate-limited error."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"response": "ok"})
+
+        limiter = AdaptiveRateLimiter(initial_rate=1, burst=1)
+        client = self._client(handler, limiter, max_rate_wait=0.01)
+
+        first = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m1", user_id="u1", content="hi")
+        )
+        second = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m2", user_id="u1", content="hi")
+        )
+
+        assert first.success
+        assert not second.success
+        assert second.metadata["rate_limited"] is True
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_spends_no_slot(self):
+        """Test that failing fast on an open circuit leaves the rate limiter slot free."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"response": "ok"})
+
+        limiter = AdaptiveRateLimiter(initial_rate=1, burst=1)
+        breakers = CircuitBreakerRegistry(failure_threshold=1)
+        client = WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=0),
+            breakers=breakers,
+            rate_limiter=limiter,
+            max_rate_wait=0.01,
+        )
+        breaker = breakers.get("https://n8n.example.com/webhook/chat")
+        breaker.record_failure()
+
+        refused = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m1", user_id="u1", content="hi")
+        )
+        breaker.record_success()
+        sent = await client.send_message(
+            "/webhook/chat", WebhookMessage(message_id="m2", user_id="u1", content="hi")
+        )
+
+        assert "circuit_state" in refused.metadata
+        assert sent.success
@@ -0,0 +1,382 @@
+"""
+Tests for the pub/sub broker and the WebSocket gateway.
+"""
+import asyncio
+import time
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.deps import (
+    get_connection_manager,
+    get_dispatcher,
+    get_message_sink,
+    get_profile_cache,
+    get_token_verifier,
+)
+from app.main import app
+from app.services.auth import RevocationList, TokenVerifier
+from app.services.broker import InMemoryBroker
+from app.services.profiles import ProfileConfig
+from app.services.realtime import IDLE_CLOSE_CODE, ConnectionManager
+from app.services.webhook import WebhookMessage, WebhookResponse
+
+
+class FakeSocket:
+    """Records frames sent to a client."""
+
+    def __init__(self):
+        self.sent: list[Any] = []
+        self.closed_with = None
+
+    async def send_json(self, data: Any) -> None:
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingBroker(InMemoryBroker):
+    """Counts upstream (per-process) channel subscriptions."""
+
+    def __init__(self):
+        super().__init__()
+        self.opened = 0
+        self.closed = 0
+
+    async def _channel_opened(self, channel: str) -> None:
+        self.opened += 1
+
+    async def _channel_closed(self, channel: str) -> None:
+        self.closed += 1
+
+
+class SlowBroker(InMemoryBroker):
+    """Broker whose subscribe yields to the event loop first, like Redis."""
+
+    async def subscribe(self, channel: str, **kwargs):
+        await asyncio.sleep(0.01)
+        return await super().subscribe(channel, **kwargs)
+
+
+class ImmediateDispatcher:
+    """Dispatcher stand-in that answers every message at once."""
+
+    async def submit(self, profile_id: str, webhook_path: str, message: WebhookMessage, profile=None):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(WebhookResponse(
+            success=True, message_id=message.message_id, agent_response=f"echo: {message.content}"
+        ))
+        return future
+
+
+class RecordingDispatcher(ImmediateDispatcher):
+    """Immediate dispatcher that records what it was asked to send."""
+
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, profile_id: str, webhook_path: str, message: WebhookMessage, profile=None):
+        self.submitted.append((profile_id, webhook_path, profile))
+        return await super().submit(profile_id, webhook_path, message, profile)
+
+
+class FailingDispatcher:
+    """Dispatcher stand-in whose jobs fail with an unexpected error."""
+
+    async def submit(self, profile_id: str, webhook_path: str, message: WebhookMessage, profile=None):
+        future = asyncio.get_running_loop().create_future()
+        future.set_exception(RuntimeError("worker crashed"))
+        return future
+
+
+class FakeProfiles:
+    """Profile cache stand-in that counts lookups."""
+
+    def __init__(self, *profiles: ProfileConfig):
+        self.profiles = {profile.id: profile for profile in profiles}
+        self.lookups = 0
+
+    async def get(self, profile_id: str):
+        self.lookups += 1
+        return self.profiles.get(profile_id)
+
+
+def _profile_config(profile_id: str, is_active: bool = True) -> ProfileConfig:
+    return ProfileConfig(
+        id=profile_id,
+        name="Agent",
+        environment="prod",
+        webhook_urls=("https://n8n.example.com/webhook/prod",),
+        webhook_auth_type="none",
+        webhook_auth_config=None,
+        context_max_tokens=None,
+        is_active=is_active,
+        version=1,
+    )
+
+
+def _token(sub: str) -> str:
+    return jwt.encode({"sub": sub, "exp": int(time.time()) + 3600}, "ws-secret", algorithm="HS256")
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestBroker:
+    """Test in-process fan-out."""
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_drops_oldest(self):
+        """Test that a subscriber's buffer is bounded."""
+        broker = InMemoryBroker()
+        subscription = await broker.subscribe("c", maxsize=2)
+        for i in range(3):
+            await broker.publish("c", {"n": i})
+
+        assert [await subscription.get(), await subscription.get()] == [{"n": 1}, {"n": 2}]
+        assert subscription.dropped == 1
+
+
+class TestConnectionManager:
+    """Test fan-out, heartbeats and reaping."""
+
+    @pytest.mark.asyncio
+    async def test_events_reach_connections_on_every_worker(self):
+        """Test that two workers sharing a broker both deliver a user's events."""
+        broker = CountingBroker()
+        worker_a, worker_b = ConnectionManager(broker), ConnectionManager(broker)
+        tab_1, tab_2, tab_3 = FakeSocket(), FakeSocket(), FakeSocket()
+        await worker_a.connect("u1", tab_1)
+        await worker_a.connect("u1", tab_2)
+        await worker_b.connect("u1", tab_3)
+
+        await worker_a.publish("u1", {"type": "agent_reply", "text": "hi"})
+        await _settle()
+
+        assert all(tab.sent == [{"type": "agent_reply", "text": "hi"}] for tab in (tab_1, tab_2, tab_3))
+        # One subscriber per manager, not per connection, and one upstream channel
+        assert broker.stats()["subscribers"] == 2
+        assert broker.opened == 1
+
+    @pytest.mark.asyncio
+    async def test_sender_can_be_excluded(self):
+        """Test that typing indicators skip the tab that is typing."""
+        manager = ConnectionManager(InMemoryBroker())
+        typing_tab, other_tab = FakeSocket(), FakeSocket()
+        conn = await manager.connect("u1", typing_tab)
+        await manager.connect("u1", other_tab)
+
+        await manager.publish("u1", {"type": "typing", "exclude_connection": conn.connection_id})
+        await _settle()
+
+        assert typing_tab.sent == []
+        assert other_tab.sent == [{"type": "typing"}]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_connects_subscribe_once(self):
+        """Test that a user's simultaneous connects share one subscription."""
+        broker = SlowBroker()
+        manager = ConnectionManager(broker)
+        tab_1, tab_2 = FakeSocket(), FakeSocket()
+
+        await asyncio.gather(manager.connect("u1", tab_1), manager.connect("u1", tab_2))
+        await manager.publish("u1", {"type": "agent_reply"})
+        await _settle()
+
+        assert tab_1.sent == tab_2.sent == [{"type": "agent_reply"}]
+        assert broker.stats()["subscribers"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disconnect_while_subscribing(self):
+        """Test that leaving before the subscription is ready leaks nothing."""
+        broker = SlowBroker()
+        manager = ConnectionManager(broker)
+        connecting = asyncio.create_task(manager.connect("u1", FakeSocket()))
+        await asyncio.sleep(0)
+        (conn,) = manager._connections["u1"]
+
+        await manager.disconnect(conn)
+        await connecting
+
+        assert len(manager) == 0
+        assert broker.stats()["subscribers"] == 0
+
+    @pytest.mark.asyncio
+    async def test_idle_connections_are_reaped(self):
+        """Test that silent connections are closed and live ones pinged."""
+        clock = FakeClock()
+        broker = CountingBroker()
+        manager = ConnectionManager(broker, idle_timeout=60, clock=clock)
+        idle, live = FakeSocket(), FakeSocket()
+        await manager.connect("idle-user", idle)
+        live_conn = await manager.connect("live-user", live)
+
+        clock.now = 50
+        manager.touch(live_conn)
+        clock.now = 61
+        await manager.sweep()
+        await _settle()
+
+        assert idle.closed_with == IDLE_CLOSE_CODE
+        assert live.sent == [{"type": "ping"}]
+        assert manager.stats() == {"connections": 1, "users": 1, "reaped": 1}
+        assert broker.closed == 1
+
+
+class TestWebSocketEndpoint:
+    """Test /ws/chat end to end."""
+
+    def test_reply_fans_out_to_all_tabs(self):
+        """Test that a message sent from one tab is answered on every tab."""
+        manager = ConnectionManager(InMemoryBroker())
+        verifier = TokenVerifier("ws-secret", ["HS256"], revocations=RevocationList(InMemoryBroker()))
+        app.dependency_overrides[get_connection_manager] = lambda: manager
+        app.dependency_overrides[get_dispatcher] = ImmediateDispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        app.dependency_overrides[get_token_verifier] = lambda: verifier
+        try:
+            # One portal (event loop) for both sockets, as in a real worker
+            with TestClient(app) as client, \
+                    client.websocket_connect(f"/ws/chat?token={_token('u1')}") as tab_1, \
+                    client.websocket_connect(
+                        "/ws/chat", headers={"Authorization": f"Bearer {_token('u1')}"}
+                    ) as tab_2:
+                tab_1.send_json({
+                    "type": "message", "profile_id": "p1",
+                    "webhook_path": "/webhook/chat", "content": "hello",
+                })
+                for tab in (tab_1, tab_2):
+                    assert tab.receive_json()["state"] == "start"
+                    assert tab.receive_json()["state"] == "stop"
+                    reply = tab.receive_json()
+                    assert reply["type"] == "agent_reply"
+                    assert reply["response"]["agent_response"] == "echo: hello"
+
+                tab_2.send_text("not json")
+                assert tab_2.receive_json() == {"type": "error", "error": "Invalid JSON"}
+        finally:
+            app.dependency_overrides.clear()
+
+        assert len(manager) == 0
+
+    def test_socket_requires_a_valid_token(self):
+        """Test that auth rejects a socket without a token or with a forged one."""
+        verifier = TokenVerifier("ws-secret", ["HS256"], revocations=RevocationList(InMemoryBroker()))
+        forged = jwt.encode({"sub": "victim"}, "wrong-secret", algorithm="HS256")
+        app.dependency_overrides[get_connection_manager] = lambda: ConnectionManager(InMemoryBroker())
+        app.dependency_overrides[get_token_verifier] = lambda: verifier
+        try:
+            client = TestClient(app)
+            for url in ("/ws/chat", "/ws/chat?user_id=victim", f"/ws/chat?token={forged}"):
+                with pytest.raises(WebSocketDisconnect) as excinfo:
+                    with client.websocket_connect(url):
+                        pass
+                assert excinfo.value.code == 1008
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_anonymous_sockets_do_not_share_a_channel(self):
+        """Test that without auth each socket is its own user."""
+        manager = ConnectionManager(InMemoryBroker())
+        app.dependency_overrides[get_connection_manager] = lambda: manager
+        app.dependency_overrides[get_dispatcher] = ImmediateDispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        app.dependency_overrides[get_token_verifier] = lambda: None
+        try:
+            with TestClient(app) as client, \
+                    client.websocket_connect("/ws/chat?user_id=u1") as tab_1, \
+                    client.websocket_connect("/ws/chat?user_id=u1") as tab_2:
+                tab_1.send_json({"type": "typing", "profile_id": "p1"})
+                tab_2.send_json({"type": "typing", "profile_id": "p1"})
+                tab_2.send_text("not json")
+                # tab_1's typing event never reaches tab_2
+                assert tab_2.receive_json() == {"type": "error", "error": "Invalid JSON"}
+                assert manager.stats()["users"] == 2
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_stored_profile_is_sent_like_the_rest_api(self):
+        """Test that a socket message resolves its profile once and uses its webhook."""
+        active = _profile_config("3f2b8c1e-4a5d-4e6f-8a9b-0c1d2e3f4a5b")
+        inactive = _profile_config("9c8b7a6d-5e4f-4a3b-8c2d-1e0f9a8b7c6d", is_active=False)
+        profiles = FakeProfiles(active, inactive)
+        dispatcher = RecordingDispatcher()
+        app.dependency_overrides[get_connection_manager] = lambda: ConnectionManager(InMemoryBroker())
+        app.dependency_overrides[get_dispatcher] = lambda: dispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        app.dependency_overrides[get_profile_cache] = lambda: profiles
+        app.dependency_overrides[get_token_verifier] = lambda: None
+        try:
+            with TestClient(app) as client, client.websocket_connect("/ws/chat") as tab:
+                tab.send_json({
+                    "type": "message", "profile_id": active.id,
+                    "webhook_path": "/webhook/chat", "content": "hello",
+                })
+                assert [tab.receive_json()["type"] for _ in range(3)] == [
+                    "typing", "typing", "agent_reply",
+                ]
+
+                tab.send_json({
+                    "type": "message", "profile_id": inactive.id,
+                    "webhook_path": "/webhook/chat", "content": "hello",
+                })
+                error = tab.receive_json()
+        finally:
+            app.dependency_overrides.clear()
+
+        assert dispatcher.submitted == [(active.id, "", active)]
+        assert profiles.lookups == 2
+        assert error["type"] == "error"
+        assert "not active" in error["error"]
+
+
+    def test_invalid_content_is_reported(self):
+        """Test that a message failing a model validator gets a JSON error frame."""
+        app.dependency_overrides[get_connection_manager] = lambda: ConnectionManager(InMemoryBroker())
+        app.dependency_overrides[get_token_verifier] = lambda: None
+        try:
+            with TestClient(app) as client, client.websocket_connect("/ws/chat") as tab:
+                tab.send_json({
+                    "type": "message", "profile_id": "p1", "webhook_path": "/webhook/chat",
+                    "content": "{not json", "content_format": "json",
+                })
+                error = tab.receive_json()
+        finally:
+            app.dependency_overrides.clear()
+
+        assert error["type"] == "error"
+        assert "ctx" not in error["error"][0]
+
+    def test_failed_delivery_stops_typing(self):
+        """Test that a reply that fails still ends the agent's typing indicator."""
+        app.dependency_overrides[get_connection_manager] = lambda: ConnectionManager(InMemoryBroker())
+        app.dependency_overrides[get_dispatcher] = FailingDispatcher
+        app.dependency_overrides[get_message_sink] = lambda: None
+        app.dependency_overrides[get_token_verifier] = lambda: None
+        try:
+            with TestClient(app) as client, client.websocket_connect("/ws/chat") as tab:
+                tab.send_json({
+                    "type": "message", "profile_id": "p1",
+                    "webhook_path": "/webhook/chat", "content": "hello",
+                })
+                frames = [tab.receive_json() for _ in range(3)]
+        finally:
+            app.dependency_overrides.clear()
+
+        # The error goes straight to the socket, typing events via the broker
+        assert [frame["state"] for frame in frames if frame["type"] == "typing"] == ["start", "stop"]
+        assert [frame["error"] for frame in frames if frame["type"] == "error"] == ["worker crashed"]
@@ -0,0 +1,218 @@
+"""
+Tests for precompiled webhook request plans.
+"""
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.request_plan import MESSAGE_ID_HEADER, compile_plan
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+    WebhookPayloadFormat,
+    build_auth_headers,
+)
+from app.services.webhook_models import WebhookAttachment
+
+BASIC = WebhookAuthConfig(auth_type=WebhookAuthType.BASIC, username="u", password="p")
+
+
+def _message(**kwargs) -> WebhookMessage:
+    fields = {"message_id": "m1", "user_id": "u1", "content": "Hello *n8n*"}
+    fields.update(kwargs)
+    return WebhookMessage(**fields)
+
+
+async def _request(plan, message) -> httpx.Request:
+    return httpx.Request("POST", plan.url, **await plan.build(message))
+
+
+class TestCompilePlan:
+    """Test the message-independent part of a request."""
+
+    def test_url_and_headers_are_frozen(self):
+        """Test that the plan resolves the URL and encodes headers once."""
+        plan = compile_plan("https://n8n.example.com", "/webhook/chat", build_auth_headers(BASIC))
+
+        assert plan.url == "https://n8n.example.com/webhook/chat"
+        headers = dict(plan.headers)
+        assert headers[b"Authorization"].startswith(b"Basic ")
+        assert headers[b"Content-Type"] == b"application/json"
+
+    def test_binary_plan_leaves_content_type_to_multipart(self):
+        """Test that multipart plans do not fix a Content-Type without a boundary."""
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat",
+            build_auth_headers(BASIC), WebhookPayloadFormat.BINARY,
+        )
+        assert b"Content-Type" not in dict(plan.headers)
+
+
+class TestBuild:
+    """Test per-message serialisation for each payload format."""
+
+    @pytest.mark.asyncio
+    async def test_json_matches_model_dump(self):
+        """Test that the JSON body equals the model_dump encoding, minus stored files."""
+        message = _message(metadata={"k": [1, 2]})
+        plan = compile_plan("https://n8n.example.com", "/webhook/chat", {})
+
+        request = await _request(plan, message)
+
+        assert json.loads(request.content) == message.model_dump(mode="json", exclude={"files"})
+        assert request.headers["content-type"] == "application/json"
+
+    @pytest.mark.asyncio
+    async def test_form_data_is_lossless(self):
+        """Test that lists repeat and nested objects survive as JSON."""
+        message = _message(attachments=["a.txt", "b.txt"], metadata={"k": "v"})
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat", {}, WebhookPayloadFormat.FORM_DATA
+        )
+
+        request = await _request(plan, message)
+        fields = parse_qs(request.content.decode())
+
+        assert request.headers["content-type"] == "application/x-www-form-urlencoded"
+        assert fields["attachments"] == ["a.txt", "b.txt"]
+        assert json.loads(fields["metadata"][0]) == {"k": "v"}
+
+    @pytest.mark.asyncio
+    async def test_raw_body_sends_content_only(self):
+        """Test that RAW_BODY posts the content with metadata in headers."""
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat", {}, WebhookPayloadFormat.RAW_BODY
+        )
+
+        request = await _request(plan, _message())
+
+        assert request.content == b"Hello *n8n*"
+        assert request.headers["content-type"] == "text/markdown; charset=utf-8"
+        assert request.headers[MESSAGE_ID_HEADER] == "m1"
+
+    @pytest.mark.asyncio
+    async def test_binary_uploads_attachments(self, tmp_path):
+        """Test that BINARY builds a multipart body with the file bytes."""
+        (tmp_path / "photo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\xff")
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat", {},
+            WebhookPayloadFormat.BINARY, upload_dir=tmp_path,
+        )
+
+        request = await _request(plan, _message(attachments=["photo.png"]))
+        body = await request.aread()
+
+        assert request.headers["content-type"].startswith("multipart/form-data; boundary=")
+        assert b'name="file0"; filename="photo.png"' in body
+        assert b"Content-Type: image/png" in body
+        assert b"\x89PNG\r\n\x1a\n\x00\xff" in body
+        assert b'name="message"' in body
+
+    @pytest.mark.asyncio
+    async def test_stored_files_keep_their_names(self, tmp_path):
+        """Test that stored files are sent under their original name, not their path."""
+        (tmp_path / "ab").mkdir()
+        (tmp_path / "ab" / "abcd1234").write_bytes(b"%PDF-1.4 numbers")
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat", {},
+            WebhookPayloadFormat.BINARY, upload_dir=tmp_path,
+        )
+        message = _message(files=[WebhookAttachment(path="ab/abcd1234", filename="report.pdf")])
+
+        body = await (await _request(plan, message)).aread()
+
+        assert b'name="file0"; filename="report.pdf"' in body
+        assert b"abcd1234" not in body
+
+    @pytest.mark.asyncio
+    async def test_binary_rejects_path_traversal(self, tmp_path):
+        """Test that attachments cannot escape the upload directory."""
+        plan = compile_plan(
+            "https://n8n.example.com", "/webhook/chat", {},
+            WebhookPayloadFormat.BINARY, upload_dir=tmp_path,
+        )
+        with pytest.raises(ValueError):
+            await plan.build(_message(attachments=["../secret"]))
+
+
+class TestWebhookClientPlans:
+    """Test that the client compiles plans once and uses them."""
+
+    @pytest.mark.asyncio
+    async def test_plan_reused_across_messages(self):
+        """Test that clients built per message share one compiled plan."""
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request)
+            return httpx.Response(200, json={"response": "ok"})
+
+        registry = HttpClientRegistry(transport=httpx.MockTransport(handler))
+        clients = [
+            WebhookClient(
+                "https://n8n.example.com",
+                BASIC,
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+            for _ in range(3)
+        ]
+        for i, client in enumerate(clients):
+            await client.send_message("/webhook/chat", _message(message_id=f"m{i}"))
+
+        plans = {id(client._plan("/webhook/chat", WebhookPayloadFormat.JSON)) for client in clients}
+        assert len(plans) == 1
+        assert [json.loads(r.content)["message_id"] for r in seen] == ["m0", "m1", "m2"]
+        assert seen[0].headers["authorization"] == seen[2].headers["authorization"]
+
+    @pytest.mark.asyncio
+    async def test_cached_plans_hold_no_credentials(self):
+        """Test that shared plans carry no auth, which is added per request."""
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request)
+            return httpx.Response(200, json={"response": "ok"})
+
+        registry = HttpClientRegistry(transport=httpx.MockTransport(handler))
+        for password in ("old", "new"):
+            client = WebhookClient(
+                "https://n8n.example.com",
+                BASIC.model_copy(update={"password": password}),
+                registry=registry,
+                retry_policy=RetryPolicy(max_retries=0),
+                breakers=CircuitBreakerRegistry(),
+            )
+            await client.send_message("/webhook/chat", _message())
+            plan = client._plan("/webhook/chat", WebhookPayloadFormat.JSON)
+            assert b"Authorization" not in dict(plan.headers)
+
+        assert seen[0].headers["authorization"] != seen[1].headers["authorization"]
+
+    @pytest.mark.asyncio
+    async def test_missing_attachment_fails_without_request(self, tmp_path):
+        """Test that an unreadable attachment is reported, not sent."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise AssertionError("no request expected")
+
+        client = WebhookClient(
+            "https://n8n.example.com",
+            BASIC,
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=0),
+            breakers=CircuitBreakerRegistry(),
+            upload_dir=tmp_path,
+        )
+        response = await client.send_message(
+            "/webhook/chat", _message(attachments=["gone.pdf"]), WebhookPayloadFormat.BINARY
+        )
+
+        assert not response.success
+        assert response.error.startswith("Invalid attachment")
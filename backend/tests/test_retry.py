@@ -0,0 +1,260 @@
+"""
+Tests for retry policies, circuit breakers and their use in WebhookClient.
+"""
+import asyncio
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import (
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitState,
+    RetryPolicy,
+    parse_retry_after,
+)
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _client(handler, policy: RetryPolicy, breakers: CircuitBreakerRegistry = None) -> WebhookClient:
+    return WebhookClient(
+        "https://n8n.example.com",
+        WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+        retry_policy=policy,
+        breakers=breakers or CircuitBreakerRegistry(),
+    )
+
+
+def _message() -> WebhookMessage:
+    return WebhookMessage(message_id="m1", user_id="u1", content="hello")
+
+
+class TestRetryPolicy:
+    """Test backoff and retry decisions."""
+
+    def test_backoff_is_bounded_and_grows(self):
+        """Test that jittered backoff stays within the exponential ceiling."""
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+        for retry, ceiling in [(0, 1.0), (1, 2.0), (2, 4.0), (5, 5.0)]:
+            for _ in range(50):
+                assert 0 <= policy.backoff(retry) <= ceiling
+
+    def test_retriable_statuses(self):
+        """Test that only overload and gateway errors are retried."""
+        policy = RetryPolicy()
+        assert all(policy.should_retry_status(code) for code in (429, 502, 503, 504))
+        assert not any(policy.should_retry_status(code) for code in (400, 401, 404, 500))
+
+    def test_only_connect_errors_retried(self):
+        """Test that errors after the request was sent are not retried."""
+        policy = RetryPolicy()
+        request = httpx.Request("POST", "https://n8n.example.com")
+        assert policy.should_retry_exception(httpx.ConnectError("x", request=request))
+        assert not policy.should_retry_exception(httpx.ReadTimeout("x", request=request))
+
+    def test_parse_retry_after(self):
+        """Test both Retry-After header forms."""
+        assert parse_retry_after("7") == 7.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+        future = datetime.now(UTC) + timedelta(seconds=30)
+        assert 25 <= parse_retry_after(format_datetime(future, usegmt=True)) <= 30
+
+    def test_retry_after_extends_delay(self):
+        """Test that the server's Retry-After wins over a shorter backoff."""
+        policy = RetryPolicy(base_delay=0.01)
+        response = httpx.Response(429, headers={"Retry-After": "3"})
+        assert policy.delay_for(0, response) == 3.0
+
+
+class TestCircuitBreaker:
+    """Test circuit breaker state transitions."""
+
+    def test_trips_after_threshold(self):
+        """Test that consecutive failures open the circuit."""
+        breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+        assert breaker.trips == 1
+
+    def test_half_open_probe(self):
+        """Test recovery through a single half-open probe."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 10
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """Test that a failed probe opens the circuit again."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.trips == 2
+
+    def test_release_frees_unused_probe(self):
+        """Test that a probe ending without an outcome frees its slot."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        assert breaker.allow_request()
+
+        breaker.release()
+
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+    def test_registry_exposes_states(self):
+        """Test that breaker state is exported per webhook."""
+        registry = CircuitBreakerRegistry(failure_threshold=1)
+        registry.get("https://a/webhook").record_failure()
+        registry.get("https://b/webhook")
+
+        states = registry.states()
+        assert states["https://a/webhook"]["state"] == "open"
+        assert states["https://b/webhook"]["state"] == "closed"
+
+
+class TestWebhookClientRetries:
+    """Test retry behaviour of WebhookClient.send_message."""
+
+    @pytest.mark.asyncio
+    async def test_retries_retriable_status_then_succeeds(self):
+        """Test that a 503 is retried and the eventual success returned."""
+        statuses = iter([503, 502, 200])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            status = next(statuses)
+            return httpx.Response(status, json={"response": "done"})
+
+        client = _client(handler, RetryPolicy(base_delay=0))
+        response = await client.send_message("/webhook/chat", _message())
+
+        assert response.success
+        assert response.agent_response == "done"
+
+    @pytest.mark.asyncio
+    async def test_non_retriable_status_fails_immediately(self):
+        """Test that a 500 from the workflow is not retried."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(500, text="workflow error")
+
+        client = _client(handler, RetryPolicy(base_delay=0))
+        response = await client.send_message("/webhook/chat", _message())
+
+        assert not response.success
+        assert len(calls) == 1
+        assert response.metadata["webhook_attempts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_after_beyond_deadline_stops(self):
+        """Test that retries stop when Retry-After exceeds the deadline budget."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(429, headers={"Retry-After": "60"})
+
+        client = _client(handler, RetryPolicy(base_delay=0, deadline=5))
+        response = await client.send_message("/webhook/chat", _message())
+
+        assert not response.success
+        assert len(calls) == 1
+        assert "retry budget exhausted" in response.error
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self):
+        """Test that a tripped breaker stops requests reaching n8n."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            raise httpx.ConnectError("refused", request=request)
+
+        breakers = CircuitBreakerRegistry(failure_threshold=2)
+        client = _client(handler, RetryPolicy(base_delay=0, max_retries=5), breakers)
+
+        first = await client.send_message("/webhook/chat", _message())
+        second = await client.send_message("/webhook/chat", _message())
+
+        assert len(calls) == 2
+        assert first.error == "Circuit open for https://n8n.example.com/webhook/chat"
+        assert second.metadata["circuit_state"] == "open"
+        assert second.metadata["webhook_attempts"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_its_slot(self):
+        """Test that cancelling a half-open probe lets the next call probe."""
+        clock = FakeClock()
+        stalled = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            stalled.set()
+            await asyncio.Event().wait()
+
+        breakers = CircuitBreakerRegistry(failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker = breakers.get("https://n8n.example.com/webhook/chat")
+        breaker.record_failure()
+        clock.now = 10
+        client = _client(handler, RetryPolicy(base_delay=0), breakers)
+
+        task = asyncio.create_task(client.send_message("/webhook/chat", _message()))
+        await stalled.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request()
+
+    @pytest.mark.asyncio
+    async def test_expired_deadline_takes_no_probe(self):
+        """Test that an attempt skipped for the deadline does not hold a probe slot."""
+        clock = FakeClock()
+        breakers = CircuitBreakerRegistry(failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker = breakers.get("https://n8n.example.com/webhook/chat")
+        breaker.record_failure()
+        clock.now = 10
+        client = _client(lambda request: httpx.Response(200), RetryPolicy(deadline=0), breakers)
+
+        response = await client.send_message("/webhook/chat", _message())
+
+        assert "deadline exceeded" in response.error
+        assert breaker.allow_request()
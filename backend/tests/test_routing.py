@@ -0,0 +1,163 @@
+"""
+Tests for multi-endpoint routing and hedged webhook calls.
+"""
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.routing import EndpointSelector, SelectorRegistry
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+A = "https://n8n-a.example.com/webhook/chat"
+B = "https://n8n-b.example.com/webhook/chat"
+C = "https://n8n-c.example.com/webhook/chat"
+
+
+def _observe(selector: EndpointSelector, url: str, latency: float, times: int = 1) -> None:
+    for _ in range(times):
+        selector.begin(url)
+        selector.end(url, latency)
+
+
+class TestEndpointSelector:
+    """Test power-of-two-choices selection."""
+
+    def test_prefers_lower_latency(self):
+        """Test that the faster of the two sampled endpoints wins."""
+        selector = EndpointSelector([A, B], rng=random.Random(0))
+        _observe(selector, A, 0.5)
+        _observe(selector, B, 0.1)
+
+        assert {selector.pick() for _ in range(20)} == {B}
+
+    def test_accounts_for_in_flight_calls(self):
+        """Test that a busy endpoint loses to an idle one of equal latency."""
+        selector = EndpointSelector([A, B], rng=random.Random(0))
+        _observe(selector, A, 0.1)
+        _observe(selector, B, 0.1)
+        selector.begin(B)
+
+        assert selector.pick() == A
+
+    def test_unknown_endpoints_are_tried(self):
+        """Test that an endpoint without samples is picked over a known one."""
+        selector = EndpointSelector([A, B], rng=random.Random(0))
+        _observe(selector, A, 0.1)
+
+        assert selector.pick() == B
+
+    def test_failures_are_penalised(self):
+        """Test that a failed call makes an endpoint look slow."""
+        selector = EndpointSelector([A, B], failure_penalty=5, rng=random.Random(0))
+        _observe(selector, B, 1.0)
+        selector.begin(A)
+        selector.end(A, 0.01, ok=False)
+
+        assert selector.pick() == B
+        assert selector.stats()["endpoints"][A]["failures"] == 1
+
+    def test_exclude_and_health(self):
+        """Test that excluded and unhealthy endpoints are skipped while others remain."""
+        selector = EndpointSelector([A, B, C], rng=random.Random(0))
+
+        assert selector.pick(exclude={A}, healthy=lambda url: url != B) == C
+        assert selector.pick(exclude={A, C}, healthy=lambda url: url != B) == B
+        assert selector.pick(exclude={A, B, C}) is None
+
+    def test_hedge_delay_is_p95(self):
+        """Test that hedging waits for enough samples, then uses the p95."""
+        selector = EndpointSelector([A, B], min_samples=20, min_hedge_delay=0.01)
+        _observe(selector, A, 0.1, times=19)
+        assert selector.hedge_delay() is None
+
+        _observe(selector, A, 2.0)
+        assert selector.hedge_delay() == 0.1
+        _observe(selector, A, 2.0, times=16)
+        assert selector.hedge_delay() == 2.0
+
+
+class TestWebhookClientRouting:
+    """Test WebhookClient across equivalent endpoints."""
+
+    def _client(self, handler, **kwargs) -> WebhookClient:
+        return WebhookClient(
+            "https://n8n-a.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0, retry_statuses=frozenset({503})),
+            breakers=CircuitBreakerRegistry(),
+            endpoints=["https://n8n-b.example.com"],
+            selectors=SelectorRegistry(),
+            **kwargs,
+        )
+
+    @pytest.mark.asyncio
+    async def test_retry_moves_to_other_endpoint(self):
+        """Test that a retry avoids the endpoint that just failed."""
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if len(hosts) == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"response": "ok"})
+
+        client = self._client(handler)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        response = await client.send_message("/webhook/chat", message)
+
+        assert response.success
+        assert len(set(hosts)) == 2
+
+    @pytest.mark.asyncio
+    async def test_hedge_wins_and_loser_is_cancelled(self):
+        """Test that a slow call is raced against the other endpoint."""
+        started, cancelled = [], []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            started.append(request.url.host)
+            if len(started) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(request.url.host)
+                    raise
+            return httpx.Response(200, json={"response": request.url.host})
+
+        client = self._client(handler, hedge=True)
+        selector = client.selector("/webhook/chat")
+        selector.min_hedge_delay = 0.01
+        for url in selector.endpoints:
+            _observe(selector, url, 0.01, times=10)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        response = await asyncio.wait_for(client.send_message("/webhook/chat", message), 1)
+
+        assert response.success
+        assert response.agent_response == started[1] != started[0]
+        assert cancelled == [started[0]]
+        assert selector.hedges == 1 and selector.hedge_wins == 1
+        assert all(s["in_flight"] == 0 for s in selector.stats()["endpoints"].values())
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_latency_data(self):
+        """Test that hedging stays off until the p95 is known."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"response": "ok"})
+
+        client = self._client(handler, hedge=True)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        await client.send_message("/webhook/chat", message)
+
+        assert client.selector("/webhook/chat").hedges == 0
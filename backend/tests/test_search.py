@@ -0,0 +1,198 @@
+"""
+Tests for full-text search over chat history.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_db_session
+from app.main import app
+from app.models import Message, Profile
+from app.models.message import create_search_index
+from app.services.history import InvalidCursorError
+from app.services.search import InvalidSearchQueryError, build_match, search_messages
+
+START = datetime(2024, 1, 1)
+
+
+async def _profile(session: AsyncSession, *contents: str) -> Profile:
+    profile = Profile(
+        name="Support agent",
+        dev_webhook_url="https://n8n.example.com/webhook/dev",
+        prod_webhook_url="https://n8n.example.com/webhook/prod",
+    )
+    session.add(profile)
+    await session.flush()
+    for i, content in enumerate(contents):
+        session.add(Message(
+            profile_id=profile.id,
+            message_type="user" if i % 2 == 0 else "agent",
+            content=content,
+            created_at=START + timedelta(days=i),
+        ))
+    await session.commit()
+    return profile
+
+
+async def _contents(session: AsyncSession, query: str, **filters) -> list:
+    page = await search_messages(session, query, **filters)
+    return [hit.message.content for hit in page.items]
+
+
+class TestBuildMatch:
+    """Test translation of user queries to FTS5 syntax."""
+
+    def test_terms_phrases_and_prefixes(self):
+        """Test that every term is quoted and prefixes keep their star."""
+        assert build_match('invoice "next march" inv*') == (
+            'content : ("invoice" "next march" "inv"*)'
+        )
+
+    def test_operators_are_not_interpreted(self):
+        """Test that FTS5 syntax typed by users is matched as plain words."""
+        assert build_match("profile_id: NEAR(a OR b)") == (
+            'content : ("profile_id" "NEAR a" "OR" "b")'
+        )
+
+    def test_profile_is_one_token(self):
+        """Test that the profile filter matches the hyphen-free id."""
+        assert build_match("x", "1b2c-33d4").endswith('AND profile_id : "1b2c33d4"')
+
+    def test_empty_query(self):
+        """Test that a query without words is rejected."""
+        with pytest.raises(InvalidSearchQueryError):
+            build_match(' "" * ')
+
+
+class TestSearch:
+    """Test ranked search and its filters."""
+
+    @pytest.mark.asyncio
+    async def test_ranked_and_prefix(self, db_session: AsyncSession):
+        """Test that denser matches rank first and prefixes match."""
+        await _profile(
+            db_session,
+            "The invoice is attached",
+            "Invoice, invoice, invoice: please pay the invoice",
+            "No match here",
+            "Invoicing runs monthly",
+        )
+
+        assert await _contents(db_session, "invoice") == [
+            "Invoice, invoice, invoice: please pay the invoice",
+            "The invoice is attached",
+        ]
+        assert len(await _contents(db_session, "invoic*")) == 3
+
+    @pytest.mark.asyncio
+    async def test_filters(self, db_session: AsyncSession):
+        """Test filtering by profile, message type and date range."""
+        mine = await _profile(db_session, "refund please", "refund issued", "refund received")
+        await _profile(db_session, "refund elsewhere")
+
+        assert len(await _contents(db_session, "refund")) == 4
+        assert len(await _contents(db_session, "refund", profile_id=mine.id)) == 3
+        assert await _contents(db_session, "refund", profile_id=mine.id, message_type="agent") == [
+            "refund issued"
+        ]
+        assert await _contents(
+            db_session, "refund", profile_id=mine.id,
+            since=START + timedelta(days=1), until=START + timedelta(days=2),
+        ) == ["refund issued"]
+
+    @pytest.mark.asyncio
+    async def test_pages_cover_results_exactly_once(self, db_session: AsyncSession):
+        """Test that walking all pages returns every match once, in rank order."""
+        await _profile(db_session, *[f"report {'word ' * i}" for i in range(25)])
+
+        seen, cursor = [], None
+        while True:
+            page = await search_messages(db_session, "report", limit=7, cursor=cursor)
+            seen.extend(page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert len({hit.message.id for hit in seen}) == 25
+        assert [hit.score for hit in seen] == sorted((hit.score for hit in seen), reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, db_session: AsyncSession):
+        """Test that a tampered cursor is rejected."""
+        with pytest.raises(InvalidCursorError):
+            await search_messages(db_session, "x", cursor="not-a-cursor")
+
+
+class TestIndexMaintenance:
+    """Test that triggers keep the index in step with the messages table."""
+
+    @pytest.mark.asyncio
+    async def test_update_and_delete(self, db_session: AsyncSession):
+        """Test that edited and deleted messages are reindexed."""
+        profile = await _profile(db_session, "alpha", "beta")
+
+        await db_session.execute(
+            update(Message).where(Message.content == "alpha").values(content="gamma")
+        )
+        await db_session.execute(delete(Message).where(Message.content == "beta"))
+        await db_session.commit()
+
+        assert await _contents(db_session, "alpha") == []
+        assert await _contents(db_session, "beta") == []
+        assert await _contents(db_session, "gamma", profile_id=profile.id) == ["gamma"]
+
+    @pytest.mark.asyncio
+    async def test_index_added_to_existing_database(self, db_session: AsyncSession):
+        """Test that a missing index is created and built from stored messages."""
+        await _profile(db_session, "legacy message")
+        await db_session.execute(text("DROP TABLE messages_fts"))
+        await db_session.commit()
+
+        connection = await db_session.connection()
+        await connection.run_sync(create_search_index)
+        await db_session.commit()
+
+        assert await _contents(db_session, "legacy") == ["legacy message"]
+
+    @pytest.mark.asyncio
+    async def test_search_is_an_index_match(self, db_session: AsyncSession):
+        """Test that SQLite answers a profile search from the FTS index."""
+        plan = (await db_session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM messages_fts "
+            "WHERE messages_fts MATCH 'content : (\"x\") AND profile_id : \"p\"'"
+        ))).all()
+
+        assert "VIRTUAL TABLE INDEX" in " ".join(row[-1] for row in plan)
+
+
+class TestSearchEndpoint:
+    """Test GET /api/chat/search."""
+
+    @pytest.mark.asyncio
+    async def test_search_pages(self, db_session: AsyncSession, async_client: AsyncClient):
+        """Test that the endpoint returns scored pages and rejects bad input."""
+        profile = await _profile(db_session, "deploy failed", "deploy fixed", "lunch")
+        app.dependency_overrides[get_db_session] = lambda: db_session
+        try:
+            first = await async_client.get(
+                "/api/chat/search", params={"q": "deploy", "profile_id": profile.id, "limit": 1}
+            )
+            second = await async_client.get(
+                "/api/chat/search",
+                params={"q": "deploy", "profile_id": profile.id, "cursor": first.json()["next_cursor"]},
+            )
+            empty = await async_client.get("/api/chat/search", params={"q": "***"})
+            bad_type = await async_client.get("/api/chat/search", params={"q": "x", "message_type": "bot"})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert first.status_code == 200
+        hits = first.json()["items"] + second.json()["items"]
+        assert sorted(hit["message"]["content"] for hit in hits) == ["deploy failed", "deploy fixed"]
+        assert all(hit["score"] > 0 for hit in hits)
+        assert second.json()["next_cursor"] is None
+        assert empty.status_code == 400
+        assert bad_type.status_code == 422
@@ -0,0 +1,87 @@
+"""
+Tests for the application factory and the import-time budget.
+
+Workers import ``app.main`` on every spawn. The budget below is loose
+enough for a slow CI machine and tight enough to catch an eagerly imported
+heavy dependency (langchain alone takes over a second). Override it with
+``NECTA_IMPORT_BUDGET_MS`` on unusually slow hardware.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.main import app, create_app
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+IMPORT_BUDGET_MS = float(os.environ.get("NECTA_IMPORT_BUDGET_MS", 3000))
+# Time spent in NECTA's own modules, excluding the libraries they import
+APP_BUDGET_MS = IMPORT_BUDGET_MS / 6
+
+# Needed only by optional features, so never at import time
+LAZY_PACKAGES = {"jose", "cryptography", "PIL", "magic", "langsmith", "langchain", "openai"}
+
+
+def _import_profile() -> tuple[float, float, dict[str, float]]:
+    """Import ``app.main`` in a fresh interpreter under ``-X importtime``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules: dict[str, float] = {}
+    total = own = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        name = name.strip()
+        modules[name] = int(cumulative_us) / 1000
+        if name == "app" or name.startswith("app."):
+            own += int(self_us) / 1000
+        if name == "app.main":
+            total = int(cumulative_us) / 1000
+    return total, own, modules
+
+
+@pytest.fixture(scope="module")
+def import_profile() -> tuple[float, float, dict[str, float]]:
+    """Fastest of two cold imports, to keep scheduler noise out."""
+    return min(_import_profile(), _import_profile(), key=lambda profile: profile[0])
+
+
+class TestCreateApp:
+    """Test the application factory."""
+
+    def test_builds_independent_apps(self):
+        """Test that each call returns a new app with every router."""
+        other = create_app()
+        paths = {route.path for route in other.routes}
+
+        assert other is not app
+        assert {"/api/chat/messages", "/api/auth/logout", "/metrics", "/ready"} <= paths
+
+
+class TestImportTime:
+    """Test that importing the application stays cheap."""
+
+    def test_heavy_optional_packages_are_lazy(self, import_profile):
+        """Test that optional features' dependencies are not imported up front."""
+        _, _, modules = import_profile
+        eager = {name.split(".")[0] for name in modules} & LAZY_PACKAGES
+
+        assert not eager, f"imported at startup: {sorted(eager)}"
+
+    def test_within_budget(self, import_profile):
+        """Test total and NECTA-owned import time against the budget."""
+        total, own, _ = import_profile
+
+        assert total < IMPORT_BUDGET_MS, f"import app.main took {total:.0f}ms"
+        assert own < APP_BUDGET_MS, f"NECTA modules took {own:.0f}ms"
@@ -0,0 +1,189 @@
+"""
+Tests for streamed agent responses and the SSE chat endpoint.
+"""
+import json
+from collections.abc import AsyncIterator
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_webhook_client
+from app.main import app
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.streaming import extract_delta
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+)
+
+
+def _streaming_client(content_type: str, parts: list[bytes], status_code: int = 200) -> WebhookClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            status_code,
+            headers={"content-type": content_type},
+            stream=httpx.ByteStream(b"".join(parts)) if status_code != 200 else _Chunks(parts),
+        )
+
+    return WebhookClient(
+        "https://n8n.example.com",
+        WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+        registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+        retry_policy=RetryPolicy(max_retries=0),
+        breakers=CircuitBreakerRegistry(),
+    )
+
+
+class _Chunks(httpx.AsyncByteStream):
+    """Response body delivered in separate network-sized chunks."""
+
+    def __init__(self, parts: list[bytes]):
+        self.parts = parts
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for part in self.parts:
+            yield part
+
+
+async def _collect(client: WebhookClient) -> list:
+    message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+    return [chunk async for chunk in client.stream_message("/webhook/chat", message)]
+
+
+class TestDeltaExtraction:
+    """Test decoding of individual stream items."""
+
+    def test_n8n_envelope(self):
+        """Test n8n begin/item/end envelopes."""
+        assert extract_delta({"type": "begin", "metadata": {}}) is None
+        assert extract_delta({"type": "item", "content": "Hel"}) == "Hel"
+        assert extract_delta({"type": "end"}) is None
+
+    def test_plain_values(self):
+        """Test raw strings and unknown shapes."""
+        assert extract_delta("token") == "token"
+        assert extract_delta({"delta": "x"}) == "x"
+        assert extract_delta([1, 2]) is None
+
+
+class TestStreamMessage:
+    """Test WebhookClient.stream_message with different body formats."""
+
+    @pytest.mark.asyncio
+    async def test_ndjson_split_across_chunks(self):
+        """Test that NDJSON lines split across network chunks are reassembled."""
+        client = _streaming_client("application/x-ndjson", [
+            b'{"type":"begin"}\n{"type":"item","content":"Hel',
+            b'lo"}\n{"type":"item","content":" world"}\n',
+            b'{"type":"end"}\n',
+        ])
+        chunks = await _collect(client)
+
+        assert [c.delta for c in chunks if not c.done] == ["Hello", " world"]
+        assert chunks[-1].done and chunks[-1].error is None
+        assert chunks[-1].metadata["webhook_attempts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_server_sent_events(self):
+        """Test SSE data frames and the [DONE] sentinel."""
+        client = _streaming_client("text/event-stream", [
+            b"data: {\"token\": \"a\"}\n\n",
+            b"data: b\n\ndata: [DONE]\n\n",
+            b"data: ignored\n\n",
+        ])
+        chunks = await _collect(client)
+
+        assert [c.delta for c in chunks if not c.done] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_plain_json_is_single_chunk(self):
+        """Test that non-streaming workflows still produce an answer."""
+        client = _streaming_client("application/json", [b'{"response": "full answer"}'])
+        chunks = await _collect(client)
+
+        assert [c.delta for c in chunks if not c.done] == ["full answer"]
+
+    @pytest.mark.asyncio
+    async def test_error_status_ends_with_error_chunk(self):
+        """Test that an HTTP error is reported in the final chunk."""
+        client = _streaming_client("text/plain", [b"bad request"], status_code=400)
+        chunks = await _collect(client)
+
+        assert len(chunks) == 1
+        assert chunks[0].done
+        assert chunks[0].error == "HTTP 400: bad request"
+
+
+class TestPlainReplies:
+    """Test non-streamed answers that are not JSON objects."""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("body,content_type", [
+        (b"Hello there", "text/plain"),
+        (b"{not json", "application/json"),
+        (b'"just a string"', "application/json"),
+    ])
+    async def test_non_json_reply_is_text(self, body, content_type):
+        """Test that a 200 whose body is not a JSON object is returned as text."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, headers={"content-type": content_type}, content=body)
+
+        client = WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=0),
+            breakers=CircuitBreakerRegistry(),
+        )
+        message = WebhookMessage(message_id="m1", user_id="u1", content="hi")
+
+        response = await client.send_message("/webhook/chat", message)
+
+        assert response.success
+        assert response.agent_response == body.decode()
+        assert response.response_format == "text"
+
+
+class TestStreamEndpoint:
+    """Test the SSE chat endpoint."""
+
+    def test_stream_endpoint_relays_events(self):
+        """Test that chunks are forwarded as server-sent events."""
+        client = _streaming_client("application/x-ndjson", [
+            b'{"type":"item","content":"Hi"}\n',
+            b'{"type":"item","content":"!"}\n',
+        ])
+        app.dependency_overrides[get_webhook_client] = lambda: client
+        try:
+            response = TestClient(app).post(
+                "/api/chat/stream",
+                json={"webhook_path": "/webhook/chat", "content": "hello"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line[len("data: "):])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        assert [e["delta"] for e in events] == ["Hi", "!", ""]
+        assert events[-1]["done"] is True
+
+    def test_stream_endpoint_rejects_foreign_paths(self, client: TestClient):
+        """Test that only webhook paths on the configured instance are accepted."""
+        app.dependency_overrides[get_webhook_client] = lambda: _streaming_client("text/plain", [])
+        try:
+            response = client.post(
+                "/api/chat/stream",
+                json={"webhook_path": "https://evil.example.com/x", "content": "hello"},
+            )
+        finally:
+            app.dependency_overrides.clear()
+        assert response.status_code == 422
@@ -0,0 +1,227 @@
+"""
+Tests for the LangSmith trace exporter.
+"""
+import asyncio
+import gzip
+import json
+from typing import Any
+
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.tracing import TraceExporter
+from app.services.webhook import WebhookMessage, WebhookResponse
+
+
+class LangSmithStub:
+    """Stands in for ``POST /runs/batch``; fails the first ``fail`` calls."""
+
+    def __init__(self, fail: int = 0, status: int = 503):
+        self.fail = fail
+        self.status = status
+        self.requests: list[httpx.Request] = []
+        self.posts: list[dict[str, Any]] = []
+        self.patches: list[dict[str, Any]] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.fail:
+            self.fail -= 1
+            return httpx.Response(self.status)
+        body = request.content
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+        self.posts.extend(payload["post"])
+        self.patches.extend(payload["patch"])
+        return httpx.Response(202, json={"message": "Runs batch ingested"})
+
+
+def _exporter(stub: LangSmithStub, **kwargs) -> TraceExporter:
+    return TraceExporter(
+        "ls-test-key",
+        endpoint="https://langsmith.test",
+        registry=HttpClientRegistry(transport=httpx.MockTransport(stub)),
+        **kwargs,
+    )
+
+
+class TestBatching:
+    """Test batched, compressed export."""
+
+    @pytest.mark.asyncio
+    async def test_runs_exported_in_compressed_batches(self):
+        """Test that buffered runs go out in gzip batches of max_batch."""
+        stub = LangSmithStub()
+        exporter = _exporter(stub, max_batch=100)
+
+        for i in range(250):
+            exporter.start_run("chat", {"content": f"message {i}"})
+        assert len(stub.requests) == 0  # recording never does I/O
+        await exporter.flush()
+
+        assert len(stub.requests) == 3
+        assert all(r.url == "https://langsmith.test/runs/batch" for r in stub.requests)
+        assert stub.requests[0].headers["x-api-key"] == "ls-test-key"
+        assert stub.requests[0].headers["content-encoding"] == "gzip"
+        assert len({run["id"] for run in stub.posts}) == 250
+        assert exporter.stats()["exported"] == 250
+
+    @pytest.mark.asyncio
+    async def test_end_merged_into_start_within_batch(self):
+        """Test that a run started and ended between flushes is one post."""
+        stub = LangSmithStub()
+        exporter = _exporter(stub, project="necta")
+
+        parent = exporter.start_run("chat", {"content": "hi"})
+        child = exporter.start_run("tool", {"q": "x"}, run_type="tool", parent=parent)
+        exporter.end_run(child, outputs={"result": "y"})
+        exporter.end_run(parent, outputs={"response": "hello"})
+        await exporter.flush()
+
+        assert stub.patches == []
+        runs = {run["name"]: run for run in stub.posts}
+        assert runs["chat"]["outputs"] == {"response": "hello"}
+        assert runs["tool"]["parent_run_id"] == parent.id
+        assert runs["tool"]["trace_id"] == parent.id
+        assert runs["tool"]["dotted_order"].startswith(parent.dotted_order + ".")
+        assert runs["chat"]["session_name"] == "necta"
+
+    @pytest.mark.asyncio
+    async def test_background_flush(self):
+        """Test that the flusher exports a partial batch after the interval."""
+        stub = LangSmithStub()
+        exporter = _exporter(stub, flush_interval=0.01)
+        exporter.start()
+        try:
+            exporter.start_run("chat", {"content": "hi"})
+            for _ in range(100):
+                if stub.posts:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await exporter.close()
+
+        assert len(stub.posts) == 1
+
+
+    @pytest.mark.asyncio
+    async def test_close_waits_for_export_in_progress(self):
+        """Test that shutting down mid-export sends the batch instead of losing it."""
+        stub = LangSmithStub()
+        sending, proceed = asyncio.Event(), asyncio.Event()
+
+        async def slow(request: httpx.Request) -> httpx.Response:
+            sending.set()
+            await proceed.wait()
+            return stub(request)
+
+        exporter = TraceExporter(
+            "ls-test-key",
+            endpoint="https://langsmith.test",
+            registry=HttpClientRegistry(transport=httpx.MockTransport(slow)),
+            flush_interval=0.01,
+        )
+        exporter.start()
+        exporter.start_run("chat", {"content": "last words"})
+        await sending.wait()
+        closing = asyncio.create_task(exporter.close())
+        await asyncio.sleep(0.01)
+        proceed.set()
+        await closing
+
+        assert len(stub.posts) == 1
+        assert exporter.stats()["dropped"] == 0
+
+
+class TestOverload:
+    """Test that overload sheds traces instead of blocking."""
+
+    def test_traces_sampled_when_buffer_fills(self):
+        """Test that new traces are sampled out above the fill threshold."""
+        exporter = _exporter(LangSmithStub(), max_queue=10, sample_above=0.5, rng=lambda: 0.99)
+
+        refs = [exporter.start_run("chat", {"n": i}) for i in range(10)]
+
+        assert sum(ref is not None for ref in refs) == 6
+        assert exporter.stats()["sampled_out"] == 4
+        exporter.end_run(None)  # ending a sampled-out trace is a no-op
+        assert exporter.pending == 6
+
+    def test_full_buffer_overwrites_oldest(self):
+        """Test that the ring buffer stays bounded."""
+        exporter = _exporter(LangSmithStub(), max_queue=3, sample_above=1.0)
+
+        for i in range(5):
+            exporter.start_run("chat", {"n": i})
+
+        assert exporter.pending == 3
+        assert exporter.dropped == 2
+
+
+class TestFailures:
+    """Test retry and drop behaviour."""
+
+    @pytest.mark.asyncio
+    async def test_server_error_requeues_batch(self):
+        """Test that a 503 keeps the runs for the next flush."""
+        stub = LangSmithStub(fail=1)
+        exporter = _exporter(stub)
+        exporter.start_run("chat", {"content": "hi"})
+
+        assert await exporter.flush() is False
+        assert exporter.pending == 1
+        assert await exporter.flush() is True
+        assert len(stub.posts) == 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_batch_is_dropped(self):
+        """Test that a 4xx is not retried."""
+        stub = LangSmithStub(fail=1, status=422)
+        exporter = _exporter(stub)
+        exporter.start_run("chat", {"content": "hi"})
+
+        await exporter.flush()
+
+        assert exporter.pending == 0
+        assert exporter.dropped == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_are_bounded(self):
+        """Test that runs are dropped after max_attempts failures."""
+        exporter = _exporter(LangSmithStub(fail=10), max_attempts=2)
+        exporter.start_run("chat", {"content": "hi"})
+
+        await exporter.flush()
+        await exporter.flush()
+
+        assert exporter.pending == 0
+        assert exporter.dropped == 1
+
+
+class TestExchange:
+    """Test the run recorded for a chat exchange."""
+
+    @pytest.mark.asyncio
+    async def test_exchange_run_fields(self):
+        """Test that a message and its answer become one finished run."""
+        stub = LangSmithStub()
+        exporter = _exporter(stub)
+        message = WebhookMessage(message_id="m1", user_id="u1", content="Hello")
+        response = WebhookResponse(
+            success=True, message_id="m1", agent_response="Hi", processing_time_ms=42,
+            metadata={"webhook_attempts": 1},
+        )
+
+        exporter.record_exchange("p1", "/webhook/chat", message, response)
+        await exporter.flush()
+
+        (run,) = stub.posts
+        assert run["name"] == "n8n /webhook/chat"
+        assert run["inputs"] == {"content": "Hello", "format": "markdown"}
+        assert run["outputs"] == {"response": "Hi", "format": "markdown"}
+        assert run["extra"]["metadata"] == {
+            "profile_id": "p1", "message_id": "m1", "processing_time_ms": 42, "webhook_attempts": 1,
+        }
+        assert "end_time" in run and "error" not in run
@@ -0,0 +1,156 @@
+"""
+Tests for streaming attachment uploads.
+"""
+import hashlib
+import json
+import os
+from email.parser import BytesParser
+from email.policy import HTTP
+
+import httpx
+import pytest
+
+from app.services.http_pool import HttpClientRegistry
+from app.services.retry import CircuitBreakerRegistry, RetryPolicy
+from app.services.uploads import (
+    MAX_ATTACHMENTS,
+    AttachmentError,
+    MultipartUpload,
+    resolve_attachments,
+    sniff_mime,
+)
+from app.services.webhook import (
+    WebhookAuthConfig,
+    WebhookAuthType,
+    WebhookClient,
+    WebhookMessage,
+    WebhookPayloadFormat,
+)
+
+
+async def _collect(upload: MultipartUpload) -> list:
+    return [chunk async for chunk in upload]
+
+
+class TestSniffMime:
+    """Test MIME detection from leading bytes."""
+
+    def test_signatures_beat_extension(self):
+        """Test that content wins over a misleading file name."""
+        assert sniff_mime(b"%PDF-1.7\n...", "report.txt") == "application/pdf"
+        assert sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ", "x.bin") == "image/webp"
+
+    def test_extension_fallback(self):
+        """Test that unknown content falls back to the extension."""
+        assert sniff_mime(b"a,b\n1,2\n", "data.csv") == "text/csv"
+        assert sniff_mime(b"\x00\x01", "blob") == "application/octet-stream"
+
+
+class TestResolveAttachments:
+    """Test path safety and per-message limits."""
+
+    def test_rejects_traversal_and_missing(self, tmp_path):
+        """Test that only existing files inside the upload dir are accepted."""
+        with pytest.raises(AttachmentError):
+            resolve_attachments(tmp_path, ["../etc/passwd"])
+        with pytest.raises(AttachmentError):
+            resolve_attachments(tmp_path, ["missing.bin"])
+
+    def test_count_and_size_limits(self, tmp_path):
+        """Test the 10 file and 16MB limits from the shared schema."""
+        (tmp_path / "a.txt").write_bytes(b"x")
+        with pytest.raises(AttachmentError):
+            resolve_attachments(tmp_path, ["a.txt"] * (MAX_ATTACHMENTS + 1))
+
+        big = tmp_path / "big.bin"
+        with open(big, "wb") as f:
+            f.truncate(16 * 1024 * 1024 + 1)
+        with pytest.raises(AttachmentError):
+            resolve_attachments(tmp_path, ["big.bin"])
+
+
+class TestMultipartUpload:
+    """Test the streamed multipart body."""
+
+    @pytest.mark.asyncio
+    async def test_chunks_are_bounded(self, tmp_path):
+        """Test that no yielded piece exceeds the chunk size, whatever the file size."""
+        data = os.urandom(1024 * 1024 + 7)
+        (tmp_path / "big.bin").write_bytes(data)
+        upload = MultipartUpload({}, resolve_attachments(tmp_path, ["big.bin"]), chunk_size=4096)
+
+        chunks = await _collect(upload)
+
+        assert max(len(c) for c in chunks) <= 4096
+        assert data in b"".join(chunks)
+
+    @pytest.mark.asyncio
+    async def test_hash_and_mime_from_the_same_pass(self, tmp_path):
+        """Test that digests and MIME types are reported after streaming."""
+        png = b"\x89PNG\r\n\x1a\n" + os.urandom(10000)
+        (tmp_path / "image.dat").write_bytes(png)
+        (tmp_path / "notes.txt").write_bytes(b"hello")
+        upload = MultipartUpload(
+            {"message": "{}"}, resolve_attachments(tmp_path, ["image.dat", "notes.txt"])
+        )
+
+        body = b"".join(await _collect(upload))
+
+        first, second = upload.attachments
+        assert first.sha256 == hashlib.sha256(png).hexdigest()
+        assert first.mime_type == "image/png"
+        assert second.size == 5
+        assert b"Content-Type: image/png" in body
+        assert body.endswith(f"--{upload.boundary}--\r\n".encode())
+
+        manifest = body.split(b'name="attachments"')[1].split(b"\r\n\r\n", 1)[1].split(b"\r\n")[0]
+        assert json.loads(manifest)[0]["sha256"] == first.sha256
+
+    @pytest.mark.asyncio
+    async def test_body_parses_as_multipart(self, tmp_path):
+        """Test that the body is valid multipart/form-data."""
+        (tmp_path / "a.bin").write_bytes(b"\x00\x01\x02")
+        upload = MultipartUpload({"message": '{"id": 1}'}, resolve_attachments(tmp_path, ["a.bin"]))
+        body = b"".join(await _collect(upload))
+
+        parsed = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {upload.content_type}\r\n\r\n".encode() + body
+        )
+        parts = {part.get_param("name", header="content-disposition"): part for part in parsed.iter_parts()}
+
+        assert parts["message"].get_content() == '{"id": 1}'
+        assert parts["file0"].get_content() == b"\x00\x01\x02"
+        assert parts["file0"].get_filename() == "a.bin"
+
+
+class TestWebhookBinaryUpload:
+    """Test BINARY sends through WebhookClient."""
+
+    @pytest.mark.asyncio
+    async def test_retry_resends_full_body(self, tmp_path):
+        """Test that a retried upload streams the files again from the start."""
+        (tmp_path / "doc.pdf").write_bytes(b"%PDF-1.4 " + b"x" * 200_000)
+        bodies = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(await request.aread())
+            if len(bodies) == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"response": "received"})
+
+        client = WebhookClient(
+            "https://n8n.example.com",
+            WebhookAuthConfig(auth_type=WebhookAuthType.NONE),
+            registry=HttpClientRegistry(transport=httpx.MockTransport(handler)),
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0),
+            breakers=CircuitBreakerRegistry(),
+            upload_dir=tmp_path,
+        )
+        message = WebhookMessage(message_id="m1", user_id="u1", content="see pdf", attachments=["doc.pdf"])
+
+        response = await client.send_message("/webhook/chat", message, WebhookPayloadFormat.BINARY)
+
+        assert response.success
+        assert len(bodies) == 2
+        assert len(bodies[1]) > 200_000
+        assert bodies[0].split(b"\r\n", 1)[1] == bodies[1].split(b"\r\n", 1)[1]
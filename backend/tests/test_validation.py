@@ -0,0 +1,148 @@
+"""
+Tests for server-side message validation.
+
+The shared fixture corpus is also run against the Zod schemas by
+``frontend/__tests__/shared-schemas.test.ts``; a case that passes on one
+side and fails on the other means the implementations have drifted.
+"""
+import json
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+from pydantic import ValidationError
+
+from app.services.validation import (
+    check_html,
+    check_json,
+    validate_message_creation,
+    validate_webhook_payload,
+)
+
+FIXTURES = Path(__file__).resolve().parents[2] / "shared" / "fixtures" / "message_validation.json"
+CORPUS = json.loads(FIXTURES.read_text(encoding="utf-8"))
+
+PROFILE_ID = "3f2b8c1e-4a5d-4e6f-8a9b-0c1d2e3f4a5b"
+
+
+def _cases(group: str):
+    return [pytest.param(case, id=case["name"]) for case in CORPUS[group]]
+
+
+def _check(validate, case):
+    if case["valid"]:
+        validate(case["data"])
+        return
+    with pytest.raises(ValidationError) as excinfo:
+        validate(case["data"])
+    if "error" in case:
+        assert case["error"] in str(excinfo.value)
+
+
+class TestSharedCorpus:
+    """Test the backend against the corpus shared with the frontend."""
+
+    @pytest.mark.parametrize("case", _cases("create_message"))
+    def test_create_message(self, case):
+        """Test user message validation."""
+        _check(validate_message_creation, case)
+
+    @pytest.mark.parametrize("case", _cases("webhook_payload"))
+    def test_webhook_payload(self, case):
+        """Test webhook payload validation."""
+        _check(validate_webhook_payload, case)
+
+
+class TestCreateMessage:
+    """Test defaults and length limits."""
+
+    def test_defaults(self):
+        """Test that the format defaults to markdown with no attachments."""
+        message = validate_message_creation({"profile_id": PROFILE_ID, "content": "Hi"})
+
+        assert message.content_format == "markdown"
+        assert message.file_attachments == []
+
+    @pytest.mark.parametrize("length,valid", [(32000, True), (32001, False)])
+    def test_content_length(self, length, valid):
+        """Test the 32000 character content limit."""
+        data = {"profile_id": PROFILE_ID, "content": "x" * length}
+        if valid:
+            validate_message_creation(data)
+        else:
+            with pytest.raises(ValidationError):
+                validate_message_creation(data)
+
+
+class TestCheckJson:
+    """Test the streaming depth and size scan."""
+
+    @pytest.mark.parametrize("content,depth", [
+        ("1", 0),
+        ("{}", 1),
+        ('{"a": [[], {}]}', 3),
+        ('["[[[[", "]]]]"]', 1),
+    ])
+    def test_depth_matches_get_object_depth(self, content, depth):
+        """Test that depth counts containers only, not brackets inside strings."""
+        check_json(content, max_depth=depth)
+        if depth:
+            with pytest.raises(ValueError, match="too deeply nested"):
+                check_json(content, max_depth=depth - 1)
+
+    def test_deep_document_rejected_before_parsing(self):
+        """Test that nesting is rejected at the first offending bracket."""
+        with pytest.raises(ValueError, match="too deeply nested"):
+            check_json("[" * 100000)
+
+    def test_large_document_rejected_before_parsing(self):
+        """Test that an oversized document is rejected before it is complete."""
+        with pytest.raises(ValueError, match="too large"):
+            check_json("[" + "1," * 100000)
+
+    def test_unterminated_string_is_invalid(self):
+        """Test that a string missing its closing quote is reported as invalid."""
+        with pytest.raises(ValueError, match="Invalid JSON content"):
+            check_json('["abc')
+
+
+class TestCheckHtml:
+    """Test the dangerous HTML patterns."""
+
+    @pytest.mark.parametrize("content", ["plain words", "", "a < b", "key: value"])
+    def test_harmless_content(self, content):
+        """Test that content without dangerous patterns passes."""
+        check_html(content)
+
+    def test_script_spanning_lines(self):
+        """Test that a multi-line script element is caught."""
+        with pytest.raises(ValueError, match="dangerous"):
+            check_html("<script type='module'>\nimport x from 'y'\n</script>")
+
+
+class TestChatEndpointValidation:
+    """Test that the chat API enforces the content checks."""
+
+    @pytest.mark.asyncio
+    async def test_dangerous_html_is_rejected(self, async_client: AsyncClient):
+        """Test that HTML with a script is refused before reaching n8n."""
+        response = await async_client.post("/api/chat/messages", json={
+            "webhook_path": "webhook/agent",
+            "content": "<script>alert(1)</script>",
+            "content_format": "html",
+        })
+
+        assert response.status_code == 422
+        assert "dangerous" in response.text
+
+    @pytest.mark.asyncio
+    async def test_invalid_json_is_rejected(self, async_client: AsyncClient):
+        """Test that JSON content must parse."""
+        response = await async_client.post("/api/chat/messages", json={
+            "webhook_path": "webhook/agent",
+            "content": "{not json",
+            "content_format": "json",
+        })
+
+        assert response.status_code == 422
+        assert "Invalid JSON content" in response.text
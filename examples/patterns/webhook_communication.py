@@ -3,6 +3,9 @@ n8n Webhook Communication Patterns for NECTA
 
 This example demonstrates secure webhook communication with n8n workflows,
 including authentication, retry logic, and error handling.
+
+The backend implementation lives in backend/app/services/webhook.py, where
+clients share per-origin connection pools (backend/app/services/http_pool.py).
 """
 
 import asyncio
@@ -0,0 +1,61 @@
+import corpus from '../../shared/fixtures/message_validation.json'
+import {
+  validateMessageCreation,
+  validateWebhookPayload,
+} from '../../shared/schemas/message'
+
+// The same corpus runs against the backend (backend/tests/test_validation.py);
+// a case that passes on one side and fails on the other means drift.
+interface ValidationCase {
+  name: string
+  data: any
+  valid: boolean
+  error?: string
+}
+
+// JSON has no dates; FileAttachmentSchema expects uploaded_at as a Date
+function reviveDates(data: any): any {
+  if (!data || !Array.isArray(data.file_attachments)) {
+    return data
+  }
+  return {
+    ...data,
+    file_attachments: data.file_attachments.map((file: any) =>
+      typeof file?.uploaded_at === 'string'
+        ? { ...file, uploaded_at: new Date(file.uploaded_at) }
+        : file
+    ),
+  }
+}
+
+function check(validate: (data: unknown) => unknown, testCase: ValidationCase) {
+  if (testCase.valid) {
+    expect(() => validate(testCase.data)).not.toThrow()
+  } else if (testCase.error) {
+    expect(() => validate(testCase.data)).toThrow(testCase.error)
+  } else {
+    expect(() => validate(testCase.data)).toThrow()
+  }
+}
+
+describe('Shared message validation corpus', () => {
+  describe('validateMessageCreation', () => {
+    const cases = (corpus.create_message as ValidationCase[]).map(
+      (testCase) => [testCase.name, testCase] as const
+    )
+
+    it.each(cases)('%s', (_name, testCase) => {
+      check(validateMessageCreation, { ...testCase, data: reviveDates(testCase.data) })
+    })
+  })
+
+  describe('validateWebhookPayload', () => {
+    const cases = (corpus.webhook_payload as ValidationCase[]).map(
+      (testCase) => [testCase.name, testCase] as const
+    )
+
+    it.each(cases)('%s', (_name, testCase) => {
+      check(validateWebhookPayload, testCase)
+    })
+  })
+})
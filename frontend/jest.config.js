@@ -41,6 +41,9 @@ const config = {
     '^.+\\.(js|jsx|ts|tsx)$': ['babel-jest', { presets: ['next/babel'] }],
   },
 
+  // Let ../shared/schemas resolve zod from the frontend's node_modules
+  moduleDirectories: ['node_modules', '<rootDir>/node_modules'],
+
   // Module file extensions
   moduleFileExtensions: ['ts', 'tsx', 'js', 'jsx', 'json'],
 
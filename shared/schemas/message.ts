@@ -27,6 +27,8 @@ export const FileAttachmentSchema = z.object({
     .regex(/^[a-zA-Z0-9][a-zA-Z0-9!#$&\-\^]*\/[a-zA-Z0-9][a-zA-Z0-9!#$&\-\^]*$/, 'Invalid MIME type'),
   
   url: z.string().url('Invalid file URL'),
+  // SHA-256 of the content in the backend blob store (identical files share it)
+  blob_id: z.string().regex(/^[0-9a-f]{64}$/, 'Invalid blob ID').optional(),
   uploaded_at: z.date(),
 })
 export type FileAttachment = z.infer<typeof FileAttachmentSchema>
@@ -60,6 +60,20 @@ export const BaseProfileSchema = z.object({
       'Production webhook URL must use HTTPS'
     ),
   
+  // Further n8n workers serving the same production workflow
+  prod_webhook_replicas: z
+    .array(
+      z
+        .string()
+        .url('Invalid production webhook URL')
+        .refine(
+          (url) => url.startsWith('https://'),
+          'Production webhook URL must use HTTPS'
+        )
+    )
+    .max(8, 'At most 8 production webhook replicas')
+    .default([]),
+  
   webhook_auth_type: WebhookAuthTypeSchema,
   webhook_auth_config: WebhookAuthConfigSchema,
   
@@ -73,6 +87,14 @@ export const BaseProfileSchema = z.object({
   
   environment: EnvironmentSchema.default('dev'),
   is_active: z.boolean().default(true),
+  
+  // Token budget of the conversation context sent with each message
+  context_max_tokens: z
+    .number()
+    .int()
+    .min(0, 'Context budget cannot be negative')
+    .max(128000, 'Context budget must be at most 128000 tokens')
+    .optional(),
 })
 
 // Create profile schema (without ID)
@@ -127,7 +149,8 @@ export function validateProfileCreation(data: unknown): CreateProfile {
   const prodUrl = new URL(profile.prod_webhook_url)
   
   // Block private IP ranges in production webhooks
-  if (isPrivateIP(prodUrl.hostname)) {
+  const replicaHosts = profile.prod_webhook_replicas.map((url) => new URL(url).hostname)
+  if ([prodUrl.hostname, ...replicaHosts].some(isPrivateIP)) {
     throw new Error('Production webhook URLs cannot use private IP addresses')
   }
   